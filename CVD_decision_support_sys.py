@@ -1,247 +1,397 @@
+import os
+import threading
+import time
+
 import streamlit as st
-import psycopg2
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from psycopg2 import Error
-import pickle
-import numpy as np
+from async_stages import StageRunner, StageTimeout
+from auth import InvalidToken, authenticate, default_session_manager, register
+from db_pool import ConnectionPool, DB_SETTINGS, POOL_SETTINGS
+from drift_monitor import DRIFT_SETTINGS, DriftMonitor
+from explanations import TreeExplainer, top_factors
+import queries
+from patient_search import PAGE_SIZE, search_patients
+from persistence import WRITE_BEHIND, BackgroundWriter, save_patient_test
+from features import FEATURE_NAMES, decode, encode, options, option_index
+from instrumentation import (METRICS_SETTINGS, PROFILE_SETTINGS, SlowRequestProfiler, start_file_exporter,
+                             start_http_server, timed)
+from prediction_cache import CACHE_SETTINGS, PredictionCache
+from recommendations import recommend
+from risk_grid import GRID_PATH, RiskGrid, grid_version
+from scoring_client import SCORING_URL, ScoringClient
+from session_cookie import SESSION_COOKIE, cookie_script
+from tree_model import artifact_version, load_model, resolve_artifact
+
+# Load the Gradient Boosting model lazily, the first time a prediction is needed
+@st.cache_resource(max_entries=1)
+def load_model_version(path, version):
+    """
+    Loads the exported model artifact once per artifact version and shares it across sessions.
 
-# Load the Gradient Boosting model using pickle
-with open('gb_model.pkl', 'rb') as file:
-    model = pickle.load(file)
+    Args:
+        path (str): Directory of the artifact version, as found by current_artifact().
+        version (str): Version of the artifact on disk; a new version replaces the cached model.
 
-# Database connection setup
-def get_db_connection():
+    Returns:
+        TreeEnsemble: The Gradient Boosting model compiled into packed NumPy trees.
     """
-    Establishes a connection to the PostgreSQL database.
+    return load_model(path)
+
+def current_artifact():
+    """
+    Finds the current model artifact once, so its version and the files loaded under it cannot come from
+    two versions when a retrain publishes a new one in between.
 
     Returns:
-        psycopg2 connection object: Connection to the PostgreSQL database.
+        tuple: Directory of the current artifact version, and its version.
     """
-    return psycopg2.connect(host='127.0.0.1', dbname='DSS', user='dadb')
+    path = resolve_artifact()
+    return path, artifact_version(path)
 
-def authenticate_user(username, password):
+# Client of the scoring service, when the app is configured to use one
+@st.cache_resource
+def get_scoring_client():
     """
-    Authenticates the user based on the provided username and password.
+    Connects to the scoring service once per server process and shares the client across sessions.
+
+    Returns:
+        ScoringClient: Client scoring predictions on the service at CVD_SCORING_URL.
+    """
+    return ScoringClient(SCORING_URL)
+
+def get_model():
+    """
+    Retrieves the model used for predictions: the scoring service if CVD_SCORING_URL is set, otherwise the
+    local model, reloaded if the artifact on disk has been replaced.
+
+    Returns:
+        ScoringClient or TreeEnsemble: Object with the model's predict interface.
+    """
+    if SCORING_URL:
+        return get_scoring_client()
+    return load_model_version(*current_artifact())
+
+# Explanations of the local model's predictions, built once per artifact version
+@st.cache_resource(max_entries=1)
+def load_explainer_version(path, version):
+    """
+    Builds the explainer of the model artifact once per version and shares it, and its cache, across sessions.
 
     Args:
-        username (str): The username of the user.
-        password (str): The password of the user.
+        path (str): Directory of the artifact version, as found by current_artifact().
+        version (str): Version of the artifact on disk; a new version replaces the cached explainer.
 
     Returns:
-        tuple: A tuple containing the user ID and user type if authentication is successful, otherwise (None, None).
+        TreeExplainer: The explainer, or None if the artifact was exported without node covers.
     """
-    user_id, user_type = None, None  # Initialize variables to None
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT \"User ID\", \"User Type\" FROM users WHERE \"username\" = %s AND \"password\" = %s", (username, password))
-    user_info = cur.fetchone()
-    cur.close()
-    conn.close()
-    if user_info:
-        user_id, user_type = user_info
-        user_type = user_type.strip().lower()
-    return user_id, user_type
+    model = load_model_version(path, version)
+    if model.cover is None:
+        return None
+    return TreeExplainer(model)
 
-def convert_gender_to_number(gender):
+# Precomputed risk table for the what-if explorer, mapped once per table version
+@st.cache_resource(max_entries=1)
+def load_risk_grid_version(version):
     """
-    Converts gender text to numerical representation.
+    Memory-maps the risk table once per version and shares it across sessions.
 
     Args:
-        gender (str): The gender text.
+        version (str): Model version recorded in the table's header; a rebuilt table replaces the cached one.
 
     Returns:
-        int: Numerical representation of gender (1 for Male, 2 for Female).
+        RiskGrid: The precomputed risk table.
     """
-    return 1 if gender == "Male" else 2  # Default to 2 if not "Male"
+    return RiskGrid.load(GRID_PATH)
 
-def convert_number_to_gender(number):
+def get_risk_grid(model_version):
     """
-    Converts numerical representation of gender to text.
+    Retrieves the risk table if one has been built for the model in use.
 
     Args:
-        number (int): Numerical representation of gender (1 for Male, 2 for Female).
+        model_version (str): Version of the model predictions are made with.
 
     Returns:
-        str: Text representation of gender.
+        RiskGrid: The risk table, or None if there is none or it was built from another model.
     """
-    return "Male" if number == 1 else "Female"
+    version = grid_version()
+    if version is None or version != model_version:
+        return None
+    return load_risk_grid_version(version)
 
-# Define functions for converting between binary text and numerical representation
-def convert_to_number(text):
-    return 1 if text == "Yes" else 0
+# Physician updates saved after the result renders, when write-behind is enabled
+@st.cache_resource
+def get_background_writer():
+    """
+    Starts the background writer once per server process and shares it across sessions.
 
-def convert_to_text(number):
-    return "Yes" if number == 1 else "No"
+    Returns:
+        BackgroundWriter: Writer saving queued physician updates in submission order.
+    """
+    return BackgroundWriter(get_db_pool())
 
-def convert_level_to_number(level):
+# Predictions shared across sessions, keyed by model version and encoded inputs
+@st.cache_resource
+def get_prediction_cache():
     """
-    Converts text representation of a level to its numerical representation.
+    Creates the prediction cache once per server process and shares it across sessions.
 
-    Args:
-        level (str): Text representation of the level.
+    Returns:
+        PredictionCache: Bounded LRU/TTL cache of model predictions.
+    """
+    return PredictionCache(**CACHE_SETTINGS)
+
+# Drift of the submitted inputs and predictions against the training data, when a reference has been built
+@st.cache_resource
+def get_drift_monitor():
+    """
+    Starts the drift monitor once per server process and shares it across sessions.
 
     Returns:
-        int: Numerical representation of the level.
+        DriftMonitor: Monitor of the inputs reaching the model, or None if there is no drift reference.
     """
-    level_map = {
-        "Normal": 1,
-        "Above Normal": 2,
-        "Well Above Normal": 3
-    }
-    return level_map.get(level, 1)  # Default to 1 if not found
+    if not os.path.exists(DRIFT_SETTINGS['reference']):
+        return None
+    return DriftMonitor.load(**DRIFT_SETTINGS)
 
-def convert_number_to_level(number):
+# Database connection setup
+@st.cache_resource
+def get_db_pool():
     """
-    Converts numerical representation of a level to its text representation.
+    Creates the PostgreSQL connection pool once per server process and shares it across sessions.
 
-    Args:
-        number (int): Numerical representation of the level.
+    Returns:
+        ConnectionPool: Pool of connections to the PostgreSQL database.
+    """
+    return ConnectionPool(**POOL_SETTINGS, **DB_SETTINGS)
+
+# Runs the database and model stages of the dashboards concurrently, with a timeout per stage
+@st.cache_resource
+def get_stage_runner():
+    """
+    Starts the stage executors once per server process and shares them across sessions.
 
     Returns:
-        str: Text representation of the level.
+        StageRunner: Runner of database and model stages with per-stage timeouts.
     """
-    level_map = {
-        1: "Normal",
-        2: "Above Normal",
-        3: "Well Above Normal"
-    }
-    return level_map.get(number, "Normal") 
+    return StageRunner(get_db_pool())
 
-# Definitions for the options in each select box
-bp_options = ["Normal", "Above Normal", "Well Above Normal"]
+# Exports the latency metrics and profiles slow page loads, configured by environment variables
+@st.cache_resource
+def start_instrumentation():
+    """
+    Starts the metrics exporters and the slow request profiler once per server process.
 
-def get_index_from_level(level, options):
+    Returns:
+        SlowRequestProfiler: Profiler of page loads slower than the configured threshold.
     """
-    Retrieves the index of a level in the given options list.
+    if METRICS_SETTINGS['port'] is not None:
+        start_http_server(METRICS_SETTINGS['port'])
+    if METRICS_SETTINGS['file']:
+        start_file_exporter(METRICS_SETTINGS['file'], METRICS_SETTINGS['interval'])
+    return SlowRequestProfiler(**PROFILE_SETTINGS)
 
-    Args:
-        level (str): Text representation of the level.
-        options (list): List of options.
+# Signed session tokens, so logged-in users are recognised across reruns, restarts and workers without a query
+@st.cache_resource
+def get_session_manager():
+    """
+    Opens the configured session store once per server process and shares it across sessions.
 
     Returns:
-        int: Index of the level in the options list.
+        SessionManager: Issuer and validator of session tokens.
     """
-    try:
-        return options.index(level)
-    except ValueError:
-        return 0
+    return default_session_manager()
 
-def analyze_blood_pressure(diastolic_bp, systolic_bp):
+def in_script_context(func):
     """
-    Analyzes blood pressure levels and provides feedback for the user.
+    Wraps a function so it can use Streamlit caches from an executor thread on behalf of the current session.
 
     Args:
-        diastolic_bp (float): Diastolic blood pressure value.
-        systolic_bp (float): Systolic blood pressure value.
+        func (callable): The function to run on another thread.
+
+    Returns:
+        callable: The function, attaching the session's script context to the thread that calls it.
     """
-    # Diastolic BP
-    if diastolic_bp < 80:
-        st.success("Your diastolic blood pressure is normal.")
-    elif 80 <= diastolic_bp < 90:
-        st.warning("Your diastolic blood pressure is at risk level. Consider monitoring it regularly. Recommended to adhere to a low-sodium diet and stay hydrated.")
-    else:
-        st.error("Your diastolic blood pressure is very high. Seek medical attention immediately.")
+    ctx = get_script_run_ctx()
 
-    # Systolic BP
-    if systolic_bp < 120:
-        st.success("Your systolic blood pressure is normal.")
-    elif 120 <= systolic_bp < 140:
-        st.warning("Your systolic blood pressure is at risk level. Consider monitoring it regularly. Recommend adhering to a low-sodium diet and staying hydrated.")
-    else:
-        st.error("Your systolic blood pressure is very high. Seek medical attention immediately.")
+    def run(*args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args)
+    return run
 
-def analyze_cholesterol(cholesterol):
+def stage_result(result, message=None):
     """
-    Analyzes cholesterol levels and provides feedback for the user.
+    Unwraps the result of a dashboard stage, degrading to a warning if the stage timed out.
 
     Args:
-        cholesterol (str): Cholesterol level.
+        result (object): Result returned by StageRunner.run for the stage.
+        message (str, optional): Warning shown if the stage timed out. Defaults to showing nothing.
+
+    Returns:
+        object: The result of the stage, or None if it timed out.
+    """
+    if isinstance(result, StageTimeout):
+        if message:
+            st.warning(message)
+        return None
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+def fetch_row(cur, query, params):
+    """
+    Runs a query and returns its first row, or None if there is none.
     """
-    if cholesterol == "Normal":
-        st.success("Your cholesterol level is normal.")
-    elif cholesterol == "Above Normal":
-        st.warning("Your cholesterol level is above normal. Recommended to have a diet low in saturated fats and cholesterol. Recommended to exercise 3 times a week.")
-    else:
-        st.error("Your cholesterol level is well above normal. Seek medical attention.")
+    cur.execute(query, params)
+    return cur.fetchone()
 
-def analyze_glucose(glucose):
+def predict_risk(feature_array):
     """
-    Analyzes glucose levels and provides feedback for the user.
+    Predicts cardiovascular disease for encoded inputs, through the shared prediction cache, and queues them
+    for the drift monitor.
 
     Args:
-        glucose (str): Glucose level.
+        feature_array (numpy.ndarray): Encoded inputs of shape (1, 11).
+
+    Returns:
+        numpy.ndarray: The predicted class.
     """
-    if glucose == "Normal":
-        st.success("Your glucose level is normal.")
-    elif glucose == "Above Normal":
-        st.warning("Your glucose level is above normal. Recommended to reduce intake of sugary and high-carbohydrate foods. Recommended to exercise 3 times a week.")
-    else:
-        st.error("Your glucose level is well above normal. Seek medical attention.")
-        
-# Helper Functions for analysis by physician
-def analyze_blood_pressure_physician(diastolic_bp, systolic_bp):
+    model = get_model()
+    prediction, proba = get_prediction_cache().predict_with_proba(model, feature_array)
+    monitor = get_drift_monitor()
+    if monitor is not None:
+        monitor.observe(feature_array, prediction, proba[:, 1], model_version=model.version)
+    return prediction
+
+@timed('login')
+def authenticate_user(username, password):
     """
-    Analyzes blood pressure levels and provides feedback for the physician.
+    Authenticates the user based on the provided username and password.
 
     Args:
-        diastolic_bp (float): Diastolic blood pressure value.
-        systolic_bp (float): Systolic blood pressure value.
+        username (str): The username of the user.
+        password (str): The password of the user.
+
+    Returns:
+        tuple: A tuple containing the user ID and user type if authentication is successful, otherwise None.
     """
-    # Diastolic BP
-    if diastolic_bp < 80:
-        st.success("Patient's diastolic blood pressure is normal.")
-    elif 80 <= diastolic_bp < 90:
-        st.warning("Patient's diastolic blood pressure is at risk level. Consider monitoring it regularly. Recommend the patient to adhere to a low-sodium diet and stay hydrated.")
-    else:
-        st.error("Patient's diastolic blood pressure is very high. Recommend the patient to adhere to a low-sodium diet and stay hydrated. Provide medical intervention.")
+    with get_db_pool().connection() as conn:
+        with conn.cursor() as cur:
+            user_info = authenticate(cur, username, password)
+        # Keeps the upgraded hash of a legacy password, if there was one
+        conn.commit()
+    return user_info
 
-    # Systolic BP
-    if systolic_bp < 120:
-        st.success("Patient's systolic blood pressure is normal.")
-        
+def restore_session():
+    """
+    Resolves the session token of a returning user, kept in an HttpOnly cookie, to the logged-in user, without
+    querying the database.
 
-def analyze_cholesterol_physician(cholesterol):
+    Sessions outlive server restarts and are shared by the workers of a host when the session store is a
+    file or SQLite database. A revoked or expired token logs the user out.
     """
-    Analyzes the cholesterol level of a patient and provides recommendations for a physician.
+    token = st.session_state.get('session_token')
+    if token is None and not st.session_state.get('logged_out'):
+        token = st.context.cookies.get(SESSION_COOKIE)
+    if token is None:
+        return
+    try:
+        st.session_state['user_id'], st.session_state['user_type'] = get_session_manager().validate(token)
+        st.session_state['session_token'] = token
+    except InvalidToken:
+        for key in ('user_id', 'user_type', 'session_token'):
+            st.session_state.pop(key, None)
+        st.session_state['logged_out'] = True
+        st.session_state['cookie_update'] = None
 
-    Args:
-        cholesterol (str): The cholesterol level of the patient.
+def update_session_cookie():
+    """
+    Has the browser store a newly issued session token in the session cookie, or clear it after a logout.
+    The cookie is set by the session route of server.py; without it, logins last until the page is reloaded.
+    """
+    if 'cookie_update' in st.session_state:
+        st.html(cookie_script(st.session_state.pop('cookie_update'), st.get_option('server.baseUrlPath')),
+                unsafe_allow_javascript=True)
 
-    Notes:
-        This function displays messages based on the cholesterol level and recommends appropriate actions for a physician.
+def show_recommendations(feature_array, prediction, audience):
+    """
+    Displays the prediction and the health recommendations for a submitted form.
 
-    Recommendations:
-        - If cholesterol level is normal, display a success message.
-        - If cholesterol level is above normal, display a warning message and recommend a diet low in saturated fats and cholesterol, along with regular exercise.
-        - If cholesterol level is well above normal, display an error message and recommend a diet low in saturated fats and cholesterol, regular exercise, and prescription of medication to manage cholesterol levels.
+    Args:
+        feature_array (numpy.ndarray): Encoded inputs of shape (1, 11).
+        prediction (int): Predicted class.
+        audience (str): 'patient' or 'physician', selecting how the messages are worded.
     """
-    if cholesterol == "Normal":
-        st.success("Patient's cholesterol level is normal.")
-    elif cholesterol == "Above Normal":
-        st.warning("Patient's cholesterol level is above normal. Recommend diet low in saturated fats and cholesterol. Suggest regular exercise.")
-    else:
-        st.error("Patient's cholesterol level is well above normal. Recommend diet low in saturated fats and cholesterol. Suggest regular exercise. Prescribe medication to manage cholesterol levels.")
+    for kind, text in recommend(feature_array[0], prediction, audience):
+        if kind == 'heading':
+            st.write(text)
+        else:
+            getattr(st, kind)(text)
 
-def analyze_glucose_physician(glucose):
+@timed('explain')
+def show_explanation(feature_array, audience):
     """
-    Analyzes the glucose level of a patient and provides recommendations for a physician.
+    Displays the inputs that drove the prediction the most, from the model's per-feature contributions. Nothing
+    is shown when the prediction came from another model version than the local artifact, e.g. a scoring
+    service not yet updated, or when no input had an effect.
 
     Args:
-        glucose (str): The glucose level of the patient.
+        feature_array (numpy.ndarray): Encoded inputs of shape (1, 11).
+        audience (str): 'patient' or 'physician'; physicians also see each contribution in log-odds.
+    """
+    explainer = load_explainer_version(*current_artifact())
+    if explainer is None or explainer.version != get_model().version:
+        return
+    factors = top_factors(feature_array[0], explainer.explain(feature_array[0]))
+    if not factors:
+        return
+    st.write("### What Drove This Prediction:")
+    lines = []
+    for label, value, contribution in factors:
+        effect = "raises the risk" if contribution > 0 else "lowers the risk"
+        if audience == 'physician':
+            effect += f" ({contribution:+.2f} log-odds)"
+        lines.append(f"- **{label}** ({value}): {effect}")
+    st.write("\n".join(lines))
 
-    Notes:
-        This function displays messages based on the glucose level and recommends appropriate actions for a physician.
 
-    Recommendations:
-        - If glucose level is normal, display a success message.
-        - If glucose level is above normal, display a warning message and recommend patient to reduce intake of sugary and high-carbohydrate foods, along with regular exercise.
-        - If glucose level is well above normal, display an error message and recommend patient to reduce intake of sugary and high-carbohydrate foods, suggest regular exercise, and provide medical intervention.
+def show_risk_trend(trend):
     """
-    if glucose == "Normal":
-        st.success("Patient's glucose level is normal.")
-    elif glucose == "Above Normal":
-        st.warning("Patient's glucose level is above normal. Recommend patient to reduce intake of sugary and high-carbohydrate foods. Suggest regular exercise.")
-    else:
-        st.error("Patient's glucose level is well above normal. Recommend patient to reduce intake of sugary and high-carbohydrate foods. Suggest regular exercise. Provide medical intervention.")
+    Displays the trend of a patient's readings: the latest predicted risk and how it changed since the reading
+    before, the mean blood pressure of the last 5 readings and the recent readings.
+
+    Args:
+        trend (tuple): Row of queries.PATIENT_RISK_TREND.
+    """
+    readings, latest_at, risk, risk_delta, mean_diastolic, mean_systolic, recorded_at, diastolic, systolic, _ = trend
+    st.write("### Risk Trend:")
+    left, middle, right = st.columns(3)
+    left.metric("Predicted risk", "High" if risk == 1 else "Low",
+                delta=f"{risk_delta:+d} since the previous reading" if risk_delta else None, delta_color="inverse")
+    if mean_systolic is not None:
+        middle.metric("Mean systolic pressure, last 5 readings", f"{mean_systolic:.0f}",
+                      delta=f"{systolic[0] - mean_systolic:+.0f} in the latest reading", delta_color="inverse")
+    if mean_diastolic is not None:
+        right.metric("Mean diastolic pressure, last 5 readings", f"{mean_diastolic:.0f}",
+                     delta=f"{diastolic[0] - mean_diastolic:+.0f} in the latest reading", delta_color="inverse")
+    st.write("Recent blood pressure, newest first: " +
+             ", ".join(f"{high}/{low}" for high, low in zip(systolic, diastolic)))
+    st.caption(f"{readings} readings, the latest on {latest_at:%Y-%m-%d %H:%M}")
+
+
+def load_more_patients():
+    """
+    Appends the next page of matches to the physician's current patient search.
+    """
+    search = st.session_state['patient_search']
+    runner = get_stage_runner()
+    [page] = runner.run(runner.query('fetch', search_patients, search['physician_id'], search['query'],
+                                     PAGE_SIZE, search['cursor']))
+    page = stage_result(page, "Loading more patients is taking longer than expected. Please try again.")
+    if page is not None:
+        rows, cursor = page
+        search['rows'] = search['rows'] + rows
+        search['cursor'] = cursor
 
 
 def physician_page(user_id):
@@ -251,119 +401,96 @@ def physician_page(user_id):
     Args:
         user_id (str): The ID of the logged-in physician.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
+    runner = get_stage_runner()
     st.title("Physician Dashboard")
-    st.write("Type to search and select a patient to update their information and see the risk of cardiovascular disease.")
 
-    # Fetch all patients assigned to the logged-in physician
-    cur.execute("""SELECT p."User ID", p."First Name", p."Last Name"
-                   FROM patient p JOIN physicianpatientlink pl ON p."User ID" = pl."Patient ID"
-                   WHERE pl."Physician ID" = %s""", (user_id,))
-    patients = cur.fetchall()
-
-    # Store patients in a dictionary for easier access
-    patient_dict = {f"{patient[1]} {patient[2]}": patient[0] for patient in patients}
+    # Report a queued update from an earlier submission that could not be saved
+    pending_update = st.session_state.get('pending_update')
+    if pending_update is not None and pending_update.done():
+        del st.session_state['pending_update']
+        if pending_update.exception() is not None:
+            st.error(f"An earlier patient update could not be saved: {pending_update.exception()}")
+    st.write("Type to search and select a patient to update their information and see the risk of cardiovascular disease.")
 
-    # Input for dynamic search
+    # Input for dynamic search; matching runs in the database one page at a time, while the model loads
     search_query = st.text_input("Search for a patient by name")
-
-    # Filter patients as per the search query
-    filtered_names = [name for name in patient_dict.keys() if search_query.lower() in name.lower()]
-
-    # Selectbox with filtered options
-    selected_name = st.selectbox("Select a Patient", filtered_names, key="patient_select")
+    search = st.session_state.get('patient_search')
+    if search is None or search['physician_id'] != user_id or search['query'] != search_query:
+        page, _ = runner.run(runner.query('fetch', search_patients, user_id, search_query),
+                             runner.call_model('load', in_script_context(get_model)))
+        page = stage_result(page, "Patient search is taking longer than expected. Please try again.")
+        if page is None:
+            return
+        rows, cursor = page
+        search = {'physician_id': user_id, 'query': search_query, 'rows': rows, 'cursor': cursor}
+        st.session_state['patient_search'] = search
+
+    # Selectbox with the matches fetched so far
+    selected_patient = st.selectbox("Select a Patient", search['rows'], key="patient_select",
+                                    format_func=lambda patient: f"{patient[1]} {patient[2]}")
+    if search['cursor'] is not None:
+        st.button(f"Show more than {len(search['rows'])} matches", on_click=load_more_patients)
     # Get the details of the selected patient
-    if selected_name:
-        patient_id = patient_dict[selected_name]
-        cur.execute("""SELECT p."First Name", p."Last Name", p."age", p."gender", p."height", p."weight", 
-               p."Smoke History", p."Alcohol Consumption", p."Exercise Level", m."Diastolic Blood Pressure", 
-               m."Systolic Blood Pressure", m."cholesterol", m."glucose"
-               FROM patient p 
-               JOIN medicaltest m ON p."User ID" = m."Patient ID" 
-               WHERE m."Patient ID" = %s""", (patient_id,))
-        patient_info = cur.fetchone()
+    if selected_patient:
+        patient_id = selected_patient[0]
+        # The patient's details and risk trend are two index lookups, run side by side
+        patient_info, trend = runner.run(runner.query('fetch', fetch_row, queries.PHYSICIAN_PATIENT_DETAILS, (patient_id,)),
+                                         runner.query('fetch', fetch_row, queries.PATIENT_RISK_TREND, (patient_id,)))
+        patient_info = stage_result(patient_info, "Patient details are taking longer than expected to load. Please try again.")
+        trend = stage_result(trend)
 
         if patient_info:
+            if trend and trend[1] is not None:
+                show_risk_trend(trend)
             with st.form(key='patient_details_form'):
                 age = st.number_input("Age", value=patient_info[2])
-                gender = st.selectbox("Gender", options=["Male", "Female"], index=["Male", "Female"].index(convert_number_to_gender(patient_info[3])))
+                gender = st.selectbox("Gender", options=options('gender'), index=option_index('gender', patient_info[3]))
                 height = st.number_input("Height (in cm)", value=patient_info[4])
                 weight = st.number_input("Weight (in kg)", value=float(patient_info[5]), format="%.2f")
-                smoke_history = st.selectbox("Smoke History", ["Yes", "No"], index=convert_to_number(patient_info[6]))
-                alcohol_consumption = st.selectbox("Alcohol Consumption", ["Yes", "No"], index=convert_to_number(patient_info[7]))
-                exercise_level = st.selectbox("Exercise Regularly", ["Yes", "No"], index=convert_to_number(patient_info[8]))
+                smoke_history = st.selectbox("Smoke History", options('smoke'), index=option_index('smoke', patient_info[6]))
+                alcohol_consumption = st.selectbox("Alcohol Consumption", options('alco'), index=option_index('alco', patient_info[7]))
+                exercise_level = st.selectbox("Exercise Regularly", options('active'), index=option_index('active', patient_info[8]))
                 diastolic_bp = st.number_input("Diastolic Blood Pressure", min_value=40, max_value=200, value=int(patient_info[9]))
                 systolic_bp = st.number_input("Systolic Blood Pressure", min_value=70, max_value=300, value=int(patient_info[10]))
-                cholesterol = st.selectbox("Cholesterol", bp_options, index=get_index_from_level(patient_info[11], bp_options))
-                glucose = st.selectbox("Glucose", bp_options, index=get_index_from_level(patient_info[12], bp_options))# Additional fields can be displayed and edited here
+                cholesterol = st.selectbox("Cholesterol", options('cholesterol'), index=option_index('cholesterol', patient_info[11]))
+                glucose = st.selectbox("Glucose", options('gluc'), index=option_index('gluc', patient_info[12]))# Additional fields can be displayed and edited here
 
                 submit_button = st.form_submit_button("Update Patient Information and Predict Cardiovascular Results")
 
                 if submit_button:
-                    feature_array = np.array([[convert_gender_to_number(gender), height, weight, systolic_bp, diastolic_bp,  
-                                                   convert_level_to_number(cholesterol), convert_level_to_number(glucose),
-                                                   convert_to_number(smoke_history), convert_to_number(alcohol_consumption), convert_to_number(exercise_level), age]
-                                                  ]).reshape(1, -1)
-                    prediction = model.predict(feature_array)
-                    cur.execute("""
-                            UPDATE patient SET "age" = %s, "gender" = %s, "height" = %s, "weight" = %s,
-                            "Smoke History" = %s, "Alcohol Consumption" = %s, "Exercise Level" = %s
-                            WHERE "User ID" = %s
-                        """, (int(age), int(convert_gender_to_number(gender)), int(height), float(weight),
-          convert_to_number(smoke_history), convert_to_number(alcohol_consumption), convert_to_number(exercise_level), int(patient_id)))
-                        
-                        # Update current medical record
-                    cur.execute("""
-                            UPDATE medicaltest SET "Diastolic Blood Pressure"= %s, "Systolic Blood Pressure"= %s, "cholesterol"= %s, "glucose"= %s, "Cardiovascular Disease"= %s
-                            WHERE "Patient ID" = %s
-                        """, (int(diastolic_bp), int(systolic_bp), int(convert_level_to_number(cholesterol)), int(convert_level_to_number(glucose)), int(prediction[0]), int(patient_id)))
-                    conn.commit()
-                        
-                    if prediction[0] == 1:
-                        st.write('# Cardiovascular Disease Prediction:')
-                        st.error(f"Based on patient's information, the patient is at high risk of cardiovascular disease. Medical assistance is advised.")
-                        st.write('# Recommendations Based on Patient Information:')
-                    else:
-                        st.write('# Cardiovascular Disease Prediction:')
-                        st.success(f"Based on patient's information, the patient is not at risk of cardiovascular disease.")
-                        st.write('# Recommendations Based on Patient Information:')
-
-                        # Additional health recommendations as per previous message
-                    st.write('### Body Mass Index:')
-                    bmi = weight / ((height / 100) ** 2)
-                    if bmi >= 25:
-                        st.warning(f"The patient's body mass index is {bmi:.1f}. Suggest weight loss measures to mitigate the risk of cardiovascular diseases.")
-                    else:
-                        st.success(f"The patient's body mass index is normal.")
-                        # Blood Pressure Analysis
-                    st.write('### Diastolic & Systolic Blood Pressure:')
-                    analyze_blood_pressure_physician(diastolic_bp, systolic_bp)
-                        # Cholesterol and Glucose Analysis
-                    analyze_cholesterol_physician(cholesterol)
-                    st.write('### Glucose Level:')
-                    analyze_glucose_physician(glucose)
-                    
-                    st.write('### Life Style:')
-                        # Lifestyle Recommendations
-                    if smoke_history == "Yes":
-                        st.warning("Recommend the patient discontinues smoking to enhance their overall health and diminish the risk of cardiovascular disease.")
-                    else:
-                        st.success("Patient is not smoking.")
-                    if alcohol_consumption == "Yes":
-                        st.warning("Advise the patient to decrease or discontinue alcohol consumption.")
+                    submit_start = time.perf_counter()
+                    feature_array = encode({'gender': gender, 'height': height, 'weight': weight, 'ap_hi': systolic_bp,
+                                            'ap_lo': diastolic_bp, 'cholesterol': cholesterol, 'gluc': glucose,
+                                            'smoke': smoke_history, 'alco': alcohol_consumption,
+                                            'active': exercise_level, 'ageinyears': age})
+                    [prediction] = runner.run(runner.call_model('predict', in_script_context(predict_risk), feature_array))
+                    prediction = stage_result(prediction)
+                    if prediction is None:
+                        st.error("The risk prediction is taking longer than expected. Patient information was not updated, please submit again.")
+                        return
+                    encoded = dict(zip(FEATURE_NAMES, feature_array[0]))
+
+                    # Save the patient and append the measurements as a new medical test
+                    if WRITE_BEHIND:
+                        st.session_state['pending_update'] = get_background_writer().submit(
+                            user_id, patient_id, encoded, age, prediction[0])
                     else:
-                        st.success("Patient is not consuming alcohol.")
-                    if exercise_level == "No":
-                        st.info("Recommend the patient to enegage in regular exerice, a minimum of three times per week.")
-                    else:
-                        st.success("Patient is exercising regularly.")
+                        [test_id] = runner.run(runner.query('save', save_patient_test, user_id, patient_id, encoded, age,
+                                                            prediction[0], commit=True))
+                        test_id = stage_result(test_id)
                     
-                    st.write('### Information Update Confirmation:')
-                    st.success("Patient information updated successfully.")
+                    with timed('render'):
+                        show_recommendations(feature_array, prediction[0], 'physician')
+                    show_explanation(feature_array, 'physician')
 
-    cur.close()
-    conn.close()
+                    st.write('### Information Update Confirmation:')
+                    if WRITE_BEHIND:
+                        st.success("Patient information update queued.")
+                    elif test_id is not None:
+                        st.success("Patient information updated successfully.")
+                    else:
+                        st.warning("Saving the patient information took longer than expected and was cancelled. Please submit again.")
+                    st.caption(f"Submitted in {(time.perf_counter() - submit_start) * 1000:.0f} ms")
 
 
 def patient_page(user_id):
@@ -376,10 +503,14 @@ def patient_page(user_id):
     st.title("Patient Dashboard")
     st.write("Welcome to your dashboard! Experiment by adjusting your information below and see the cardiovascular disease risk and health suggestions.")
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""SELECT "First Name", "Last Name", "age", "gender", "Contact Information", "height", "weight", "Smoke History", "Alcohol Consumption", "Exercise Level", "Diastolic Blood Pressure", "Systolic Blood Pressure", "cholesterol", "glucose" FROM users u JOIN patient p ON u."User ID" = p."User ID" JOIN medicaltest m ON p."User ID" = m."Patient ID" WHERE p."User ID"=%s""", (user_id,))
-    patient_details = cur.fetchone()
+    # Fetch the patient's record while the model loads
+    runner = get_stage_runner()
+    patient_details, model = runner.run(runner.query('fetch', fetch_row, queries.PATIENT_DETAILS, (user_id,)),
+                                        runner.call_model('load', in_script_context(get_model)))
+    if isinstance(patient_details, StageTimeout):
+        st.error("Your details are taking longer than expected to load. Please try again in a moment.")
+        return
+    patient_details = stage_result(patient_details)
 
     if not patient_details:
         st.error("An error occurred while fetching patient details.")
@@ -390,74 +521,103 @@ def patient_page(user_id):
         first_name = st.text_input("First Name", patient_details[0])
         last_name = st.text_input("Last Name", patient_details[1])
         age = st.number_input("Age", value=patient_details[2])
-        gender = st.selectbox("Gender", options=["Male", "Female"], index=["Male", "Female"].index(convert_number_to_gender(patient_details[3])))
+        gender = st.selectbox("Gender", options=options('gender'), index=option_index('gender', patient_details[3]))
         contact_info = st.text_input("Email", patient_details[4])
         height = st.number_input("Height (in cm)", value=patient_details[5])
         weight = st.number_input("Weight (in kg)", value=float(patient_details[6]), format="%.2f")
-        smoke_history = st.selectbox("Smoke History", ["Yes", "No"], index=convert_to_number(patient_details[7]))
-        alcohol_consumption = st.selectbox("Alcohol Consumption", ["Yes", "No"], index=convert_to_number(patient_details[8]))
-        exercise_level = st.selectbox("Exercise Regularly", ["Yes", "No"], index=convert_to_number(patient_details[9]))
+        smoke_history = st.selectbox("Smoke History", options('smoke'), index=option_index('smoke', patient_details[7]))
+        alcohol_consumption = st.selectbox("Alcohol Consumption", options('alco'), index=option_index('alco', patient_details[8]))
+        exercise_level = st.selectbox("Exercise Regularly", options('active'), index=option_index('active', patient_details[9]))
         diastolic_bp = st.number_input("Diastolic Blood Pressure", min_value=40, max_value=200, value=int(patient_details[10]))
         systolic_bp = st.number_input("Systolic Blood Pressure", min_value=70, max_value=300, value=int(patient_details[11]))
-        cholesterol = st.selectbox("Cholesterol", bp_options, index=get_index_from_level(patient_details[12], bp_options))
-        glucose = st.selectbox("Glucose", bp_options, index=get_index_from_level(patient_details[13], bp_options))
+        cholesterol = st.selectbox("Cholesterol", options('cholesterol'), index=option_index('cholesterol', patient_details[12]))
+        glucose = st.selectbox("Glucose", options('gluc'), index=option_index('gluc', patient_details[13]))
 
         submit_button = st.form_submit_button(label='Check Cardiovascular Disease Risk and Get Health Suggestions')
 
         if submit_button:
             # Prepare data for standardization and prediction
-            feature_array = np.array([
-                [convert_gender_to_number(gender), height, weight, systolic_bp, diastolic_bp,  
-                convert_level_to_number(cholesterol), convert_level_to_number(glucose),
-                convert_to_number(smoke_history), convert_to_number(alcohol_consumption), convert_to_number(exercise_level), age]
-            ]).reshape(1, -1)
+            feature_array = encode({'gender': gender, 'height': height, 'weight': weight, 'ap_hi': systolic_bp,
+                                    'ap_lo': diastolic_bp, 'cholesterol': cholesterol, 'gluc': glucose,
+                                    'smoke': smoke_history, 'alco': alcohol_consumption,
+                                    'active': exercise_level, 'ageinyears': age})
             # Make prediction of result
-            prediction = model.predict(feature_array)
+            [prediction] = runner.run(runner.call_model('predict', in_script_context(predict_risk), feature_array))
+            prediction = stage_result(prediction)
+            if prediction is None:
+                st.error("The risk prediction is taking longer than expected. Please submit again.")
+                return
+            with timed('render'):
+                show_recommendations(feature_array, prediction[0], 'patient')
+            show_explanation(feature_array, 'patient')
+
+    # Live what-if exploration, if a risk table has been built for the model in use
+    grid = get_risk_grid(model.version) if not isinstance(model, BaseException) else None
+    if grid is not None:
+        what_if_explorer(grid, {'gender': patient_details[3], 'height': patient_details[5],
+                                'weight': float(patient_details[6]), 'ap_hi': int(patient_details[11]),
+                                'ap_lo': int(patient_details[10]), 'cholesterol': patient_details[12],
+                                'gluc': patient_details[13], 'smoke': patient_details[7],
+                                'alco': patient_details[8], 'active': patient_details[9],
+                                'ageinyears': patient_details[2]})
+
+
+@st.fragment
+@timed('what_if')
+def what_if_explorer(grid, baseline):
+    """
+    Lets the patient see how changing their weight, blood pressure, levels and lifestyle would move their risk.
+
+    Every change reruns only this section and reads the risk from the precomputed table, with a button to
+    confirm the explored values with the model.
+
+    Args:
+        grid (RiskGrid): The precomputed risk table.
+        baseline (dict): The patient's stored inputs keyed by model column, categorical ones as numbers.
+    """
+    st.write("## What-if Explorer")
+    st.write("See how changes would affect your risk. The estimate updates as you move the sliders.")
+    baseline_record = encode(baseline)
+    snapped = dict(zip(FEATURE_NAMES, grid.snap(baseline_record)[0]))
+
+    def axis_slider(label, name):
+        start, step, count = grid.axes[FEATURE_NAMES.index(name)]
+        return st.slider(label, min_value=int(start), max_value=int(start + step * (count - 1)), step=int(step),
+                         value=int(snapped[name]), key=f"what_if_{name}")
+
+    left, right = st.columns(2)
+    with left:
+        weight = axis_slider("Weight (in kg)", 'weight')
+        systolic_bp = axis_slider("Systolic Blood Pressure", 'ap_hi')
+        diastolic_bp = axis_slider("Diastolic Blood Pressure", 'ap_lo')
+    with right:
+        cholesterol = st.select_slider("Cholesterol", options('cholesterol'), key="what_if_cholesterol",
+                                       value=decode('cholesterol', baseline['cholesterol']))
+        glucose = st.select_slider("Glucose", options('gluc'), key="what_if_gluc",
+                                   value=decode('gluc', baseline['gluc']))
+        smoke = st.toggle("Smoking", value=baseline['smoke'] == 1, key="what_if_smoke")
+        alcohol = st.toggle("Drinking alcohol", value=baseline['alco'] == 1, key="what_if_alco")
+        active = st.toggle("Exercising regularly", value=baseline['active'] == 1, key="what_if_active")
+
+    record = encode(dict(baseline, weight=weight, ap_hi=systolic_bp, ap_lo=diastolic_bp, cholesterol=cholesterol,
+                         gluc=glucose, smoke=int(smoke), alco=int(alcohol), active=int(active)))
+    risk = grid.lookup(record[0])
+    change = risk - grid.lookup(baseline_record[0])
+    st.metric("Estimated risk of cardiovascular disease", f"{risk:.0%}",
+              delta=f"{change * 100:+.0f} points from your current values", delta_color="inverse")
+    st.caption("Estimated from risk precomputed on a grid of values; age and height are rounded to the grid as well.")
+
+    if st.button("Confirm with the model", key="what_if_confirm"):
+        runner = get_stage_runner()
+        [result] = runner.run(runner.call_model('predict', in_script_context(lambda X: get_model().predict_with_proba(X)),
+                                                record))
+        result = stage_result(result, "The model is taking longer than expected. Please try again.")
+        if result is not None:
+            prediction, proba = result
             if prediction[0] == 1:
-                st.write('# Cardiovascular Disease Prediction:')
-                st.error(f"Based on your inputs, you are at high risk of cardiovascular disease, please seek professional medical help.")
-                st.write('# Recommendations Based on Your Input:')
-            else:
-                st.write('# Cardiovascular Disease Prediction:')
-                st.success(f"Based on your inputs, you are not at risk of cardiovascular disease. Keep it up!")
-                st.write('# Recommendations Based on Your Input:')
-
-            # Additional health recommendations as per previous message
-            st.write('### Body Mass Index:')
-            bmi = weight / ((height / 100) ** 2)
-            if bmi >= 25:
-                st.warning(f"Your Body Mass Index is {bmi:.1f}. It's recommended to lose weight to lower your risk of cardiovascular disease.")
-            else:
-                st.success(f"Your Body Mass Index is normal. Keep it up!")
-            
-            st.write('### Diastolic & Systolic Blood Pressure:')
-            # Blood Pressure Analysis
-            analyze_blood_pressure(diastolic_bp, systolic_bp)
-            
-            st.write('### Cholesterol Level:')
-            # Cholesterol and Glucose Analysis
-            analyze_cholesterol(cholesterol)
-            
-            st.write('### Glucose Level:')
-            analyze_glucose(glucose)
-            
-            st.write('### Life Style:')
-            # Lifestyle Recommendations
-            if smoke_history == "Yes":
-                st.warning("It is strongly advised to stop smoking to improve your overall health and lower your risk of cardiovascular disease.")
+                st.error(f"The model confirms a high risk of cardiovascular disease for these values ({proba[0, 1]:.0%}).")
             else:
-                st.success("Opting not to smoke can lead to better health outcomes and a higher quality of life. Keep it up!")
-            if alcohol_consumption == "Yes":
-                st.warning("Consider reducing your alcohol intake to lower your health risks and lower your risk of cardiovascular disease.")
-            else:
-                st.success("Choosing not to consume alcohol can support your overall health and well-being, promoting clarity of mind and a healthier lifestyle. Keep it up!")
-            if exercise_level == "No":
-                st.info("Regular exercise is recommended. Try to exercise at least 3 times a week.")
-            else:
-                st.success("Engaging in regular exercise can significantly enhance your physical fitness, mental well-being, and overall quality of life. Keep it up!")
-
-    cur.close()
-    conn.close()
+                st.success(f"The model confirms no high risk of cardiovascular disease for these values ({proba[0, 1]:.0%}).")
 
 
 def register_user():
@@ -477,24 +637,18 @@ def register_user():
         submit_button = st.form_submit_button("Register")
 
         if submit_button:
-            conn = get_db_connection()
-            cur = conn.cursor()
             try:
-                # Check if username already exists
-                cur.execute("SELECT * FROM users WHERE username = %s", (new_username,))
-                if cur.fetchone() is not None:
+                with get_db_pool().connection() as conn:
+                    # Insert the new user, unless the username already exists
+                    with conn.cursor() as cur:
+                        user_id = register(cur, new_username, new_password, new_user_type)
+                    conn.commit()
+                if user_id is None:
                     st.sidebar.error("Username already exists. Try another username.")
                 else:
-                    # Insert new user into the database
-                    cur.execute("INSERT INTO users (username, password, \"User Type\") VALUES (%s, %s, %s)",
-                                (new_username, new_password, new_user_type))
-                    conn.commit()
                     st.sidebar.success("User registered successfully!")
             except Exception as e:
                 st.sidebar.error(f"An error occurred: {e}")
-            finally:
-                cur.close()
-                conn.close()
 
 
 def set_bg_from_url(url, opacity=1):
@@ -550,56 +704,70 @@ def main():
     """
     Main function to set up the Streamlit layout, including background image, login/register functionality, and user-specific pages.
     """
-    # Set a background image from a URL with custom opacity
-    set_bg_from_url("https://images.everydayhealth.com/homepage/health-topics-2.jpg?w=768", opacity=0.875)
+    # Time the whole script run, and sample its stacks if it is slow
+    with start_instrumentation().request('page'), timed('page'):
+        # Set a background image from a URL with custom opacity
+        set_bg_from_url("https://images.everydayhealth.com/homepage/health-topics-2.jpg?w=768", opacity=0.875)
 
-    # Title and description
-    st.title('Welcome to Cardiovascular Disease Decision Support System')
-    st.write("Please utilize this Decision Support System to identify the likelihood of cardiovascular disease and recommend preventive actions")
+        # Title and description
+        st.title('Welcome to Cardiovascular Disease Decision Support System')
+        st.write("Please utilize this Decision Support System to identify the likelihood of cardiovascular disease and recommend preventive actions")
     
-    st.sidebar.title("User Login/Sign Up")
-
-    # Radio button for user to select either Login or Register
-    mode = st.sidebar.radio("Choose mode:", ["Login", "Register"])
-
-    if mode == "Login":
-        # Login section
-        if 'user_id' not in st.session_state or 'user_type' not in st.session_state:
-            username = st.sidebar.text_input("Username")
-            password = st.sidebar.text_input("Password", type="password")
-
-            if st.sidebar.button("Login"):
-                user_info = authenticate_user(username, password)
-                if user_info:
-                    st.session_state['user_id'], st.session_state['user_type'] = user_info
-                    st.write(f"Logged in as {user_info[1]}")
-                else:
-                    st.sidebar.error("Invalid username or password")
+        st.sidebar.title("User Login/Sign Up")
+
+        # Pick up the session of a returning user
+        restore_session()
+
+        # Radio button for user to select either Login or Register
+        mode = st.sidebar.radio("Choose mode:", ["Login", "Register"])
+
+        if mode == "Login":
+            # Login section
+            if 'user_id' not in st.session_state or 'user_type' not in st.session_state:
+                username = st.sidebar.text_input("Username")
+                password = st.sidebar.text_input("Password", type="password")
+
+                if st.sidebar.button("Login"):
+                    user_info = authenticate_user(username, password)
+                    if user_info:
+                        st.session_state['user_id'], st.session_state['user_type'] = user_info
+                        st.session_state['session_token'] = get_session_manager().issue(*user_info)
+                        st.session_state['cookie_update'] = st.session_state['session_token']
+                        st.session_state.pop('logged_out', None)
+                        st.write(f"Logged in as {user_info[1]}")
+                    else:
+                        st.sidebar.error("Invalid username or password")
     
-    elif mode == "Register":
-        # Registration section
-        register_user()
-
-    # Check if user is logged in
-    if 'user_id' in st.session_state and 'user_type' in st.session_state:
-        # Show a logout button in the sidebar
-        if st.sidebar.button("Logout"):
-            # Clear the session state when the user clicks logout
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
-            st.sidebar.success("You have been logged out.")
-            # Refresh the page to return to login/register selection
-            st.experimental_rerun()
-
-        # Display the appropriate page based on user type
-        if st.session_state['user_type'] == 'patient':
-            patient_page(st.session_state['user_id'])
-        elif st.session_state['user_type'] == 'physician':
-            physician_page(st.session_state['user_id'])
+        elif mode == "Register":
+            # Registration section
+            register_user()
+
+        # Check if user is logged in
+        if 'user_id' in st.session_state and 'user_type' in st.session_state:
+            # Show a logout button in the sidebar
+            if st.sidebar.button("Logout"):
+                # End the session and clear the session state when the user clicks logout
+                get_session_manager().revoke(st.session_state.get('session_token'))
+                for key in list(st.session_state.keys()):
+                    del st.session_state[key]
+                # The browser still sent the old cookie with this page load; ignore it and have it cleared
+                st.session_state['logged_out'] = True
+                st.session_state['cookie_update'] = None
+                st.sidebar.success("You have been logged out.")
+                # Refresh the page to return to login/register selection
+                st.rerun()
+
+            # Display the appropriate page based on user type
+            if st.session_state['user_type'] == 'patient':
+                patient_page(st.session_state['user_id'])
+            elif st.session_state['user_type'] == 'physician':
+                physician_page(st.session_state['user_id'])
+            else:
+                st.sidebar.error(f"Unhandled user type: {st.session_state['user_type']}")
         else:
-            st.sidebar.error(f"Unhandled user type: {st.session_state['user_type']}")
-    else:
-        st.sidebar.write("Please log in or register to continue.")
+            st.sidebar.write("Please log in or register to continue.")
+
+        update_session_cookie()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import STAGE_ERRORS, STAGE_SECONDS
+
+# Seconds each stage of a dashboard run may take before the page stops waiting for it and degrades
+STAGE_TIMEOUTS = {
+    'fetch': float(os.environ.get('CVD_FETCH_TIMEOUT', 3.0)),
+    'load': float(os.environ.get('CVD_MODEL_LOAD_TIMEOUT', 10.0)),
+    'predict': float(os.environ.get('CVD_PREDICT_TIMEOUT', 3.0)),
+    'save': float(os.environ.get('CVD_SAVE_TIMEOUT', 5.0)),
+}
+
+
+class StageTimeout(Exception):
+    """
+    Raised when a stage of a dashboard run does not finish within its timeout.
+    """
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"The {stage} stage did not finish within {timeout:g} seconds")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class _DatabaseCall:
+    """
+    State of one database call shared between its worker thread and the event loop waiting on it.
+
+    Until the call starts committing, a timeout cancels the running statement on the server, so the worker
+    thread and its pooled connection are freed instead of being held by a query nobody waits for.
+    Once the commit has been sent, the call is past the point of no return and the timeout waits for it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.cancelled = False
+        self.committing = False
+
+    def cancel(self):
+        """
+        Cancels the call, returning False if it is already committing.
+        """
+        with self.lock:
+            if self.committing:
+                return False
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.cancel()
+            return True
+
+
+class StageRunner:
+    """
+    Runs the database, model and write-back stages of a dashboard run on executors, with a timeout per stage.
+
+    Each Streamlit script run drives its stages from one event loop, so independent stages overlap, e.g. the
+    patient record is fetched while the model loads. Database work runs on its own threads, sized to the
+    connection pool, and model calls on a separate executor, so a slow query cannot hold up predictions.
+    A stage that times out raises StageTimeout, and timed-out queries are cancelled on the server.
+
+    Args:
+        pool (ConnectionPool): Pool providing the database connections.
+        model_workers (int, optional): Threads running model calls. Defaults to 2.
+        timeouts (dict, optional): Seconds per stage, overriding STAGE_TIMEOUTS.
+    """
+
+    def __init__(self, pool, model_workers=2, timeouts=None):
+        self.pool = pool
+        self.timeouts = dict(STAGE_TIMEOUTS, **(timeouts or {}))
+        self._db_executor = ThreadPoolExecutor(pool.maxconn, thread_name_prefix='cvd-db')
+        self._model_executor = ThreadPoolExecutor(model_workers, thread_name_prefix='cvd-model')
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, stage, seconds, timed_out):
+        with self._lock:
+            stats = self._stats.setdefault(stage, {'calls': 0, 'timeouts': 0, 'seconds_total': 0.0,
+                                                   'seconds_max': 0.0})
+            stats['calls'] += 1
+            stats['timeouts'] += timed_out
+            stats['seconds_total'] += seconds
+            stats['seconds_max'] = max(stats['seconds_max'], seconds)
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        if timed_out:
+            STAGE_ERRORS.inc(stage=stage, error=StageTimeout.__name__)
+
+    async def query(self, stage, func, *args, commit=False):
+        """
+        Runs `func(cur, *args)` on a pooled connection in a database thread.
+
+        Args:
+            stage (str): Name of the stage, selecting its timeout.
+            func (callable): Function running the statements on the cursor it is given.
+            *args: Further arguments of `func`.
+            commit (bool, optional): Commit after `func` returns. Defaults to False.
+
+        Returns:
+            object: The return value of `func`.
+        """
+        timeout = self.timeouts[stage]
+        call = _DatabaseCall()
+
+        def work():
+            # The connection checkout counts towards the stage's timeout as well
+            conn = self.pool.getconn(timeout)
+            discard = False
+            try:
+                with call.lock:
+                    if call.cancelled:
+                        raise StageTimeout(stage, timeout)
+                    call.conn = conn
+                with conn.cursor() as cur:
+                    result = func(cur, *args)
+                with call.lock:
+                    if call.cancelled:
+                        raise StageTimeout(stage, timeout)
+                    call.committing = True
+                    call.conn = None
+                if commit:
+                    conn.commit()
+                return result
+            except BaseException:
+                # A cancel request may still be in flight, do not hand this connection to another query
+                discard = call.cancelled
+                raise
+            finally:
+                self.pool.putconn(conn, discard=discard)
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(self._db_executor, work)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if not call.cancel():
+                return await future
+            future.cancel()
+            self._record(stage, time.perf_counter() - start, True)
+            raise StageTimeout(stage, timeout) from None
+        finally:
+            if not call.cancelled:
+                self._record(stage, time.perf_counter() - start, False)
+
+    async def call_model(self, stage, func, *args):
+        """
+        Runs a model call, such as loading the model or predicting, on the model executor.
+
+        Returns:
+            object: The return value of `func(*args)`.
+        """
+        timeout = self.timeouts[stage]
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(self._model_executor, func, *args)
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # A running model call cannot be interrupted; its result is dropped when it finishes
+            self._record(stage, time.perf_counter() - start, True)
+            raise StageTimeout(stage, timeout) from None
+        self._record(stage, time.perf_counter() - start, False)
+        return result
+
+    def run(self, *stages):
+        """
+        Runs stages concurrently on an event loop and waits for all of them.
+
+        Args:
+            *stages: Coroutines from `query` and `call_model`.
+
+        Returns:
+            list: The result of each stage in order, or the exception it raised, e.g. StageTimeout.
+        """
+        async def gather():
+            return await asyncio.gather(*stages, return_exceptions=True)
+
+        return asyncio.run(gather())
+
+    def stats(self):
+        """
+        Returns a snapshot of call counts, timeouts and durations per stage.
+
+        Returns:
+            dict: Metrics keyed by stage name.
+        """
+        with self._lock:
+            snapshot = {stage: dict(stats) for stage, stats in self._stats.items()}
+        for stats in snapshot.values():
+            stats['seconds_avg'] = stats['seconds_total'] / stats['calls']
+        return snapshot
+
+    def close(self):
+        """
+        Waits for running stages to finish and stops the executors.
+        """
+        self._db_executor.shutdown()
+        self._model_executor.shutdown()
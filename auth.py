@@ -0,0 +1,472 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+import psycopg2
+
+import queries
+from db_pool import DB_SETTINGS
+
+# Password hashing cost and session settings, each overridable through the environment.
+# The store is 'memory' (one process), 'file:<directory>' or 'sqlite:<path>' (shared by the workers of a host).
+AUTH_SETTINGS = {
+    'iterations': int(os.environ.get('CVD_PASSWORD_ITERATIONS', 600000)),
+    'session_ttl': float(os.environ.get('CVD_SESSION_TTL', 8 * 3600)),
+    'session_store': os.environ.get('CVD_SESSION_STORE', 'memory'),
+    'secret': os.environ.get('CVD_SESSION_SECRET'),
+}
+
+# Encoded hashes look like pbkdf2_sha256$<iterations>$<salt>$<hash>, with base64 salt and hash
+HASH_ALGORITHM = 'pbkdf2_sha256'
+SALT_BYTES = 16
+
+# Seconds a validated session is trusted in process before its store is asked again, bounding how long
+# a logout on another worker takes to apply
+SESSION_CACHE_TTL = 60.0
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def hash_password(password, iterations=None):
+    """
+    Hashes a password with PBKDF2-HMAC-SHA256 and a random salt.
+
+    Args:
+        password (str): The password.
+        iterations (int, optional): Hashing cost. Defaults to AUTH_SETTINGS['iterations'].
+
+    Returns:
+        str: The encoded hash, recording the algorithm, cost and salt next to the hash.
+    """
+    iterations = iterations or AUTH_SETTINGS['iterations']
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f'{HASH_ALGORITHM}${iterations}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+def is_password_hash(stored):
+    return stored.startswith(HASH_ALGORITHM + '$')
+
+
+def verify_password(password, stored, iterations=None):
+    """
+    Checks a password against its stored hash, in time independent of where they differ.
+
+    Passwords stored before hashing was introduced are compared as plain text, so existing users can still
+    log in; they are reported as needing a rehash, like hashes made with a different cost.
+
+    Args:
+        password (str): The password entered.
+        stored (str): The stored hash, or a legacy plain text password.
+        iterations (int, optional): Current hashing cost. Defaults to AUTH_SETTINGS['iterations'].
+
+    Returns:
+        tuple: (whether the password matches, whether the stored value should be replaced by a new hash).
+    """
+    iterations = iterations or AUTH_SETTINGS['iterations']
+    if not is_password_hash(stored):
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    try:
+        _, stored_iterations, salt, digest = stored.split('$')
+        stored_iterations = int(stored_iterations)
+        salt, digest = _b64decode(salt), _b64decode(digest)
+    except ValueError:
+        return False, False
+    candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, stored_iterations)
+    return hmac.compare_digest(candidate, digest), stored_iterations != iterations
+
+
+def authenticate(cur, username, password):
+    """
+    Looks a user up by username and checks their password in process, upgrading its stored hash if needed.
+
+    The password never leaves the process; the database only sees the username and, on an upgrade, the new
+    hash. The caller commits the upgrade.
+
+    Args:
+        cur (psycopg2.extensions.cursor): Database cursor.
+        username (str): The username entered.
+        password (str): The password entered.
+
+    Returns:
+        tuple: (user ID, user type) if the credentials are valid, otherwise None.
+    """
+    cur.execute(queries.AUTHENTICATE_USER, (username,))
+    row = cur.fetchone()
+    if row is None:
+        # Spend the same time as for a wrong password, so usernames cannot be probed by timing
+        hash_password(password)
+        return None
+    user_id, user_type, stored = row
+    valid, needs_rehash = verify_password(password, stored)
+    if not valid:
+        return None
+    if needs_rehash:
+        cur.execute(queries.UPDATE_PASSWORD, (hash_password(password), user_id, stored))
+    return user_id, user_type.strip().lower()
+
+
+def register(cur, username, password, user_type):
+    """
+    Creates a user in one round trip, unless the username is taken. The caller commits.
+
+    Returns:
+        int: The new user's ID, or None if the username already exists.
+    """
+    cur.execute(queries.INSERT_USER, (username, hash_password(password), user_type))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+class InvalidToken(Exception):
+    """
+    Raised for a session token that is malformed, forged, expired or revoked.
+    """
+
+
+class MemoryTokenStore:
+    """
+    Sessions kept in this process only; they are lost on restart and unknown to other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self.secret = None
+
+    def add(self, token_id, user_id, user_type, expires):
+        with self._lock:
+            self._sessions[token_id] = (user_id, user_type, expires)
+
+    def get(self, token_id):
+        with self._lock:
+            return self._sessions.get(token_id)
+
+    def remove(self, token_id):
+        with self._lock:
+            self._sessions.pop(token_id, None)
+
+    def purge(self, now):
+        with self._lock:
+            for token_id in [token_id for token_id, (_, _, expires) in self._sessions.items() if expires <= now]:
+                del self._sessions[token_id]
+
+
+class FileTokenStore:
+    """
+    Sessions kept as one small JSON file per token in a local directory, shared by the workers of a host.
+
+    Files are written to a temporary name and renamed into place, so readers never see a partial session.
+    The directory also holds the signing secret, created on first use, unless one is configured.
+
+    Args:
+        directory (str): Directory holding the sessions.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.secret = self._load_secret(os.path.join(directory, 'secret'))
+
+    @staticmethod
+    def _load_secret(path):
+        temporary = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            file.write(secrets.token_hex(32))
+        try:
+            # Linking fails if the secret exists, so concurrently starting workers agree on the first one
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+        with open(path) as file:
+            return file.read().strip()
+
+    def _path(self, token_id):
+        return os.path.join(self.directory, f'{token_id}.json')
+
+    def add(self, token_id, user_id, user_type, expires):
+        temporary = self._path(token_id) + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump([user_id, user_type, expires], file)
+        os.replace(temporary, self._path(token_id))
+
+    def get(self, token_id):
+        try:
+            with open(self._path(token_id)) as file:
+                return tuple(json.load(file))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def remove(self, token_id):
+        try:
+            os.remove(self._path(token_id))
+        except FileNotFoundError:
+            pass
+
+    def purge(self, now):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                session = self.get(name[:-len('.json')])
+                if session is not None and session[2] <= now:
+                    self.remove(name[:-len('.json')])
+
+
+class SQLiteTokenStore:
+    """
+    Sessions kept in a local SQLite database, shared by the workers of a host.
+
+    Each thread uses its own connection; WAL mode lets workers read while another one writes.
+    The database also holds the signing secret, created on first use, unless one is configured.
+
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                                token_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, user_type TEXT NOT NULL,
+                                expires REAL NOT NULL)""")
+            conn.execute("CREATE TABLE IF NOT EXISTS secret (id INTEGER PRIMARY KEY CHECK (id = 1), value TEXT)")
+            conn.execute("INSERT OR IGNORE INTO secret (id, value) VALUES (1, ?)", (secrets.token_hex(32),))
+            self.secret = conn.execute("SELECT value FROM secret").fetchone()[0]
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, token_id, user_id, user_type, expires):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)", (token_id, user_id, user_type, expires))
+
+    def get(self, token_id):
+        return self._connect().execute("SELECT user_id, user_type, expires FROM sessions WHERE token_id = ?",
+                                       (token_id,)).fetchone()
+
+    def remove(self, token_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE token_id = ?", (token_id,))
+
+    def purge(self, now):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+
+def open_token_store(spec):
+    """
+    Opens the session store described by 'memory', 'file:<directory>' or 'sqlite:<path>'.
+    """
+    kind, _, location = spec.partition(':')
+    if kind == 'memory':
+        return MemoryTokenStore()
+    if kind == 'file' and location:
+        return FileTokenStore(location)
+    if kind == 'sqlite' and location:
+        return SQLiteTokenStore(location)
+    raise ValueError(f"Unknown session store {spec!r}, expected 'memory', 'file:<directory>' or 'sqlite:<path>'")
+
+
+class SessionManager:
+    """
+    Issues and validates signed session tokens, so a logged-in user is recognised without a database query.
+
+    A token is "<token ID>.<expiry>.<signature>", signed with HMAC-SHA256. Validation checks the signature
+    and expiry first, so forged or stale tokens never reach the store, then looks the session up in the
+    store, which is what makes logouts stick. Validated sessions are remembered in process for
+    SESSION_CACHE_TTL seconds, so most page loads cost one HMAC and a dictionary lookup.
+
+    Args:
+        store (object): Session store, e.g. from open_token_store.
+        secret (str, optional): Signing secret. Defaults to the store's own secret, or a random one per
+            process for the memory store.
+        ttl (float, optional): Seconds a session lasts. Defaults to AUTH_SETTINGS['session_ttl'].
+        clock (callable, optional): Returns the current time in seconds since the epoch. Defaults to time.time.
+    """
+
+    def __init__(self, store, secret=None, ttl=None, clock=time.time):
+        self.store = store
+        secret = secret or store.secret or secrets.token_hex(32)
+        self._key = secret.encode()
+        self.ttl = ttl or AUTH_SETTINGS['session_ttl']
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._cache = {}  # token ID -> (user ID, user type, expiry, time cached)
+        self._stats = {'issued': 0, 'validated': 0, 'cache_hits': 0, 'rejected': 0, 'revoked': 0}
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user_id, user_type):
+        """
+        Starts a session.
+
+        Returns:
+            str: The session token to hand to the client.
+        """
+        token_id = secrets.token_urlsafe(18)
+        expires = int(self.clock() + self.ttl)
+        self.store.add(token_id, user_id, user_type, expires)
+        with self._lock:
+            self._stats['issued'] += 1
+            # Drop expired sessions now and then, so the stores do not grow without bound
+            if self._stats['issued'] % 1000 == 0:
+                self.store.purge(self.clock())
+        payload = f'{token_id}.{expires}'
+        return f'{payload}.{self._sign(payload)}'
+
+    def validate(self, token):
+        """
+        Resolves a session token to its user.
+
+        Args:
+            token (str): Token from issue().
+
+        Returns:
+            tuple: (user ID, user type).
+
+        Raises:
+            InvalidToken: The token is malformed, forged, expired or revoked.
+        """
+        now = self.clock()
+        try:
+            token_id, expires, signature = token.split('.')
+            expires = int(expires)
+        except (AttributeError, ValueError):
+            self._reject()
+            raise InvalidToken("Malformed session token") from None
+        if not hmac.compare_digest(signature, self._sign(f'{token_id}.{expires}')):
+            self._reject()
+            raise InvalidToken("Session token signature does not match")
+        if expires <= now:
+            self._reject()
+            raise InvalidToken("Session expired")
+
+        with self._lock:
+            self._stats['validated'] += 1
+            cached = self._cache.get(token_id)
+            if cached is not None and now - cached[3] < SESSION_CACHE_TTL:
+                self._stats['cache_hits'] += 1
+                return cached[0], cached[1]
+        session = self.store.get(token_id)
+        if session is None:
+            with self._lock:
+                self._cache.pop(token_id, None)
+            self._reject()
+            raise InvalidToken("Session was revoked")
+        user_id, user_type, _ = session
+        with self._lock:
+            self._cache[token_id] = (user_id, user_type, expires, now)
+            if len(self._cache) > 10000:
+                self._cache = {key: value for key, value in self._cache.items() if now - value[3] < SESSION_CACHE_TTL}
+        return user_id, user_type
+
+    def _reject(self):
+        with self._lock:
+            self._stats['rejected'] += 1
+
+    def revoke(self, token):
+        """
+        Ends the session of a token, e.g. on logout. Unknown or malformed tokens are ignored.
+        """
+        token_id = str(token).split('.')[0]
+        self.store.remove(token_id)
+        with self._lock:
+            self._cache.pop(token_id, None)
+            self._stats['revoked'] += 1
+
+    def stats(self):
+        """
+        Returns a snapshot of session counters.
+
+        Returns:
+            dict: Tokens issued, validated, served from the in-process cache, rejected and revoked.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def default_session_manager():
+    """
+    Returns the session manager of this process, opening the configured store on first use, so the app and
+    its session cookie route issue and validate tokens against the same store and secret.
+
+    Returns:
+        SessionManager: Issuer and validator of session tokens.
+    """
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = SessionManager(open_token_store(AUTH_SETTINGS['session_store']),
+                                              secret=AUTH_SETTINGS['secret'])
+        return _default_manager
+
+
+def hash_legacy_passwords(conn, iterations=None, batch_size=1000, verbose=True):
+    """
+    Replaces every plain text password still stored with a salted hash.
+
+    Logging in upgrades a user's password as well; this converts the accounts that have not logged in since.
+
+    Returns:
+        int: Number of passwords hashed.
+    """
+    hashed = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(queries.LEGACY_PASSWORDS, (HASH_ALGORITHM + '$', batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            for user_id, stored in rows:
+                cur.execute(queries.UPDATE_PASSWORD, (hash_password(stored, iterations), user_id, stored))
+            conn.commit()
+            hashed += len(rows)
+            if verbose:
+                print(f"Hashed {hashed} passwords")
+    return hashed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the plain text passwords still stored to salted hashes.")
+    parser.add_argument('--dbname', default=DB_SETTINGS['dbname'])
+    parser.add_argument('--user', default=DB_SETTINGS['user'])
+    parser.add_argument('--host', default=DB_SETTINGS['host'])
+    parser.add_argument('--iterations', type=int, default=AUTH_SETTINGS['iterations'])
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user, host=args.host)
+    try:
+        print(f"Hashed {hash_legacy_passwords(conn, args.iterations)} passwords in total")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import time
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from db_pool import ConnectionPool, DB_SETTINGS
+from explanations import TreeExplainer, factor_codes
+from features import encode
+from recommendations import evaluate, recommendation_codes
+from tree_model import MODEL_PATH, load_model
+
+# Joined feature rows in the model's column order, prefixed with the Test ID the result is written back to.
+# Only each patient's latest test is scored, as the patient's current details only describe that one, and
+# only when it was not scored by this model version yet; earlier tests are history and never rewritten.
+FEATURE_QUERY = """SELECT m."Test ID", p."gender", p."height", p."weight"::float8, m."Systolic Blood Pressure",
+                          m."Diastolic Blood Pressure", m."cholesterol", m."glucose", p."Smoke History",
+                          p."Alcohol Consumption", p."Exercise Level", p."age"
+                   FROM patient p
+                   CROSS JOIN LATERAL (SELECT * FROM medicaltest
+                                       WHERE "Patient ID" = p."User ID"
+                                       ORDER BY "Test ID" DESC LIMIT 1) m
+                   WHERE m."Model Version" IS DISTINCT FROM %(version)s
+                """
+
+# Bulk write-back of one chunk, recording the model version that scored it
+UPDATE_QUERY = """UPDATE medicaltest AS m SET "Cardiovascular Disease" = v.prediction,
+                                             "Recommendation Codes" = v.codes,
+                                             "Risk Factors" = v.factors,
+                                             "Model Version" = v.version
+                  FROM (VALUES %s) AS v(test_id, prediction, codes, factors, version)
+                  WHERE m."Test ID" = v.test_id"""
+
+
+def predict_chunk(model, rows, explainer=None):
+    """
+    Scores one chunk of joined feature rows with a single predict_proba call, evaluates the
+    recommendation rules on it and, given an explainer, names the inputs that raised each risk the most.
+
+    Args:
+        model (object): Fitted classifier.
+        rows (list): Tuples of (Test ID, 11 model features) as returned by FEATURE_QUERY.
+        explainer (TreeExplainer, optional): Explainer of the model. Defaults to storing no risk factors.
+
+    Returns:
+        tuple: Arrays of Test IDs, predicted classes, recommendation codes and risk factors, one per row;
+            the risk factors are None without an explainer.
+    """
+    matrix = np.array(rows, dtype=np.float64)
+    test_ids = matrix[:, 0].astype(np.int64)
+    X = encode(matrix[:, 1:])
+    probabilities = model.predict_proba(X)
+    predictions = model.classes_[np.argmax(probabilities, axis=1)]
+    factors = factor_codes(explainer.shap_values(X)) if explainer is not None else np.full(len(X), None)
+    return test_ids, predictions, recommendation_codes(evaluate(X, predictions)), factors
+
+
+def score_patients(pool, model, chunk_size=10000, dry_run=False, verbose=True):
+    """
+    Scores every patient's latest medical test that this model version has not scored yet, and writes the
+    predictions, recommendation codes, risk factors and model version back. Earlier tests are left as they
+    are. Risk factors are only computed for models exported with node covers.
+
+    Rows are streamed through a server-side cursor, scored one chunk at a time and written back with a
+    single UPDATE ... FROM (VALUES ...) statement per chunk, committed as it goes.
+
+    Args:
+        pool (ConnectionPool): Pool providing one reading and one writing connection.
+        model (object): Fitted classifier.
+        chunk_size (int, optional): Rows fetched and scored per chunk. Defaults to 10000.
+        dry_run (bool, optional): Score without writing results back. Defaults to False.
+        verbose (bool, optional): Print progress after each chunk. Defaults to True.
+
+    Returns:
+        dict: Rows scored, rows updated, elapsed seconds and throughput in rows per second.
+    """
+    scored, updated = 0, 0
+    explainer = TreeExplainer(model) if getattr(model, 'cover', None) is not None else None
+    start = time.perf_counter()
+    with pool.connection() as read_conn, pool.connection() as write_conn:
+        # A named cursor keeps the result set on the server and fetches it chunk by chunk
+        with read_conn.cursor(name='cvd_batch_scoring') as cur:
+            cur.itersize = chunk_size
+            cur.execute(FEATURE_QUERY, {'version': model.version})
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                test_ids, predictions, codes, factors = predict_chunk(model, rows, explainer)
+                if not dry_run:
+                    with write_conn.cursor() as wcur:
+                        results = zip(test_ids.tolist(), predictions.astype(int).tolist(), codes.tolist(),
+                                      factors.tolist())
+                        execute_values(wcur, UPDATE_QUERY, [(*result, model.version) for result in results],
+                                       page_size=len(rows))
+                        updated += wcur.rowcount
+                    write_conn.commit()
+                scored += len(rows)
+                if verbose:
+                    elapsed = time.perf_counter() - start
+                    print(f"Scored {scored} rows ({scored / elapsed:,.0f} rows/sec)")
+    elapsed = time.perf_counter() - start
+    return {
+        'rows_scored': scored,
+        'rows_updated': updated,
+        'seconds': elapsed,
+        'rows_per_second': scored / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every patient's latest medical test with the current "
+                                                 "model in bulk.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Model artifact directory or pickled model.")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Rows fetched and scored per chunk.")
+    parser.add_argument('--dry-run', action='store_true', help="Score without writing results back.")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    pool = ConnectionPool(minconn=0, maxconn=2, **DB_SETTINGS)
+    try:
+        report = score_patients(pool, model, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    finally:
+        pool.closeall()
+    print(f"Scored {report['rows_scored']} rows, updated {report['rows_updated']} "
+          f"in {report['seconds']:.2f}s ({report['rows_per_second']:,.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
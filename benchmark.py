@@ -0,0 +1,564 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+import queries
+from auth import hash_password
+from check_query_plans import sample_parameters
+from compare_backends import SAMPLE_FORM
+from database import LAST_NAMES, bulk_load_sql_file, create_database, print_report
+from db_pool import DB_SETTINGS
+from drift_monitor import DRIFT_SETTINGS, DriftMonitor
+from explanations import TreeExplainer
+from features import FEATURE_NAMES, decode, encode, option_index
+from migrate import migrate
+from prediction_cache import PredictionCache
+from risk_grid import GRID_PATH, RiskGrid, grid_version
+from tree_model import MODEL_PATH, TreeEnsemble
+
+# Database the benchmark loads synthetic users into; --rebuild drops and recreates it
+BENCH_DBNAME = os.environ.get('CVD_BENCH_DB', 'CVDBench')
+
+# Password of the users the replayed sessions log in as
+BENCHMARK_PASSWORD = 'benchmark'
+
+# Replayed sessions log in as scratch accounts named SCRATCH_PREFIX followed by the ID of the user each one copies,
+# so no real account has its password changed
+SCRATCH_PREFIX = 'benchmark-'
+
+# Creates a scratch account per sampled user, returning its ID and the ID of the user it copies
+CREATE_SCRATCH_USERS = """INSERT INTO users (username, password, "User Type")
+                          SELECT %(prefix)s || u."User ID", %(password)s, u."User Type"
+                          FROM users u WHERE u.username = ANY(%(usernames)s)
+                          RETURNING "User ID", substr(username, length(%(prefix)s) + 1)::integer"""
+
+# Gives each scratch account the details, panel and medical tests of the user it copies. Physicians' panels
+# are copied first, so scratch physicians only ever see real patients.
+COPY_SCRATCH_USERS = """INSERT INTO physician ("User ID", "First Name", "Last Name", "Contact Information")
+                        SELECT s.scratch_id, p."First Name", p."Last Name", p."Contact Information"
+                        FROM unnest(%(scratch)s::integer[], %(source)s::integer[]) s(scratch_id, source_id)
+                        JOIN physician p ON p."User ID" = s.source_id;
+                        INSERT INTO physicianpatientlink ("Physician ID", "Patient ID")
+                        SELECT s.scratch_id, l."Patient ID"
+                        FROM unnest(%(scratch)s::integer[], %(source)s::integer[]) s(scratch_id, source_id)
+                        JOIN physicianpatientlink l ON l."Physician ID" = s.source_id;
+                        INSERT INTO patient ("User ID", "First Name", "Last Name", age, gender, "Contact Information",
+                                             height, weight, "Smoke History", "Alcohol Consumption", "Exercise Level")
+                        SELECT s.scratch_id, p."First Name", p."Last Name", p.age, p.gender, p."Contact Information",
+                               p.height, p.weight, p."Smoke History", p."Alcohol Consumption", p."Exercise Level"
+                        FROM unnest(%(scratch)s::integer[], %(source)s::integer[]) s(scratch_id, source_id)
+                        JOIN patient p ON p."User ID" = s.source_id;
+                        INSERT INTO physicianpatientlink ("Physician ID", "Patient ID")
+                        SELECT l."Physician ID", s.scratch_id
+                        FROM unnest(%(scratch)s::integer[], %(source)s::integer[]) s(scratch_id, source_id)
+                        JOIN physicianpatientlink l ON l."Patient ID" = s.source_id;
+                        INSERT INTO medicaltest ("Physician ID", "Patient ID", "Diastolic Blood Pressure",
+                                                 "Systolic Blood Pressure", cholesterol, glucose,
+                                                 "Cardiovascular Disease", "Recommendation Codes", "Risk Factors",
+                                                 "Model Version")
+                        SELECT m."Physician ID", s.scratch_id, m."Diastolic Blood Pressure",
+                               m."Systolic Blood Pressure", m.cholesterol, m.glucose, m."Cardiovascular Disease",
+                               m."Recommendation Codes", m."Risk Factors", m."Model Version"
+                        FROM unnest(%(scratch)s::integer[], %(source)s::integer[]) s(scratch_id, source_id)
+                        JOIN medicaltest m ON m."Patient ID" = s.source_id
+                        ORDER BY m."Test ID\""""
+
+# Removes every scratch account with what the sessions wrote for it. Tests scratch physicians wrote for real
+# patients are kept, and credited to the physician the account copies.
+DROP_SCRATCH_USERS = """UPDATE medicaltest m SET "Physician ID" = substr(u.username, length(%(prefix)s) + 1)::integer
+                        FROM users u WHERE u."User ID" = ANY(%(scratch)s) AND m."Physician ID" = u."User ID";
+                        UPDATE risk_history h SET "Physician ID" = substr(u.username, length(%(prefix)s) + 1)::integer
+                        FROM users u WHERE u."User ID" = ANY(%(scratch)s) AND h."Physician ID" = u."User ID";
+                        DELETE FROM medicaltest WHERE "Patient ID" = ANY(%(scratch)s);
+                        DELETE FROM risk_history WHERE "Patient ID" = ANY(%(scratch)s);
+                        DELETE FROM risk_trend WHERE "Patient ID" = ANY(%(scratch)s);
+                        DELETE FROM physicianpatientlink
+                        WHERE "Patient ID" = ANY(%(scratch)s) OR "Physician ID" = ANY(%(scratch)s);
+                        DELETE FROM patient WHERE "User ID" = ANY(%(scratch)s);
+                        DELETE FROM physician WHERE "User ID" = ANY(%(scratch)s);
+                        DELETE FROM users WHERE "User ID" = ANY(%(scratch)s)"""
+
+# Results file, and the relative slowdown of a median latency that counts as a regression
+RESULTS_FILE = 'benchmark.json'
+REGRESSION_TOLERANCE = 0.2
+
+# Script replayed by the login -> dashboard -> submit flows
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CVD_decision_support_sys.py')
+
+# Text the app shows once each step of a flow has succeeded
+DASHBOARD_TITLES = {'patient': 'Patient Dashboard', 'physician': 'Physician Dashboard'}
+PREDICTION_HEADER = '# Cardiovascular Disease Prediction:'
+SEARCH_LABEL = 'Search for a patient by name'
+SUBMIT_LABELS = {'patient': 'Check Cardiovascular Disease Risk', 'physician': 'Update Patient Information'}
+
+
+def summarize(seconds):
+    """
+    Summarizes latency samples in milliseconds.
+
+    Args:
+        seconds (list): Latency of each call in seconds.
+
+    Returns:
+        dict: Sample count, mean, median, 95th and 99th percentile and maximum in milliseconds.
+    """
+    if not seconds:
+        return {'n': 0}
+    ms = np.asarray(seconds, dtype=np.float64) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'n': int(ms.size), 'mean_ms': float(ms.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95),
+            'p99_ms': float(p99), 'max_ms': float(ms.max())}
+
+
+def time_calls(func, repeat, warmup=3):
+    """
+    Calls a function repeatedly, after a few untimed warm-up calls, and summarizes the latency of each call.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def rebuild(dbname, user, host, sql_file, patients, patients_per_physician):
+    """
+    Recreates the benchmark database from the SQL dump plus synthetic patients drawn from cardio_train.csv.
+
+    Args:
+        dbname (str): Database to drop and recreate.
+        user (str): Database user.
+        host (str): Database host.
+        sql_file (str): pg_dump file with the schema and seed rows.
+        patients (int): Synthetic patients to add.
+        patients_per_physician (int): Synthetic patients per synthetic physician.
+    """
+    create_database(dbname=dbname, user=user, host=host)
+    print_report(bulk_load_sql_file(sql_file, dbname=dbname, user=user, host=host,
+                                    synthetic_source='data/cardio_train.csv', synthetic_count=patients,
+                                    patients_per_physician=patients_per_physician))
+    conn = psycopg2.connect(dbname=dbname, user=user, host=host)
+    try:
+        migrate(conn)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def bench_model(X, repeat):
+    """
+    Microbenchmarks loading the model artifact, single-row and batch prediction, the prediction cache,
+    single-row and batch explanations, queueing a prediction for the drift monitor and, if one has been built
+    for the model, the risk table lookup.
+
+    Returns:
+        dict: Latency summaries, plus batch throughput in rows per second.
+    """
+    results = {'load_artifact': time_calls(lambda: TreeEnsemble.load(MODEL_PATH), max(repeat // 20, 5), warmup=1)}
+    model = TreeEnsemble.load(MODEL_PATH)
+    row = X[:1]
+    batch = X[:10000]
+    results['predict_1_row'] = time_calls(lambda: model.predict(row), repeat)
+    results['predict_proba_1_row'] = time_calls(lambda: model.predict_proba(row), repeat)
+    results['predict_proba_10k_rows'] = time_calls(lambda: model.predict_proba(batch), max(repeat // 20, 5))
+    results['predict_proba_10k_rows']['rows_per_second'] = len(batch) / (
+        results['predict_proba_10k_rows']['p50_ms'] / 1e3)
+    cache = PredictionCache(maxsize=1000, ttl=3600)
+    cache.predict(model, row)
+    results['prediction_cache_hit'] = time_calls(lambda: cache.predict(model, row), repeat)
+    explainer = TreeExplainer(model)
+    record = tuple(row[0])
+    results['explain_1_row'] = time_calls(lambda: explainer.shap_values(row), repeat)
+    results['explain_10k_rows'] = time_calls(lambda: explainer.shap_values(batch), max(repeat // 20, 5))
+    results['explain_10k_rows']['rows_per_second'] = len(batch) / (results['explain_10k_rows']['p50_ms'] / 1e3)
+    explainer.explain(record)
+    results['explanation_cache_hit'] = time_calls(lambda: explainer.explain(record), repeat)
+    if os.path.exists(DRIFT_SETTINGS['reference']):
+        monitor = DriftMonitor.load(DRIFT_SETTINGS['reference'], state=None)
+        prediction, proba = model.predict_with_proba(row)
+        results['drift_observe'] = time_calls(
+            lambda: monitor.observe(row, prediction, proba[:, 1], model_version=model.version), repeat)
+        monitor.close()
+    if grid_version(GRID_PATH) == model.version:
+        grid = RiskGrid.load(GRID_PATH)
+        results['risk_grid_lookup'] = time_calls(lambda: grid.lookup(record), repeat)
+    return results
+
+
+def bench_encoders(data, repeat):
+    """
+    Microbenchmarks encoding a form submission and a batch of records, and decoding stored options.
+
+    Returns:
+        dict: Latency summaries.
+    """
+    batch = data.iloc[:10000]
+    return {
+        'encode_form': time_calls(lambda: encode(SAMPLE_FORM), repeat),
+        'encode_10k_rows': time_calls(lambda: encode(batch), max(repeat // 20, 5)),
+        'decode': time_calls(lambda: decode('cholesterol', 2), repeat),
+        'option_index': time_calls(lambda: option_index('gluc', 3), repeat),
+    }
+
+
+def bench_queries(conn, repeat):
+    """
+    Microbenchmarks every statement in queries.py, with parameters picked from the data.
+
+    Writes run in a transaction that is rolled back after each call, so the data does not change.
+
+    Returns:
+        dict: Latency summaries keyed by query name.
+    """
+    with conn.cursor() as cur:
+        params = sample_parameters(cur)
+    conn.rollback()
+    params['INSERT_USER'] = ('benchmark_user', 'benchmark', 'patient')
+    results = {}
+    with conn.cursor() as cur:
+        for name, query_params in params.items():
+            def run():
+                cur.execute(getattr(queries, name), query_params)
+                if cur.description is not None:
+                    cur.fetchall()
+                conn.rollback()
+            results[name] = time_calls(run, repeat)
+    return results
+
+
+def create_scratch_users(conn, usernames):
+    """
+    Creates a scratch account with BENCHMARK_PASSWORD for each of the given users, holding a copy of their details,
+    panel and medical tests; drop_scratch_users removes them again.
+
+    Returns:
+        list: Usernames of the scratch accounts.
+    """
+    with conn.cursor() as cur:
+        cur.execute(CREATE_SCRATCH_USERS, {'prefix': SCRATCH_PREFIX, 'password': hash_password(BENCHMARK_PASSWORD),
+                                           'usernames': usernames})
+        scratch, source = zip(*cur.fetchall()) if usernames else ((), ())
+        cur.execute(COPY_SCRATCH_USERS, {'scratch': list(scratch), 'source': list(source)})
+    conn.commit()
+    return [SCRATCH_PREFIX + str(user_id) for user_id in source]
+
+
+def drop_scratch_users(conn):
+    """
+    Removes the scratch accounts of this and any interrupted earlier run.
+    """
+    with conn.cursor() as cur:
+        cur.execute('SELECT "User ID" FROM users WHERE starts_with(username, %s)', (SCRATCH_PREFIX,))
+        scratch = [row[0] for row in cur.fetchall()]
+        if scratch:
+            cur.execute(DROP_SCRATCH_USERS, {'prefix': SCRATCH_PREFIX, 'scratch': scratch})
+    conn.commit()
+
+
+def pick_users(conn, user_type, count, seed):
+    """
+    Samples users of one type who have a dashboard to show, and creates a scratch copy of each to log in as.
+
+    Returns:
+        list: (username, password) pairs of the scratch copies, repeated if there are fewer users than requested.
+    """
+    if user_type == 'patient':
+        condition = 'EXISTS (SELECT 1 FROM medicaltest m WHERE m."Patient ID" = u."User ID")'
+    else:
+        condition = 'EXISTS (SELECT 1 FROM physicianpatientlink pl WHERE pl."Physician ID" = u."User ID")'
+    with conn.cursor() as cur:
+        cur.execute("SELECT setseed(%s)", (seed / 2 ** 31,))
+        cur.execute(f"""SELECT username FROM users u
+                        WHERE rtrim(u."User Type") = %s AND NOT starts_with(u.username, %s) AND {condition}
+                        ORDER BY random() LIMIT %s""", (user_type, SCRATCH_PREFIX, count))
+        usernames = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    if not usernames:
+        raise SystemExit(f"No {user_type} users with data in the benchmark database, run with --rebuild first")
+    usernames = create_scratch_users(conn, usernames)
+    return [(usernames[i % len(usernames)], BENCHMARK_PASSWORD) for i in range(count)]
+
+
+def _init_flow_worker(db_settings):
+    # Point the app at the benchmark database before it creates its connection pool
+    os.environ.update({'CVD_DB_HOST': db_settings['host'], 'CVD_DB_NAME': db_settings['dbname'],
+                       'CVD_DB_USER': db_settings['user']})
+    DB_SETTINGS.update(db_settings)
+
+
+def _step(timings, name, start, ok, errors):
+    timings.setdefault(name, []).append(time.perf_counter() - start)
+    if not ok:
+        errors[name] = errors.get(name, 0) + 1
+    return ok
+
+
+def replay_session(user_type, username, password, seed):
+    """
+    Replays one browser session against the app script: open the page, log in to the dashboard and submit
+    the form; physicians first search their panel for a patient.
+
+    Returns:
+        tuple: (seconds per step, failed steps per step name).
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    timings, errors = {}, {}
+    at = AppTest.from_file(APP_SCRIPT, default_timeout=60)
+
+    start = time.perf_counter()
+    at.run()
+    if not _step(timings, 'open', start, not at.exception, errors):
+        return timings, errors
+
+    start = time.perf_counter()
+    at.sidebar.text_input[0].input(username)
+    at.sidebar.text_input[1].input(password)
+    at.sidebar.button[0].click().run()
+    titles = [title.value for title in at.title]
+    if not _step(timings, 'login', start, not at.exception and DASHBOARD_TITLES[user_type] in titles, errors):
+        return timings, errors
+
+    if user_type == 'physician':
+        # Search the panel by the start of a last name; the first match is shown for editing
+        start = time.perf_counter()
+        search = next(box for box in at.text_input if box.label == SEARCH_LABEL)
+        search.input(rng.choice(LAST_NAMES)[:2].lower()).run()
+        ok = not at.exception and any(SUBMIT_LABELS[user_type] in (button.label or '') for button in at.button)
+        if not _step(timings, 'search', start, ok, errors):
+            return timings, errors
+
+    start = time.perf_counter()
+    for button in at.button:
+        if SUBMIT_LABELS[user_type] in (button.label or ''):
+            button.click().run()
+            break
+    ok = not at.exception and any(markdown.value == PREDICTION_HEADER for markdown in at.markdown)
+    _step(timings, 'submit', start, ok, errors)
+    return timings, errors
+
+
+def _run_flow_worker(sessions, warmup):
+    # One simulated user: sessions run back to back, the first `warmup` ones are not recorded
+    timings, errors = {}, {}
+    for user_type, username, password, seed in sessions[:warmup]:
+        replay_session(user_type, username, password, seed)
+    start = time.perf_counter()
+    for user_type, username, password, seed in sessions[warmup:]:
+        session_timings, session_errors = replay_session(user_type, username, password, seed)
+        for step, samples in session_timings.items():
+            timings.setdefault(user_type, {}).setdefault(step, []).extend(samples)
+        for step, count in session_errors.items():
+            key = f'{user_type}.{step}'
+            errors[key] = errors.get(key, 0) + count
+    return timings, errors, time.perf_counter() - start
+
+
+def bench_flows(conn, db_settings, sessions, concurrency, physician_share=0.2, warmup=1, seed=0):
+    """
+    Replays login -> dashboard -> submit flows against CVD_decision_support_sys.py with concurrent users.
+
+    Each simulated user is a worker process running Streamlit's AppTest sessions one after another, since
+    AppTest drives a process-wide runtime and cannot run sessions on several threads of one process. The
+    workers share the benchmark database, so queries and writes contend as they would on a deployment. Sessions
+    log in as scratch copies of sampled users, removed when the benchmark ends.
+
+    Args:
+        conn (psycopg2.extensions.connection): Connection used to create the scratch accounts.
+        db_settings (dict): Connection settings the app is pointed at.
+        sessions (int): Recorded sessions across all users.
+        concurrency (int): Simultaneous users.
+        physician_share (float, optional): Fraction of sessions by physicians. Defaults to 0.2.
+        warmup (int, optional): Unrecorded sessions per user, loading the model and filling caches.
+        seed (int, optional): Seed for picking users and patients. Defaults to 0.
+
+    Returns:
+        dict: Latency summaries per user type and step, failed steps and sessions per second.
+    """
+    rng = random.Random(seed)
+    total = sessions + warmup * concurrency
+    physicians = round(total * physician_share)
+    drop_scratch_users(conn)
+    try:
+        plan = ([('physician',) + user for user in pick_users(conn, 'physician', physicians, seed)]
+                + [('patient',) + user for user in pick_users(conn, 'patient', total - physicians, seed)])
+        rng.shuffle(plan)
+        plan = [session + (rng.randrange(2 ** 31),) for session in plan]
+
+        # Deal the sessions out so every user gets its warm-up sessions first
+        per_worker = [plan[i::concurrency] for i in range(concurrency)]
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(concurrency, mp_context=context, initializer=_init_flow_worker,
+                                 initargs=(db_settings,)) as pool:
+            results = list(pool.map(_run_flow_worker, per_worker, [warmup] * concurrency))
+    finally:
+        conn.rollback()
+        drop_scratch_users(conn)
+
+    timings, errors = {}, {}
+    for worker_timings, worker_errors, _ in results:
+        for user_type, steps in worker_timings.items():
+            for step, samples in steps.items():
+                timings.setdefault(user_type, {}).setdefault(step, []).extend(samples)
+        for key, count in worker_errors.items():
+            errors[key] = errors.get(key, 0) + count
+    elapsed = max(seconds for _, _, seconds in results)
+    report = {user_type: {step: summarize(samples) for step, samples in steps.items()}
+              for user_type, steps in timings.items()}
+    report.update({'sessions': sessions, 'concurrency': concurrency, 'errors': errors,
+                   'sessions_per_second': sessions / elapsed if elapsed else 0.0})
+    return report
+
+
+def environment(args, conn=None):
+    """
+    Records what the results were measured on, so runs can be compared between releases. Without a connection,
+    the Postgres version and patient count are left out.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(APP_SCRIPT)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    patients, server_version = None, None
+    if conn is not None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM patient")
+            patients = cur.fetchone()[0]
+            cur.execute("SHOW server_version")
+            server_version = cur.fetchone()[0]
+        conn.rollback()
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'postgres': server_version,
+        'model_version': TreeEnsemble.load(MODEL_PATH).version,
+        'patients': patients,
+        'repeat': args.repeat,
+    }
+
+
+def latencies(results, prefix=''):
+    """
+    Flattens the results into {"section.benchmark": median milliseconds}.
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and 'p50_ms' in value:
+            flat[prefix + key] = value['p50_ms']
+        elif isinstance(value, dict):
+            flat.update(latencies(value, f'{prefix}{key}.'))
+    return flat
+
+
+def compare(baseline, current, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compares median latencies with an earlier run.
+
+    Args:
+        baseline (dict): Results of the earlier run.
+        current (dict): Results of this run.
+        tolerance (float, optional): Relative slowdown that counts as a regression. Defaults to 0.2.
+
+    Returns:
+        list: (benchmark, baseline ms, current ms) for every benchmark that got slower than the tolerance.
+    """
+    before, after = latencies(baseline), latencies(current)
+    return [(name, before[name], after[name]) for name in sorted(before.keys() & after.keys())
+            if after[name] > before[name] * (1 + tolerance)]
+
+
+def print_results(results):
+    for name, p50 in latencies(results).items():
+        print(f"{name:<52} p50 {p50:10.3f} ms")
+    flows = results.get('flows')
+    if flows:
+        print(f"{flows['sessions']} sessions by {flows['concurrency']} users: "
+              f"{flows['sessions_per_second']:.2f} sessions/s, failed steps: {flows['errors'] or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the model, the encoders, the SQL queries and "
+                                                 "replayed dashboard sessions, writing the results as JSON.")
+    parser.add_argument('--dbname', default=BENCH_DBNAME)
+    parser.add_argument('--user', default=DB_SETTINGS['user'])
+    parser.add_argument('--host', default=DB_SETTINGS['host'])
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Drop and recreate --dbname from --sql-file with synthetic users first.")
+    parser.add_argument('--sql-file', default='data/database.sql')
+    parser.add_argument('--patients', type=int, default=10000, help="Synthetic patients when rebuilding.")
+    parser.add_argument('--patients-per-physician', type=int, default=500)
+    parser.add_argument('--only', nargs='+', choices=['model', 'encoders', 'sql', 'flows'],
+                        default=['model', 'encoders', 'sql', 'flows'], help="Benchmarks to run.")
+    parser.add_argument('--repeat', type=int, default=1000, help="Timed calls per microbenchmark.")
+    parser.add_argument('--sessions', type=int, default=100, help="Recorded dashboard sessions.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Simultaneous simulated users.")
+    parser.add_argument('--physician-share', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=RESULTS_FILE, help="JSON file to write the results to.")
+    parser.add_argument('--baseline', help="Earlier results to compare median latencies with.")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    db_settings = {'dbname': args.dbname, 'user': args.user, 'host': args.host}
+    if args.rebuild:
+        rebuild(args.dbname, args.user, args.host, args.sql_file, args.patients, args.patients_per_physician)
+
+    # The model and encoder benchmarks run without a database
+    conn = psycopg2.connect(**db_settings) if {'sql', 'flows'} & set(args.only) else None
+    try:
+        results = {'environment': environment(args, conn)}
+        if 'model' in args.only or 'encoders' in args.only:
+            data = pd.read_csv('data/cardio_train.csv', sep=';')
+            data['ageinyears'] = data['age'] // 365
+            X = encode(data[list(FEATURE_NAMES)])
+        if 'model' in args.only:
+            results['model'] = bench_model(X, args.repeat)
+        if 'encoders' in args.only:
+            results['encoders'] = bench_encoders(data, args.repeat)
+        if 'sql' in args.only:
+            results['sql'] = bench_queries(conn, args.repeat)
+        if 'flows' in args.only:
+            results['flows'] = bench_flows(conn, db_settings, args.sessions, args.concurrency,
+                                           args.physician_share, seed=args.seed)
+    finally:
+        if conn is not None:
+            conn.close()
+
+    with open(args.out, 'w') as file:
+        json.dump(results, file, indent=2)
+    print_results(results)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(json.load(file), results, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import json
+import sys
+
+import psycopg2
+
+import queries
+from database import bulk_load_sql_file, create_database, print_report
+from db_pool import DB_SETTINGS
+from migrate import migrate
+
+# Tables the dashboards read; a sequential scan on any of them fails the check
+CHECKED_TABLES = ('users', 'patient', 'medicaltest', 'physicianpatientlink', 'physician', 'risk_trend')
+
+# Plan nodes that read a table through an index
+INDEX_NODES = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+def sample_parameters(cur):
+    """
+    Picks representative query parameters from the data: the physician with the largest panel,
+    one of their patients, and that patient's login.
+
+    Args:
+        cur (psycopg2.extensions.cursor): Database cursor.
+
+    Returns:
+        dict: Parameters for every query in the check, keyed by query name.
+    """
+    cur.execute("""SELECT "Physician ID", count(*) FROM physicianpatientlink
+                   GROUP BY "Physician ID" ORDER BY count(*) DESC LIMIT 1""")
+    physician_id, _ = cur.fetchone()
+    cur.execute("""SELECT u."User ID", u.username, u.password FROM users u
+                   JOIN physicianpatientlink pl ON u."User ID" = pl."Patient ID"
+                   WHERE pl."Physician ID" = %s LIMIT 1""", (physician_id,))
+    patient_id, username, password = cur.fetchone()
+    return {
+        'AUTHENTICATE_USER': (username,),
+        'UPDATE_PASSWORD': (password, patient_id, password),
+        'SEARCH_PATIENTS': {'physician_id': physician_id, 'prefix': 'ma%', 'after_last': 'Jones',
+                            'after_first': 'Mary', 'after_id': patient_id, 'limit': 26},
+        'PHYSICIAN_PATIENT_DETAILS': (patient_id,),
+        'PATIENT_RISK_TREND': (patient_id,),
+        'SAVE_PATIENT_TEST': {'physician_id': physician_id, 'patient_id': patient_id, 'age': 50, 'gender': 1,
+                              'height': 170, 'weight': 70.0, 'smoke': 0, 'alco': 0, 'active': 1, 'ap_lo': 80,
+                              'ap_hi': 120, 'cholesterol': 1, 'gluc': 1, 'prediction': 0},
+        'PATIENT_DETAILS': (patient_id,),
+        'PATIENT_PHYSICIANS': (patient_id,),
+    }
+
+
+def plan_nodes(plan):
+    """
+    Walks an EXPLAIN (FORMAT JSON) plan tree depth first.
+
+    Args:
+        plan (dict): Plan node.
+
+    Yields:
+        dict: Every node of the tree, starting with the given one.
+    """
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def explain(cur, query, params):
+    """
+    Plans a query without running it.
+
+    Args:
+        cur (psycopg2.extensions.cursor): Database cursor.
+        query (str): SQL statement.
+        params (tuple): Statement parameters.
+
+    Returns:
+        dict: Root plan node.
+    """
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    result = cur.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]['Plan']
+
+
+def check_plans(conn, verbose=True):
+    """
+    Explains every dashboard query and collects the sequential scans on the dashboard tables.
+
+    Args:
+        conn (psycopg2.extensions.connection): Database connection.
+        verbose (bool, optional): Print how each query reads each table. Defaults to True.
+
+    Returns:
+        list: Tuples of (query name, table) for every sequential scan found; empty if all plans use indexes.
+    """
+    failures = []
+    with conn.cursor() as cur:
+        for name, params in sample_parameters(cur).items():
+            scans = [(node['Node Type'], node.get('Relation Name') or node.get('Index Name'))
+                     for node in plan_nodes(explain(cur, getattr(queries, name), params))
+                     if node['Node Type'] == 'Seq Scan' or node['Node Type'] in INDEX_NODES]
+            seq_scans = [table for node_type, table in scans
+                         if node_type == 'Seq Scan' and table in CHECKED_TABLES]
+            failures.extend((name, table) for table in seq_scans)
+            if verbose:
+                status = 'FAIL' if seq_scans else 'ok'
+                print(f"{status:<5} {name:<26} " + ', '.join(f"{node_type} on {table}" for node_type, table in scans))
+    conn.rollback()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every dashboard query is planned as an index scan.")
+    parser.add_argument('--dbname', default=DB_SETTINGS['dbname'])
+    parser.add_argument('--user', default=DB_SETTINGS['user'])
+    parser.add_argument('--host', default=DB_SETTINGS['host'])
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Drop and recreate --dbname from --sql-file with synthetic patients first.")
+    parser.add_argument('--sql-file', default='data/database.sql')
+    parser.add_argument('--synthetic-patients', type=int, default=1000000)
+    parser.add_argument('--synthetic-source', default='data/cardio_train.csv')
+    parser.add_argument('--patients-per-physician', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        create_database(dbname=args.dbname, user=args.user, host=args.host)
+        print_report(bulk_load_sql_file(args.sql_file, dbname=args.dbname, user=args.user, host=args.host,
+                                        synthetic_source=args.synthetic_source,
+                                        synthetic_count=args.synthetic_patients,
+                                        patients_per_physician=args.patients_per_physician))
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user, host=args.host)
+    try:
+        migrate(conn)
+        # Fresh statistics, so the planner sees the real table sizes
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM patient")
+            print(f"Checking query plans against {cur.fetchone()[0]:,} patients")
+        failures = check_plans(conn)
+    finally:
+        conn.close()
+
+    if failures:
+        for name, table in failures:
+            print(f"{name} scans {table} sequentially", file=sys.stderr)
+        sys.exit(1)
+    print("All dashboard queries use index scans")
+
+
+if __name__ == '__main__':
+    main()
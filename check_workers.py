@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import psycopg2
+import websockets
+from streamlit.proto import BackMsg_pb2, ForwardMsg_pb2
+
+from auth import SessionManager, open_token_store
+from session_cookie import SESSION_COOKIE
+from db_pool import DB_SETTINGS
+from launcher import APP_SCRIPT, streamlit_flags, wait_for_port
+
+# Ports used by the check, clear of the app's defaults
+CHECK_PORT = 8811
+CHECK_WORKER_PORT = 8821
+
+# Text the patient dashboard renders once the session is restored
+DASHBOARD_TITLE = 'Patient Dashboard'
+
+# Seconds to wait for a page to render
+RENDER_TIMEOUT = 30.0
+
+# PSS each preforked worker must save against a separate streamlit process, in MB
+MIN_SAVING_PER_WORKER = 5.0
+
+# Records scored through the shared prediction cache, as the forms submit them
+SHARED_RECORDS = (
+    {'gender': 'Male', 'height': 170, 'weight': 70.0, 'ap_hi': 120, 'ap_lo': 80, 'cholesterol': 'Normal',
+     'gluc': 'Normal', 'smoke': 'No', 'alco': 'No', 'active': 'Yes', 'ageinyears': 50},
+    {'gender': 'Female', 'height': 165, 'weight': 90.0, 'ap_hi': 150, 'ap_lo': 95, 'cholesterol': 'Well Above Normal',
+     'gluc': 'Above Normal', 'smoke': 'Yes', 'alco': 'No', 'active': 'No', 'ageinyears': 60},
+    {'gender': 'Male', 'height': 180, 'weight': 80.0, 'ap_hi': 130, 'ap_lo': 85, 'cholesterol': 'Above Normal',
+     'gluc': 'Normal', 'smoke': 'No', 'alco': 'Yes', 'active': 'Yes', 'ageinyears': 45},
+)
+
+
+def memory(pid):
+    """
+    Reads the memory of a process from /proc/<pid>/smaps_rollup.
+
+    Returns:
+        dict: 'rss', 'pss' (resident memory with shared pages split between their users) and 'uss' (pages
+        only this process uses), in MB.
+    """
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0])
+    return {'rss': fields['Rss'] / 1024, 'pss': fields['Pss'] / 1024,
+            'uss': (fields['Private_Clean'] + fields['Private_Dirty']) / 1024}
+
+
+def listener(port):
+    """
+    Finds the process listening on a local TCP port.
+
+    Returns:
+        int: Its PID, or None.
+    """
+    inodes = set()
+    with open('/proc/net/tcp') as f:
+        for line in f.readlines()[1:]:
+            fields = line.split()
+            if fields[3] == '0A' and int(fields[1].rsplit(':', 1)[1], 16) == port:
+                inodes.add(fields[9])
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            for fd in os.listdir(f'/proc/{pid}/fd'):
+                link = os.readlink(f'/proc/{pid}/fd/{fd}')
+                if link.startswith('socket:[') and link[8:-1] in inodes:
+                    return int(pid)
+        except OSError:
+            continue
+    return None
+
+
+async def _render(port, token):
+    headers = {'Cookie': f'{SESSION_COOKIE}={token}'} if token else None
+    async with websockets.connect(f'ws://127.0.0.1:{port}/_stcore/stream', additional_headers=headers,
+                                  max_size=None) as ws:
+        message = BackMsg_pb2.BackMsg()
+        message.rerun_script.SetInParent()
+        await ws.send(message.SerializeToString())
+        texts = []
+        while True:
+            forward = ForwardMsg_pb2.ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(ws.recv(), RENDER_TIMEOUT))
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                if element.WhichOneof('type') in ('markdown', 'heading', 'text'):
+                    texts.append(getattr(element, element.WhichOneof('type')).body)
+            elif kind == 'script_finished':
+                return texts
+
+
+def render(port, token=None):
+    """
+    Runs the app for a new browser session over Streamlit's websocket, as a browser would.
+
+    Args:
+        port (int): Port of the worker or balancer.
+        token (str, optional): Session token the browser sends in its session cookie.
+
+    Returns:
+        list: Text of the rendered markdown and heading elements.
+    """
+    return asyncio.run(_render(port, token))
+
+
+def issue_token(username, state_dir):
+    """
+    Logs `username` in through the workers' shared session store, as the login form does.
+
+    Returns:
+        str: The session token the app keeps in the session cookie.
+    """
+    conn = psycopg2.connect(**DB_SETTINGS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""SELECT "User ID", "User Type" FROM users WHERE username = %s""", (username,))
+            user_id, user_type = cur.fetchone()
+    finally:
+        conn.close()
+    store = open_token_store(f"sqlite:{os.path.join(state_dir, 'sessions.sqlite3')}")
+    return SessionManager(store).issue(user_id, user_type.strip().lower())
+
+
+def start_preforked(workers, state_dir):
+    """
+    Starts launcher.py with `workers` workers behind its balancer.
+
+    Returns:
+        tuple: (launcher process, PIDs of the workers).
+    """
+    process = subprocess.Popen([sys.executable, 'launcher.py', f'--workers={workers}', f'--port={CHECK_PORT}',
+                                f'--worker-port={CHECK_WORKER_PORT}', f'--state-dir={state_dir}'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ports = [CHECK_WORKER_PORT + i for i in range(workers)]
+    if not all(wait_for_port('127.0.0.1', port) for port in ports + [CHECK_PORT]):
+        stop([process])
+        raise RuntimeError("The launcher's workers did not start")
+    return process, [listener(port) for port in ports]
+
+
+def start_independent(workers, state_dir):
+    """
+    Starts `workers` separate `streamlit run` processes with the same shared stores, the deployment the
+    launcher replaces.
+
+    Returns:
+        list: The processes.
+    """
+    env = dict(os.environ, CVD_SESSION_STORE=f"sqlite:{os.path.join(state_dir, 'sessions.sqlite3')}",
+               CVD_PREDICTION_CACHE_STORE=f"sqlite:{os.path.join(state_dir, 'predictions.sqlite3')}")
+    processes = [subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', APP_SCRIPT,
+                                   *streamlit_flags('127.0.0.1', CHECK_WORKER_PORT + i)],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for i in range(workers)]
+    if not all(wait_for_port('127.0.0.1', CHECK_WORKER_PORT + i) for i in range(workers)):
+        stop(processes)
+        raise RuntimeError("The streamlit processes did not start")
+    return processes
+
+
+def stop(processes):
+    for process in processes:
+        process.send_signal(signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def check_sessions(ports, token):
+    """
+    Restores one login on every port.
+
+    Returns:
+        list: Ports that did not render the dashboard.
+    """
+    return [port for port in ports if DASHBOARD_TITLE not in render(port, token)]
+
+
+def measure(pids):
+    """
+    Memory of the worker processes, with their totals.
+
+    Returns:
+        dict: Per-worker and total 'rss', 'pss' and 'uss' in MB.
+    """
+    samples = [memory(pid) for pid in pids]
+    return {'workers': samples, 'total': {key: sum(s[key] for s in samples) for key in ('rss', 'pss', 'uss')}}
+
+
+def _score_shared(path):
+    # Runs in a fresh process: scores SHARED_RECORDS through a cache backed by the shared store
+    from features import encode
+    from prediction_cache import PredictionCache
+    from tree_model import TreeEnsemble
+
+    model = TreeEnsemble.load('gb_model', mmap_mode='r')
+    cache = PredictionCache(maxsize=100, ttl=600, store=f'sqlite:{path}')
+    cache.predict(model, encode(SHARED_RECORDS))
+    return cache.stats()
+
+
+def check_prediction_cache(state_dir):
+    """
+    Scores the same records in two fresh processes sharing one prediction store.
+
+    Returns:
+        tuple: The cache statistics of the first and second process.
+    """
+    path = os.path.join(state_dir, 'predictions.sqlite3')
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        first = pool.submit(_score_shared, path).result()
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        second = pool.submit(_score_shared, path).result()
+    return first, second
+
+
+def check_restart(process, pids):
+    """
+    Kills the first worker and waits for the launcher to replace it.
+
+    Returns:
+        int: The new worker's PID, or None if none started listening.
+    """
+    os.kill(pids[0], signal.SIGKILL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        pid = listener(CHECK_WORKER_PORT)
+        if pid is not None and pid != pids[0]:
+            return pid
+        time.sleep(0.2)
+    return None
+
+
+def print_memory(label, report):
+    for i, sample in enumerate(report['workers']):
+        print(f"{label} worker {i:<3} rss {sample['rss']:7.1f} MB  pss {sample['pss']:7.1f} MB  "
+              f"uss {sample['uss']:7.1f} MB")
+    total = report['total']
+    print(f"{label} total      rss {total['rss']:7.1f} MB  pss {total['pss']:7.1f} MB  uss {total['uss']:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the multi-worker launcher: shared logins, shared "
+                                                 "predictions, worker restarts, and memory per worker.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--username', default='goodwinkenneth',
+                        help="Patient whose login is restored on every worker.")
+    parser.add_argument('--no-baseline', action='store_true',
+                        help="Skip measuring separate streamlit processes, and so the memory check.")
+    args = parser.parse_args()
+
+    failures = []
+    state_dir = tempfile.mkdtemp(prefix='cvd_workers_')
+    try:
+        process, pids = start_preforked(args.workers, state_dir)
+        try:
+            token = issue_token(args.username, state_dir)
+            ports = [CHECK_WORKER_PORT + i for i in range(args.workers)]
+            missing = check_sessions(ports + [CHECK_PORT] * args.workers, token)
+            if missing:
+                failures.append(f"The login was not restored on ports {sorted(set(missing))}")
+            else:
+                print(f"Login restored on {args.workers} workers and through the balancer")
+            preforked = measure(pids)
+            print_memory('preforked', preforked)
+
+            pid = check_restart(process, pids)
+            if pid is None or check_sessions([CHECK_WORKER_PORT], token):
+                failures.append("A killed worker was not replaced")
+            else:
+                print(f"Killed worker 0 was replaced by PID {pid}")
+        finally:
+            stop([process])
+
+        first, second = check_prediction_cache(state_dir)
+        if second['shared_hits'] != len(SHARED_RECORDS):
+            failures.append(f"The second process found {second['shared_hits']} of {len(SHARED_RECORDS)} "
+                            f"predictions in the shared store")
+        print(f"Shared prediction cache: first process scored {first['misses']}, "
+              f"second found {second['shared_hits']} in the shared store")
+
+        if not args.no_baseline:
+            processes = start_independent(args.workers, state_dir)
+            try:
+                missing = check_sessions([CHECK_WORKER_PORT + i for i in range(args.workers)], token)
+                if missing:
+                    failures.append(f"The login was not restored by separate processes on ports {missing}")
+                independent = measure([p.pid for p in processes])
+                print_memory('separate ', independent)
+            finally:
+                stop(processes)
+            saved = independent['total']['pss'] - preforked['total']['pss']
+            print(f"Preforking saves {saved:.1f} MB PSS in total, "
+                  f"{saved / args.workers:.1f} MB per worker")
+            if saved < MIN_SAVING_PER_WORKER * args.workers:
+                failures.append(f"Preforked workers saved {saved / args.workers:.1f} MB PSS each, expected at "
+                                f"least {MIN_SAVING_PER_WORKER:.1f} MB")
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    if failures:
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        sys.exit(1)
+    print("All worker checks passed")
+
+
+if __name__ == '__main__':
+    main()
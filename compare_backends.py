@@ -0,0 +1,152 @@
+import argparse
+import json
+import pickle
+import time
+
+import numpy as np
+
+from features import FEATURE_NAMES, N_FEATURES, encode
+from train import build_model, load_dataset
+from tree_model import PICKLE_PATH, TreeEnsemble
+
+# A single form submission, encoded the same way the app does it
+SAMPLE_FORM = {'gender': 'Female', 'height': 165, 'weight': 70.0, 'ap_hi': 130, 'ap_lo': 85,
+               'cholesterol': 'Above Normal', 'gluc': 'Normal', 'smoke': 'No', 'alco': 'No', 'active': 'Yes',
+               'ageinyears': 52}
+
+
+def best_time(func, repeat):
+    """
+    Runs a function repeatedly and returns the fastest run in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_contract(model, compiled, X):
+    """
+    Checks that a model keeps the app's 11-column feature contract and that its compiled form matches it.
+
+    Args:
+        model (object): Fitted scikit-learn classifier.
+        compiled (TreeEnsemble): Compiled form of the model.
+        X (numpy.ndarray): Encoded inputs to compare predictions on.
+
+    Returns:
+        dict: Whether the column count, a form submission and the compiled predictions all check out.
+    """
+    form = encode(SAMPLE_FORM)
+    feature_names = getattr(model, 'feature_names_in_', None)
+    return {
+        'n_features': model.n_features_in_ == N_FEATURES and compiled.n_features_in_ == N_FEATURES,
+        'feature_names': feature_names is None or tuple(feature_names) == FEATURE_NAMES,
+        'form_prediction': np.array_equal(model.predict(form), compiled.predict(form)),
+        'compiled_identical': (np.array_equal(model.predict_proba(X), compiled.predict_proba(X))
+                               and np.array_equal(model.predict(X), compiled.predict(X))),
+    }
+
+
+def measure(model, compiled, X_test, y_test, repeat):
+    """
+    Measures holdout AUC, single-row latency and batch throughput of a model and its compiled form.
+
+    Returns:
+        dict: AUC, best single-row latency in seconds and 10k-row batch throughput in rows per second,
+            for the scikit-learn model and the compiled ensemble.
+    """
+    from sklearn.metrics import roc_auc_score
+
+    row, batch = X_test[:1], X_test[:10000]
+    results = {'auc': roc_auc_score(y_test, compiled.predict_proba(X_test)[:, 1])}
+    for name, predictor in (('sklearn', model), ('compiled', compiled)):
+        results[f'{name}_row_seconds'] = best_time(lambda: predictor.predict_proba(row), repeat)
+        seconds = best_time(lambda: predictor.predict_proba(batch), max(repeat // 20, 3))
+        results[f'{name}_batch_rows_per_second'] = len(batch) / seconds
+    return results
+
+
+def compare(pickle_path, data_path, backends, scale=1, repeat=200, seed=0):
+    """
+    Compares model backends against the current pickle on the notebook's holdout split.
+
+    Each backend is fitted with the pickle's n_estimators, learning_rate and max_depth. Fit time is measured
+    on the training split repeated `scale` times, to see how each backend grows towards registry-sized data.
+
+    Args:
+        pickle_path (str): The current pickled model.
+        data_path (str): File in the cardio_train.csv layout.
+        backends (list): Keys of train.BACKENDS to fit.
+        scale (int, optional): Times the training split is repeated for the fit. Defaults to 1.
+        repeat (int, optional): Timed repetitions for latency, the best one is reported. Defaults to 200.
+        seed (int, optional): Random state of the fitted models. Defaults to 0.
+
+    Returns:
+        dict: Measurements per model, keyed 'pickle' and by backend name.
+    """
+    from sklearn.model_selection import train_test_split
+
+    X, y = load_dataset(data_path)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+    X_test = encode(X_test)
+    X_fit, y_fit = np.tile(X_train, (scale, 1)), np.tile(y_train, scale)
+
+    with open(pickle_path, 'rb') as file:
+        current = pickle.load(file)
+    params = {name: current.get_params()[name] for name in ('n_estimators', 'learning_rate', 'max_depth')}
+    candidates = {'pickle': (current, None)}
+    for backend in backends:
+        model = build_model(backend, params, seed)
+        start = time.perf_counter()
+        model.fit(X_fit, y_fit)
+        candidates[backend] = (model, time.perf_counter() - start)
+
+    results = {}
+    for name, (model, fit_seconds) in candidates.items():
+        compiled = TreeEnsemble.from_sklearn(model)
+        results[name] = {'fit_rows': len(X_fit) if fit_seconds is not None else None, 'fit_seconds': fit_seconds}
+        results[name].update(measure(model, compiled, X_test, y_test, repeat))
+        results[name]['contract'] = check_contract(model, compiled, X_test)
+    return results
+
+
+def print_results(results):
+    # One line per model, then the contract checks that failed
+    print(f"{'model':<24} {'AUC':>7} {'fit s':>8} {'row ms':>8} {'row ms (c)':>10} "
+          f"{'batch rows/s':>13} {'batch rows/s (c)':>16}")
+    for name, result in results.items():
+        fit = f"{result['fit_seconds']:8.2f}" if result['fit_seconds'] is not None else f"{'-':>8}"
+        print(f"{name:<24} {result['auc']:7.4f} {fit} {result['sklearn_row_seconds'] * 1e3:8.3f} "
+              f"{result['compiled_row_seconds'] * 1e3:10.3f} {result['sklearn_batch_rows_per_second']:13,.0f} "
+              f"{result['compiled_batch_rows_per_second']:16,.0f}")
+    for name, result in results.items():
+        failed = [check for check, ok in result['contract'].items() if not ok]
+        if failed:
+            print(f"{name}: contract checks failed: {', '.join(failed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare model backends against the current pickled model.")
+    parser.add_argument('--model', default=PICKLE_PATH, help="The current pickled model.")
+    parser.add_argument('--data', default='data/cardio_train.csv', help="Data in the cardio_train.csv layout.")
+    parser.add_argument('--backend', nargs='+', default=['gradient_boosting', 'hist_gradient_boosting'],
+                        help="Backends to fit, see train.BACKENDS.")
+    parser.add_argument('--scale', type=int, default=1, help="Times the training split is repeated for the fit.")
+    parser.add_argument('--repeat', type=int, default=200, help="Timed repetitions for latency.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results = compare(args.model, args.data, args.backend, scale=args.scale, repeat=args.repeat)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    if not all(all(result['contract'].values()) for result in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,35 @@
+import argparse
+import csv
+import io
+import itertools
+import random
+import re
+import time
+
 import psycopg2
 from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
+# Rows buffered per table before they are streamed to the server with COPY
+COPY_CHUNK_ROWS = 10000
+
+# Data rows in a pg_dump file: INSERT INTO <table> (<columns>) VALUES (<values>);
+INSERT_PATTERN = re.compile(r'^INSERT INTO (?P<table>\S+) \((?P<columns>[^)]*)\) VALUES \((?P<values>.*)\);\s*$')
+# One SQL literal inside a VALUES list: a quoted string (with '' escapes) or a bare token such as 42 or NULL
+LITERAL_PATTERN = re.compile(r"'((?:[^']|'')*)'|([^,\s]+)")
+
+# Names used for synthetic patients generated from cardio_train.csv
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+               "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin"]
+
 def create_database(dbname, user, host):
     # Connect to the default database
     conn = psycopg2.connect(dbname='postgres', user=user, host=host)
     conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)  # Set the isolation level for the connection
     cur = conn.cursor()
-    
+
     # Create the new database
     cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(dbname)))
     cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(dbname)))
@@ -27,9 +49,264 @@ def run_sql_file(filename, dbname, user, host):
     cur.close()
     conn.close()
 
+def copy_value(value):
+    """
+    Formats one Python value as a field of PostgreSQL's COPY text format.
+    """
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def parse_literal(match):
+    """
+    Converts one SQL literal matched by LITERAL_PATTERN to its COPY text field.
+    """
+    quoted, bare = match.groups()
+    if quoted is not None:
+        return copy_value(quoted.replace("''", "'"))
+    return '\\N' if bare.upper() == 'NULL' else bare
+
+class CopyWriter:
+    """
+    Buffers rows per table and streams them to the server with COPY FROM STDIN in chunks.
+
+    Args:
+        cur (psycopg2 cursor object): Cursor used for COPY.
+        chunk_rows (int, optional): Rows buffered before a COPY is sent. Defaults to COPY_CHUNK_ROWS.
+    """
+
+    def __init__(self, cur, chunk_rows=COPY_CHUNK_ROWS):
+        self.cur = cur
+        self.chunk_rows = chunk_rows
+        self.buffers = {}  # (table, columns) -> [StringIO, buffered rows]
+        self.report = {}  # table -> [rows, seconds]
+
+    def write_line(self, table, columns, line):
+        key = (table, columns)
+        if key not in self.buffers:
+            self.buffers[key] = [io.StringIO(), 0]
+        buffer = self.buffers[key]
+        buffer[0].write(line)
+        buffer[0].write('\n')
+        buffer[1] += 1
+        if buffer[1] >= self.chunk_rows:
+            self.flush(key)
+
+    def write_row(self, table, columns, row):
+        self.write_line(table, columns, '\t'.join(copy_value(value) for value in row))
+
+    def flush(self, key=None):
+        keys = [key] if key else list(self.buffers)
+        for table, columns in keys:
+            buffer, count = self.buffers.pop((table, columns))
+            if not count:
+                continue
+            start = time.perf_counter()
+            buffer.seek(0)
+            self.cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+            stats = self.report.setdefault(table, [0, 0.0])
+            stats[0] += count
+            stats[1] += time.perf_counter() - start
+
+def read_statements(file):
+    """
+    Streams a pg_dump file, yielding ('insert', match) for each data row and ('sql', text) for every other statement.
+    """
+    statement = []
+    for line in file:
+        if not statement:
+            match = INSERT_PATTERN.match(line)
+            if match:
+                yield 'insert', match
+                continue
+            if not line.strip() or line.startswith('--'):
+                continue
+        statement.append(line)
+        if line.rstrip().endswith(';'):
+            yield 'sql', ''.join(statement)
+            statement = []
+
+def is_deferred(statement):
+    """
+    Tells whether a schema statement can wait until after the data load: constraints, indexes and sequence values.
+    """
+    text = ' '.join(statement.split())
+    return ('ADD CONSTRAINT' in text or text.startswith('CREATE INDEX') or text.startswith('CREATE UNIQUE INDEX')
+            or text.startswith('SELECT pg_catalog.setval'))
+
+def synthetic_physicians(count, start_user_id, seed=0):
+    """
+    Generates synthetic physician users, so synthetic patients can be spread over realistic panel sizes.
+
+    Args:
+        count (int): Number of physicians to generate.
+        start_user_id (int): First "User ID" to assign.
+        seed (int, optional): Seed for names and passwords. Defaults to 0.
+
+    Yields:
+        tuple: (table, columns, row) for each row to load, in foreign key order.
+    """
+    rng = random.Random(seed)
+    for user_id in range(start_user_id, start_user_id + count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        password = ''.join(rng.choices('abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789', k=8))
+        yield ('public.users', '"User ID", username, password, "User Type"',
+               (user_id, f"physician{user_id}", password, 'physician'))
+        yield ('public.physician', '"User ID", "First Name", "Last Name", "Contact Information"',
+               (user_id, first_name, last_name, f"physician{user_id}@example.org"))
+
+def synthetic_patients(source, count, start_user_id, start_test_id, physician_ids, seed=0):
+    """
+    Generates synthetic users, patients, physician links and medical tests from cardio_train.csv records.
+
+    The source file is cycled through if more patients are requested than it holds.
+
+    Args:
+        source (str): Path to a semicolon-delimited file in the cardio_train.csv layout.
+        count (int): Number of patients to generate.
+        start_user_id (int): First "User ID" to assign.
+        start_test_id (int): First "Test ID" to assign.
+        physician_ids (list): Physicians the patients are linked to, round robin.
+        seed (int, optional): Seed for names and passwords. Defaults to 0.
+
+    Yields:
+        tuple: (table, columns, row) for each row to load, in foreign key order.
+    """
+    rng = random.Random(seed)
+
+    def records():
+        while True:
+            with open(source, newline='') as file:
+                yield from csv.DictReader(file, delimiter=';')
+
+    for i, record in enumerate(itertools.islice(records(), count)):
+        user_id, test_id = start_user_id + i, start_test_id + i
+        physician_id = physician_ids[i % len(physician_ids)]
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        password = ''.join(rng.choices('abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789', k=8))
+        yield ('public.users', '"User ID", username, password, "User Type"',
+               (user_id, f"synthetic{user_id}", password, 'patient'))
+        yield ('public.patient', '"User ID", "First Name", "Last Name", age, gender, "Contact Information", height, '
+                                 'weight, "Smoke History", "Alcohol Consumption", "Exercise Level"',
+               (user_id, first_name, last_name, int(record['age']) // 365, record['gender'],
+                f"synthetic{user_id}@example.org", int(float(record['height'])), record['weight'],
+                record['smoke'], record['alco'], record['active']))
+        yield ('public.physicianpatientlink', '"Physician ID", "Patient ID"', (physician_id, user_id))
+        yield ('public.medicaltest', '"Test ID", "Physician ID", "Patient ID", "Diastolic Blood Pressure", '
+                                     '"Systolic Blood Pressure", cholesterol, glucose, "Cardiovascular Disease"',
+               (test_id, physician_id, user_id, record['ap_lo'], record['ap_hi'], record['cholesterol'],
+                record['gluc'], record['cardio']))
+
+def bulk_load_sql_file(filename, dbname, user, host, synthetic_source=None, synthetic_count=0,
+                       patients_per_physician=None, chunk_rows=COPY_CHUNK_ROWS):
+    """
+    Loads a pg_dump file with COPY instead of running its single-row INSERT statements.
+
+    The file is streamed line by line. Tables, sequences and defaults are created first, data rows are
+    streamed per table through COPY FROM STDIN, and constraints, indexes and sequence values are applied
+    after all data is loaded, so keys and foreign keys are validated once instead of per row.
+
+    Args:
+        filename (str): Path to the pg_dump file.
+        dbname (str): Database to load into.
+        user (str): Database user.
+        host (str): Database host.
+        synthetic_source (str, optional): File in the cardio_train.csv layout to generate extra patients from.
+        synthetic_count (int, optional): Number of synthetic patients to add. Defaults to 0.
+        patients_per_physician (int, optional): Also add synthetic physicians so each has about this many
+            synthetic patients. Defaults to None, which links them to the existing physicians.
+        chunk_rows (int, optional): Rows per COPY chunk. Defaults to COPY_CHUNK_ROWS.
+
+    Returns:
+        dict: Seconds spent per phase and [rows, seconds] per table.
+    """
+    conn = psycopg2.connect(dbname=dbname, user=user, host=host)
+    cur = conn.cursor()
+    writer = CopyWriter(cur, chunk_rows)
+    deferred = []
+    report = {'schema': 0.0}
+
+    # Schema statements run as they are read, data rows are buffered for COPY
+    start = time.perf_counter()
+    with open(filename, 'r') as file:
+        for kind, item in read_statements(file):
+            if kind == 'insert':
+                fields = [parse_literal(match) for match in LITERAL_PATTERN.finditer(item['values'])]
+                writer.write_line(item['table'], item['columns'], '\t'.join(fields))
+            elif is_deferred(item):
+                deferred.append(item)
+            else:
+                writer.flush()
+                statement_start = time.perf_counter()
+                cur.execute(item)
+                report['schema'] += time.perf_counter() - statement_start
+    writer.flush()
+
+    if synthetic_count:
+        cur.execute('SELECT max("User ID") FROM public.users')
+        start_user_id = (cur.fetchone()[0] or 0) + 1
+        cur.execute('SELECT coalesce(max("Test ID"), 0) + 1 FROM public.medicaltest')
+        start_test_id = cur.fetchone()[0]
+        cur.execute('SELECT "User ID" FROM public.physician ORDER BY "User ID"')
+        physician_ids = [row[0] for row in cur.fetchall()]
+        if patients_per_physician:
+            physician_count = -(-synthetic_count // patients_per_physician)
+            for table, columns, row in synthetic_physicians(physician_count, start_user_id):
+                writer.write_row(table, columns, row)
+            physician_ids = list(range(start_user_id, start_user_id + physician_count))
+            start_user_id += physician_count
+        for table, columns, row in synthetic_patients(synthetic_source, synthetic_count, start_user_id,
+                                                      start_test_id, physician_ids):
+            writer.write_row(table, columns, row)
+        writer.flush()
+
+    # Keys, foreign keys and sequence values once all rows are in place
+    constraints_start = time.perf_counter()
+    for statement in deferred:
+        cur.execute(statement)
+    # Move sequences past the loaded IDs so new rows don't collide with them
+    cur.execute("""SELECT pg_catalog.setval('public.users_user_id_seq', max("User ID")) FROM public.users""")
+    cur.execute("""SELECT pg_catalog.setval('public."medicaltest_Test ID_seq"', max("Test ID"))
+                   FROM public.medicaltest HAVING count(*) > 0""")
+    conn.commit()
+    report['constraints'] = time.perf_counter() - constraints_start
+    report['tables'] = writer.report
+    report['total'] = time.perf_counter() - start
+    cur.close()
+    conn.close()
+    return report
+
+def print_report(report):
+    # Print the time spent per phase and per table
+    for table, (rows, seconds) in sorted(report['tables'].items()):
+        rate = rows / seconds if seconds else 0.0
+        print(f"{table:<32} {rows:>10} rows {seconds:8.3f}s ({rate:,.0f} rows/sec)")
+    print(f"{'schema':<32} {'':>15} {report['schema']:8.3f}s")
+    print(f"{'constraints and sequences':<32} {'':>15} {report['constraints']:8.3f}s")
+    print(f"{'total':<32} {'':>15} {report['total']:8.3f}s")
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create and populate the decision support database.")
     # Change the database name, user, and host if neccessary, assuming there is not password or port
-    create_database(dbname = 'Test', user='dadb', host='127.0.0.1')
-    
-    # Change the database name, user, and host if neccessary, assuming there is not password or port
-    run_sql_file('data/database.sql', dbname='Test', user='dadb', host='127.0.0.1')
\ No newline at end of file
+    parser.add_argument('--dbname', default='Test')
+    parser.add_argument('--user', default='dadb')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--sql-file', default='data/database.sql')
+    parser.add_argument('--bulk', action='store_true', help="Load data rows with COPY instead of running the INSERTs.")
+    parser.add_argument('--synthetic-patients', type=int, default=0,
+                        help="Synthetic patients to add from --synthetic-source (bulk mode only).")
+    parser.add_argument('--synthetic-source', default='data/cardio_train.csv')
+    parser.add_argument('--patients-per-physician', type=int, default=None,
+                        help="Add synthetic physicians with panels of about this many synthetic patients.")
+    args = parser.parse_args()
+
+    create_database(dbname=args.dbname, user=args.user, host=args.host)
+
+    if args.bulk:
+        print_report(bulk_load_sql_file(args.sql_file, dbname=args.dbname, user=args.user, host=args.host,
+                                        synthetic_source=args.synthetic_source,
+                                        synthetic_count=args.synthetic_patients,
+                                        patients_per_physician=args.patients_per_physician))
+    else:
+        run_sql_file(args.sql_file, dbname=args.dbname, user=args.user, host=args.host)
@@ -0,0 +1,309 @@
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from features import FEATURE_NAMES
+from train import CSV_CHUNK_ROWS, CSV_DTYPES, file_sha256
+
+# Training data and the directory of column files converted from it
+DATA_PATH = 'data/cardio_train.csv'
+CACHE_SUFFIX = '_columns'
+
+# Cache format, checked when loading so an incompatible cache is rejected
+FORMAT_NAME = 'cvd-columns'
+FORMAT_VERSION = 1
+HEADER_FILE = 'columns.json'
+
+# Columns derived while converting: name -> (storage dtype, function of a parsed chunk). Ages are
+# computed in float64 like the notebook before storing them compactly.
+DERIVED_COLUMNS = {
+    'ageinyears': (np.float32, lambda chunk: chunk['age'] / 365),
+}
+
+# Bytes read per block while counting and hashing the CSV
+BLOCK_BYTES = 1 << 20
+
+
+def default_cache_path(csv_path=DATA_PATH):
+    """
+    Names the cache directory of a CSV file: data/cardio_train.csv is cached in data/cardio_train_columns.
+    """
+    return os.path.splitext(csv_path)[0] + CACHE_SUFFIX
+
+
+def _scan(csv_path):
+    # Counts the data rows of the file and hashes it in one pass
+    digest = hashlib.sha256()
+    lines, last = 0, b'\n'
+    with open(csv_path, 'rb') as file:
+        for block in iter(lambda: file.read(BLOCK_BYTES), b''):
+            digest.update(block)
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return lines - 1, digest.hexdigest()
+
+
+def _source(csv_path):
+    stat = os.stat(csv_path)
+    return {'path': csv_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def convert(csv_path=DATA_PATH, path=None, chunk_rows=CSV_CHUNK_ROWS, verbose=True):
+    """
+    Converts a CSV in the cardio_train.csv layout into one .npy file per column.
+
+    Columns are stored with the compact dtypes train.py parses them with, next to the derived columns of
+    DERIVED_COLUMNS, so loaders neither parse text nor derive anything. The CSV is streamed in chunks into
+    memory-mapped column files, and a columns.json header recording the row count, dtypes and the source
+    file's size, modification time and SHA-256 is written last, so a directory with a header always holds
+    complete columns.
+
+    Args:
+        csv_path (str, optional): Semicolon-delimited file to convert. Defaults to DATA_PATH.
+        path (str, optional): Directory to write. Defaults to default_cache_path(csv_path).
+        chunk_rows (int, optional): Rows parsed per chunk. Defaults to CSV_CHUNK_ROWS.
+        verbose (bool, optional): Print a summary. Defaults to True.
+
+    Returns:
+        dict: The header just written.
+    """
+    import pandas as pd
+
+    path = path or default_cache_path(csv_path)
+    start = time.perf_counter()
+    source = _source(csv_path)
+    rows, sha256 = _scan(csv_path)
+    dtypes = {name: np.dtype(dtype) for name, dtype in CSV_DTYPES.items()}
+    dtypes.update({name: np.dtype(dtype) for name, (dtype, _) in DERIVED_COLUMNS.items()})
+
+    os.makedirs(path, exist_ok=True)
+    header_path = os.path.join(path, HEADER_FILE)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+    columns = {name: np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+', dtype=dtype,
+                                               shape=(rows,))
+               for name, dtype in dtypes.items()}
+    written = 0
+    for chunk in pd.read_csv(csv_path, delimiter=';', dtype=CSV_DTYPES, chunksize=chunk_rows):
+        if written + len(chunk) > rows:
+            raise ValueError(f"{csv_path} has more records than lines")
+        for name, (dtype, derive) in DERIVED_COLUMNS.items():
+            chunk[name] = derive(chunk)
+        for name, column in columns.items():
+            column[written:written + len(chunk)] = chunk[name].to_numpy(dtype=dtypes[name])
+        written += len(chunk)
+    if written != rows:
+        raise ValueError(f"{csv_path} has {rows} lines but {written} records; remove its blank lines")
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    header = {
+        'format': FORMAT_NAME,
+        'format_version': FORMAT_VERSION,
+        'rows': rows,
+        'columns': {name: dtype.str for name, dtype in dtypes.items()},
+        'source': dict(source, sha256=sha256),
+    }
+    with open(header_path, 'w') as file:
+        json.dump(header, file, indent=2)
+    if verbose:
+        size = sum(os.path.getsize(os.path.join(path, f'{name}.npy')) for name in dtypes)
+        print(f"Converted {rows:,} records of {csv_path} ({source['size'] / 1e6:.1f} MB) into {len(dtypes)} "
+              f"columns in {path} ({size / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s")
+    return header
+
+
+def read_header(path):
+    """
+    Reads the header of a cache written by convert().
+
+    Returns:
+        dict: The header, or None if the directory holds no complete cache.
+    """
+    try:
+        with open(os.path.join(path, HEADER_FILE)) as file:
+            header = json.load(file)
+    except FileNotFoundError:
+        return None
+    if header.get('format') != FORMAT_NAME or header.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported column cache in {path}: {header.get('format')} "
+                         f"version {header.get('format_version')}")
+    return header
+
+
+def is_fresh(csv_path=DATA_PATH, path=None):
+    """
+    Checks that a cache exists and was converted from the CSV as it is now: by its size and modification time,
+    then, as an edit can keep both, by its SHA-256.
+    """
+    header = read_header(path or default_cache_path(csv_path))
+    if header is None or not os.path.exists(csv_path):
+        return False
+    source = _source(csv_path)
+    if header['source']['size'] != source['size'] or header['source']['mtime_ns'] != source['mtime_ns']:
+        return False
+    return header['source']['sha256'] == file_sha256(csv_path)
+
+
+def load_columns(columns=None, path=None, mmap_mode='r'):
+    """
+    Memory-maps the requested columns of a cache; only the pages a job touches are read from disk.
+
+    Args:
+        columns (sequence, optional): Column names. Defaults to every column.
+        path (str, optional): Cache directory. Defaults to the cache of DATA_PATH.
+        mmap_mode (str, optional): Passed to numpy.load; None reads the columns into memory. Defaults to 'r'.
+
+    Returns:
+        dict: Array per column name, in the requested order.
+    """
+    path = path or default_cache_path()
+    header = read_header(path)
+    if header is None:
+        raise FileNotFoundError(f"No column cache in {path}, create it with: python dataset_cache.py convert")
+    names = list(columns) if columns is not None else list(header['columns'])
+    unknown = [name for name in names if name not in header['columns']]
+    if unknown:
+        raise KeyError(f"Columns {unknown} are not cached in {path}, expected some of {list(header['columns'])}")
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+            for name in names}
+
+
+def load_features(path=None):
+    """
+    Loads the model inputs and labels from a cache, as train.load_dataset returns them from the CSV.
+
+    Returns:
+        tuple: float32 feature matrix of shape (n_records, 11) in the model's column order, and the int8
+            cardio labels of shape (n_records,).
+    """
+    columns = load_columns(FEATURE_NAMES + ('cardio',), path)
+    X = np.empty((len(columns['cardio']), len(FEATURE_NAMES)), dtype=np.float32)
+    for i, name in enumerate(FEATURE_NAMES):
+        X[:, i] = columns[name]
+    return X, np.array(columns['cardio'])
+
+
+def _peak_rss_mb():
+    # The high-water mark of this process image; ru_maxrss would include the parent's memory from before exec
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(case, csv_path, cache_path):
+    # Runs one loader in a fresh process and reports its time and the process's peak memory, including the
+    # libraries the loader needs: the CSV loaders need pandas, the column loaders only numpy
+    start = time.perf_counter()
+    if case == 'csv_read':
+        import pandas as pd
+
+        data = pd.read_csv(csv_path, sep=';')
+        data['ageinyears'] = data['age'] / 365
+        data = data.drop(columns='id')
+        checksum = float(data['ap_hi'].sum())
+    elif case == 'csv_load_dataset':
+        from train import load_dataset
+
+        X, y = load_dataset(csv_path, use_cache=False)
+        checksum = float(X[:, FEATURE_NAMES.index('ap_hi')].sum())
+    elif case == 'columns_load_features':
+        X, y = load_features(cache_path)
+        checksum = float(X[:, FEATURE_NAMES.index('ap_hi')].sum())
+    elif case == 'columns_two':
+        columns = load_columns(['ap_hi', 'cardio'], cache_path)
+        checksum = float(columns['ap_hi'].sum())
+    else:
+        raise ValueError(f"Unknown benchmark case {case!r}")
+    return {'seconds': time.perf_counter() - start, 'peak_rss_mb': _peak_rss_mb(), 'checksum': checksum}
+
+
+# Loaders compared by the benchmark: the notebook's read_csv, train.py's CSV loader, the cached model inputs,
+# and the two columns a summary query needs
+BENCHMARK_CASES = ('csv_read', 'csv_load_dataset', 'columns_load_features', 'columns_two')
+
+
+def benchmark(csv_path=DATA_PATH, scale=1, repeat=3):
+    """
+    Compares loading the CSV with loading the column cache, each run in a fresh process.
+
+    Args:
+        csv_path (str, optional): Training data. Defaults to DATA_PATH.
+        scale (int, optional): Benchmark a copy of the data with its records repeated this many times, to see
+            how the loaders grow with the extract. Defaults to 1.
+        repeat (int, optional): Runs per loader; the fastest is reported. Defaults to 3.
+
+    Returns:
+        dict: Per case the best time in seconds and the process's peak memory in MB, plus the conversion time.
+    """
+    directory = tempfile.mkdtemp(prefix='cvd-columns-')
+    try:
+        if scale > 1:
+            scaled_path = os.path.join(directory, 'cardio_train.csv')
+            with open(csv_path) as source, open(scaled_path, 'w') as target:
+                header, body = source.readline(), source.read()
+                if not body.endswith('\n'):
+                    body += '\n'
+                target.write(header)
+                for _ in range(scale):
+                    target.write(body)
+            csv_path = scaled_path
+        cache_path = os.path.join(directory, 'columns')
+        start = time.perf_counter()
+        rows = convert(csv_path, cache_path, verbose=False)['rows']
+        results = {'rows': rows, 'csv_mb': os.path.getsize(csv_path) / 1e6, 'convert_seconds': time.perf_counter() - start}
+        for case in BENCHMARK_CASES:
+            runs = []
+            for _ in range(repeat):
+                # A fresh process per run, so peak memory is not inherited from an earlier loader
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                    runs.append(pool.submit(_run_case, case, csv_path, cache_path).result())
+            results[case] = {'seconds': min(run['seconds'] for run in runs),
+                             'peak_rss_mb': min(run['peak_rss_mb'] for run in runs)}
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert cardio_train.csv into memory-mapped column files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help="Write the column cache of a CSV.")
+    convert_parser.add_argument('--data', default=DATA_PATH)
+    convert_parser.add_argument('--out', help="Cache directory, next to the CSV by default.")
+    benchmark_parser = subparsers.add_parser('benchmark', help="Compare load time and memory with the CSV.")
+    benchmark_parser.add_argument('--data', default=DATA_PATH)
+    benchmark_parser.add_argument('--scale', type=int, default=1, help="Repeat the records this many times.")
+    benchmark_parser.add_argument('--repeat', type=int, default=3, help="Runs per loader.")
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        convert(args.data, args.out)
+        return
+
+    results = benchmark(args.data, args.scale, args.repeat)
+    print(f"{results['rows']:,} records, {results['csv_mb']:.1f} MB of CSV, converted in "
+          f"{results['convert_seconds']:.2f}s")
+    for case in BENCHMARK_CASES:
+        print(f"{case:<24} {results[case]['seconds'] * 1000:>9.1f} ms  {results[case]['peak_rss_mb']:>8.1f} MB peak RSS")
+
+
+if __name__ == '__main__':
+    main()
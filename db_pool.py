@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+# Connection settings shared by the app and the command line tools.
+# Each value can be overridden through the environment, assuming there is no password or port by default.
+DB_SETTINGS = {
+    'host': os.environ.get('CVD_DB_HOST', '127.0.0.1'),
+    'dbname': os.environ.get('CVD_DB_NAME', 'DSS'),
+    'user': os.environ.get('CVD_DB_USER', 'dadb'),
+}
+
+# Default pool sizing for one server process
+POOL_SETTINGS = {
+    'minconn': int(os.environ.get('CVD_DB_POOL_MIN', 1)),
+    'maxconn': int(os.environ.get('CVD_DB_POOL_MAX', 10)),
+}
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection becomes available within the checkout timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections shared by every session of a server process.
+
+    Connections are borrowed with the `connection()` context manager and returned automatically.
+    A connection that has been idle longer than `health_check_interval` seconds is pinged before
+    it is handed out, and broken connections are replaced transparently.
+
+    Args:
+        minconn (int): Number of connections opened up front and kept warm.
+        maxconn (int): Maximum number of connections open at the same time.
+        timeout (float): Seconds to wait for a free connection before raising PoolTimeout.
+        health_check_interval (float): Idle seconds after which a connection is pinged before reuse.
+        **connect_kwargs: Keyword arguments passed to psycopg2.connect.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=30.0, health_check_interval=30.0, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: minconn=%s, maxconn=%s" % (minconn, maxconn))
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = connect_kwargs or dict(DB_SETTINGS)
+
+        self._lock = threading.Condition()
+        self._idle = []  # Stack of (connection, time it was returned)
+        self._size = 0  # Connections currently open, idle or checked out
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            with self._lock:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        with self._lock:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        """
+        Checks that a connection is still usable, pinging the server if it has been idle for a while.
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats['connections_discarded'] += 1
+            self._lock.notify()
+
+    def getconn(self, timeout=None):
+        """
+        Borrows a connection from the pool, waiting for one to be returned if the pool is at capacity.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to the pool's timeout.
+
+        Returns:
+            psycopg2 connection object: A healthy connection that must be handed back with putconn().
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            conn, idle_since = None, None
+            with self._lock:
+                while not self._idle and self._size >= self.maxconn and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout("No database connection available after %.1f seconds" % timeout)
+                    self._lock.wait(remaining)
+                if self._closed:
+                    raise psycopg2.InterfaceError("Connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    self._size += 1  # Reserve a slot before connecting outside the lock
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                with self._lock:
+                    self._stats['health_check_failures'] += 1
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - start
+            with self._lock:
+                self._stats['checkouts'] += 1
+                self._stats['wait_time_total'] += waited
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """
+        Returns a borrowed connection to the pool, rolling back any transaction left open.
+
+        Args:
+            conn (psycopg2 connection object): The connection obtained from getconn().
+            discard (bool, optional): Close the connection instead of reusing it. Defaults to False.
+        """
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager that borrows a connection and always returns it to the pool.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free connection.
+
+        Yields:
+            psycopg2 connection object: The borrowed connection.
+        """
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            # The server or network went away, do not hand this connection out again
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool's checkout and wait-time metrics.
+
+        Returns:
+            dict: Pool size, idle and in-use counts, and cumulative checkout statistics.
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+            snapshot['in_use'] = self._size - len(self._idle)
+            snapshot['maxconn'] = self.maxconn
+        checkouts = snapshot['checkouts']
+        snapshot['wait_time_avg'] = snapshot['wait_time_total'] / checkouts if checkouts else 0.0
+        return snapshot
+
+    def closeall(self):
+        """
+        Closes every idle connection and refuses further checkouts.
+        Connections still borrowed are closed when they are returned.
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._lock.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
@@ -0,0 +1,607 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from features import FEATURE_NAMES, FEATURES
+from instrumentation import REGISTRY
+from tree_model import MODEL_PATH, load_model
+
+# Drift monitoring settings; the app and the scoring service only monitor when the reference file exists.
+# Every server process needs its own state file.
+DRIFT_SETTINGS = {
+    'reference': os.environ.get('CVD_DRIFT_REFERENCE', 'drift_reference.json'),
+    'state': os.environ.get('CVD_DRIFT_STATE', 'drift_state.json'),
+    'window': int(os.environ.get('CVD_DRIFT_WINDOW', 1000)),
+    'interval': float(os.environ.get('CVD_DRIFT_INTERVAL', 60.0)),
+}
+
+# Reference file format, checked when loading so an incompatible reference is rejected
+FORMAT_NAME = 'cvd-drift-reference'
+FORMAT_VERSION = 1
+
+# Columns with at most this many distinct training values get one bin per value, the others one per decile
+MAX_CATEGORIES = 12
+DECILES = tuple(np.linspace(0.1, 0.9, 9).round(1))
+
+# Bins of the predicted probability of the positive class
+PROBABILITY_EDGES = DECILES
+
+# Quantiles reported for the binned numeric columns
+REPORT_QUANTILES = (0.05, 0.5, 0.95)
+
+# Population stability index (PSI) above which a column is worth watching, and above which it has drifted
+PSI_WATCH = 0.1
+PSI_DRIFT = 0.25
+
+# Smallest bin share used in the PSI, so a bin empty on one side gives a large but finite value
+PSI_EPSILON = 1e-4
+
+# Observations queued for the monitor thread; beyond this the oldest are dropped so memory stays bounded
+MAX_PENDING = 10000
+
+# Seconds between the monitor thread's passes over the queue
+DRAIN_INTERVAL = 1.0
+
+# Drift alerts kept in the state, newest last
+MAX_ALERTS = 50
+
+# Metrics of the monitored inputs, exported with the app's latency metrics
+OBSERVATIONS = REGISTRY.counter('cvd_drift_observations_total', "Predictions seen by the drift monitor.")
+DROPPED = REGISTRY.counter('cvd_drift_dropped_total', "Predictions dropped because the monitor fell behind.")
+OUT_OF_RANGE = REGISTRY.counter('cvd_drift_out_of_range_total', "Inputs outside the schema's valid range.",
+                                ('column',))
+PSI = REGISTRY.gauge('cvd_drift_psi', "Population stability index of the last full window against the "
+                                      "training data.", ('column',))
+WINDOW_MEAN = REGISTRY.gauge('cvd_drift_window_mean', "Mean of each column over the last full window.",
+                             ('column',))
+ALERTS = REGISTRY.counter('cvd_drift_alerts_total', "Windows in which a column drifted.", ('column',))
+ERRORS = REGISTRY.counter('cvd_drift_errors_total', "Passes of the monitor thread that failed.")
+
+# Failures of the monitor thread are logged here, as nothing else would report them
+logger = logging.getLogger(__name__)
+
+_MIN_VALUES = np.array([feature.min_value for feature in FEATURES], dtype=np.float64)
+_MAX_VALUES = np.array([feature.max_value for feature in FEATURES], dtype=np.float64)
+
+
+def _counts_state(counts):
+    # Columns never observed have infinite minimums and maximums, saved as JSON nulls
+    return {key: [value if np.isfinite(value) else None for value in values.tolist()]
+            for key, values in counts.items()}
+
+
+def bin_edges(values):
+    """
+    Chooses the bin edges of a column from its training values.
+
+    Args:
+        values (numpy.ndarray): Training values of the column.
+
+    Returns:
+        tuple: Increasing inner bin edges, and whether the column is categorical (one bin per distinct value).
+    """
+    distinct = np.unique(values)
+    if len(distinct) <= MAX_CATEGORIES:
+        return (distinct[:-1] + distinct[1:]) / 2, True
+    return np.unique(np.quantile(values, DECILES)), False
+
+
+def bin_index(values, edges):
+    """
+    Bins values: bin 0 holds values below edges[0], bin i values in [edges[i - 1], edges[i]).
+    """
+    return np.searchsorted(edges, values, side='right')
+
+
+def psi(expected, actual):
+    """
+    Population stability index of observed bin counts against reference bin shares.
+
+    Args:
+        expected (numpy.ndarray): Reference share per bin, summing to 1.
+        actual (numpy.ndarray): Observed count per bin.
+
+    Returns:
+        float: sum((q - p) * ln(q / p)) over the bins; 0 when nothing was observed.
+    """
+    total = actual.sum()
+    if not total:
+        return 0.0
+    p = np.maximum(expected, PSI_EPSILON)
+    q = np.maximum(actual / total, PSI_EPSILON)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def status(value):
+    """
+    Names the drift level of a PSI: 'ok', 'watch' or 'drift'.
+    """
+    if value >= PSI_DRIFT:
+        return 'drift'
+    return 'watch' if value >= PSI_WATCH else 'ok'
+
+
+def histogram_quantiles(counts, edges, minimum, maximum, quantiles=REPORT_QUANTILES):
+    """
+    Estimates quantiles from bin counts, interpolating linearly within each bin.
+
+    The outer bins are bounded by the smallest and largest values observed.
+
+    Args:
+        counts (numpy.ndarray): Count per bin.
+        edges (numpy.ndarray): Inner bin edges.
+        minimum (float): Smallest observed value.
+        maximum (float): Largest observed value.
+        quantiles (tuple, optional): Quantiles to estimate. Defaults to REPORT_QUANTILES.
+
+    Returns:
+        list: Estimate per quantile, or None per quantile if nothing was observed.
+    """
+    total = counts.sum()
+    if not total:
+        return [None] * len(quantiles)
+    bounds = np.clip(np.concatenate(([minimum], edges, [maximum])), minimum, maximum)
+    cumulative = np.cumsum(counts)
+    estimates = []
+    for quantile in quantiles:
+        rank = quantile * total
+        i = min(int(np.searchsorted(cumulative, rank, side='left')), len(counts) - 1)
+        before = cumulative[i] - counts[i]
+        share = (rank - before) / counts[i] if counts[i] else 0.0
+        estimates.append(float(bounds[i] + share * (bounds[i + 1] - bounds[i])))
+    return estimates
+
+
+def build_reference(data_path='data/cardio_train.csv', model_path=MODEL_PATH, path=DRIFT_SETTINGS['reference']):
+    """
+    Summarizes the training data and the model's predictions on it into the reference the monitor compares with.
+
+    Every model input gets bins and the share of training records per bin. The model's predicted class and
+    positive class probability on the training data are summarized the same way, next to the observed rate
+    of the positive label, so a shift in predicted risk can be told apart from a shift in inputs.
+
+    Args:
+        data_path (str, optional): Training data in the cardio_train.csv layout.
+        model_path (str, optional): Model artifact or pickled model. Defaults to MODEL_PATH.
+        path (str, optional): JSON file to write. Defaults to DRIFT_SETTINGS['reference'].
+
+    Returns:
+        dict: The reference just written.
+    """
+    from train import load_dataset
+
+    X, y = load_dataset(data_path)
+    X = X.astype(np.float64)
+    model = load_model(model_path)
+    labels, proba = model.predict_with_proba(X)
+    values = dict(zip(FEATURE_NAMES, X.T))
+    values['prediction'] = labels.astype(np.float64)
+    values['probability'] = proba[:, 1]
+
+    columns = []
+    for name, column in values.items():
+        if name == 'probability':
+            edges, categorical = np.array(PROBABILITY_EDGES), False
+        else:
+            edges, categorical = bin_edges(column)
+        counts = np.bincount(bin_index(column, edges), minlength=len(edges) + 1)
+        columns.append({
+            'name': name,
+            'categorical': bool(categorical),
+            'edges': edges.tolist(),
+            'shares': (counts / len(column)).tolist(),
+            'mean': float(column.mean()),
+            'min': float(column.min()),
+            'max': float(column.max()),
+            'quantiles': np.quantile(column, REPORT_QUANTILES).tolist(),
+        })
+    reference = {
+        'format': FORMAT_NAME,
+        'format_version': FORMAT_VERSION,
+        'model_version': model.version,
+        'rows': int(len(X)),
+        'label_rate': float(y.mean()),
+        'columns': columns,
+    }
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(reference, file, indent=1)
+    os.replace(temporary, path)
+    return reference
+
+
+def load_reference(path=DRIFT_SETTINGS['reference']):
+    """
+    Reads a reference written by build_reference().
+
+    Returns:
+        dict: The reference.
+    """
+    with open(path) as file:
+        reference = json.load(file)
+    if reference.get('format') != FORMAT_NAME or reference.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported drift reference in {path}: {reference.get('format')} "
+                         f"version {reference.get('format_version')}")
+    names = tuple(column['name'] for column in reference['columns'])
+    if names != FEATURE_NAMES + ('prediction', 'probability'):
+        raise ValueError(f"Drift reference in {path} was built for other model inputs: {names}")
+    return reference
+
+
+class DriftMonitor:
+    """
+    Constant-memory drift monitor of the inputs and predictions reaching the model.
+
+    `observe` only queues the records, so the submit path pays for one deque append. A background thread
+    bins the queued records every second into fixed histograms: one per model input plus the predicted
+    class and, where the caller has it, the predicted probability. It keeps counts since the state was
+    started and counts of the current window. The window closes after `window` predictions. Its PSI per
+    column against the training reference is then exported as metrics, and a column above PSI_DRIFT raises
+    an alert. Memory stays constant: a few counts per bin, plus at most MAX_PENDING queued records.
+
+    Predictions are compared only when they come from the model version the reference was built with.
+    The counts are saved to `state_path` every `interval` seconds and reloaded at startup, so restarts
+    continue the histograms.
+
+    Args:
+        reference (dict): Output of load_reference().
+        state_path (str, optional): JSON file the counts are saved to and resumed from. Defaults to None,
+            keeping them in memory only.
+        window (int, optional): Predictions per drift window. Defaults to 1000.
+        interval (float, optional): Seconds between saves of the state. Defaults to 60.
+    """
+
+    def __init__(self, reference, state_path=None, window=1000, interval=60.0):
+        self.reference = reference
+        self.state_path = state_path
+        self.window = window
+        self.interval = interval
+        self.model_version = reference['model_version']
+        columns = reference['columns']
+        self.names = [column['name'] for column in columns]
+        self._edges = [np.array(column['edges'], dtype=np.float64) for column in columns]
+        self._expected = [np.array(column['shares'], dtype=np.float64) for column in columns]
+        sizes = [len(edges) + 1 for edges in self._edges]
+        self._offsets = np.concatenate(([0], np.cumsum(sizes)))
+        self._id = hashlib.sha256(json.dumps([column['edges'] for column in columns]).encode()).hexdigest()[:16]
+
+        self._pending = deque(maxlen=MAX_PENDING)
+        self._lock = threading.Lock()
+        self._total = self._empty_counts()
+        self._current = self._empty_counts()
+        self._last_window = None
+        self._alerts = deque(maxlen=MAX_ALERTS)
+        self._stats = {'observed': 0, 'dropped': 0, 'windows': 0, 'saves': 0, 'last_save': None, 'errors': 0,
+                       'last_error': None}
+        if state_path and os.path.exists(state_path):
+            self._restore(state_path)
+
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='cvd-drift-monitor', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def load(cls, reference=DRIFT_SETTINGS['reference'], state=DRIFT_SETTINGS['state'],
+             window=DRIFT_SETTINGS['window'], interval=DRIFT_SETTINGS['interval']):
+        """
+        Starts a monitor from a reference file, resuming the saved state if there is one.
+
+        Args:
+            reference (str, optional): Reference file. Defaults to DRIFT_SETTINGS['reference'].
+            state (str, optional): State file. Defaults to DRIFT_SETTINGS['state'].
+            window (int, optional): Predictions per drift window. Defaults to DRIFT_SETTINGS['window'].
+            interval (float, optional): Seconds between saves. Defaults to DRIFT_SETTINGS['interval'].
+
+        Returns:
+            DriftMonitor: The running monitor.
+        """
+        return cls(load_reference(reference), state_path=state, window=window, interval=interval)
+
+    def _empty_counts(self):
+        # Predictions counted, then counts per bin of every column, and per column its observations, sum,
+        # minimum and maximum; columns skip missing values, so only 'rows' counts every prediction
+        return {'rows': np.zeros(1, dtype=np.int64),
+                'bins': np.zeros(self._offsets[-1], dtype=np.int64),
+                'count': np.zeros(len(self.names), dtype=np.int64),
+                'sum': np.zeros(len(self.names), dtype=np.float64),
+                'min': np.full(len(self.names), np.inf),
+                'max': np.full(len(self.names), -np.inf),
+                'out_of_range': np.zeros(len(FEATURE_NAMES), dtype=np.int64)}
+
+    def observe(self, X, predictions, probabilities=None, model_version=None):
+        """
+        Queues predicted records for the monitor thread.
+
+        Args:
+            X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+            predictions (numpy.ndarray): Predicted class per record.
+            probabilities (numpy.ndarray, optional): Predicted probability of the positive class per record.
+                Defaults to None, when the caller only has the class.
+            model_version (str, optional): Version of the model that predicted. Predictions of other
+                versions than the reference's are not compared. Defaults to None.
+        """
+        if len(self._pending) == MAX_PENDING:
+            with self._lock:
+                self._stats['dropped'] += 1
+            DROPPED.inc()
+        self._pending.append((X, predictions, probabilities, model_version))
+
+    def _run(self):
+        last_save = time.monotonic()
+        while not self._stop:
+            self._wake.wait(DRAIN_INTERVAL)
+            try:
+                self._drain()
+                if self.state_path and time.monotonic() - last_save >= self.interval:
+                    last_save = time.monotonic()
+                    self.save()
+            except Exception as e:
+                # A failed drain or save must not stop the monitoring of the predictions that follow
+                logger.exception("Drift monitor iteration failed")
+                with self._lock:
+                    self._stats['errors'] += 1
+                    self._stats['last_error'] = f'{type(e).__name__}: {e}'
+                ERRORS.inc()
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self._pending.popleft())
+            except IndexError:
+                break
+        if not items:
+            return
+        X = np.concatenate([np.asarray(item[0], dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+                            for item in items])
+        values = np.full((len(X), len(self.names)), np.nan)
+        values[:, :len(FEATURE_NAMES)] = X
+        start = 0
+        for _, predictions, probabilities, model_version in items:
+            rows = len(np.atleast_1d(predictions))
+            if model_version is None or model_version == self.model_version:
+                values[start:start + rows, -2] = np.asarray(predictions, dtype=np.float64).reshape(-1)
+                if probabilities is not None:
+                    values[start:start + rows, -1] = np.asarray(probabilities, dtype=np.float64).reshape(-1)
+            start += rows
+        OBSERVATIONS.inc(len(values))
+        # Split the batch at window boundaries, so each window holds exactly `window` predictions
+        with self._lock:
+            self._stats['observed'] += len(values)
+            while len(values):
+                room = max(self.window - int(self._current['rows'][0]), 0)
+                self._add(values[:room])
+                values = values[room:]
+                if self._current['rows'][0] >= self.window:
+                    self._close_window()
+
+    def _add(self, values):
+        # Called with the lock held
+        batch = self._empty_counts()
+        batch['rows'][0] = len(values)
+        for i, (column, edges) in enumerate(zip(values.T, self._edges)):
+            column = column[~np.isnan(column)]
+            if not len(column):
+                continue
+            batch['bins'][self._offsets[i]:self._offsets[i + 1]] = np.bincount(bin_index(column, edges),
+                                                                               minlength=len(edges) + 1)
+            batch['count'][i] = len(column)
+            batch['sum'][i] = column.sum()
+            batch['min'][i] = column.min()
+            batch['max'][i] = column.max()
+        features = values[:, :len(FEATURE_NAMES)]
+        batch['out_of_range'] = ((features < _MIN_VALUES) | (features > _MAX_VALUES)).sum(axis=0)
+        for name, count in zip(FEATURE_NAMES, batch['out_of_range']):
+            if count:
+                OUT_OF_RANGE.inc(int(count), column=name)
+        for counts in (self._total, self._current):
+            for key in ('rows', 'bins', 'count', 'sum', 'out_of_range'):
+                counts[key] += batch[key]
+            np.minimum(counts['min'], batch['min'], out=counts['min'])
+            np.maximum(counts['max'], batch['max'], out=counts['max'])
+
+    def _close_window(self):
+        # Called with the lock held
+        report = self._report(self._current)
+        report['closed_at'] = time.time()
+        for row in report['columns']:
+            if row['psi'] is None:
+                continue
+            PSI.set(row['psi'], column=row['name'])
+            WINDOW_MEAN.set(row['mean'], column=row['name'])
+            if row['status'] == 'drift':
+                ALERTS.inc(column=row['name'])
+                self._alerts.append({'at': report['closed_at'], 'column': row['name'], 'psi': row['psi'],
+                                     'mean': row['mean'], 'reference_mean': row['reference_mean']})
+        self._last_window = report
+        self._current = self._empty_counts()
+        self._stats['windows'] += 1
+
+    def _report(self, counts):
+        columns = []
+        for i, (name, edges, expected, reference) in enumerate(zip(self.names, self._edges, self._expected,
+                                                                   self.reference['columns'])):
+            bins = counts['bins'][self._offsets[i]:self._offsets[i + 1]]
+            observed = int(counts['count'][i])
+            value = psi(expected, bins) if observed else None
+            row = {
+                'name': name,
+                'observations': observed,
+                'psi': value,
+                'status': status(value) if observed else None,
+                'mean': float(counts['sum'][i] / observed) if observed else None,
+                'reference_mean': reference['mean'],
+                'quantiles': None,
+                'reference_quantiles': reference['quantiles'],
+                'out_of_range': int(counts['out_of_range'][i]) if i < len(FEATURE_NAMES) else 0,
+            }
+            if observed and not reference['categorical']:
+                row['quantiles'] = histogram_quantiles(bins, edges, counts['min'][i], counts['max'][i])
+            columns.append(row)
+        return {'observations': int(counts['rows'][0]), 'label_rate': self.reference['label_rate'],
+                'columns': columns}
+
+    def report(self):
+        """
+        Summarizes the monitored predictions: since the state was started, in the current window and in the
+        last full window.
+
+        Per column each summary holds the observations, PSI and its status, mean, estimated quantiles and
+        out-of-range inputs next to the reference's. The training data's positive label rate is included
+        to compare the mean predicted class and probability with.
+
+        Returns:
+            dict: 'total', 'current' and 'last_window' summaries, and the recent 'alerts'.
+        """
+        with self._lock:
+            return {'total': self._report(self._total), 'current': self._report(self._current),
+                    'last_window': self._last_window, 'alerts': list(self._alerts)}
+
+    def drifted(self):
+        """
+        Lists the columns that drifted in the last full window.
+        """
+        with self._lock:
+            if self._last_window is None:
+                return []
+            return [row['name'] for row in self._last_window['columns'] if row['status'] == 'drift']
+
+    def flush(self):
+        """
+        Bins every queued record now, without waiting for the monitor thread.
+        """
+        self._drain()
+
+    def save(self, path=None):
+        """
+        Writes the counts to the state file atomically.
+
+        Args:
+            path (str, optional): File to write. Defaults to the monitor's state path.
+        """
+        path = path or self.state_path
+        with self._lock:
+            state = {
+                'reference_id': self._id,
+                'saved_at': time.time(),
+                'total': _counts_state(self._total),
+                'current': _counts_state(self._current),
+                'last_window': self._last_window,
+                'alerts': list(self._alerts),
+                'report': self._report(self._total),
+            }
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, path)
+        self._stats['saves'] += 1
+        self._stats['last_save'] = state['saved_at']
+
+    def _restore(self, path):
+        with open(path) as file:
+            state = json.load(file)
+        if state.get('reference_id') != self._id:
+            # Saved against another reference: its bins do not line up with this one's
+            return
+        for name in ('total', 'current'):
+            counts = self._empty_counts()
+            for key, value in state[name].items():
+                counts[key] = np.array([np.nan if v is None else v for v in value], dtype=counts[key].dtype)
+            if 'rows' not in state[name]:
+                # Saved before predictions were counted separately; the first column is the best estimate
+                counts['rows'][0] = counts['count'][0]
+            counts['min'] = np.where(np.isnan(counts['min']), np.inf, counts['min'])
+            counts['max'] = np.where(np.isnan(counts['max']), -np.inf, counts['max'])
+            setattr(self, f'_{name}', counts)
+        self._last_window = state.get('last_window')
+        self._alerts.extend(state.get('alerts', []))
+
+    def close(self):
+        """
+        Bins the remaining queued records, saves the state and stops the monitor thread.
+        """
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        self._drain()
+        if self.state_path:
+            self.save()
+
+    def stats(self):
+        """
+        Returns a snapshot of the monitor's throughput.
+
+        Returns:
+            dict: Observed and dropped records, closed windows, saves, failed iterations of the monitor thread
+                with the last error, and records still queued.
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['pending'] = len(self._pending)
+        return snapshot
+
+
+def print_report(report):
+    """
+    Prints a monitor report, one line per column: PSI and status of the last full window, and the mean and
+    median since the state was started next to the training data's.
+    """
+    last = {row['name']: row for row in (report['last_window'] or {'columns': []})['columns']}
+    print(f"{report['total']['observations']:,} predictions monitored, "
+          f"{report['current']['observations']:,} in the current window")
+    print(f"{'column':<12} {'window PSI':>10} {'status':<7} {'mean':>9} {'training':>9} {'median':>9} "
+          f"{'training':>9} {'out of range':>12}")
+    for row in report['total']['columns']:
+        window = last.get(row['name'], {})
+        value = window.get('psi')
+        mean = f"{row['mean']:.3f}" if row['mean'] is not None else '-'
+        median = f"{row['quantiles'][1]:.1f}" if row['quantiles'] else '-'
+        reference_median = f"{row['reference_quantiles'][1]:.1f}" if row['quantiles'] else '-'
+        print(f"{row['name']:<12} {value if value is None else round(value, 4)!s:>10} "
+              f"{window.get('status') or '-':<7} {mean:>9} {row['reference_mean']:>9.3f} {median:>9} "
+              f"{reference_median:>9} {row['out_of_range']:>12,}")
+    print(f"Training positive label rate {report['total']['label_rate']:.3f}")
+    for alert in report['alerts'][-10:]:
+        print(f"Drift alert {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(alert['at']))}: {alert['column']} "
+              f"PSI {alert['psi']:.3f}, mean {alert['mean']:.3f} against {alert['reference_mean']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the drift reference or report the monitored drift.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    reference_parser = subparsers.add_parser('reference', help="Summarize the training data and the model's "
+                                                               "predictions on it.")
+    reference_parser.add_argument('--data', default='data/cardio_train.csv')
+    reference_parser.add_argument('--model', default=MODEL_PATH, help="Model artifact directory or pickled model.")
+    reference_parser.add_argument('--out', default=DRIFT_SETTINGS['reference'])
+    report_parser = subparsers.add_parser('report', help="Report a saved monitor state; exits with 1 if a column "
+                                                         "drifted in the last full window.")
+    report_parser.add_argument('--reference', default=DRIFT_SETTINGS['reference'])
+    report_parser.add_argument('--state', default=DRIFT_SETTINGS['state'])
+    args = parser.parse_args()
+
+    if args.command == 'reference':
+        reference = build_reference(args.data, args.model, args.out)
+        print(f"Wrote the reference of {reference['rows']:,} records for model {reference['model_version']} "
+              f"to {args.out}")
+        return
+
+    if not os.path.exists(args.state):
+        raise SystemExit(f"No drift monitor state at {args.state}")
+    monitor = DriftMonitor(load_reference(args.reference), window=DRIFT_SETTINGS['window'])
+    monitor._restore(args.state)
+    print_report(monitor.report())
+    if monitor.drifted():
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
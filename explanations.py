@@ -0,0 +1,400 @@
+import argparse
+import functools
+import itertools
+import math
+import os
+import time
+
+import numpy as np
+
+from features import FEATURE_NAMES, FEATURES, decode
+from tree_model import MODEL_PATH, load_model, load_training_features
+
+# Distinct inputs whose explanations are remembered per explainer
+EXPLANATION_CACHE_SIZE = int(os.environ.get('CVD_EXPLANATION_CACHE_SIZE', 10000))
+
+# Rows explained per vectorized step, bounding the (trees, rows, features) temporaries to a few MB
+EXPLAIN_CHUNK_ROWS = 1024
+
+# Trees with up to this many splits get their attributions precomputed for every combination of sides taken
+# at the splits (2 ** splits rows each); larger trees are explained leaf by leaf per row
+MAX_TABLE_SPLITS = 10
+
+# How each model input is named when explaining a prediction
+FACTOR_LABELS = {
+    'gender': 'Gender',
+    'height': 'Height',
+    'weight': 'Weight',
+    'ap_hi': 'Systolic blood pressure',
+    'ap_lo': 'Diastolic blood pressure',
+    'cholesterol': 'Cholesterol',
+    'gluc': 'Glucose',
+    'smoke': 'Smoking',
+    'alco': 'Alcohol consumption',
+    'active': 'Regular exercise',
+    'ageinyears': 'Age',
+}
+
+
+def _shapley_weights(n_players):
+    # Weight of a coalition of k other players in a Shapley value: k! (n - k - 1)! / n!
+    return np.array([math.factorial(k) * math.factorial(n_players - k - 1) / math.factorial(n_players)
+                     for k in range(n_players)])
+
+
+def _product_game_shapley(A, B):
+    """
+    Shapley values of the games v(S) = prod(A[j] for j in S) * prod(B[j] for j not in S), where the last axis
+    indexes the players and every leading index is a separate game.
+
+    For one leaf of a tree, A[j] is 1 if the input meets all of the path's conditions on feature j and B[j] is
+    the share of training samples the path's splits on j keep, so v(S) is the leaf's weight in the expected
+    prediction given only the features in S. Players with A = B = 1 pad short paths and get 0.
+    """
+    A, B = np.broadcast_arrays(A, B)
+    n_players = A.shape[-1]
+    weights = _shapley_weights(n_players)
+    phi = np.empty(A.shape, dtype=np.float64)
+    for i in range(n_players):
+        # Coefficient k of prod over j != i of (B[j] + A[j] z): the coalitions of k other players
+        coefficients = np.zeros(A.shape[:-1] + (n_players,), dtype=np.float64)
+        coefficients[..., 0] = 1.0
+        for j in range(n_players):
+            if j == i:
+                continue
+            joined = coefficients[..., :-1] * A[..., j, None]
+            coefficients *= B[..., j, None]
+            coefficients[..., 1:] += joined
+        phi[..., i] = (A[..., i] - B[..., i]) * (coefficients @ weights)
+    return phi
+
+
+class TreeExplainer:
+    """
+    Exact path-dependent TreeSHAP attributions for a TreeEnsemble: how much each input moved a prediction's
+    log-odds away from the model's expected log-odds over the training data.
+
+    A tree's expected prediction given a set of known features is a sum over its leaves, and each leaf's term
+    only depends on which of its path conditions the input meets. So every leaf is reduced to its distinct path
+    features, the interval each must fall in, and the share of training samples its splits keep when the
+    feature is unknown; its attributions then follow in closed form. Which conditions an input meets in a tree
+    is fixed by the side it takes at each of the tree's splits, so the attributions of every tree are
+    precomputed for every combination of sides. Explaining a batch is one comparison per split, one sum of the
+    sides' bits per tree and one table lookup per tree, vectorized across the rows and the trees. Trees with
+    more than MAX_TABLE_SPLITS splits are explained leaf by leaf instead.
+
+    The attributions and the expected value add up to the model's raw prediction: for every row,
+    expected_value + contributions.sum() == model.decision_function(row) up to rounding.
+
+    Args:
+        model (TreeEnsemble): Model with node covers, as exported by tree_model.py.
+        cache_size (int, optional): Distinct inputs remembered by explain(). Defaults to EXPLANATION_CACHE_SIZE.
+    """
+
+    def __init__(self, model, cache_size=EXPLANATION_CACHE_SIZE):
+        if getattr(model, 'cover', None) is None:
+            raise ValueError("The model artifact has no node covers; export it again with tree_model.py export")
+        self.model = model
+        self.version = model.version
+        self._build_leaf_tables()
+        self._explain_key = functools.lru_cache(maxsize=cache_size)(self._explain_uncached)
+
+    def _build_leaf_tables(self):
+        model = self.model
+        n_features = model.n_features_in_
+        trees = []  # Per tree: its split nodes, and per leaf (value, path) where path maps
+                    # feature -> (lower bound, upper bound, share of samples kept, [(split, goes right)])
+        for root in model._roots:
+            splits, leaves, stack = [], [], [(root, {})]
+            while stack:
+                node, path = stack.pop()
+                left, right = model._left[node], model._right[node]
+                if left == node:
+                    leaves.append((model.value[node], path))
+                    continue
+                split = len(splits)
+                splits.append(node)
+                feature, threshold = int(model._feature[node]), float(model.threshold[node])
+                lower, upper, kept, sides = path.get(feature, (-np.inf, np.inf, 1.0, ()))
+                # Samples go left when value <= threshold
+                stack.append((left, {**path, feature: (lower, min(upper, threshold),
+                                                       kept * model.cover[left] / model.cover[node],
+                                                       sides + ((split, 0),))}))
+                stack.append((right, {**path, feature: (max(lower, threshold), upper,
+                                                        kept * model.cover[right] / model.cover[node],
+                                                        sides + ((split, 1),))}))
+            trees.append((splits, leaves))
+
+        leaves = [leaf for _, tree_leaves in trees for leaf in tree_leaves]
+        n_leaves = len(leaves)
+        width = max(1, max(len(path) for _, path in leaves))
+        self._leaf_values = np.array([value for value, _ in leaves], dtype=np.float64)
+        self._slot_feature = np.zeros((n_leaves, width), dtype=np.intp)
+        self._lower = np.full((n_leaves, width), -np.inf)
+        self._upper = np.full((n_leaves, width), np.inf)
+        self._kept = np.ones((n_leaves, width))
+        for leaf, (_, path) in enumerate(leaves):
+            for slot, (feature, (lower, upper, kept, _)) in enumerate(path.items()):
+                self._slot_feature[leaf, slot] = feature
+                self._lower[leaf, slot] = lower
+                self._upper[leaf, slot] = upper
+                self._kept[leaf, slot] = kept
+        self.expected_value = model.init_raw + float(self._leaf_values @ np.prod(self._kept, axis=1))
+
+        # Sums each (leaf, slot) attribution into its feature; padding slots always attribute 0
+        self._feature_map = np.zeros((n_leaves * width, n_features))
+        self._feature_map[np.arange(n_leaves * width), self._slot_feature.ravel()] = 1.0
+
+        self._tree_tables = None
+        if max(len(splits) for splits, _ in trees) > MAX_TABLE_SPLITS:
+            return
+        # Per tree, the attributions for every combination of sides taken at its splits: bit k of a combination
+        # is set when the input goes right at the tree's split k
+        tables, split_nodes, split_bits = [], [], []
+        for splits, tree_leaves in trees:
+            n_combinations = 2 ** len(splits)
+            goes_right = (np.arange(n_combinations)[:, None] >> np.arange(len(splits))) & 1
+            table = np.zeros((n_combinations, n_features))
+            for value, path in tree_leaves:
+                features = list(path)
+                met = np.ones((n_combinations, len(features)))
+                for slot, (_, _, _, sides) in enumerate(path.values()):
+                    for split, side in sides:
+                        met[:, slot] *= goes_right[:, split] == side
+                kept = np.array([path[feature][2] for feature in features])
+                np.add.at(table.T, features, (value * _product_game_shapley(met, kept)).T)
+            tables.append(table)
+            split_nodes.extend(splits)
+            split_bits.extend(1 << k for k in range(len(splits)))
+        self._split_feature = model._feature[split_nodes]
+        self._split_threshold = model.threshold[split_nodes][:, None]
+        self._split_bits = np.array(split_bits, dtype=np.int32)[:, None]
+        # Each tree's splits are contiguous; its combination is the sum of the bits of the splits taken right
+        self._tree_starts = np.cumsum([0] + [len(splits) for splits, _ in trees[:-1]]).astype(np.intp)
+        self._trees_without_splits = np.array([not splits for splits, _ in trees])
+        self._table_offsets = np.cumsum([0] + [len(table) for table in tables[:-1]]).astype(np.intp)[:, None]
+        self._tree_tables = np.concatenate(tables)
+
+    @property
+    def n_leaves(self):
+        return len(self._leaf_values)
+
+    def shap_values(self, X):
+        """
+        Computes the contribution of every feature to each row's raw (log-odds) prediction.
+
+        Args:
+            X (numpy.ndarray): Encoded inputs of shape (n_samples, 11).
+
+        Returns:
+            numpy.ndarray: Contributions of shape (n_samples, 11), in the model's column order.
+        """
+        X = self.model._validate(X)
+        contributions = np.empty((X.shape[0], self.model.n_features_in_), dtype=np.float64)
+        for start in range(0, X.shape[0], EXPLAIN_CHUNK_ROWS):
+            chunk = X[start:start + EXPLAIN_CHUNK_ROWS]
+            if self._tree_tables is not None:
+                # Laid out split by split and tree by tree, so each reduction adds whole rows
+                columns = np.ascontiguousarray(chunk.T)
+                goes_right = columns[self._split_feature] > self._split_threshold
+                combinations = np.add.reduceat(goes_right * self._split_bits, self._tree_starts, axis=0)
+                combinations[self._trees_without_splits] = 0
+                contributions[start:start + len(chunk)] = self._tree_tables.take(
+                    combinations + self._table_offsets, axis=0).sum(axis=0)
+            else:
+                values = chunk[:, self._slot_feature]
+                met = (values > self._lower) & (values <= self._upper)
+                leaf_contributions = (_product_game_shapley(met.astype(np.float64), self._kept)
+                                      * self._leaf_values[:, None])
+                contributions[start:start + len(chunk)] = (leaf_contributions.reshape(len(chunk), -1)
+                                                           @ self._feature_map)
+        return contributions
+
+    def explain(self, record):
+        """
+        Computes the contributions for one record, remembering them for repeated inputs.
+
+        Args:
+            record (sequence): The 11 encoded inputs, in the model's column order.
+
+        Returns:
+            numpy.ndarray: Read-only contributions of shape (11,).
+        """
+        key = tuple(np.asarray(record, dtype=self.model.input_dtype).reshape(-1).tolist())
+        return self._explain_key(key)
+
+    def _explain_uncached(self, key):
+        contributions = self.shap_values(np.array([key]))[0]
+        contributions.setflags(write=False)
+        return contributions
+
+    def stats(self):
+        """
+        Returns a snapshot of the explanation cache's counters.
+
+        Returns:
+            dict: Cache size, hits, misses and hit rate, and the explained model's version.
+        """
+        info = self._explain_key.cache_info()
+        lookups = info.hits + info.misses
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize,
+                'hit_rate': info.hits / lookups if lookups else 0.0, 'model_version': self.version}
+
+
+def top_factors(record, contributions, count=5):
+    """
+    Lists the inputs that moved a prediction the most, in either direction.
+
+    Args:
+        record (sequence): The 11 encoded inputs, in the model's column order.
+        contributions (numpy.ndarray): Their contributions, as returned by TreeExplainer.explain().
+        count (int, optional): Number of factors. Defaults to 5.
+
+    Returns:
+        list: Tuples of (label, displayed value, contribution), largest effect first; factors without effect
+            are left out.
+    """
+    factors = []
+    for index in np.argsort(-np.abs(contributions), kind='stable')[:count]:
+        if contributions[index] == 0:
+            break
+        feature = FEATURES[index]
+        value = decode(feature.name, record[index]) if feature.encoding is not None else f"{record[index]:g}"
+        factors.append((FACTOR_LABELS[feature.name], value, float(contributions[index])))
+    return factors
+
+
+def factor_codes(contributions, count=3):
+    """
+    Names the inputs that raised each prediction the most, e.g. "ap_hi,ageinyears,cholesterol".
+
+    Args:
+        contributions (numpy.ndarray): Contributions of shape (n_samples, 11).
+        count (int, optional): Factors per row. Defaults to 3.
+
+    Returns:
+        numpy.ndarray: Comma-separated feature names per row, largest first; empty if nothing raised the risk.
+    """
+    order = np.argsort(-contributions, axis=1, kind='stable')[:, :count]
+    raised = np.take_along_axis(contributions, order, axis=1) > 0
+    names = np.array(FEATURE_NAMES, dtype=object)
+    return np.array([','.join(names[row[keep]]) for row, keep in zip(order, raised)], dtype=object)
+
+
+def reference_shap_values(model, record):
+    """
+    Computes path-dependent TreeSHAP values for one record the slow way, for checking TreeExplainer: for each
+    tree, every subset of the features it splits on is enumerated, and the expected prediction given a subset
+    follows the record at splits on known features and averages both branches by cover at the others.
+
+    Args:
+        model (TreeEnsemble): Model with node covers.
+        record (sequence): The 11 encoded inputs.
+
+    Returns:
+        numpy.ndarray: Contributions of shape (11,).
+    """
+    x = np.asarray(record, dtype=model.input_dtype).reshape(-1).tolist()
+    phi = np.zeros(model.n_features_in_)
+
+    def expectation(node, known):
+        left, right = model._left[node], model._right[node]
+        if left == node:
+            return model.value[node]
+        feature = model._feature[node]
+        if feature in known:
+            return expectation(left if x[feature] <= model.threshold[node] else right, known)
+        return (model.cover[left] * expectation(left, known)
+                + model.cover[right] * expectation(right, known)) / model.cover[node]
+
+    for root in model._roots:
+        features, stack = set(), [root]
+        while stack:
+            node = stack.pop()
+            if model._left[node] != node:
+                features.add(int(model._feature[node]))
+                stack.extend((model._left[node], model._right[node]))
+        weights = _shapley_weights(len(features)) if features else ()
+        for feature in features:
+            others = sorted(features - {feature})
+            for size, weight in enumerate(weights):
+                for subset in itertools.combinations(others, size):
+                    known = set(subset)
+                    phi[feature] += weight * (expectation(root, known | {feature}) - expectation(root, known))
+    return phi
+
+
+def verify(explainer, X, reference_rows=50):
+    """
+    Checks that the attributions add up to the raw predictions on every row, and match the slow reference
+    implementation on a sample of rows.
+
+    Returns:
+        bool: True if both checks pass.
+    """
+    contributions = explainer.shap_values(X)
+    raw = explainer.model.decision_function(X)
+    additivity_error = np.abs(explainer.expected_value + contributions.sum(axis=1) - raw).max()
+    sample = np.random.default_rng(0).choice(len(X), size=min(reference_rows, len(X)), replace=False)
+    reference = np.array([reference_shap_values(explainer.model, X[i]) for i in sample])
+    reference_error = np.abs(contributions[sample] - reference).max()
+    print(f"Expected value {explainer.expected_value:.6f}, {explainer.n_leaves} leaves")
+    print(f"Largest additivity error on {len(X)} rows: {additivity_error:.2e}")
+    print(f"Largest difference from the reference on {len(sample)} rows: {reference_error:.2e}")
+    return additivity_error < 1e-9 and reference_error < 1e-9
+
+
+def benchmark(explainer, X, repeat=1000):
+    """
+    Measures the cost of explanations next to the predictions they explain: one uncached and one cached row,
+    and a 10k-row batch.
+
+    Returns:
+        dict: Median latency in seconds per case.
+    """
+    model = explainer.model
+
+    def median_time(func, repetitions):
+        samples = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        return float(np.median(samples))
+
+    rows = iter(X)
+    batch = X[:10000]
+    explainer.explain(X[0])
+    results = {
+        'predict_1_row': median_time(lambda: model.predict_with_proba(X[:1]), repeat),
+        'explain_1_row': median_time(lambda: explainer.shap_values(next(rows)[None]), repeat),
+        'explain_1_row_cached': median_time(lambda: explainer.explain(X[0]), repeat),
+        'predict_10k_rows': median_time(lambda: model.predict_with_proba(batch), max(repeat // 50, 5)),
+        'explain_10k_rows': median_time(lambda: explainer.shap_values(batch), max(repeat // 50, 5)),
+    }
+    for name, seconds in results.items():
+        print(f"{name:>22}: {seconds * 1e3:9.3f} ms")
+    print(f"{'explain_10k_rows':>22}: {len(batch) / results['explain_10k_rows']:,.0f} rows/sec")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or benchmark the per-feature explanations of predictions.")
+    parser.add_argument('command', choices=['verify', 'benchmark'])
+    parser.add_argument('--model', default=MODEL_PATH, help="Model artifact directory or pickled model.")
+    parser.add_argument('--data', default='data/cardio_train.csv', help="Path to cardio_train.csv.")
+    parser.add_argument('--reference-rows', type=int, default=50,
+                        help="Rows compared with the slow reference implementation.")
+    args = parser.parse_args()
+
+    explainer = TreeExplainer(load_model(args.model))
+    X = load_training_features(args.data)
+    if args.command == 'verify':
+        if not verify(explainer, X, args.reference_rows):
+            raise SystemExit(1)
+    else:
+        benchmark(explainer, X)
+
+
+if __name__ == '__main__':
+    main()
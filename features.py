@@ -0,0 +1,148 @@
+from collections import namedtuple
+from collections.abc import Mapping
+
+import numpy as np
+
+# Text options shown in the app's select boxes, mapped to the numbers the model and database use
+GENDER_ENCODING = {"Male": 1, "Female": 2}
+YES_NO_ENCODING = {"Yes": 1, "No": 0}
+LEVEL_ENCODING = {"Normal": 1, "Above Normal": 2, "Well Above Normal": 3}
+
+# One model input column.
+#   name: column name used by the training data (cardio_train.csv after deriving ageinyears)
+#   dtype: compact storage dtype for the column
+#   encoding: text option -> number mapping, or None for numeric inputs
+#   default: number used for unrecognised text options
+#   min_value, max_value: plausible range, values outside it are flagged by out_of_range()
+Feature = namedtuple('Feature', ['name', 'dtype', 'encoding', 'default', 'min_value', 'max_value'])
+
+# The 11 model columns, in the order the Gradient Boosting model was trained on
+FEATURES = (
+    Feature('gender', np.int8, GENDER_ENCODING, 2, 1, 2),
+    Feature('height', np.int16, None, None, 50, 250),
+    Feature('weight', np.float32, None, None, 10, 300),
+    Feature('ap_hi', np.int16, None, None, 70, 300),
+    Feature('ap_lo', np.int16, None, None, 40, 200),
+    Feature('cholesterol', np.int8, LEVEL_ENCODING, 1, 1, 3),
+    Feature('gluc', np.int8, LEVEL_ENCODING, 1, 1, 3),
+    Feature('smoke', np.int8, YES_NO_ENCODING, 0, 0, 1),
+    Feature('alco', np.int8, YES_NO_ENCODING, 0, 0, 1),
+    Feature('active', np.int8, YES_NO_ENCODING, 0, 0, 1),
+    Feature('ageinyears', np.float32, None, None, 0, 120),
+)
+
+FEATURE_NAMES = tuple(feature.name for feature in FEATURES)
+FEATURE_INDEX = {feature.name: i for i, feature in enumerate(FEATURES)}
+N_FEATURES = len(FEATURES)
+
+_MIN_VALUES = np.array([feature.min_value for feature in FEATURES], dtype=np.float64)
+_MAX_VALUES = np.array([feature.max_value for feature in FEATURES], dtype=np.float64)
+
+
+def _encode_column(feature, values, out):
+    """
+    Encodes one column of values into the given output column.
+    Text options are mapped with one vectorized comparison per option, numbers are copied as floats.
+    """
+    values = np.asarray(values)
+    if feature.encoding is not None and values.dtype.kind in 'OUS':
+        out[:] = feature.default
+        for text, number in feature.encoding.items():
+            out[values == text] = number
+    else:
+        out[:] = values
+
+
+def encode(data):
+    """
+    Encodes model inputs into a contiguous float array in the model's column order.
+
+    Args:
+        data: One of
+            - a mapping of column name to a scalar (a single form submission) or to a column of values,
+            - a pandas DataFrame with the model's column names,
+            - a sequence of mappings (one per record),
+            - a 2-D array or sequence of tuples already in the model's column order.
+            Categorical columns may hold either the app's text options or their numbers.
+
+    Returns:
+        numpy.ndarray: C-contiguous float64 array of shape (n_records, 11).
+    """
+    if isinstance(data, Mapping) or hasattr(data, 'columns'):
+        columns = [data[name] for name in FEATURE_NAMES]
+    elif isinstance(data, np.ndarray) and data.dtype.kind in 'iuf':
+        if data.ndim != 2 or data.shape[1] != N_FEATURES:
+            raise ValueError(f"Expected an array of shape (n, {N_FEATURES}), got {data.shape}")
+        return np.ascontiguousarray(data, dtype=np.float64)
+    else:
+        records = list(data)
+        if records and isinstance(records[0], Mapping):
+            columns = [[record[name] for record in records] for name in FEATURE_NAMES]
+        else:
+            columns = list(zip(*records)) if records else [()] * N_FEATURES
+            if len(columns) != N_FEATURES:
+                raise ValueError(f"Expected records with {N_FEATURES} values, got {len(columns)}")
+
+    columns = [np.atleast_1d(np.asarray(column)) for column in columns]
+    X = np.empty((len(columns[0]), N_FEATURES), dtype=np.float64)
+    for i, (feature, column) in enumerate(zip(FEATURES, columns)):
+        _encode_column(feature, column, X[:, i])
+    return X
+
+
+def decode(name, number):
+    """
+    Converts a stored number back to the text option shown in the app.
+
+    Args:
+        name (str): Name of a categorical model column, e.g. 'gender' or 'cholesterol'.
+        number (int): Numerical representation of the option.
+
+    Returns:
+        str: Text option, or the column's default option if the number is not recognised.
+    """
+    feature = FEATURES[FEATURE_INDEX[name]]
+    for text, value in feature.encoding.items():
+        if value == number:
+            return text
+    return decode(name, feature.default)
+
+
+def options(name):
+    """
+    Lists the text options of a categorical model column, in the order the app displays them.
+
+    Args:
+        name (str): Name of a categorical model column.
+
+    Returns:
+        list: Text options.
+    """
+    return list(FEATURES[FEATURE_INDEX[name]].encoding)
+
+
+def option_index(name, number):
+    """
+    Retrieves the select box index of a stored number.
+
+    Args:
+        name (str): Name of a categorical model column.
+        number (int): Numerical representation of the option.
+
+    Returns:
+        int: Index of the matching option in options(name).
+    """
+    return options(name).index(decode(name, number))
+
+
+def out_of_range(X):
+    """
+    Flags encoded records that have any value outside the schema's valid ranges.
+
+    Args:
+        X (numpy.ndarray): Encoded array of shape (n_records, 11).
+
+    Returns:
+        numpy.ndarray: Boolean array of shape (n_records,), True where a record is out of range.
+    """
+    return ((X < _MIN_VALUES) | (X > _MAX_VALUES)).any(axis=1)
@@ -0,0 +1,297 @@
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+
+from database import copy_value
+from db_pool import ConnectionPool, DB_SETTINGS
+from features import FEATURE_INDEX, FEATURES, encode, out_of_range
+from tree_model import MODEL_PATH, load_model
+
+# Columns a lab feed must provide, in the cardio_train.csv layout; `id` is the patient's "User ID" and
+# `age` is in days. Other columns, such as `cardio`, are ignored.
+FEED_COLUMNS = ('id', 'age', 'gender', 'height', 'weight', 'ap_hi', 'ap_lo', 'cholesterol', 'gluc', 'smoke',
+                'alco', 'active')
+
+# Columns holding codes that must be whole numbers: the patient ID and the categorical inputs
+CODE_COLUMNS = ('id',) + tuple(feature.name for feature in FEATURES if feature.encoding is not None)
+
+# Reasons a row can be rejected for, in the order they are checked
+REJECT_REASONS = ('malformed', 'invalid_code', 'out_of_range', 'unknown_patient')
+
+# Rows read, validated, scored and written per chunk
+CHUNK_ROWS = 10000
+
+# Session table each chunk is copied into before the upsert, emptied when the chunk commits
+CREATE_STAGING_TABLE = """CREATE TEMPORARY TABLE IF NOT EXISTS ingest_feed (
+                              patient_id integer, row_number integer, source_record varchar(200), age integer,
+                              gender integer,
+                              height integer, weight numeric, smoke integer, alco integer, active integer,
+                              ap_lo integer, ap_hi integer, cholesterol integer, gluc integer, prediction integer
+                          ) ON COMMIT DELETE ROWS"""
+
+# Upsert of one chunk: inserts a test per row of a known patient, or overwrites the test created by an earlier
+# ingestion of the same source record, and updates each patient from their last row. Patients and tests whose
+# stored values are unchanged are not rewritten, which saves a new row version and an entry in every index.
+# An overwritten test loses the recommendation codes, risk factors and model version batch_scoring.py stored
+# for its old readings, so the batch scorer picks it up again instead of keeping stale results.
+# Returns how many rows matched a patient, and how many tests were inserted and overwritten.
+UPSERT_QUERY = """WITH known AS (
+                      SELECT f.*, (p.age, p.gender, p.height, p.weight, p."Smoke History",
+                                   p."Alcohol Consumption", p."Exercise Level")
+                                  IS DISTINCT FROM (f.age, f.gender, f.height, f.weight, f.smoke, f.alco,
+                                                    f.active) AS changed
+                      FROM ingest_feed f
+                      JOIN patient p ON p."User ID" = f.patient_id
+                  ),
+                  updated AS (
+                      UPDATE patient p
+                      SET age = k.age, gender = k.gender, height = k.height, weight = k.weight,
+                          "Smoke History" = k.smoke, "Alcohol Consumption" = k.alco, "Exercise Level" = k.active
+                      FROM (SELECT DISTINCT ON (patient_id) * FROM known
+                            ORDER BY patient_id, row_number DESC) k
+                      WHERE p."User ID" = k.patient_id AND k.changed
+                  ),
+                  written AS (
+                      INSERT INTO medicaltest ("Physician ID", "Patient ID", "Diastolic Blood Pressure",
+                                               "Systolic Blood Pressure", cholesterol, glucose,
+                                               "Cardiovascular Disease", "Source Record")
+                      SELECT (SELECT min(l."Physician ID") FROM physicianpatientlink l
+                              WHERE l."Patient ID" = f.patient_id),
+                             f.patient_id, f.ap_lo, f.ap_hi, f.cholesterol, f.gluc, f.prediction, f.source_record
+                      FROM known f
+                      ON CONFLICT ("Source Record") DO UPDATE
+                      SET "Diastolic Blood Pressure" = excluded."Diastolic Blood Pressure",
+                          "Systolic Blood Pressure" = excluded."Systolic Blood Pressure",
+                          cholesterol = excluded.cholesterol, glucose = excluded.glucose,
+                          "Cardiovascular Disease" = excluded."Cardiovascular Disease",
+                          "Recommendation Codes" = NULL, "Risk Factors" = NULL, "Model Version" = NULL
+                      WHERE (medicaltest."Diastolic Blood Pressure", medicaltest."Systolic Blood Pressure",
+                             medicaltest.cholesterol, medicaltest.glucose, medicaltest."Cardiovascular Disease")
+                            IS DISTINCT FROM (excluded."Diastolic Blood Pressure", excluded."Systolic Blood Pressure",
+                                              excluded.cholesterol, excluded.glucose, excluded."Cardiovascular Disease")
+                      RETURNING xmax = 0 AS inserted
+                  )
+                  SELECT (SELECT count(*) FROM known), count(*) FILTER (WHERE inserted),
+                         count(*) FILTER (WHERE NOT inserted)
+                  FROM written"""
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS, file_format=None):
+    """
+    Streams a lab feed in chunks, so memory stays bounded whatever the size of the file.
+
+    Args:
+        path (str): Semicolon-delimited file in the cardio_train.csv layout, or NDJSON with one record per line.
+        chunk_rows (int, optional): Rows per chunk. Defaults to CHUNK_ROWS.
+        file_format (str, optional): 'csv' or 'ndjson'. Defaults to guessing from the file extension.
+
+    Yields:
+        pandas.DataFrame: The next rows of the file, with columns holding unparseable values left as text.
+    """
+    import pandas as pd
+
+    file_format = file_format or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if file_format == 'ndjson':
+        reader = pd.read_json(path, lines=True, dtype=False, chunksize=chunk_rows)
+    else:
+        reader = pd.read_csv(path, delimiter=';', chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            missing = [column for column in FEED_COLUMNS if column not in chunk.columns]
+            if missing:
+                raise ValueError(f"{path} is missing the columns {', '.join(missing)}")
+            yield chunk
+
+
+def validate_chunk(chunk):
+    """
+    Parses a chunk of feed rows, maps them to the model's inputs and flags the rows that cannot be ingested.
+
+    Args:
+        chunk (pandas.DataFrame): Rows as read by read_chunks.
+
+    Returns:
+        tuple: Patient IDs, age in days, encoded model inputs of shape (n_rows, 11), and an array holding the
+            index in REJECT_REASONS of each rejected row, -1 for accepted rows. A patient may be listed more
+            than once; each row is a test of its own.
+    """
+    import pandas as pd
+
+    values = {column: pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=np.float64)
+              for column in FEED_COLUMNS}
+    X = encode(dict(values, ageinyears=values['age'] / 365))
+    reasons = np.full(len(chunk), -1, dtype=np.int8)
+
+    def reject(reason, mask):
+        reasons[(reasons < 0) & mask] = REJECT_REASONS.index(reason)
+
+    with np.errstate(invalid='ignore'):
+        reject('malformed', np.isnan(X).any(axis=1) | np.isnan(values['id']) | np.isnan(values['age']))
+        codes = np.column_stack([values[column] for column in CODE_COLUMNS])
+        reject('invalid_code', (codes != np.round(codes)).any(axis=1) | (values['id'] <= 0))
+        reject('out_of_range', out_of_range(X))
+    return values['id'], values['age'], X, reasons
+
+
+def upsert_rows(cur, source, row_numbers, patient_ids, age_days, X, predictions):
+    """
+    Writes validated, scored rows: copies them into the staging table, then updates the patients and upserts
+    their tests with one statement.
+
+    Args:
+        cur (psycopg2.extensions.cursor): Database cursor; the caller creates the staging table and commits.
+        source (str): Name of the feed, combined with the row number into each test's source record.
+        row_numbers (numpy.ndarray): Number of each row within the feed, counting from 1, each at most once.
+        patient_ids (numpy.ndarray): Patient IDs.
+        age_days (numpy.ndarray): Ages in days.
+        X (numpy.ndarray): Encoded model inputs of shape (n_rows, 11).
+        predictions (numpy.ndarray): Predicted classes.
+
+    Returns:
+        tuple: Rows of known patients, tests inserted and tests overwritten with new values. The other tests
+            of known patients were already stored with the same values.
+    """
+    def column(name, rounded=True):
+        values = X[:, FEATURE_INDEX[name]]
+        return np.rint(values).astype(np.int64).tolist() if rounded else values.tolist()
+
+    source = copy_value(source)
+    rows = zip(patient_ids.astype(np.int64).tolist(), np.asarray(row_numbers).astype(np.int64).tolist(),
+               (age_days // 365).astype(np.int64).tolist(),
+               column('gender'), column('height'), column('weight', rounded=False), column('smoke'),
+               column('alco'), column('active'), column('ap_lo'), column('ap_hi'), column('cholesterol'),
+               column('gluc'), np.asarray(predictions).astype(np.int64).tolist())
+    buffer = io.StringIO()
+    for patient_id, row_number, *values in rows:
+        buffer.write('\t'.join(map(str, (patient_id, row_number, f"{source}:{row_number}", *values))))
+        buffer.write('\n')
+    buffer.seek(0)
+    cur.copy_expert("COPY ingest_feed FROM STDIN", buffer)
+    cur.execute(UPSERT_QUERY)
+    return cur.fetchone()
+
+
+def ingest_file(pool, model, path, source=None, chunk_rows=CHUNK_ROWS, file_format=None, dry_run=False,
+                verbose=True):
+    """
+    Ingests a lab feed: reads it in chunks, validates and scores each chunk, and upserts the accepted rows.
+
+    Each row becomes a test whose source record is the feed name and the row's number in the file, so an
+    interrupted run can simply be repeated: tests already written are updated in place through their source
+    record, and counted as overwritten when their values changed. Two feeds with the same name would overwrite
+    each other's tests.
+
+    Args:
+        pool (ConnectionPool): Pool providing the writing connection.
+        model (object): Model scoring the rows, e.g. a TreeEnsemble.
+        path (str): The feed file, see read_chunks.
+        source (str, optional): Name of the feed, unique among feeds. Defaults to the file name.
+        chunk_rows (int, optional): Rows per chunk. Defaults to CHUNK_ROWS.
+        file_format (str, optional): 'csv' or 'ndjson'. Defaults to guessing from the file extension.
+        dry_run (bool, optional): Validate and score without writing. Defaults to False.
+        verbose (bool, optional): Print progress after each chunk. Defaults to True.
+
+    Returns:
+        dict: Rows read and accepted, rejected rows per reason, tests inserted, updated (overwritten with new
+            values) and unchanged, seconds per stage, elapsed seconds and throughput in rows per second.
+    """
+    source = source or os.path.basename(path)
+    report = {'rows_read': 0, 'rows_accepted': 0, 'rejected': dict.fromkeys(REJECT_REASONS, 0),
+              'tests_inserted': 0, 'tests_updated': 0, 'tests_unchanged': 0,
+              'stage_seconds': {'read': 0.0, 'validate': 0.0, 'score': 0.0, 'write': 0.0}}
+    stages = report['stage_seconds']
+    start = time.perf_counter()
+    with pool.connection() as conn:
+        if not dry_run:
+            with conn.cursor() as cur:
+                cur.execute(CREATE_STAGING_TABLE)
+            conn.commit()
+        chunks = read_chunks(path, chunk_rows, file_format)
+        while True:
+            stage_start = time.perf_counter()
+            chunk = next(chunks, None)
+            stages['read'] += time.perf_counter() - stage_start
+            if chunk is None:
+                break
+
+            stage_start = time.perf_counter()
+            patient_ids, age_days, X, reasons = validate_chunk(chunk)
+            accepted = reasons < 0
+            stages['validate'] += time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            predictions = model.predict(X[accepted]) if accepted.any() else np.empty(0, dtype=np.int64)
+            stages['score'] += time.perf_counter() - stage_start
+
+            accepted_count = int(accepted.sum())
+            if not dry_run and accepted.any():
+                stage_start = time.perf_counter()
+                with conn.cursor() as cur:
+                    row_numbers = report['rows_read'] + 1 + np.flatnonzero(accepted)
+                    known, inserted, updated = upsert_rows(cur, source, row_numbers, patient_ids[accepted],
+                                                           age_days[accepted], X[accepted], predictions)
+                conn.commit()
+                stages['write'] += time.perf_counter() - stage_start
+                report['tests_inserted'] += inserted
+                report['tests_updated'] += updated
+                report['tests_unchanged'] += known - inserted - updated
+                report['rejected']['unknown_patient'] += accepted_count - known
+                accepted_count = known
+
+            for index, count in zip(*np.unique(reasons[~accepted], return_counts=True)):
+                report['rejected'][REJECT_REASONS[index]] += int(count)
+            report['rows_read'] += len(chunk)
+            report['rows_accepted'] += accepted_count
+            if verbose:
+                elapsed = time.perf_counter() - start
+                print(f"Read {report['rows_read']} rows, accepted {report['rows_accepted']} "
+                      f"({report['rows_read'] / elapsed:,.0f} rows/sec)")
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_second'] = report['rows_read'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+
+def print_report(report):
+    # Totals, then the rejected rows per reason and the time spent per stage
+    print(f"Read {report['rows_read']} rows in {report['seconds']:.2f}s ({report['rows_per_second']:,.0f} rows/sec): "
+          f"{report['rows_accepted']} accepted, {report['tests_inserted']} tests inserted, "
+          f"{report['tests_updated']} overwritten, {report['tests_unchanged']} unchanged")
+    for reason, count in report['rejected'].items():
+        print(f"{'rejected ' + reason:<26} {count:>10}")
+    for stage, seconds in report['stage_seconds'].items():
+        print(f"{stage:<26} {seconds:10.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest lab feeds of medical test results into the database.")
+    parser.add_argument('files', nargs='+', help="Feeds in the cardio_train.csv layout, CSV or NDJSON.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Model artifact directory or pickled model.")
+    parser.add_argument('--source', help="Name of the feed, defaults to the file's name. Only valid with a "
+                                         "single file, as the tests of feeds sharing a name overwrite each other.")
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help="Feed format, guessed from the extension.")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_ROWS, help="Rows per chunk.")
+    parser.add_argument('--dry-run', action='store_true', help="Validate and score without writing.")
+    args = parser.parse_args()
+    if args.source and len(args.files) > 1:
+        parser.error("--source names a single feed, drop it to name each file by its file name")
+    names = [os.path.basename(path) for path in args.files]
+    if len(set(names)) < len(names):
+        parser.error("feed files must have distinct file names, as they name the feeds")
+
+    model = load_model(args.model)
+    pool = ConnectionPool(minconn=0, maxconn=1, **DB_SETTINGS)
+    try:
+        for path in args.files:
+            report = ingest_file(pool, model, path, source=args.source, chunk_rows=args.chunk_size,
+                                 file_format=args.format, dry_run=args.dry_run, verbose=False)
+            print(f"{path}:")
+            print_report(report)
+    finally:
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
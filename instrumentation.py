@@ -0,0 +1,387 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Exporting and profiling settings; nothing is exported unless a port or a file is configured
+METRICS_SETTINGS = {
+    'port': int(os.environ['CVD_METRICS_PORT']) if os.environ.get('CVD_METRICS_PORT') else None,
+    'file': os.environ.get('CVD_METRICS_FILE'),
+    'interval': float(os.environ.get('CVD_METRICS_INTERVAL', 15.0)),
+}
+PROFILE_SETTINGS = {
+    'threshold': float(os.environ.get('CVD_PROFILE_THRESHOLD', 1.0)),
+    'directory': os.environ.get('CVD_PROFILE_DIR', 'profiles'),
+}
+
+# Upper bounds of the latency histogram buckets in seconds, from sub-millisecond cache hits to slow page loads
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    """
+    Monotonic count per combination of label values.
+
+    Args:
+        name (str): Metric name, ending in _total by convention.
+        documentation (str): Help text of the metric.
+        labelnames (tuple, optional): Names of the labels. Defaults to none.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    """
+    Last value set per combination of label values.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text of the metric.
+        labelnames (tuple, optional): Names of the labels. Defaults to none.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """
+    Distribution of observed values per combination of label values, in cumulative buckets.
+
+    Args:
+        name (str): Metric name, ending in the unit, e.g. _seconds.
+        documentation (str): Help text of the metric.
+        labelnames (tuple, optional): Names of the labels. Defaults to none.
+        buckets (tuple, optional): Increasing bucket upper bounds. Defaults to LATENCY_BUCKETS.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> [count per bucket, sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        # Linear search is fastest for a dozen buckets and most observations land in the first few
+        index = 0
+        while value > self.buckets[index]:
+            index += 1
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, **labels):
+        """
+        Returns the count, sum and per-bucket counts observed for one combination of label values.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key, [[0] * len(self.buckets), 0.0, 0])
+            return {'count': count, 'sum': total, 'buckets': dict(zip(self.buckets, counts))}
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', _format_value(bound))]),
+                       cumulative)
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text exposition format, version 0.0.4.
+
+        Returns:
+            str: The exposition, one sample per line.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics of the app's hot paths
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('cvd_stage_seconds', "Latency of each stage of a page load.", ('stage',))
+STAGE_ERRORS = REGISTRY.counter('cvd_stage_errors_total', "Stages that raised, by exception type.",
+                                ('stage', 'error'))
+SLOW_REQUESTS = REGISTRY.counter('cvd_slow_requests_total', "Requests that exceeded the profiling threshold.",
+                                 ('request',))
+
+
+class timed(contextlib.ContextDecorator):
+    """
+    Times a stage into STAGE_SECONDS, as a context manager or a decorator, and counts the errors it raises.
+
+    A decorated function gets a fresh timer per call, so calls overlapping in several session threads each
+    record their own duration.
+
+    Args:
+        stage (str): Name of the stage, e.g. 'login', 'fetch', 'predict', 'save' or 'render'.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def _recreate_cm(self):
+        return timed(self.stage)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self._start, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage, error=exc_type.__name__)
+        return False
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler that only samples requests which are already slower than a threshold.
+
+    Requests are tracked by the thread running them. While any tracked request is in flight, a background
+    thread wakes every `interval` seconds and, for requests running longer than `threshold`, records the
+    thread's current call stack. When such a request ends, its samples are written to `directory` in the
+    collapsed stack format understood by flame graph tools, one "frame;frame;frame count" line per stack.
+    Fast requests cost two lock acquisitions and are never sampled.
+
+    Args:
+        threshold (float): Seconds after which a request is sampled.
+        directory (str): Directory the profiles are written to.
+        interval (float, optional): Seconds between samples. Defaults to 0.005.
+        max_profiles (int, optional): Profiles written per process, later slow requests are only counted.
+            Defaults to 100.
+    """
+
+    def __init__(self, threshold, directory, interval=0.005, max_profiles=100):
+        self.threshold = threshold
+        self.directory = directory
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self.profiles_written = 0
+        self._condition = threading.Condition()
+        self._active = {}  # thread ID -> [request name, start time, StackCounter]
+        self._thread = threading.Thread(target=self._run, name='cvd-slow-request-profiler', daemon=True)
+        self._thread.start()
+
+    @contextlib.contextmanager
+    def request(self, name):
+        """
+        Tracks one request run by the current thread.
+
+        Args:
+            name (str): Name of the request, used in the profile's file name.
+        """
+        thread_id = threading.get_ident()
+        state = [name, time.perf_counter(), StackCounter()]
+        with self._condition:
+            self._active[thread_id] = state
+            self._condition.notify()
+        try:
+            yield
+        finally:
+            with self._condition:
+                del self._active[thread_id]
+            elapsed = time.perf_counter() - state[1]
+            if elapsed >= self.threshold:
+                SLOW_REQUESTS.inc(request=name)
+                if state[2]:
+                    self._write_profile(name, elapsed, state[2])
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._active:
+                    self._condition.wait()
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            with self._condition:
+                for thread_id, (_, start, samples) in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and now - start >= self.threshold:
+                        samples[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _write_profile(self, name, elapsed, samples):
+        with self._condition:
+            if self.profiles_written >= self.max_profiles:
+                return
+            self.profiles_written += 1
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{elapsed * 1000:.0f}ms"
+                                            f"-{threading.get_ident()}.folded")
+        with open(path, 'w') as file:
+            for stack, count in samples.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1', registry=REGISTRY):
+    """
+    Serves the metrics at /metrics on a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 for any free port.
+        host (str, optional): Interface to listen on. Defaults to the local interface only.
+        registry (Registry, optional): Metrics to serve. Defaults to REGISTRY.
+
+    Returns:
+        ThreadingHTTPServer: The running server; server_address holds the bound port.
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='cvd-metrics-server', daemon=True).start()
+    return server
+
+
+def write_metrics_file(path, registry=REGISTRY):
+    """
+    Writes the metrics to a file atomically, e.g. for node_exporter's textfile collector.
+    """
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        file.write(registry.render())
+    os.replace(temporary, path)
+
+
+def start_file_exporter(path, interval, registry=REGISTRY):
+    """
+    Rewrites the metrics file every `interval` seconds on a background thread.
+
+    Returns:
+        threading.Thread: The exporting thread.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            write_metrics_file(path, registry)
+
+    thread = threading.Thread(target=run, name='cvd-metrics-file', daemon=True)
+    thread.start()
+    return thread
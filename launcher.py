@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import gc
+import importlib
+import itertools
+import os
+import secrets
+import signal
+import socket
+import sys
+import time
+
+# Multi-worker deployment settings, each overridable through the environment. Clients connect to the
+# balancer on `port`; worker i listens on `worker_port` + i. Shared state lives in `state_dir`.
+LAUNCHER_SETTINGS = {
+    'workers': int(os.environ.get('CVD_WORKERS', os.cpu_count() or 1)),
+    'host': os.environ.get('CVD_HOST', '127.0.0.1'),
+    'port': int(os.environ.get('CVD_PORT', 8501)),
+    'worker_port': int(os.environ.get('CVD_WORKER_PORT', 8601)),
+    'state_dir': os.environ.get('CVD_STATE_DIR', 'run'),
+}
+
+# Entry point every worker serves: the Streamlit app with its session cookie route
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+
+# Modules imported once by the launcher before the workers are forked, so the workers share their memory
+# copy-on-write instead of each importing its own copy
+PRELOAD_MODULES = (
+    'numpy', 'psycopg2', 'streamlit', 'streamlit.web.cli', 'streamlit.web.bootstrap',
+    'async_stages', 'auth', 'db_pool', 'drift_monitor', 'explanations', 'features', 'instrumentation',
+    'patient_search', 'persistence', 'prediction_cache', 'queries', 'recommendations', 'risk_grid',
+    'scoring_client', 'session_cookie', 'tree_model',
+)
+
+# Seconds a worker may take to start listening
+START_TIMEOUT = 60.0
+
+# Seconds to wait before restarting a worker that exited
+RESTART_DELAY = 1.0
+
+# Bytes copied per read by the balancer
+PROXY_BUFFER = 65536
+
+
+def shared_environment(settings):
+    """
+    Sets the environment every worker inherits: the session store and prediction cache shared through SQLite
+    files in the state directory, unless other shared stores are configured, and one thread per numeric
+    library, since the workers already use the cores.
+
+    Must run before the app's modules are imported, as they read their settings at import.
+
+    Args:
+        settings (dict): Launcher settings, see LAUNCHER_SETTINGS.
+    """
+    os.makedirs(settings['state_dir'], exist_ok=True)
+    if os.environ.get('CVD_SESSION_STORE', 'memory') == 'memory':
+        os.environ['CVD_SESSION_STORE'] = f"sqlite:{os.path.join(settings['state_dir'], 'sessions.sqlite3')}"
+    if os.environ.get('CVD_PREDICTION_CACHE_STORE', 'memory') == 'memory':
+        os.environ['CVD_PREDICTION_CACHE_STORE'] = f"sqlite:{os.path.join(settings['state_dir'], 'predictions.sqlite3')}"
+    for name in ('OPENBLAS_NUM_THREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(name, '1')
+
+
+def preload():
+    """
+    Imports PRELOAD_MODULES and freezes the objects they created, so the garbage collector does not write
+    to the pages the workers share.
+
+    Returns:
+        float: Seconds spent importing.
+    """
+    start = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    gc.collect()
+    gc.freeze()
+    return time.perf_counter() - start
+
+
+def configure_worker(index, settings):
+    """
+    Gives worker `index` its own drift monitor state, metrics port and metrics file, as these must not be
+    shared. Called in the worker after forking; the settings modules were imported by the launcher, so their
+    settings dictionaries are updated in place.
+    """
+    from drift_monitor import DRIFT_SETTINGS
+    from instrumentation import METRICS_SETTINGS
+
+    os.environ['CVD_WORKER_ID'] = str(index)
+    DRIFT_SETTINGS['state'] = os.path.join(settings['state_dir'], f'drift_state.{index}.json')
+    if METRICS_SETTINGS['port'] is not None:
+        METRICS_SETTINGS['port'] += index
+    if METRICS_SETTINGS['file']:
+        METRICS_SETTINGS['file'] = f"{METRICS_SETTINGS['file']}.{index}"
+
+
+def streamlit_flags(host, port):
+    """
+    Streamlit options of one worker.
+    """
+    return [f'--server.address={host}', f'--server.port={port}', '--server.headless=true',
+            '--server.fileWatcherType=none', '--browser.gatherUsageStats=false']
+
+
+def _run_worker(index, settings):
+    # Runs in the forked worker and never returns
+    code = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        configure_worker(index, settings)
+        from streamlit.web import cli
+
+        sys.argv = ['streamlit', 'run', APP_SCRIPT,
+                    *streamlit_flags(settings['host'], settings['worker_port'] + index)]
+        cli.main(prog_name='streamlit')
+        code = 0
+    except SystemExit as e:
+        if e.code is not None and not isinstance(e.code, int):
+            print(e.code, file=sys.stderr)
+        code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(PROXY_BUFFER)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def balance(host, port, backends):
+    """
+    Accepts connections on host:port and hands each to the next worker in turn, trying the following ones
+    if a worker does not accept.
+
+    Balancing is per TCP connection. Each Streamlit session runs over one websocket, so it stays on one
+    worker, and a reconnecting browser may land on any worker, which restores the login from the shared
+    session store.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+        backends (list): (host, port) of every worker.
+    """
+    turn = itertools.cycle(range(len(backends)))
+
+    async def handle(client_reader, client_writer):
+        first = next(turn)
+        for offset in range(len(backends)):
+            backend = backends[(first + offset) % len(backends)]
+            try:
+                reader, writer = await asyncio.open_connection(*backend)
+                break
+            except OSError:
+                continue
+        else:
+            client_writer.close()
+            return
+        await asyncio.gather(_pipe(client_reader, writer), _pipe(reader, client_writer))
+
+    server = await asyncio.start_server(handle, host, port, reuse_address=True)
+    async with server:
+        await server.serve_forever()
+
+
+def _run_balancer(settings):
+    # Runs in the forked balancer and never returns
+    code = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        backends = [(settings['host'], settings['worker_port'] + i) for i in range(settings['workers'])]
+        asyncio.run(balance(settings['host'], settings['port'], backends))
+        code = 0
+    finally:
+        os._exit(code)
+
+
+def _fork(target, *args):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        target(*args)
+    return pid
+
+
+def wait_for_port(host, port, timeout=START_TIMEOUT):
+    """
+    Waits until host:port accepts connections.
+
+    Returns:
+        bool: True if it did within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1.0):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def launch(settings, balancer=True, verbose=True):
+    """
+    Runs the app in `workers` processes forked from one preloaded launcher, behind a round-robin balancer.
+
+    The launcher imports the app's modules once, then forks the workers, so the interpreter, numpy,
+    Streamlit and the app's code are shared copy-on-write. The model artifact and risk table are memory
+    mapped, so every worker reads the same page cache. Logins and predictions are shared through the SQLite
+    stores set up by shared_environment. The launcher restarts workers that exit, and stops them all on
+    SIGTERM or Ctrl+C.
+
+    Args:
+        settings (dict): Launcher settings, see LAUNCHER_SETTINGS.
+        balancer (bool, optional): Run the balancer on settings['port']. Without it, put another proxy in
+            front of the worker ports. Defaults to True.
+        verbose (bool, optional): Print progress. Defaults to True.
+    """
+    shared_environment(settings)
+    seconds = preload()
+    if verbose:
+        print(f"Preloaded {len(PRELOAD_MODULES)} modules in {seconds:.2f}s")
+    # Every worker signs cookies with the same secret, so a browser can move between them. Streamlit only
+    # takes it from its configuration file or the environment.
+    os.environ.setdefault('STREAMLIT_SERVER_COOKIE_SECRET', secrets.token_hex(32))
+    workers = {}
+    for index in range(settings['workers']):
+        workers[_fork(_run_worker, index, settings)] = index
+    balancer_pid = _fork(_run_balancer, settings) if balancer else None
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers) + ([balancer_pid] if balancer_pid else []):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(settings['workers']):
+        port = settings['worker_port'] + index
+        if not wait_for_port(settings['host'], port) and verbose:
+            print(f"Worker {index} did not start listening on port {port}")
+    if verbose:
+        address = settings['port'] if balancer else f"{settings['worker_port']}-{settings['worker_port'] + settings['workers'] - 1}"
+        print(f"Serving {settings['workers']} workers on http://{settings['host']}:{address}", flush=True)
+
+    while workers or balancer_pid:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == balancer_pid:
+            balancer_pid = None if stopping else _fork(_run_balancer, settings)
+            continue
+        index = workers.pop(pid, None)
+        if index is None or stopping:
+            continue
+        if verbose:
+            print(f"Worker {index} exited with status {os.waitstatus_to_exitcode(status)}, restarting", flush=True)
+        time.sleep(RESTART_DELAY)
+        workers[_fork(_run_worker, index, settings)] = index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app from several preloaded worker processes.")
+    parser.add_argument('--workers', type=int, default=LAUNCHER_SETTINGS['workers'])
+    parser.add_argument('--host', default=LAUNCHER_SETTINGS['host'])
+    parser.add_argument('--port', type=int, default=LAUNCHER_SETTINGS['port'], help="Port of the balancer.")
+    parser.add_argument('--worker-port', type=int, default=LAUNCHER_SETTINGS['worker_port'],
+                        help="Port of the first worker; the others use the following ports.")
+    parser.add_argument('--state-dir', default=LAUNCHER_SETTINGS['state_dir'],
+                        help="Directory of the shared session store, prediction cache and drift states.")
+    parser.add_argument('--no-balancer', action='store_true', help="Only start the workers.")
+    args = parser.parse_args()
+
+    settings = {'workers': args.workers, 'host': args.host, 'port': args.port, 'worker_port': args.worker_port,
+                'state_dir': args.state_dir}
+    launch(settings, balancer=not args.no_balancer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import os
+
+import psycopg2
+
+from db_pool import DB_SETTINGS
+
+# Directory holding the numbered migration files, applied in file name order
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Bookkeeping table recording which migrations have been applied
+CREATE_MIGRATIONS_TABLE = """CREATE TABLE IF NOT EXISTS public.schema_migrations (
+                                 version text PRIMARY KEY,
+                                 applied_at timestamp with time zone NOT NULL DEFAULT now()
+                             )"""
+
+
+def available_migrations(directory=MIGRATIONS_DIR):
+    """
+    Lists the migration files in the order they must be applied.
+
+    Args:
+        directory (str, optional): Directory holding the .sql files. Defaults to MIGRATIONS_DIR.
+
+    Returns:
+        list: Tuples of (version, path), where the version is the file name without its extension.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.sql'))
+    return [(os.path.splitext(name)[0], os.path.join(directory, name)) for name in names]
+
+
+def applied_migrations(conn):
+    """
+    Retrieves the versions already applied to a database, creating the bookkeeping table if needed.
+
+    Args:
+        conn (psycopg2.extensions.connection): Database connection.
+
+    Returns:
+        set: Applied versions.
+    """
+    with conn.cursor() as cur:
+        cur.execute(CREATE_MIGRATIONS_TABLE)
+        cur.execute("SELECT version FROM public.schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def pending_migrations(conn, directory=MIGRATIONS_DIR):
+    """
+    Lists the migrations not yet applied to a database.
+
+    Args:
+        conn (psycopg2.extensions.connection): Database connection.
+        directory (str, optional): Directory holding the .sql files. Defaults to MIGRATIONS_DIR.
+
+    Returns:
+        list: Tuples of (version, path), in the order they must be applied.
+    """
+    applied = applied_migrations(conn)
+    return [(version, path) for version, path in available_migrations(directory) if version not in applied]
+
+
+def migrate(conn, directory=MIGRATIONS_DIR, verbose=True):
+    """
+    Applies every pending migration in order.
+
+    Each migration runs in its own transaction together with its bookkeeping row, so a failing
+    migration leaves the database at the last migration that succeeded.
+
+    Args:
+        conn (psycopg2.extensions.connection): Database connection.
+        directory (str, optional): Directory holding the .sql files. Defaults to MIGRATIONS_DIR.
+        verbose (bool, optional): Print each migration as it is applied. Defaults to True.
+
+    Returns:
+        list: Versions applied by this call.
+    """
+    applied = []
+    for version, path in pending_migrations(conn, directory):
+        with open(path, 'r') as file:
+            script = file.read()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(script)
+                cur.execute("INSERT INTO public.schema_migrations (version) VALUES (%s)", (version,))
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"Applied {version}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument('command', nargs='?', choices=['up', 'status'], default='up',
+                        help="Apply pending migrations (up) or list them (status).")
+    parser.add_argument('--dbname', default=DB_SETTINGS['dbname'])
+    parser.add_argument('--user', default=DB_SETTINGS['user'])
+    parser.add_argument('--host', default=DB_SETTINGS['host'])
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user, host=args.host)
+    try:
+        if args.command == 'status':
+            applied = applied_migrations(conn)
+            for version, _ in available_migrations():
+                print(f"{'applied' if version in applied else 'pending':<8} {version}")
+        else:
+            if not migrate(conn):
+                print("No pending migrations")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+-- Indexes behind the dashboard and login queries (see queries.py).
+-- Primary keys already cover lookups by "User ID" and the physician's panel by "Physician ID".
+
+-- Both dashboards join medicaltest on "Patient ID"
+CREATE INDEX IF NOT EXISTS "medicaltest_Patient ID_idx" ON public.medicaltest ("Patient ID");
+
+-- Reverse lookups of a patient's physicians; the primary key leads with "Physician ID"
+CREATE INDEX IF NOT EXISTS "physicianpatientlink_Patient ID_idx" ON public.physicianpatientlink ("Patient ID");
+
+-- Login and registration look users up by username, which must be unique
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON public.users (username);
@@ -0,0 +1,11 @@
+-- Prefix indexes behind the physician's patient search (queries.SEARCH_PATIENTS).
+-- The expressions must match the query exactly; text_pattern_ops lets LIKE 'prefix%' use them.
+
+CREATE INDEX IF NOT EXISTS patient_first_name_prefix_idx
+    ON public.patient (lower(rtrim("First Name")) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS patient_last_name_prefix_idx
+    ON public.patient (lower(rtrim("Last Name")) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS patient_full_name_prefix_idx
+    ON public.patient ((lower(rtrim("First Name") || ' ' || rtrim("Last Name"))) text_pattern_ops);
@@ -0,0 +1,9 @@
+-- Physician updates append a new medicaltest row per submission instead of rewriting the patient's tests.
+
+-- The dump leaves the "Test ID" sequence at 1 while rows 1..n exist, so the first insert would collide
+SELECT pg_catalog.setval('public."medicaltest_Test ID_seq"', coalesce(max("Test ID"), 0) + 1, false)
+FROM public.medicaltest;
+
+-- The dashboards read each patient's latest test: ("Patient ID", "Test ID") serves it with one index probe
+CREATE INDEX IF NOT EXISTS "medicaltest_Patient ID_Test ID_idx" ON public.medicaltest ("Patient ID", "Test ID");
+DROP INDEX IF EXISTS public."medicaltest_Patient ID_idx";
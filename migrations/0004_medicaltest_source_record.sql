@@ -0,0 +1,7 @@
+-- Lab feeds ingested by ingest.py are upserted by their source record, e.g. 'lab-2024-05-01.csv:1042',
+-- so re-ingesting a file updates the tests it created instead of appending them again.
+-- Tests entered through the app have no source record.
+
+ALTER TABLE public.medicaltest ADD COLUMN IF NOT EXISTS "Source Record" character varying(200);
+
+CREATE UNIQUE INDEX IF NOT EXISTS "medicaltest_Source Record_key" ON public.medicaltest ("Source Record");
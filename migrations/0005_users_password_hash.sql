@@ -0,0 +1,5 @@
+-- Passwords are stored as salted PBKDF2 hashes (see auth.py), e.g. 'pbkdf2_sha256$600000$<salt>$<hash>',
+-- which do not fit the original 50 characters. Plain text passwords are hashed on the user's next login
+-- or in bulk with auth.py.
+
+ALTER TABLE public.users ALTER COLUMN password TYPE character varying(200);
@@ -0,0 +1,4 @@
+-- Recommendation codes of each medical test, written by batch_scoring.py from the rules in
+-- recommendations.py, e.g. 'bmi.overweight,ap_hi.at_risk,smoke.yes'; empty when nothing calls for attention.
+
+ALTER TABLE public.medicaltest ADD COLUMN IF NOT EXISTS "Recommendation Codes" character varying(200);
@@ -0,0 +1,193 @@
+-- Append-only history of every patient's measurements and predictions, with per-patient trend aggregates
+-- maintained as medical tests are written, so the physician dashboard reads a patient's trend from one row.
+--
+-- risk_history gets one row whenever a medical test is inserted, or updated with different measurements or a
+-- different prediction (e.g. by ingest.py or batch_scoring.py). It is partitioned by month on "Recorded At";
+-- rows outside the monthly partitions land in risk_history_default until risk_history.py creates theirs.
+-- risk_trend holds each patient's latest reading, the change in predicted risk since the reading before,
+-- the mean blood pressure of the last 5 readings and the last 10 readings for charting.
+
+CREATE TABLE public.risk_history (
+    "History ID" bigserial,
+    "Recorded At" timestamp with time zone NOT NULL DEFAULT now(),
+    "Patient ID" integer NOT NULL,
+    "Test ID" integer NOT NULL,
+    "Physician ID" integer,
+    "Event" character varying(10) NOT NULL,
+    weight numeric,
+    "Diastolic Blood Pressure" integer,
+    "Systolic Blood Pressure" integer,
+    cholesterol integer,
+    glucose integer,
+    "Cardiovascular Disease" integer
+) PARTITION BY RANGE ("Recorded At");
+
+ALTER TABLE public.risk_history OWNER TO dadb;
+
+CREATE TABLE public.risk_history_default PARTITION OF public.risk_history DEFAULT;
+
+-- A patient's latest readings in time order, answered from the index alone
+CREATE INDEX "risk_history_Patient ID_Recorded At_idx"
+    ON public.risk_history ("Patient ID", "Recorded At", "History ID")
+    INCLUDE ("Test ID", "Diastolic Blood Pressure", "Systolic Blood Pressure", "Cardiovascular Disease");
+
+CREATE TABLE public.risk_trend (
+    "Patient ID" integer PRIMARY KEY,
+    "Readings" integer NOT NULL DEFAULT 0,
+    "Latest Recorded At" timestamp with time zone,
+    "Latest Test ID" integer,
+    "Latest Cardiovascular Disease" integer,
+    "Risk Delta" integer,
+    "Mean Diastolic Blood Pressure" numeric,
+    "Mean Systolic Blood Pressure" numeric,
+    "Recent Recorded At" timestamp with time zone[],
+    "Recent Diastolic Blood Pressure" integer[],
+    "Recent Systolic Blood Pressure" integer[],
+    "Recent Cardiovascular Disease" integer[]
+);
+
+ALTER TABLE public.risk_trend OWNER TO dadb;
+
+-- Creates the monthly partitions from the current month to months_ahead months ahead that do not exist yet,
+-- moving their rows out of the default partition first. Returns the number of partitions created.
+CREATE FUNCTION public.risk_history_add_partitions(months_ahead integer DEFAULT 3) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC');
+    lower_bound timestamp with time zone;
+    upper_bound timestamp with time zone;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        partition_name := 'risk_history_' || to_char(month, 'YYYY_MM');
+        lower_bound := month AT TIME ZONE 'UTC';
+        upper_bound := (month + interval '1 month') AT TIME ZONE 'UTC';
+        IF to_regclass('public.' || partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE public.%I (LIKE public.risk_history INCLUDING DEFAULTS)', partition_name);
+            EXECUTE format('WITH moved AS (DELETE FROM public.risk_history_default
+                                           WHERE "Recorded At" >= %L AND "Recorded At" < %L RETURNING *)
+                            INSERT INTO public.%I SELECT * FROM moved',
+                           lower_bound, upper_bound, partition_name);
+            EXECUTE format('ALTER TABLE public.risk_history ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, lower_bound, upper_bound);
+            created := created + 1;
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$;
+
+-- Recomputes the trend of the given patients from their last 10 readings. Each occurrence of a patient in
+-- patient_ids stands for one new reading, counted into "Readings".
+CREATE FUNCTION public.risk_trend_refresh(patient_ids integer[]) RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Lock the patients' trend rows in ID order, creating missing ones, so concurrent writers take turns
+    -- and each recomputation sees the readings committed before it
+    INSERT INTO public.risk_trend ("Patient ID")
+    SELECT DISTINCT id FROM unnest(patient_ids) id ORDER BY id
+    ON CONFLICT DO NOTHING;
+    PERFORM 1 FROM public.risk_trend WHERE "Patient ID" = ANY (patient_ids) ORDER BY "Patient ID" FOR UPDATE;
+
+    UPDATE public.risk_trend t
+    SET "Readings" = t."Readings" + added.readings,
+        "Latest Recorded At" = recent.recorded_at[1],
+        "Latest Test ID" = recent.test_ids[1],
+        "Latest Cardiovascular Disease" = recent.risks[1],
+        "Risk Delta" = recent.risks[1] - recent.risks[2],
+        "Mean Diastolic Blood Pressure" = (SELECT avg(v) FROM unnest(recent.diastolic[1:5]) v),
+        "Mean Systolic Blood Pressure" = (SELECT avg(v) FROM unnest(recent.systolic[1:5]) v),
+        "Recent Recorded At" = recent.recorded_at,
+        "Recent Diastolic Blood Pressure" = recent.diastolic,
+        "Recent Systolic Blood Pressure" = recent.systolic,
+        "Recent Cardiovascular Disease" = recent.risks
+    FROM (SELECT id, count(*) AS readings FROM unnest(patient_ids) id GROUP BY id) added
+    CROSS JOIN LATERAL (
+        SELECT array_agg(h."Recorded At" ORDER BY h."Recorded At" DESC, h."History ID" DESC) AS recorded_at,
+               array_agg(h."Test ID" ORDER BY h."Recorded At" DESC, h."History ID" DESC) AS test_ids,
+               array_agg(h."Diastolic Blood Pressure" ORDER BY h."Recorded At" DESC, h."History ID" DESC) AS diastolic,
+               array_agg(h."Systolic Blood Pressure" ORDER BY h."Recorded At" DESC, h."History ID" DESC) AS systolic,
+               array_agg(h."Cardiovascular Disease" ORDER BY h."Recorded At" DESC, h."History ID" DESC) AS risks
+        FROM (SELECT * FROM public.risk_history
+              WHERE "Patient ID" = added.id
+              ORDER BY "Recorded At" DESC, "History ID" DESC
+              LIMIT 10) h
+    ) recent
+    WHERE t."Patient ID" = added.id;
+END
+$$;
+
+-- Statement-level triggers, so a bulk write (ingest, batch scoring) appends its history and refreshes each
+-- affected patient once per statement instead of once per row
+CREATE FUNCTION public.medicaltest_record_history() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    patient_ids integer[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        WITH recorded AS (
+            INSERT INTO public.risk_history ("Patient ID", "Test ID", "Physician ID", "Event", weight,
+                                             "Diastolic Blood Pressure", "Systolic Blood Pressure", cholesterol,
+                                             glucose, "Cardiovascular Disease")
+            SELECT n."Patient ID", n."Test ID", n."Physician ID", 'insert', p.weight, n."Diastolic Blood Pressure",
+                   n."Systolic Blood Pressure", n.cholesterol, n.glucose, n."Cardiovascular Disease"
+            FROM new_tests n
+            LEFT JOIN public.patient p ON p."User ID" = n."Patient ID"
+            WHERE n."Patient ID" IS NOT NULL
+            ORDER BY n."Test ID"
+            RETURNING "Patient ID"
+        )
+        SELECT array_agg("Patient ID") INTO patient_ids FROM recorded;
+    ELSE
+        WITH recorded AS (
+            INSERT INTO public.risk_history ("Patient ID", "Test ID", "Physician ID", "Event", weight,
+                                             "Diastolic Blood Pressure", "Systolic Blood Pressure", cholesterol,
+                                             glucose, "Cardiovascular Disease")
+            SELECT n."Patient ID", n."Test ID", n."Physician ID", 'update', p.weight, n."Diastolic Blood Pressure",
+                   n."Systolic Blood Pressure", n.cholesterol, n.glucose, n."Cardiovascular Disease"
+            FROM new_tests n
+            JOIN old_tests o ON o."Test ID" = n."Test ID"
+            LEFT JOIN public.patient p ON p."User ID" = n."Patient ID"
+            WHERE n."Patient ID" IS NOT NULL
+              AND (n."Patient ID", n."Diastolic Blood Pressure", n."Systolic Blood Pressure", n.cholesterol,
+                   n.glucose, n."Cardiovascular Disease")
+                  IS DISTINCT FROM
+                  (o."Patient ID", o."Diastolic Blood Pressure", o."Systolic Blood Pressure", o.cholesterol,
+                   o.glucose, o."Cardiovascular Disease")
+            ORDER BY n."Test ID"
+            RETURNING "Patient ID"
+        )
+        SELECT array_agg("Patient ID") INTO patient_ids FROM recorded;
+    END IF;
+    IF patient_ids IS NOT NULL THEN
+        PERFORM public.risk_trend_refresh(patient_ids);
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+SELECT public.risk_history_add_partitions(3);
+
+-- Existing tests become each patient's first readings, in "Test ID" order
+INSERT INTO public.risk_history ("Patient ID", "Test ID", "Physician ID", "Event", weight, "Diastolic Blood Pressure",
+                                 "Systolic Blood Pressure", cholesterol, glucose, "Cardiovascular Disease")
+SELECT m."Patient ID", m."Test ID", m."Physician ID", 'backfill', p.weight, m."Diastolic Blood Pressure",
+       m."Systolic Blood Pressure", m.cholesterol, m.glucose, m."Cardiovascular Disease"
+FROM public.medicaltest m
+LEFT JOIN public.patient p ON p."User ID" = m."Patient ID"
+WHERE m."Patient ID" IS NOT NULL
+ORDER BY m."Test ID";
+
+SELECT public.risk_trend_refresh(array_agg("Patient ID")) FROM public.risk_history;
+
+CREATE TRIGGER medicaltest_record_history_insert
+    AFTER INSERT ON public.medicaltest
+    REFERENCING NEW TABLE AS new_tests
+    FOR EACH STATEMENT EXECUTE FUNCTION public.medicaltest_record_history();
+
+CREATE TRIGGER medicaltest_record_history_update
+    AFTER UPDATE ON public.medicaltest
+    REFERENCING OLD TABLE AS old_tests NEW TABLE AS new_tests
+    FOR EACH STATEMENT EXECUTE FUNCTION public.medicaltest_record_history();
@@ -0,0 +1,5 @@
+-- Inputs that raised each medical test's predicted risk the most, largest first, written by batch_scoring.py
+-- from the model's per-feature contributions (explanations.py), e.g. 'ap_hi,ageinyears,cholesterol';
+-- empty when no input raised the risk above the model's average.
+
+ALTER TABLE public.medicaltest ADD COLUMN IF NOT EXISTS "Risk Factors" character varying(200);
@@ -0,0 +1,5 @@
+-- Version of the model artifact that produced each medical test's stored prediction, written by
+-- batch_scoring.py. It only re-scores a patient's latest test, and only when that test was scored by another
+-- model version or not at all, so earlier tests keep the prediction made from the readings of their time.
+
+ALTER TABLE public.medicaltest ADD COLUMN IF NOT EXISTS "Model Version" character varying(32);
@@ -0,0 +1,53 @@
+import queries
+
+# Matches fetched per page of search results
+PAGE_SIZE = 25
+
+
+def like_prefix(text):
+    """
+    Turns search text into a lower-case LIKE prefix pattern, escaping LIKE wildcards typed by the user.
+
+    Args:
+        text (str): Search text, e.g. 'mary' or 'mary co'.
+
+    Returns:
+        str: Pattern such as 'mary co%'.
+    """
+    text = ' '.join(text.lower().split())
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_patients(cur, physician_id, text, limit=PAGE_SIZE, after=None):
+    """
+    Fetches one page of a physician's patients whose first, last or full name starts with the search text.
+
+    The filtering, ordering and paging run in Postgres, so only the requested page is transferred.
+
+    Args:
+        cur (psycopg2.extensions.cursor): Database cursor.
+        physician_id (int): The ID of the logged-in physician.
+        text (str): Search text; empty text matches every patient on the panel.
+        limit (int, optional): Maximum number of matches to return. Defaults to PAGE_SIZE.
+        after (tuple, optional): Cursor returned with the previous page. Defaults to None, the first page.
+
+    Returns:
+        tuple: List of (User ID, first name, last name) rows ordered by name, and the cursor for the next
+            page, or None if there are no more matches.
+    """
+    after_last, after_first, after_id = after or (None, None, None)
+    # One extra row tells whether another page exists without a separate count query
+    cur.execute(queries.SEARCH_PATIENTS, {
+        'physician_id': physician_id,
+        'prefix': like_prefix(text),
+        'after_last': after_last,
+        'after_first': after_first,
+        'after_id': after_id,
+        'limit': limit + 1,
+    })
+    rows = cur.fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    user_id, first_name, last_name = rows[-1]
+    return rows, (last_name, first_name, user_id)
@@ -0,0 +1,131 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import queries
+
+# Queue physician updates to a background writer instead of saving them before the result renders
+WRITE_BEHIND = os.environ.get('CVD_WRITE_BEHIND', '0') == '1'
+
+
+def save_patient_test(cur, physician_id, patient_id, encoded, age, prediction):
+    """
+    Saves a submitted physician form in one round trip: updates the patient and appends a new medical test.
+
+    Args:
+        cur (psycopg2.extensions.cursor): Database cursor; the caller commits.
+        physician_id (int): The ID of the physician submitting the form.
+        patient_id (int): The ID of the patient.
+        encoded (dict): Encoded model inputs keyed by feature name, as produced by features.encode.
+        age (int): Age in years.
+        prediction (int): Predicted cardiovascular disease class.
+
+    Returns:
+        int: "Test ID" of the new medical test, or None if the patient does not exist.
+    """
+    cur.execute(queries.SAVE_PATIENT_TEST, {
+        'physician_id': int(physician_id),
+        'patient_id': int(patient_id),
+        'age': int(age),
+        'gender': int(encoded['gender']),
+        'height': int(encoded['height']),
+        'weight': float(encoded['weight']),
+        'smoke': int(encoded['smoke']),
+        'alco': int(encoded['alco']),
+        'active': int(encoded['active']),
+        'ap_lo': int(encoded['ap_lo']),
+        'ap_hi': int(encoded['ap_hi']),
+        'cholesterol': int(encoded['cholesterol']),
+        'gluc': int(encoded['gluc']),
+        'prediction': int(prediction),
+    })
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+class BackgroundWriter:
+    """
+    Single background thread that saves physician updates after the prediction has been rendered.
+
+    Updates are written in submission order, each in its own transaction on a pooled connection.
+    `submit` returns a Future resolving to the new "Test ID", so a later rerun can report a failed write.
+    When `max_pending` updates are already queued, `submit` blocks until the writer catches up.
+
+    Args:
+        pool (ConnectionPool): Pool providing the writer's connection.
+        max_pending (int, optional): Maximum number of queued updates. Defaults to 1000.
+    """
+
+    def __init__(self, pool, max_pending=1000):
+        self.pool = pool
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'written': 0, 'failed': 0, 'lag_total': 0.0, 'lag_max': 0.0}
+        self._thread = threading.Thread(target=self._run, name='cvd-background-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, physician_id, patient_id, encoded, age, prediction):
+        """
+        Queues a physician update; see save_patient_test for the arguments.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the new "Test ID", or to the error that stopped the write.
+        """
+        future = Future()
+        self._queue.put((future, time.perf_counter(), (physician_id, patient_id, encoded, age, prediction)))
+        with self._lock:
+            self._stats['submitted'] += 1
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, queued_at, args = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    with self.pool.connection() as conn, conn.cursor() as cur:
+                        test_id = save_patient_test(cur, *args)
+                        conn.commit()
+                except Exception as e:
+                    future.set_exception(e)
+                    outcome = 'failed'
+                else:
+                    future.set_result(test_id)
+                    outcome = 'written'
+                lag = time.perf_counter() - queued_at
+                with self._lock:
+                    self._stats[outcome] += 1
+                    self._stats['lag_total'] += lag
+                    self._stats['lag_max'] = max(self._stats['lag_max'], lag)
+            self._queue.task_done()
+
+    def flush(self):
+        """
+        Blocks until every queued update has been written or has failed.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Writes the remaining queued updates and stops the writer thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        """
+        Returns a snapshot of the writer's queue and write-lag metrics.
+
+        Returns:
+            dict: Queued, written and failed counts, and the time updates spent waiting to be written.
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['pending'] = self._queue.qsize()
+        done = snapshot['written'] + snapshot['failed']
+        snapshot['lag_avg'] = snapshot['lag_total'] / done if done else 0.0
+        return snapshot
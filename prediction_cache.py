@@ -0,0 +1,268 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Default cache sizing for one server process, overridable through the environment. The shared store behind
+# it is 'memory' (none, this process only) or 'sqlite:<path>' (shared by the workers of a host).
+CACHE_SETTINGS = {
+    'maxsize': int(os.environ.get('CVD_PREDICTION_CACHE_SIZE', 10000)),
+    'ttl': float(os.environ.get('CVD_PREDICTION_CACHE_TTL', 3600)),
+    'store': os.environ.get('CVD_PREDICTION_CACHE_STORE', 'memory'),
+}
+
+# Predictions kept in a shared store; the oldest are trimmed once it holds more
+SHARED_STORE_SIZE = int(os.environ.get('CVD_PREDICTION_STORE_SIZE', 100000))
+
+# Writes to a shared store between purges of its expired, outdated and excess entries
+PURGE_EVERY = 1000
+
+
+class SQLitePredictionStore:
+    """
+    Predictions kept in a local SQLite database, shared by the workers of a host.
+
+    Entries are keyed by model version and the record's bytes in the model's input dtype, hold the predicted
+    class and positive class probability, and expire at a wall-clock time so every worker agrees on it. Each
+    thread uses its own connection; WAL mode lets workers read while another one writes.
+
+    Args:
+        path (str): Path of the SQLite database file.
+        maxsize (int, optional): Entries kept; the oldest are trimmed beyond it. Defaults to SHARED_STORE_SIZE.
+    """
+
+    def __init__(self, path, maxsize=SHARED_STORE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(predictions)")]
+            if columns and 'probability' not in columns:
+                # Written before probabilities were stored; a cache can simply start over
+                conn.execute("DROP TABLE predictions")
+            conn.execute("""CREATE TABLE IF NOT EXISTS predictions (
+                                version TEXT NOT NULL, record BLOB NOT NULL, prediction INTEGER NOT NULL,
+                                probability REAL NOT NULL, expires REAL, PRIMARY KEY (version, record))""")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, version, records, now):
+        """
+        Looks up unexpired predictions.
+
+        Returns:
+            dict: (prediction, probability) per record found, keyed by the record's bytes.
+        """
+        found = {}
+        conn = self._connect()
+        # Stays well below SQLite's limit on bound parameters
+        for start in range(0, len(records), 500):
+            batch = records[start:start + 500]
+            rows = conn.execute(f"""SELECT record, prediction, probability FROM predictions
+                                    WHERE version = ? AND record IN ({','.join('?' * len(batch))})
+                                      AND (expires IS NULL OR expires > ?)""", (version, *batch, now))
+            found.update((record, (prediction, probability)) for record, prediction, probability in rows)
+        return found
+
+    def put_many(self, version, entries, expires):
+        """
+        Stores (record bytes, prediction, probability) entries, purging now and then.
+        """
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                             [(version, record, prediction, probability, expires)
+                              for record, prediction, probability in entries])
+        self._writes += len(entries)
+        if self._writes >= PURGE_EVERY:
+            self._writes = 0
+            self.purge(version, time.time())
+
+    def purge(self, version, now):
+        """
+        Deletes expired entries, entries of other model versions, and the oldest entries beyond maxsize.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM predictions WHERE version != ? OR expires <= ?", (version, now))
+            conn.execute("DELETE FROM predictions WHERE rowid <= (SELECT max(rowid) FROM predictions) - ?",
+                         (self.maxsize,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM predictions")
+
+
+def open_prediction_store(spec):
+    """
+    Opens the shared prediction store described by 'memory' (none) or 'sqlite:<path>'.
+
+    Returns:
+        SQLitePredictionStore: The store, or None for 'memory'.
+    """
+    kind, _, location = spec.partition(':')
+    if kind == 'memory':
+        return None
+    if kind == 'sqlite' and location:
+        return SQLitePredictionStore(location)
+    raise ValueError(f"Unknown prediction cache store {spec!r}, expected 'memory' or 'sqlite:<path>'")
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of model predictions shared by every session of a server process.
+
+    Entries are keyed by the model version and the canonical feature tuple: the encoded record cast to the
+    model's input dtype, so inputs the model cannot tell apart share one entry. Each entry holds the predicted
+    class and the probability of the positive class. An entry expires `ttl` seconds after it was stored, and
+    the least recently used entry is evicted once `maxsize` is reached. When a model with a different version
+    is seen, all entries of the previous version are dropped.
+
+    With a shared store, predictions missing from this process are looked up there before scoring, and new
+    ones are written to it, so the workers of a host share one cache; the in-process entries stay the fast path.
+
+    Args:
+        maxsize (int): Maximum number of cached predictions.
+        ttl (float): Seconds an entry stays valid; 0 or None keeps entries until they are evicted.
+        store (str or SQLitePredictionStore, optional): Shared store, or its spec for open_prediction_store.
+            Defaults to None, caching in this process only.
+        clock (callable, optional): Time source in seconds. Defaults to time.monotonic.
+    """
+
+    def __init__(self, maxsize, ttl, store=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.store = open_prediction_store(store) if isinstance(store, str) else store
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._model_version = None
+        self._stats = {'hits': 0, 'misses': 0, 'shared_hits': 0, 'evictions': 0, 'expirations': 0,
+                       'invalidations': 0}
+
+    @staticmethod
+    def _keys(model, X):
+        X = np.asarray(X, dtype=getattr(model, 'input_dtype', np.float64))
+        return [(model.version, row) for row in map(tuple, X.tolist())]
+
+    def _switch_version(self, version):
+        # Called with the lock held: entries of another model version can never be hit again
+        if version != self._model_version:
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._model_version = version
+
+    def predict(self, model, X):
+        """
+        Predicts class labels, reusing cached predictions and scoring the misses in one model call.
+
+        Args:
+            model (TreeEnsemble): Fitted model with a `version`.
+            X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+
+        Returns:
+            numpy.ndarray: Predicted labels of shape (n_samples,).
+        """
+        return self.predict_with_proba(model, X)[0]
+
+    def predict_with_proba(self, model, X):
+        """
+        Predicts class labels and probabilities, reusing cached entries and scoring the misses in one model call.
+
+        Args:
+            model (TreeEnsemble): Fitted model with a `version`.
+            X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+
+        Returns:
+            tuple: Labels of shape (n_samples,) and probabilities of shape (n_samples, 2), as the model's
+                predict_with_proba() returns them.
+        """
+        keys = self._keys(model, X)
+        results = [None] * len(keys)
+        now = self._clock()
+        with self._lock:
+            self._switch_version(model.version)
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[2] is not None and entry[2] <= now:
+                    del self._entries[key]
+                    self._stats['expirations'] += 1
+                    continue
+                self._entries.move_to_end(key)
+                results[i] = entry[:2]
+            missing = [i for i, result in enumerate(results) if result is None]
+            self._stats['hits'] += len(keys) - len(missing)
+            self._stats['misses'] += len(missing)
+
+        if missing:
+            # Looked up and scored outside the lock, so concurrent sessions don't wait on each other's predictions
+            found, scored = {}, missing
+            if self.store is not None:
+                records = np.asarray(X, dtype=getattr(model, 'input_dtype', np.float64))
+                blobs = {i: records[i].tobytes() for i in missing}
+                found = self.store.get_many(model.version, list(blobs.values()), time.time())
+                scored = [i for i in missing if blobs[i] not in found]
+            predictions = {}
+            if scored:
+                labels, proba = model.predict_with_proba(np.asarray(X)[scored])
+                predictions = dict(zip(scored, zip(labels.tolist(), proba[:, 1].tolist())))
+            if self.store is not None:
+                for i in missing:
+                    if i not in predictions:
+                        predictions[i] = found[blobs[i]]
+                if scored:
+                    self.store.put_many(model.version, [(blobs[i], *predictions[i]) for i in scored],
+                                        time.time() + self.ttl if self.ttl else None)
+            expires = now + self.ttl if self.ttl else None
+            with self._lock:
+                self._switch_version(model.version)
+                self._stats['shared_hits'] += len(missing) - len(scored)
+                for i in missing:
+                    results[i] = predictions[i]
+                    self._entries[keys[i]] = (*predictions[i], expires)
+                    self._entries.move_to_end(keys[i])
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        labels = np.array([result[0] for result in results], dtype=np.asarray(model.classes_).dtype)
+        proba = np.empty((len(results), 2), dtype=np.float64)
+        proba[:, 1] = [result[1] for result in results]
+        proba[:, 0] = 1.0 - proba[:, 1]
+        return labels, proba
+
+    def clear(self):
+        """
+        Drops every prediction cached in this process; the counters and the shared store are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns a snapshot of the cache's hit, miss and eviction counters.
+
+        Returns:
+            dict: Cache size and cumulative counters, plus the hit rate; shared_hits are misses in this
+                process answered by the shared store.
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+            snapshot['maxsize'] = self.maxsize
+            snapshot['model_version'] = self._model_version
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = snapshot['hits'] / lookups if lookups else 0.0
+        return snapshot
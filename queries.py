@@ -0,0 +1,84 @@
+# SQL statements issued by the dashboards and login, kept in one place so the query plan
+# regression check (check_query_plans.py) explains exactly what the app runs.
+
+# Login: look up the user by username (unique index); the password hash is checked in process (auth.py)
+AUTHENTICATE_USER = """SELECT "User ID", "User Type", password FROM users WHERE username = %s"""
+
+# Replace a stored password by a new hash, unless it changed since it was read
+UPDATE_PASSWORD = """UPDATE users SET password = %s WHERE "User ID" = %s AND password = %s"""
+
+# Plain text passwords left from before hashing, in batches. The prefix is matched literally: as a LIKE
+# pattern the _ of pbkdf2_sha256 would match any character
+LEGACY_PASSWORDS = """SELECT "User ID", password FROM users WHERE NOT starts_with(password, %s) LIMIT %s"""
+
+# Registration in one round trip: nothing is returned if the username is taken
+INSERT_USER = """INSERT INTO users (username, password, "User Type") VALUES (%s, %s, %s)
+                 ON CONFLICT (username) DO NOTHING
+                 RETURNING "User ID\""""
+
+# Physician dashboard: one page of the physician's patients whose first, last or full name starts with the
+# search text, ordered by name. Pages are fetched by keyset: pass the (last name, first name, User ID) of the
+# previous page's last row as after_*, or NULLs for the first page. The name expressions match the indexes
+# in migrations/0002_patient_name_search.sql.
+SEARCH_PATIENTS = """SELECT p."User ID", rtrim(p."First Name"), rtrim(p."Last Name")
+                     FROM physicianpatientlink pl JOIN patient p ON p."User ID" = pl."Patient ID"
+                     WHERE pl."Physician ID" = %(physician_id)s
+                       AND (lower(rtrim(p."First Name")) LIKE %(prefix)s
+                            OR lower(rtrim(p."Last Name")) LIKE %(prefix)s
+                            OR lower(rtrim(p."First Name") || ' ' || rtrim(p."Last Name")) LIKE %(prefix)s)
+                       AND (%(after_id)s::integer IS NULL
+                            OR (rtrim(p."Last Name"), rtrim(p."First Name"), p."User ID")
+                               > (%(after_last)s::text, %(after_first)s::text, %(after_id)s::integer))
+                     ORDER BY rtrim(p."Last Name"), rtrim(p."First Name"), p."User ID"
+                     LIMIT %(limit)s"""
+
+# Physician dashboard: details and latest medical test of the selected patient
+PHYSICIAN_PATIENT_DETAILS = """SELECT p."First Name", p."Last Name", p."age", p."gender", p."height", p."weight",
+                                      p."Smoke History", p."Alcohol Consumption", p."Exercise Level",
+                                      m."Diastolic Blood Pressure", m."Systolic Blood Pressure", m."cholesterol",
+                                      m."glucose"
+                               FROM patient p
+                               CROSS JOIN LATERAL (SELECT * FROM medicaltest
+                                                   WHERE "Patient ID" = p."User ID"
+                                                   ORDER BY "Test ID" DESC LIMIT 1) m
+                               WHERE p."User ID" = %s"""
+
+# Physician dashboard: trend of the selected patient's readings, maintained by the medicaltest triggers in
+# migrations/0007_risk_history.sql; the recent readings are newest first
+PATIENT_RISK_TREND = """SELECT "Readings", "Latest Recorded At", "Latest Cardiovascular Disease", "Risk Delta",
+                               "Mean Diastolic Blood Pressure", "Mean Systolic Blood Pressure", "Recent Recorded At",
+                               "Recent Diastolic Blood Pressure", "Recent Systolic Blood Pressure",
+                               "Recent Cardiovascular Disease"
+                        FROM risk_trend
+                        WHERE "Patient ID" = %s"""
+
+# Physician dashboard: save the submitted form in one round trip, updating the patient and appending
+# the measurements as a new medical test. Nothing is inserted if the patient does not exist.
+SAVE_PATIENT_TEST = """WITH updated AS (
+                           UPDATE patient SET "age" = %(age)s, "gender" = %(gender)s, "height" = %(height)s,
+                                              "weight" = %(weight)s, "Smoke History" = %(smoke)s,
+                                              "Alcohol Consumption" = %(alco)s, "Exercise Level" = %(active)s
+                           WHERE "User ID" = %(patient_id)s
+                           RETURNING "User ID"
+                       )
+                       INSERT INTO medicaltest ("Physician ID", "Patient ID", "Diastolic Blood Pressure",
+                                                "Systolic Blood Pressure", "cholesterol", "glucose",
+                                                "Cardiovascular Disease")
+                       SELECT %(physician_id)s, "User ID", %(ap_lo)s, %(ap_hi)s, %(cholesterol)s, %(gluc)s,
+                              %(prediction)s
+                       FROM updated
+                       RETURNING "Test ID\""""
+
+# Patient dashboard: the logged-in patient's details and latest medical test
+PATIENT_DETAILS = """SELECT "First Name", "Last Name", "age", "gender", "Contact Information", "height", "weight",
+                            "Smoke History", "Alcohol Consumption", "Exercise Level", "Diastolic Blood Pressure",
+                            "Systolic Blood Pressure", "cholesterol", "glucose"
+                     FROM users u
+                     JOIN patient p ON u."User ID" = p."User ID"
+                     CROSS JOIN LATERAL (SELECT * FROM medicaltest
+                                         WHERE "Patient ID" = p."User ID"
+                                         ORDER BY "Test ID" DESC LIMIT 1) m
+                     WHERE p."User ID" = %s"""
+
+# Reverse lookup: physicians a patient is assigned to
+PATIENT_PHYSICIANS = """SELECT "Physician ID" FROM physicianpatientlink WHERE "Patient ID" = %s"""
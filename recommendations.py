@@ -0,0 +1,226 @@
+import functools
+from bisect import bisect_right
+from collections import namedtuple
+
+import numpy as np
+
+from features import FEATURE_INDEX
+
+# Who the messages address: the logged-in patient, or a physician looking at one of their patients
+AUDIENCES = ('patient', 'physician')
+
+# One outcome of a rule.
+#   code: short name, stored as "<rule>.<code>"
+#   severity: how the app shows it, the name of the Streamlit call: success, info, warning or error
+#   patient, physician: message per audience, or None to show nothing; {bmi} is filled in with the BMI
+Level = namedtuple('Level', ['code', 'severity', 'patient', 'physician'])
+
+# One rule: the measure it looks at and its levels, split by increasing thresholds. A value below bins[0]
+# gets levels[0], a value v with bins[i - 1] <= v < bins[i] gets levels[i].
+Rule = namedtuple('Rule', ['name', 'measure', 'bins', 'levels'])
+
+# One block of the recommendations, shown after its headings per audience
+Section = namedtuple('Section', ['headings', 'rules'])
+
+RULES = (
+    Rule('prediction', 'prediction', (1,), (
+        Level('no_risk', 'success',
+              "Based on your inputs, you are not at risk of cardiovascular disease. Keep it up!",
+              "Based on patient's information, the patient is not at risk of cardiovascular disease."),
+        Level('high_risk', 'error',
+              "Based on your inputs, you are at high risk of cardiovascular disease, please seek professional medical help.",
+              "Based on patient's information, the patient is at high risk of cardiovascular disease. Medical assistance is advised."),
+    )),
+    Rule('bmi', 'bmi', (25,), (
+        Level('normal', 'success',
+              "Your Body Mass Index is normal. Keep it up!",
+              "The patient's body mass index is normal."),
+        Level('overweight', 'warning',
+              "Your Body Mass Index is {bmi:.1f}. It's recommended to lose weight to lower your risk of cardiovascular disease.",
+              "The patient's body mass index is {bmi:.1f}. Suggest weight loss measures to mitigate the risk of cardiovascular diseases."),
+    )),
+    Rule('ap_lo', 'ap_lo', (80, 90), (
+        Level('normal', 'success',
+              "Your diastolic blood pressure is normal.",
+              "Patient's diastolic blood pressure is normal."),
+        Level('at_risk', 'warning',
+              "Your diastolic blood pressure is at risk level. Consider monitoring it regularly. Recommended to adhere to a low-sodium diet and stay hydrated.",
+              "Patient's diastolic blood pressure is at risk level. Consider monitoring it regularly. Recommend the patient to adhere to a low-sodium diet and stay hydrated."),
+        Level('very_high', 'error',
+              "Your diastolic blood pressure is very high. Seek medical attention immediately.",
+              "Patient's diastolic blood pressure is very high. Recommend the patient to adhere to a low-sodium diet and stay hydrated. Provide medical intervention."),
+    )),
+    Rule('ap_hi', 'ap_hi', (120, 140), (
+        Level('normal', 'success',
+              "Your systolic blood pressure is normal.",
+              "Patient's systolic blood pressure is normal."),
+        Level('at_risk', 'warning',
+              "Your systolic blood pressure is at risk level. Consider monitoring it regularly. Recommend adhering to a low-sodium diet and staying hydrated.",
+              None),
+        Level('very_high', 'error',
+              "Your systolic blood pressure is very high. Seek medical attention immediately.",
+              None),
+    )),
+    Rule('cholesterol', 'cholesterol', (2, 3), (
+        Level('normal', 'success',
+              "Your cholesterol level is normal.",
+              "Patient's cholesterol level is normal."),
+        Level('above_normal', 'warning',
+              "Your cholesterol level is above normal. Recommended to have a diet low in saturated fats and cholesterol. Recommended to exercise 3 times a week.",
+              "Patient's cholesterol level is above normal. Recommend diet low in saturated fats and cholesterol. Suggest regular exercise."),
+        Level('well_above_normal', 'error',
+              "Your cholesterol level is well above normal. Seek medical attention.",
+              "Patient's cholesterol level is well above normal. Recommend diet low in saturated fats and cholesterol. Suggest regular exercise. Prescribe medication to manage cholesterol levels."),
+    )),
+    Rule('gluc', 'gluc', (2, 3), (
+        Level('normal', 'success',
+              "Your glucose level is normal.",
+              "Patient's glucose level is normal."),
+        Level('above_normal', 'warning',
+              "Your glucose level is above normal. Recommended to reduce intake of sugary and high-carbohydrate foods. Recommended to exercise 3 times a week.",
+              "Patient's glucose level is above normal. Recommend patient to reduce intake of sugary and high-carbohydrate foods. Suggest regular exercise."),
+        Level('well_above_normal', 'error',
+              "Your glucose level is well above normal. Seek medical attention.",
+              "Patient's glucose level is well above normal. Recommend patient to reduce intake of sugary and high-carbohydrate foods. Suggest regular exercise. Provide medical intervention."),
+    )),
+    Rule('smoke', 'smoke', (1,), (
+        Level('no', 'success',
+              "Opting not to smoke can lead to better health outcomes and a higher quality of life. Keep it up!",
+              "Patient is not smoking."),
+        Level('yes', 'warning',
+              "It is strongly advised to stop smoking to improve your overall health and lower your risk of cardiovascular disease.",
+              "Recommend the patient discontinues smoking to enhance their overall health and diminish the risk of cardiovascular disease."),
+    )),
+    Rule('alco', 'alco', (1,), (
+        Level('no', 'success',
+              "Choosing not to consume alcohol can support your overall health and well-being, promoting clarity of mind and a healthier lifestyle. Keep it up!",
+              "Patient is not consuming alcohol."),
+        Level('yes', 'warning',
+              "Consider reducing your alcohol intake to lower your health risks and lower your risk of cardiovascular disease.",
+              "Advise the patient to decrease or discontinue alcohol consumption."),
+    )),
+    Rule('active', 'active', (1,), (
+        Level('no', 'info',
+              "Regular exercise is recommended. Try to exercise at least 3 times a week.",
+              "Recommend the patient to enegage in regular exerice, a minimum of three times per week."),
+        Level('yes', 'success',
+              "Engaging in regular exercise can significantly enhance your physical fitness, mental well-being, and overall quality of life. Keep it up!",
+              "Patient is exercising regularly."),
+    )),
+)
+
+RULE_INDEX = {rule.name: i for i, rule in enumerate(RULES)}
+
+# Display order of the rules, with the headings each audience sees
+SECTIONS = (
+    Section({'patient': ('# Cardiovascular Disease Prediction:',),
+             'physician': ('# Cardiovascular Disease Prediction:',)}, ('prediction',)),
+    Section({'patient': ('# Recommendations Based on Your Input:', '### Body Mass Index:'),
+             'physician': ('# Recommendations Based on Patient Information:', '### Body Mass Index:')}, ('bmi',)),
+    Section({'patient': ('### Diastolic & Systolic Blood Pressure:',),
+             'physician': ('### Diastolic & Systolic Blood Pressure:',)}, ('ap_lo', 'ap_hi')),
+    Section({'patient': ('### Cholesterol Level:',), 'physician': ()}, ('cholesterol',)),
+    Section({'patient': ('### Glucose Level:',), 'physician': ('### Glucose Level:',)}, ('gluc',)),
+    Section({'patient': ('### Life Style:',), 'physician': ('### Life Style:',)}, ('smoke', 'alco', 'active')),
+)
+
+# Distinct input buckets whose rendered messages and codes are remembered
+MEMO_SIZE = 4096
+
+
+def measures(X, predictions):
+    """
+    Computes the values the rules look at from encoded records.
+
+    Args:
+        X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+        predictions (numpy.ndarray): Predicted class per record.
+
+    Returns:
+        dict: Array of values per measure name.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    values = {name: X[:, index] for name, index in FEATURE_INDEX.items()}
+    values['bmi'] = values['weight'] / ((values['height'] / 100) ** 2)
+    values['prediction'] = np.asarray(predictions, dtype=np.float64).reshape(-1)
+    return values
+
+
+def evaluate(X, predictions):
+    """
+    Evaluates every rule on a batch of records, one vectorized threshold search per rule.
+
+    Args:
+        X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+        predictions (numpy.ndarray): Predicted class per record.
+
+    Returns:
+        numpy.ndarray: Level index per record and rule, of shape (n_samples, len(RULES)).
+    """
+    values = measures(X, predictions)
+    levels = np.empty((len(values['prediction']), len(RULES)), dtype=np.int8)
+    for i, rule in enumerate(RULES):
+        levels[:, i] = np.digitize(values[rule.measure], rule.bins)
+    return levels
+
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def _plan(levels, audience):
+    # Headings and message templates of one input bucket, in display order
+    items = []
+    for section in SECTIONS:
+        items.extend(('heading', line) for line in section.headings[audience])
+        for name in section.rules:
+            level = RULES[RULE_INDEX[name]].levels[levels[RULE_INDEX[name]]]
+            message = getattr(level, audience)
+            if message is not None:
+                items.append((level.severity, message))
+    return tuple(items)
+
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def _codes(levels):
+    # Codes of the levels that call for attention, i.e. everything not shown as a success
+    return ','.join(f'{rule.name}.{rule.levels[level].code}' for rule, level in zip(RULES, levels)
+                    if rule.levels[level].severity != 'success')
+
+
+def recommend(record, prediction, audience):
+    """
+    Builds the prediction and recommendation messages for one submitted form.
+
+    Each record falls into one bucket per rule, so the messages are looked up per bucket combination and
+    only the BMI is filled in per record.
+
+    Args:
+        record (sequence): The 11 encoded inputs, in the model's column order.
+        prediction (int): Predicted class.
+        audience (str): 'patient' or 'physician'.
+
+    Returns:
+        list: (kind, text) pairs in display order, where kind is 'heading' or the message's severity.
+    """
+    values = {name: float(record[index]) for name, index in FEATURE_INDEX.items()}
+    values['bmi'] = values['weight'] / ((values['height'] / 100) ** 2)
+    values['prediction'] = float(prediction)
+    levels = tuple(bisect_right(rule.bins, values[rule.measure]) for rule in RULES)
+    return [(kind, text.format(bmi=values['bmi']) if kind != 'heading' else text)
+            for kind, text in _plan(levels, audience)]
+
+
+def recommendation_codes(levels):
+    """
+    Turns evaluated levels into the codes stored with each medical test, e.g. "bmi.overweight,smoke.yes".
+
+    Args:
+        levels (numpy.ndarray): Output of evaluate().
+
+    Returns:
+        numpy.ndarray: Comma-separated codes of the levels that call for attention, per record; empty if none.
+    """
+    # Pack each record's levels into one integer, so the distinct buckets are found with a 1-D unique
+    radix = np.cumprod([1] + [len(rule.levels) for rule in RULES[:-1]], dtype=np.int64)
+    keys = levels.astype(np.int64) @ radix
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    codes = np.array([_codes(tuple(levels[i].tolist())) for i in first], dtype=object)
+    return codes[inverse]
@@ -0,0 +1,297 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from features import FEATURE_NAMES, FEATURES, N_FEATURES
+from tree_model import PICKLE_PATH, load_model, resolve_artifact
+
+# Directory of the precomputed risk table used by the patient dashboard's what-if explorer
+GRID_PATH = 'risk_grid'
+
+# Artifact format, checked when loading so an incompatible table is rejected
+FORMAT_NAME = 'cvd-risk-grid'
+FORMAT_VERSION = 1
+HEADER_FILE = 'grid.json'
+RISK_FILE = 'risk.npy'
+
+# Quantized (start, step, count) of the numeric inputs; categorical inputs take every option.
+# Ages are whole years as entered in the app, the other ranges cover about 98% of cardio_train.csv.
+NUMERIC_AXES = {
+    'height': (145, 5, 11),
+    'weight': (45, 5, 19),
+    'ap_hi': (90, 10, 11),
+    'ap_lo': (60, 10, 6),
+    'ageinyears': (30, 1, 36),
+}
+
+# Cells evaluated per model call while building
+SLAB_CELLS = 250000
+
+# Per-process model and output table, set by _init_worker
+_worker = {}
+
+
+def default_axes():
+    """
+    Lists the grid axes in the model's column order.
+
+    Returns:
+        list: (start, step, count) per input, every option of the categorical inputs.
+    """
+    return [NUMERIC_AXES.get(feature.name) or (feature.min_value, 1, feature.max_value - feature.min_value + 1)
+            for feature in FEATURES]
+
+
+def axis_values(axis):
+    start, step, count = axis
+    return start + step * np.arange(count, dtype=np.float64)
+
+
+def quantize(proba):
+    """
+    Stores probabilities in one byte each: bucket q holds [q/256, (q+1)/256), so q >= 128 exactly when p >= 0.5.
+    """
+    return np.minimum(np.floor(proba * 256), 255).astype(np.uint8)
+
+
+def _slab_points(axes, prefix):
+    """
+    Encoded inputs of every cell whose leading indices are `prefix`, in the table's C order.
+    """
+    values = [axis_values(axis) for axis in axes]
+    rest = np.meshgrid(*values[len(prefix):], indexing='ij')
+    X = np.empty((rest[0].size, len(axes)), dtype=np.float64)
+    for i, index in enumerate(prefix):
+        X[:, i] = values[i][index]
+    for i, column in enumerate(rest, start=len(prefix)):
+        X[:, i] = column.ravel()
+    return X
+
+
+def _init_worker(model_path, risk_path, axes):
+    _worker['model'] = load_model(model_path)
+    _worker['risk'] = np.load(risk_path, mmap_mode='r+')
+    _worker['axes'] = axes
+
+
+def _fill_slab(prefix):
+    # Each worker writes its slabs straight into the memory-mapped table
+    risk = _worker['risk']
+    X = _slab_points(_worker['axes'], prefix)
+    risk[prefix] = quantize(_worker['model'].predict_proba(X)[:, 1]).reshape(risk[prefix].shape)
+    risk.flush()
+    return prefix
+
+
+def build(model_path=PICKLE_PATH, path=GRID_PATH, axes=None, jobs=None, verbose=True):
+    """
+    Evaluates the model on every cell of the grid and writes the risk table.
+
+    The table is a C-ordered uint8 array with one axis per model input, written with numpy's .npy format so
+    the app can memory-map it, next to a grid.json header recording the axes and the model version.
+
+    Args:
+        model_path (str, optional): Pickled model or model artifact to evaluate. Defaults to PICKLE_PATH.
+        path (str, optional): Directory to write. Defaults to GRID_PATH.
+        axes (list, optional): (start, step, count) per input. Defaults to default_axes().
+        jobs (int, optional): Worker processes. Defaults to None, one per core.
+        verbose (bool, optional): Print progress. Defaults to True.
+
+    Returns:
+        RiskGrid: The table just written.
+    """
+    axes = [tuple(axis) for axis in (axes or default_axes())]
+    shape = tuple(count for _, _, count in axes)
+    # The workers load the same version as the header records, even if a retrain publishes another meanwhile
+    model_path = resolve_artifact(model_path)
+    model = load_model(model_path)
+
+    # Split the table along its leading axes into slabs of at most SLAB_CELLS cells
+    split = 0
+    while split < len(shape) and int(np.prod(shape[split:])) > SLAB_CELLS:
+        split += 1
+    prefixes = list(itertools.product(*(range(count) for count in shape[:split])))
+
+    os.makedirs(path, exist_ok=True)
+    header_path = os.path.join(path, HEADER_FILE)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+    risk_path = os.path.join(path, RISK_FILE)
+    np.lib.format.open_memmap(risk_path, mode='w+', dtype=np.uint8, shape=shape).flush()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(model_path, risk_path, axes)) as pool:
+        for done, _ in enumerate(pool.map(_fill_slab, prefixes), start=1):
+            if verbose and done % max(len(prefixes) // 10, 1) == 0:
+                print(f"{done}/{len(prefixes)} slabs, {time.perf_counter() - start:.1f}s")
+
+    header = {
+        'format': FORMAT_NAME,
+        'format_version': FORMAT_VERSION,
+        'model_version': model.version,
+        'features': list(FEATURE_NAMES),
+        'axes': [list(axis) for axis in axes],
+    }
+    # Written last, so a directory with a header always has a complete table
+    with open(header_path, 'w') as file:
+        json.dump(header, file, indent=2)
+    if verbose:
+        print(f"Wrote {int(np.prod(shape)):,} cells for model {model.version} to {path} "
+              f"in {time.perf_counter() - start:.1f}s")
+    return RiskGrid.load(path)
+
+
+def grid_version(path=GRID_PATH):
+    """
+    Reads the model version of a risk table without mapping it, or None if there is no table.
+    """
+    try:
+        with open(os.path.join(path, HEADER_FILE)) as file:
+            return json.load(file)['model_version']
+    except FileNotFoundError:
+        return None
+
+
+class RiskGrid:
+    """
+    Precomputed model risk on a quantized grid of the 11 inputs, read from a memory-mapped table.
+
+    Looking up a record snaps each input to the nearest grid value, clamped to the grid's range, and reads
+    one byte, so exploring what-if changes costs microseconds instead of a model call. Lookups approximate
+    the model between grid values; the model remains the source of truth for submitted forms.
+
+    Args:
+        risk (numpy.ndarray): Quantized risk, one uint8 axis per input.
+        axes (list): (start, step, count) per input, in the model's column order.
+        model_version (str): Version of the model the table was computed from.
+    """
+
+    def __init__(self, risk, axes, model_version):
+        if len(axes) != N_FEATURES or risk.shape != tuple(count for _, _, count in axes):
+            raise ValueError(f"Risk table of shape {risk.shape} does not match its axes")
+        self.risk = risk
+        self.axes = [tuple(axis) for axis in axes]
+        self.model_version = model_version
+        self._start = np.array([axis[0] for axis in axes], dtype=np.float64)
+        self._step = np.array([axis[1] for axis in axes], dtype=np.float64)
+        self._last = np.array([axis[2] - 1 for axis in axes], dtype=np.intp)
+
+    @classmethod
+    def load(cls, path=GRID_PATH):
+        """
+        Memory-maps a risk table written by build().
+
+        Args:
+            path (str, optional): Table directory. Defaults to GRID_PATH.
+
+        Returns:
+            RiskGrid: The table.
+        """
+        with open(os.path.join(path, HEADER_FILE)) as file:
+            header = json.load(file)
+        if header.get('format') != FORMAT_NAME or header.get('format_version', 0) > FORMAT_VERSION:
+            raise ValueError(f"Unsupported risk table in {path}: {header.get('format')} "
+                             f"version {header.get('format_version')}")
+        if tuple(header['features']) != FEATURE_NAMES:
+            raise ValueError(f"Risk table in {path} was built for other model inputs: {header['features']}")
+        risk = np.load(os.path.join(path, RISK_FILE), mmap_mode='r', allow_pickle=False)
+        return cls(risk, header['axes'], header['model_version'])
+
+    def indices(self, X):
+        """
+        Snaps encoded records to their nearest grid cells.
+
+        Args:
+            X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+
+        Returns:
+            numpy.ndarray: Grid indices of shape (n_samples, 11).
+        """
+        positions = np.rint((np.asarray(X, dtype=np.float64) - self._start) / self._step)
+        return np.clip(positions, 0, self._last).astype(np.intp)
+
+    def snap(self, X):
+        """
+        Returns the grid values the records are looked up at.
+        """
+        return self._start + self.indices(X) * self._step
+
+    def predict_proba(self, X):
+        """
+        Looks up the positive class probability of encoded records, at the middle of their stored bucket.
+
+        Args:
+            X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+
+        Returns:
+            numpy.ndarray: Probabilities of shape (n_samples,).
+        """
+        cells = self.risk[tuple(self.indices(X).T)]
+        return (cells + 0.5) / 256
+
+    def lookup(self, record):
+        """
+        Looks up the positive class probability of one encoded record, without array overhead.
+
+        Args:
+            record (sequence): The 11 encoded inputs, in the model's column order.
+
+        Returns:
+            float: Probability at the middle of the stored bucket.
+        """
+        index = tuple(min(max(round((value - start) / step), 0), count - 1)
+                      for value, (start, step, count) in zip(record, self.axes))
+        return (int(self.risk[index]) + 0.5) / 256
+
+    def predict(self, X):
+        """
+        Looks up the predicted class of encoded records: 1 where the model's probability is at least 0.5.
+        """
+        return (self.risk[tuple(self.indices(X).T)] >= 128).astype(np.int64)
+
+
+def check(grid, model, samples=100000, seed=0):
+    """
+    Compares the table with the model at random grid cells.
+
+    Args:
+        grid (RiskGrid): The table.
+        model (TreeEnsemble): The model it was built from.
+        samples (int, optional): Cells to compare. Defaults to 100000.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        int: Number of cells whose stored bucket differs from the model's.
+    """
+    rng = np.random.default_rng(seed)
+    indices = np.column_stack([rng.integers(0, count, samples) for _, _, count in grid.axes])
+    X = grid._start + indices * grid._step
+    expected = quantize(model.predict_proba(X)[:, 1])
+    return int(np.count_nonzero(grid.risk[tuple(indices.T)] != expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the model's risk on a quantized grid of its inputs.")
+    parser.add_argument('--model', default=PICKLE_PATH, help="Pickled model or model artifact to evaluate.")
+    parser.add_argument('--out', default=GRID_PATH, help="Directory to write the risk table to.")
+    parser.add_argument('--jobs', type=int, default=None, help="Worker processes, one per core by default.")
+    parser.add_argument('--check', type=int, default=100000, help="Random cells to compare with the model after "
+                                                                  "building, 0 to skip.")
+    args = parser.parse_args()
+
+    grid = build(args.model, args.out, jobs=args.jobs)
+    if args.check:
+        mismatches = check(grid, load_model(args.model), samples=args.check)
+        print(f"{mismatches} of {args.check} sampled cells differ from the model")
+        if mismatches:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
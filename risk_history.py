@@ -0,0 +1,75 @@
+import argparse
+
+import psycopg2
+
+from db_pool import DB_SETTINGS
+
+# Monthly partitions of risk_history kept ready ahead of the current month
+MONTHS_AHEAD = 3
+
+# Partitions of risk_history with their estimated rows, oldest first; the default partition sorts last
+PARTITIONS_QUERY = """SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), greatest(c.reltuples, 0)::bigint
+                      FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                      WHERE i.inhparent = 'public.risk_history'::regclass
+                      ORDER BY c.relname = 'risk_history_default', c.relname"""
+
+
+def add_partitions(conn, months_ahead=MONTHS_AHEAD):
+    """
+    Creates the monthly risk_history partitions up to `months_ahead` months ahead that do not exist yet.
+
+    Readings recorded outside every monthly partition are kept in the default partition; creating their
+    month's partition moves them into it. Run this at least monthly, e.g. from cron, so new readings land in
+    their own partition.
+
+    Args:
+        conn (psycopg2.extensions.connection): Database connection.
+        months_ahead (int, optional): Months after the current one to create. Defaults to MONTHS_AHEAD.
+
+    Returns:
+        int: Number of partitions created.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT public.risk_history_add_partitions(%s)", (months_ahead,))
+        created = cur.fetchone()[0]
+    conn.commit()
+    return created
+
+
+def partitions(conn):
+    """
+    Lists the partitions of risk_history.
+
+    Args:
+        conn (psycopg2.extensions.connection): Database connection.
+
+    Returns:
+        list: Tuples of (partition name, bounds, estimated rows).
+    """
+    with conn.cursor() as cur:
+        cur.execute(PARTITIONS_QUERY)
+        rows = cur.fetchall()
+    conn.rollback()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create upcoming monthly partitions of the patients' risk history.")
+    parser.add_argument('--months-ahead', type=int, default=MONTHS_AHEAD,
+                        help="Months after the current one to create partitions for.")
+    parser.add_argument('--dbname', default=DB_SETTINGS['dbname'])
+    parser.add_argument('--user', default=DB_SETTINGS['user'])
+    parser.add_argument('--host', default=DB_SETTINGS['host'])
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user, host=args.host)
+    try:
+        print(f"Created {add_partitions(conn, args.months_ahead)} partitions")
+        for name, bounds, rows in partitions(conn):
+            print(f"{name:<24} {rows:>12,} rows  {bounds}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
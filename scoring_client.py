@@ -0,0 +1,87 @@
+import http.client
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Scoring service used by the app; unset to score with the local model artifact instead
+SCORING_URL = os.environ.get('CVD_SCORING_URL')
+
+
+class ScoringError(Exception):
+    """
+    Raised when the scoring service rejects a request or cannot be reached.
+    """
+
+
+class ScoringClient:
+    """
+    Thin client of the scoring service with the same prediction interface as TreeEnsemble.
+
+    It can stand in for the local model anywhere the app predicts, including behind the PredictionCache:
+    `version` follows the model version reported with every response, and `input_dtype` and `classes_`
+    come from the service's /health endpoint. Each thread keeps its own keep-alive connection.
+
+    Args:
+        url (str): Base URL of the service, e.g. http://127.0.0.1:8500.
+        timeout (float, optional): Seconds to wait for the service. Defaults to 5.
+    """
+
+    def __init__(self, url, timeout=5.0):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+        health = self._request('GET', '/health')
+        self.version = health['model_version']
+        self.input_dtype = np.dtype(health['input_dtype'])
+        self.classes_ = np.asarray(health['classes'])
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload) if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        # Retry once on a fresh connection, in case the kept-alive one was closed by the server
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = json.loads(response.read())
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise ScoringError(f"Scoring service at {self.host}:{self.port} is unavailable: {e}")
+        if response.status != 200:
+            raise ScoringError(data.get('error', f"Scoring service returned HTTP {response.status}"))
+        return data
+
+    def predict_with_proba(self, X):
+        """
+        Scores encoded records on the service.
+
+        Args:
+            X (numpy.ndarray): Encoded records of shape (n_samples, 11).
+
+        Returns:
+            tuple: Labels of shape (n_samples,) and probabilities of shape (n_samples, 2).
+        """
+        result = self._request('POST', '/predict', {'instances': np.asarray(X, dtype=np.float64).tolist()})
+        self.version = result['model_version']
+        predictions = result['predictions']
+        labels = np.array([prediction['prediction'] for prediction in predictions], dtype=self.classes_.dtype)
+        proba = np.empty((len(predictions), 2), dtype=np.float64)
+        proba[:, 1] = [prediction['probability'] for prediction in predictions]
+        proba[:, 0] = 1.0 - proba[:, 1]
+        return labels, proba
+
+    def predict(self, X):
+        return self.predict_with_proba(X)[0]
+
+    def predict_proba(self, X):
+        return self.predict_with_proba(X)[1]
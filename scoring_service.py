@@ -0,0 +1,422 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from drift_monitor import DRIFT_SETTINGS, DriftMonitor
+from features import FEATURE_NAMES, FEATURES, encode
+from tree_model import MODEL_PATH, load_model
+
+# Where the service listens and how it batches, overridable through the environment
+SERVICE_SETTINGS = {
+    'host': os.environ.get('CVD_SCORING_HOST', '127.0.0.1'),
+    'port': int(os.environ.get('CVD_SCORING_PORT', 8500)),
+    'max_batch': int(os.environ.get('CVD_SCORING_MAX_BATCH', 256)),
+    'max_wait': float(os.environ.get('CVD_SCORING_MAX_WAIT', 0.002)),
+}
+
+# Records scored per model call when streaming NDJSON
+STREAM_CHUNK_ROWS = 1000
+
+# Largest accepted JSON request body, in bytes
+MAX_JSON_BYTES = 64 * 1024 * 1024
+
+# Valid range of every model input, in the model's column order
+_MIN_VALUES = np.array([feature.min_value for feature in FEATURES], dtype=np.float64)
+_MAX_VALUES = np.array([feature.max_value for feature in FEATURES], dtype=np.float64)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent small prediction requests into one model call.
+
+    A single worker thread takes the first queued request plus every request queued behind it, and scores
+    them with one predict_with_proba call. While other requests are still arriving (see `arriving`), it waits
+    for them up to `max_wait` seconds or until `max_batch` rows are collected. A lone request is therefore
+    scored without delay, and under load requests also pile up while the previous batch is being scored.
+
+    Args:
+        model (TreeEnsemble): Model shared by every request.
+        max_batch (int, optional): Maximum rows per model call. Defaults to 256.
+        max_wait (float, optional): Seconds to wait for arriving requests after the first one. Defaults to 0.002.
+    """
+
+    def __init__(self, model, max_batch=256, max_wait=0.002):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._arriving = 0
+        self._stats = {'requests': 0, 'rows': 0, 'batches': 0, 'max_batch_rows': 0, 'wait_total': 0.0}
+        self._thread = threading.Thread(target=self._run, name='cvd-micro-batcher', daemon=True)
+        self._thread.start()
+
+    @contextmanager
+    def arriving(self):
+        """
+        Context manager wrapped around reading and parsing a request that will be submitted,
+        so the batch being collected waits for it instead of leaving without it.
+        """
+        with self._lock:
+            self._arriving += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._arriving -= 1
+
+    def submit(self, X):
+        """
+        Queues encoded rows for the next batch.
+
+        Args:
+            X (numpy.ndarray): Encoded records of shape (n, 11).
+
+        Returns:
+            concurrent.futures.Future: Resolves to (labels, probabilities) for the submitted rows.
+        """
+        future = Future()
+        self._queue.put((X, future, time.perf_counter()))
+        return future
+
+    def _collect(self, first):
+        items, rows = [first], len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch:
+            remaining = deadline - time.perf_counter() if self._arriving else 0
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                if self._arriving and deadline > time.perf_counter():
+                    continue
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            items.append(item)
+            rows += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            items = self._collect(first)
+            started = time.perf_counter()
+            try:
+                labels, proba = self.model.predict_with_proba(np.concatenate([item[0] for item in items]))
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for X, future, _ in items:
+                future.set_result((labels[offset:offset + len(X)], proba[offset:offset + len(X)]))
+                offset += len(X)
+            with self._lock:
+                self._stats['requests'] += len(items)
+                self._stats['rows'] += offset
+                self._stats['batches'] += 1
+                self._stats['max_batch_rows'] = max(self._stats['max_batch_rows'], offset)
+                self._stats['wait_total'] += sum(started - queued_at for _, _, queued_at in items)
+
+    def close(self):
+        """
+        Scores the requests already queued and stops the worker thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        """
+        Returns a snapshot of the batcher's request, batch and queueing metrics.
+
+        Returns:
+            dict: Cumulative counters, average batch size and average time a request waited to be scored.
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['pending'] = self._queue.qsize()
+        snapshot['avg_batch_rows'] = snapshot['rows'] / snapshot['batches'] if snapshot['batches'] else 0.0
+        snapshot['avg_wait'] = snapshot['wait_total'] / snapshot['requests'] if snapshot['requests'] else 0.0
+        return snapshot
+
+
+def parse_records(records, first=0):
+    """
+    Encodes JSON records: objects keyed by feature name (text options or numbers) or arrays of 11 values.
+
+    Args:
+        records (list): Decoded JSON records.
+        first (int, optional): Number of the first record in the request, used in error messages. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: Encoded records of shape (n, 11).
+
+    Raises:
+        ValueError: A record is malformed, or has a missing, non-finite or out of range value.
+    """
+    if not records:
+        return encode(np.empty((0, len(FEATURE_NAMES))))
+    # encode() maps missing and unknown text options to a default, which a client must hear about instead
+    for number, record in enumerate(records, start=first):
+        if isinstance(record, dict):
+            missing = [name for name in FEATURE_NAMES if name not in record]
+            if missing:
+                raise ValueError(f"Record {number} is missing feature {missing[0]!r}")
+            values = [record[name] for name in FEATURE_NAMES]
+        elif isinstance(record, list):
+            values = record
+        else:
+            continue
+        for feature, value in zip(FEATURES, values):
+            # JSON true and false would otherwise be taken as 1 and 0
+            if (value is None or isinstance(value, bool)
+                    or (isinstance(value, str) and value not in (feature.encoding or ()))):
+                raise ValueError(f"Record {number}: {feature.name} must be a number"
+                                 + (f" or one of {list(feature.encoding)}" if feature.encoding else "")
+                                 + f", got {json.dumps(value)}")
+    try:
+        X = encode(records)
+    except KeyError as e:
+        raise ValueError(f"Record is missing feature {e}")
+    except TypeError:
+        raise ValueError("Records must all be objects keyed by feature name or all be arrays of 11 values")
+    invalid = ~np.isfinite(X) | (X < _MIN_VALUES) | (X > _MAX_VALUES)
+    if invalid.any():
+        row, column = np.argwhere(invalid)[0]
+        feature = FEATURES[column]
+        raise ValueError(f"Record {first + row}: {feature.name} must be a number from {feature.min_value} "
+                         f"to {feature.max_value}, got {X[row, column]:g}")
+    return X
+
+
+def format_predictions(labels, proba):
+    """
+    Builds one JSON-ready result per record: the predicted class and the probability of the positive class.
+    """
+    return [{'prediction': label, 'probability': probability}
+            for label, probability in zip(labels.tolist(), proba[:, 1].tolist())]
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """
+    HTTP endpoints of the scoring service.
+
+    GET /health              model version and input contract
+    GET /stats               micro-batching metrics
+    GET /drift               drift of the scored records, when started with a drift monitor
+    POST /predict            JSON: one record, a list of records, or {"instances": [...]}
+                             NDJSON (Content-Type application/x-ndjson): one record per line, results streamed back
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'CVDScoring/1.0'
+    # Headers and body are written separately; without TCP_NODELAY keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        model = self.server.model
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'model_version': model.version, 'features': list(FEATURE_NAMES),
+                                  'input_dtype': model.input_dtype.str, 'classes': model.classes_.tolist()})
+        elif self.path == '/stats':
+            self._send_json(200, self.server.batcher.stats())
+        elif self.path == '/drift' and self.server.monitor is not None:
+            self._send_json(200, self.server.monitor.report())
+        else:
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        content_type = self.headers.get('Content-Type', 'application/json').split(';')[0].strip()
+        try:
+            if content_type == 'application/x-ndjson':
+                self._predict_stream(length)
+            else:
+                self._predict_json(length)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+
+    def _read_json(self, length):
+        if length > MAX_JSON_BYTES:
+            # The body is left unread, so the connection cannot carry another request
+            self.close_connection = True
+            raise ValueError(f"Request body larger than {MAX_JSON_BYTES} bytes, send NDJSON instead")
+        try:
+            payload = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if isinstance(payload, dict) and 'instances' in payload:
+            payload = payload['instances']
+        return parse_records(payload if isinstance(payload, list) else [payload])
+
+    def _predict_json(self, length):
+        with self.server.batcher.arriving():
+            X = self._read_json(length)
+        if not len(X):
+            labels, proba = np.empty(0, dtype=self.server.model.classes_.dtype), np.empty((0, 2))
+        elif len(X) <= self.server.batcher.max_batch:
+            labels, proba = self.server.batcher.submit(X).result()
+        else:
+            # Already a batch: scoring it directly avoids delaying the small requests queued behind it
+            labels, proba = self.server.model.predict_with_proba(X)
+        self._observe(X, labels, proba)
+        self._send_json(200, {'model_version': self.server.model.version,
+                              'predictions': format_predictions(labels, proba)})
+
+    def _predict_stream(self, length):
+        # Results are sent with chunked transfer encoding as each chunk of input lines is scored
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Model-Version', self.server.model.version)
+        self.end_headers()
+        remaining, records, line_number, first = length, [], 0, 0
+        while remaining > 0:
+            line = self.rfile.readline(min(remaining, MAX_JSON_BYTES))
+            remaining -= len(line)
+            line_number += 1
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    self._write_chunk({'error': f"Invalid JSON on line {line_number}: {e}"})
+                    break
+            if len(records) == STREAM_CHUNK_ROWS or (remaining <= 0 and records):
+                if not self._score_chunk(records, first):
+                    break
+                first += len(records)
+                records = []
+        if remaining > 0:
+            # Stopped at an error with part of the body unread, so the connection cannot carry another request
+            self.close_connection = True
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _score_chunk(self, records, first):
+        try:
+            X = parse_records(records, first)
+            labels, proba = self.server.model.predict_with_proba(X)
+        except ValueError as e:
+            self._write_chunk({'error': str(e)})
+            return False
+        self._observe(X, labels, proba)
+        self._write_chunk(*format_predictions(labels, proba))
+        return True
+
+    def _observe(self, X, labels, proba):
+        if self.server.monitor is not None and len(X):
+            self.server.monitor.observe(X, labels, proba[:, 1], model_version=self.server.model.version)
+
+    def _write_chunk(self, *results):
+        data = ''.join(json.dumps(result) + '\n' for result in results).encode()
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the one model instance and micro-batcher shared by every request.
+
+    Args:
+        address (tuple): (host, port) to listen on; port 0 picks a free port.
+        model (TreeEnsemble): Model to serve.
+        max_batch (int, optional): Maximum rows per micro-batch. Defaults to 256.
+        max_wait (float, optional): Micro-batching latency budget in seconds. Defaults to 0.002.
+        verbose (bool, optional): Log every request. Defaults to False.
+        monitor (DriftMonitor, optional): Monitor of the scored records and probabilities, reported at
+            /drift. Defaults to None.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, model, max_batch=256, max_wait=0.002, verbose=False, monitor=None):
+        super().__init__(address, ScoringHandler)
+        self.model = model
+        self.batcher = MicroBatcher(model, max_batch=max_batch, max_wait=max_wait)
+        self.verbose = verbose
+        self.monitor = monitor
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        if self.monitor is not None:
+            self.monitor.close()
+
+
+def start_server(model, host='127.0.0.1', port=0, **kwargs):
+    """
+    Starts a scoring server on a background thread, e.g. for local testing.
+
+    Args:
+        model (TreeEnsemble): Model to serve.
+        host (str, optional): Interface to listen on. Defaults to '127.0.0.1'.
+        port (int, optional): Port to listen on. Defaults to 0, a free port.
+        **kwargs: Passed to ScoringServer.
+
+    Returns:
+        ScoringServer: The running server; its URL is http://host:server.server_port. Stop it with
+            shutdown() followed by server_close().
+    """
+    server = ScoringServer((host, port), model, **kwargs)
+    threading.Thread(target=server.serve_forever, name='cvd-scoring-server', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve cardiovascular disease predictions over HTTP.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Model artifact directory or pickled model.")
+    parser.add_argument('--host', default=SERVICE_SETTINGS['host'])
+    parser.add_argument('--port', type=int, default=SERVICE_SETTINGS['port'])
+    parser.add_argument('--max-batch', type=int, default=SERVICE_SETTINGS['max_batch'],
+                        help="Maximum rows coalesced into one model call.")
+    parser.add_argument('--max-wait', type=float, default=SERVICE_SETTINGS['max_wait'],
+                        help="Seconds a request may wait for others to join its batch.")
+    parser.add_argument('--verbose', action='store_true', help="Log every request.")
+    parser.add_argument('--drift-state', help="Monitor the drift of the scored records against the reference "
+                                              "in CVD_DRIFT_REFERENCE, saving the monitor's state to this file.")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    monitor = None
+    if args.drift_state:
+        monitor = DriftMonitor.load(DRIFT_SETTINGS['reference'], args.drift_state, DRIFT_SETTINGS['window'],
+                                    DRIFT_SETTINGS['interval'])
+    server = ScoringServer((args.host, args.port), model, max_batch=args.max_batch, max_wait=args.max_wait,
+                           verbose=args.verbose, monitor=monitor)
+    print(f"Serving model version {model.version} on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+import os
+
+import streamlit as st
+
+from session_cookie import session_routes
+
+# Entry point of the app: `streamlit run server.py` serves CVD_decision_support_sys.py together with the route
+# that keeps the login in an HttpOnly cookie. Run directly, the app works the same but logins last one page load.
+app = st.App(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CVD_decision_support_sys.py'),
+             routes=session_routes())
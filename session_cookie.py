@@ -0,0 +1,79 @@
+import json
+from urllib.parse import urlsplit
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Route
+
+from auth import AUTH_SETTINGS, InvalidToken, default_session_manager
+
+# Cookie carrying the session token. It is HttpOnly, so page scripts cannot read it, and it never appears in
+# a URL, so it stays out of browser history, Referer headers and proxy logs.
+SESSION_COOKIE = 'cvd_session'
+
+# Route the page posts a new session token to, to have it stored in SESSION_COOKIE, and deletes at logout
+SESSION_ROUTE = '/_cvd/session'
+
+
+def _same_origin(request):
+    # Browsers send Origin with every fetch POST and DELETE; a missing or foreign one is refused, so another
+    # site cannot plant its own session in a user's browser
+    origin = request.headers.get('origin')
+    return origin is not None and urlsplit(origin).netloc == request.headers.get('host')
+
+
+async def session_endpoint(request):
+    """
+    Sets SESSION_COOKIE to the valid session token posted as the request body (POST), or clears it (DELETE).
+
+    Args:
+        request (starlette.requests.Request): The request.
+
+    Returns:
+        starlette.responses.Response: 204 with the cookie set or cleared, 403 for a cross-origin request,
+        or 400 for a token that does not validate.
+    """
+    if not _same_origin(request):
+        return Response(status_code=403)
+    response = Response(status_code=204)
+    secure = request.url.scheme == 'https' or request.headers.get('x-forwarded-proto') == 'https'
+    if request.method == 'DELETE':
+        response.delete_cookie(SESSION_COOKIE, path='/', secure=secure, httponly=True, samesite='strict')
+        return response
+    token = (await request.body()).decode('ascii', 'replace').strip()
+    try:
+        await run_in_threadpool(default_session_manager().validate, token)
+    except InvalidToken:
+        return Response(status_code=400)
+    response.set_cookie(SESSION_COOKIE, token, max_age=int(AUTH_SETTINGS['session_ttl']), path='/',
+                        secure=secure, httponly=True, samesite='strict')
+    return response
+
+
+def session_routes():
+    """
+    Returns:
+        list: The routes to mount next to the app.
+    """
+    return [Route(SESSION_ROUTE, session_endpoint, methods=['POST', 'DELETE'])]
+
+
+def cookie_script(token=None, base_path=''):
+    """
+    Script that has the browser store a session token in SESSION_COOKIE, or clear it when `token` is None.
+
+    The token only passes through the request body; the page keeps no copy of it.
+
+    Args:
+        token (str, optional): Session token from SessionManager.issue. Defaults to None, logging out.
+        base_path (str, optional): Streamlit's server.baseUrlPath. Defaults to ''.
+
+    Returns:
+        str: HTML to render with st.html(..., unsafe_allow_javascript=True).
+    """
+    url = json.dumps('/' + '/'.join(part for part in (base_path.strip('/'), SESSION_ROUTE.strip('/')) if part))
+    if token is None:
+        call = f'fetch({url}, {{method: "DELETE", credentials: "same-origin"}});'
+    else:
+        call = f'fetch({url}, {{method: "POST", credentials: "same-origin", body: {json.dumps(token)}}});'
+    return f'<script>{call}</script>'
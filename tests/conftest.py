@@ -0,0 +1,44 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live flat at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from features import encode  # noqa: E402
+from tree_model import MODEL_PATH, load_model  # noqa: E402
+
+# Form inputs as the app submits them: text options for the categorical features
+RECORDS = (
+    {'gender': 'Male', 'height': 170, 'weight': 70.0, 'ap_hi': 120, 'ap_lo': 80, 'cholesterol': 'Normal',
+     'gluc': 'Normal', 'smoke': 'No', 'alco': 'No', 'active': 'Yes', 'ageinyears': 50},
+    {'gender': 'Female', 'height': 165, 'weight': 90.0, 'ap_hi': 150, 'ap_lo': 95, 'cholesterol': 'Well Above Normal',
+     'gluc': 'Above Normal', 'smoke': 'Yes', 'alco': 'No', 'active': 'No', 'ageinyears': 60},
+    {'gender': 'Male', 'height': 180, 'weight': 80.0, 'ap_hi': 130, 'ap_lo': 85, 'cholesterol': 'Above Normal',
+     'gluc': 'Normal', 'smoke': 'No', 'alco': 'Yes', 'active': 'Yes', 'ageinyears': 45},
+)
+
+
+@pytest.fixture(scope='session')
+def model():
+    return load_model(os.path.join(ROOT, MODEL_PATH))
+
+
+@pytest.fixture
+def records():
+    return [dict(record) for record in RECORDS]
+
+
+@pytest.fixture(scope='session')
+def random_X():
+    # Valid encoded inputs spread over the schema's ranges
+    rng = np.random.default_rng(0)
+    n = 500
+    return encode({'gender': rng.integers(1, 3, n), 'height': rng.integers(140, 200, n),
+                   'weight': rng.uniform(45, 130, n).round(1), 'ap_hi': rng.integers(90, 200, n),
+                   'ap_lo': rng.integers(50, 120, n), 'cholesterol': rng.integers(1, 4, n),
+                   'gluc': rng.integers(1, 4, n), 'smoke': rng.integers(0, 2, n), 'alco': rng.integers(0, 2, n),
+                   'active': rng.integers(0, 2, n), 'ageinyears': rng.uniform(30, 65, n).round(1)})
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from async_stages import StageRunner, StageTimeout
+
+
+class FakeCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def cancel(self):
+        # Like pg_cancel_backend, the running statement fails soon after
+        self.cancelled.set()
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakePool:
+    # Stands in for ConnectionPool, recording which connections were handed back and which were discarded
+    maxconn = 4
+
+    def __init__(self):
+        self.opened = []
+        self.returned = []
+
+    def getconn(self, timeout=None):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+    def putconn(self, conn, discard=False):
+        self.returned.append((conn, discard))
+
+
+@pytest.fixture
+def runner():
+    runners = []
+
+    def start(**timeouts):
+        runners.append(StageRunner(FakePool(), timeouts=timeouts))
+        return runners[-1]
+
+    yield start
+    for runner in runners:
+        runner.close()
+
+
+def test_stages_run_concurrently(runner):
+    stages = runner(fetch=5, load=5)
+    start = time.perf_counter()
+    results = stages.run(stages.query('fetch', lambda cur: time.sleep(0.2) or 'record'),
+                         stages.call_model('load', lambda: time.sleep(0.2) or 'model'))
+    assert results == ['record', 'model']
+    assert time.perf_counter() - start < 0.35
+
+
+def test_query_commits_when_asked(runner):
+    stages = runner(save=5)
+    assert stages.run(stages.query('save', lambda cur, test_id: test_id, 42, commit=True)) == [42]
+    [(conn, discard)] = stages.pool.returned
+    assert conn.commits == 1 and not discard
+
+
+def test_timed_out_query_is_cancelled_and_its_connection_discarded(runner):
+    stages = runner(fetch=0.1)
+    connections = stages.pool.opened
+
+    def slow_query(cur):
+        if connections[0].cancelled.wait(5):
+            raise RuntimeError("canceling statement due to user request")
+
+    [result] = stages.run(stages.query('fetch', slow_query))
+    assert isinstance(result, StageTimeout) and result.stage == 'fetch'
+    stages.close()
+    assert connections[0].cancelled.is_set()
+    assert stages.pool.returned == [(connections[0], True)]
+    assert stages.stats()['fetch']['timeouts'] == 1
+
+
+def test_timed_out_model_call_degrades_the_stage_only(runner):
+    stages = runner(fetch=5, predict=0.05)
+    release = threading.Event()
+    record, prediction = stages.run(stages.query('fetch', lambda cur: 'record'),
+                                    stages.call_model('predict', release.wait, 5))
+    release.set()
+    assert record == 'record'
+    assert isinstance(prediction, StageTimeout)
+    assert str(prediction) == "The predict stage did not finish within 0.05 seconds"
+    stats = stages.stats()
+    assert stats['predict']['timeouts'] == 1 and stats['fetch']['timeouts'] == 0
+
+
+def test_errors_are_returned_in_place(runner):
+    stages = runner(load=5)
+    [error] = stages.run(stages.call_model('load', lambda: 1 / 0))
+    assert isinstance(error, ZeroDivisionError)
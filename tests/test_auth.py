@@ -0,0 +1,175 @@
+import pytest
+
+import queries
+from auth import (SESSION_CACHE_TTL, FileTokenStore, InvalidToken, MemoryTokenStore, SessionManager,
+                  SQLiteTokenStore, hash_legacy_passwords, hash_password, open_token_store, verify_password)
+
+# Low hashing cost, so the tests stay fast
+ITERATIONS = 1000
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class UsersConnection:
+    # Serves the legacy password queries from a dict of User ID to stored password
+    def __init__(self, passwords):
+        self.passwords = passwords
+        self.rows = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        if query == queries.LEGACY_PASSWORDS:
+            prefix, limit = params
+            self.rows = [(user_id, stored) for user_id, stored in self.passwords.items()
+                         if not stored.startswith(prefix)][:limit]
+        elif query == queries.UPDATE_PASSWORD:
+            password, user_id, stored = params
+            if self.passwords[user_id] == stored:
+                self.passwords[user_id] = password
+
+    def fetchall(self):
+        return self.rows
+
+    def commit(self):
+        pass
+
+
+def test_password_hash_round_trip():
+    stored = hash_password('s3cret', iterations=ITERATIONS)
+    assert stored.startswith(f'pbkdf2_sha256${ITERATIONS}$')
+    assert verify_password('s3cret', stored, iterations=ITERATIONS) == (True, False)
+    assert verify_password('S3cret', stored, iterations=ITERATIONS) == (False, False)
+
+
+def test_password_hashes_are_salted():
+    assert hash_password('s3cret', iterations=ITERATIONS) != hash_password('s3cret', iterations=ITERATIONS)
+
+
+def test_hash_with_another_cost_needs_rehash():
+    stored = hash_password('s3cret', iterations=ITERATIONS)
+    assert verify_password('s3cret', stored, iterations=2 * ITERATIONS) == (True, True)
+
+
+def test_legacy_plain_text_password_needs_rehash():
+    assert verify_password('NcwOwDck', 'NcwOwDck') == (True, True)
+    assert verify_password('wrong', 'NcwOwDck') == (False, True)
+
+
+def test_malformed_hash_never_matches():
+    assert verify_password('s3cret', 'pbkdf2_sha256$oops') == (False, False)
+
+
+@pytest.fixture(params=['memory', 'file', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryTokenStore()
+    if request.param == 'file':
+        return FileTokenStore(str(tmp_path / 'sessions'))
+    return SQLiteTokenStore(str(tmp_path / 'sessions.sqlite'))
+
+
+def test_issued_token_validates(store):
+    manager = SessionManager(store, ttl=3600)
+    token = manager.issue(42, 'patient')
+    assert manager.validate(token) == (42, 'patient')
+    assert manager.validate(token) == (42, 'patient')
+    assert manager.stats()['cache_hits'] == 1
+
+
+def test_revoked_token_is_rejected(store):
+    manager = SessionManager(store, ttl=3600)
+    token = manager.issue(42, 'patient')
+    manager.validate(token)
+    manager.revoke(token)
+    with pytest.raises(InvalidToken, match="revoked"):
+        manager.validate(token)
+
+
+def test_expired_token_is_rejected(store):
+    clock = Clock()
+    manager = SessionManager(store, ttl=60, clock=clock)
+    token = manager.issue(7, 'physician')
+    clock.now += 61
+    with pytest.raises(InvalidToken, match="expired"):
+        manager.validate(token)
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda token: token[:-2] + ('AA' if not token.endswith('AA') else 'BB'),
+    lambda token: token.replace('.', '.9', 1),
+    lambda token: 'not-a-token',
+    lambda token: None,
+])
+def test_forged_or_malformed_token_is_rejected(tamper):
+    manager = SessionManager(MemoryTokenStore(), ttl=3600)
+    token = manager.issue(42, 'patient')
+    with pytest.raises(InvalidToken):
+        manager.validate(tamper(token))
+    assert manager.stats()['rejected'] == 1
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    store = MemoryTokenStore()
+    token = SessionManager(store, secret='one', ttl=3600).issue(42, 'patient')
+    with pytest.raises(InvalidToken, match="signature"):
+        SessionManager(store, secret='two', ttl=3600).validate(token)
+
+
+def test_workers_sharing_a_store_see_logins_and_logouts(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / 'sessions.sqlite')
+    first = SessionManager(SQLiteTokenStore(path), ttl=3600, clock=clock)
+    second = SessionManager(SQLiteTokenStore(path), ttl=3600, clock=clock)
+    token = first.issue(42, 'patient')
+    assert second.validate(token) == (42, 'patient')
+    first.revoke(token)
+    # The other worker trusts its cached validation for at most SESSION_CACHE_TTL seconds
+    clock.now += SESSION_CACHE_TTL + 1
+    with pytest.raises(InvalidToken):
+        second.validate(token)
+
+
+def test_stores_share_their_secret(tmp_path):
+    assert FileTokenStore(str(tmp_path / 's')).secret == FileTokenStore(str(tmp_path / 's')).secret
+    assert SQLiteTokenStore(str(tmp_path / 's.db')).secret == SQLiteTokenStore(str(tmp_path / 's.db')).secret
+
+
+def test_purge_removes_expired_sessions(store):
+    store.add('old', 1, 'patient', 100)
+    store.add('new', 2, 'patient', 300)
+    store.purge(200)
+    assert store.get('old') is None
+    assert tuple(store.get('new')) == (2, 'patient', 300)
+
+
+def test_open_token_store_specs(tmp_path):
+    assert isinstance(open_token_store('memory'), MemoryTokenStore)
+    assert isinstance(open_token_store(f'file:{tmp_path / "s"}'), FileTokenStore)
+    assert isinstance(open_token_store(f'sqlite:{tmp_path / "s.db"}'), SQLiteTokenStore)
+    with pytest.raises(ValueError):
+        open_token_store('file:')
+
+
+def test_legacy_passwords_are_found_by_their_literal_prefix():
+    hashed = hash_password('s3cret', iterations=ITERATIONS)
+    # Would pass for a hash if the _ of the algorithm name were a wildcard
+    lookalike = 'pbkdf2-sha256$plain'
+    conn = UsersConnection({1: hashed, 2: 'NcwOwDck', 3: lookalike})
+    assert hash_legacy_passwords(conn, iterations=ITERATIONS, batch_size=1, verbose=False) == 2
+    assert conn.passwords[1] == hashed
+    assert verify_password('NcwOwDck', conn.passwords[2], iterations=ITERATIONS) == (True, False)
+    assert verify_password(lookalike, conn.passwords[3], iterations=ITERATIONS) == (True, False)
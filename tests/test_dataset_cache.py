@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+from dataset_cache import convert, default_cache_path, is_fresh, load_columns, load_features, read_header
+from train import load_dataset
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    # The first records of the training data
+    with open(os.path.join(ROOT, 'data', 'cardio_train.csv')) as file:
+        lines = [next(file) for _ in range(301)]
+    path = tmp_path / 'cardio_train.csv'
+    path.write_text(''.join(lines))
+    return str(path)
+
+
+def test_cache_path_sits_next_to_the_csv():
+    assert default_cache_path('data/cardio_train.csv') == 'data/cardio_train_columns'
+
+
+def test_cached_features_match_the_csv(csv_path):
+    header = convert(csv_path, chunk_rows=128, verbose=False)
+    assert header['rows'] == 300
+    X, y = load_features(default_cache_path(csv_path))
+    expected_X, expected_y = load_dataset(csv_path, use_cache=False)
+    np.testing.assert_array_equal(X, expected_X)
+    np.testing.assert_array_equal(y, expected_y)
+    assert X.dtype == np.float32 and y.dtype == np.int8
+
+
+def test_columns_are_memory_mapped(csv_path):
+    convert(csv_path, verbose=False)
+    columns = load_columns(['ap_hi', 'id'], default_cache_path(csv_path))
+    assert list(columns) == ['ap_hi', 'id']
+    assert isinstance(columns['ap_hi'], np.memmap) and columns['id'].dtype == np.int64
+    with pytest.raises(KeyError):
+        load_columns(['bmi'], default_cache_path(csv_path))
+
+
+def test_missing_cache_is_reported(tmp_path):
+    assert read_header(str(tmp_path)) is None
+    with pytest.raises(FileNotFoundError, match="dataset_cache.py convert"):
+        load_columns(path=str(tmp_path))
+
+
+def test_training_reads_a_fresh_cache(csv_path):
+    assert not is_fresh(csv_path)
+    convert(csv_path, verbose=False)
+    assert is_fresh(csv_path)
+    # A fresh cache is used as is: emptying a column shows up in what train.py loads
+    ap_hi = load_columns(['ap_hi'], default_cache_path(csv_path), mmap_mode='r+')['ap_hi']
+    ap_hi[:] = 0
+    ap_hi.flush()
+    assert not load_dataset(csv_path)[0][:, 3].any()
+
+
+def test_edits_make_the_cache_stale(csv_path):
+    convert(csv_path, verbose=False)
+    with open(csv_path, 'a') as file:
+        file.write('99999;18393;2;168;62.0;110;80;1;1;0;0;1;0\n')
+    assert not is_fresh(csv_path)
+
+
+def test_edit_keeping_size_and_mtime_is_noticed(csv_path):
+    convert(csv_path, verbose=False)
+    stat = os.stat(csv_path)
+    with open(csv_path) as file:
+        text = file.read()
+    with open(csv_path, 'w') as file:
+        file.write(text.replace(';110;', ';120;', 1))
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.path.getsize(csv_path) == stat.st_size
+    assert not is_fresh(csv_path)
+
+
+def test_csv_with_blank_lines_is_refused(csv_path, tmp_path):
+    path = str(tmp_path / 'blank.csv')
+    shutil.copy(csv_path, path)
+    with open(path, 'a') as file:
+        file.write('\n\n')
+    with pytest.raises(ValueError, match="blank lines"):
+        convert(path, verbose=False)
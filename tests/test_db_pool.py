@@ -0,0 +1,151 @@
+import threading
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.pings += 1
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    # Stands in for a psycopg2 connection, so the pool can be tested without a server
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.pings = 0
+        self.rollbacks = 0
+        self.info = FakeInfo()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    return opened
+
+
+def test_minconn_connections_are_opened_up_front(connections):
+    pool = ConnectionPool(minconn=2, maxconn=4)
+    assert len(connections) == 2
+    assert pool.stats()['idle'] == 2
+
+
+@pytest.mark.parametrize('minconn, maxconn', [(-1, 1), (0, 0), (3, 2)])
+def test_invalid_pool_sizes_are_refused(connections, minconn, maxconn):
+    with pytest.raises(ValueError):
+        ConnectionPool(minconn=minconn, maxconn=maxconn)
+
+
+def test_connections_are_reused(connections):
+    pool = ConnectionPool(minconn=0, maxconn=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(connections) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted(connections):
+    pool = ConnectionPool(minconn=0, maxconn=1)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    assert pool.stats()['timeouts'] == 1
+    pool.putconn(conn)
+    assert pool.getconn(timeout=0.05) is conn
+
+
+def test_waiting_checkout_gets_the_returned_connection(connections):
+    pool = ConnectionPool(minconn=0, maxconn=1)
+    conn = pool.getconn()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.getconn(timeout=5)))
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join()
+    assert borrowed == [conn]
+
+
+def test_open_transaction_is_rolled_back_on_return(connections):
+    pool = ConnectionPool(minconn=0, maxconn=1)
+    with pool.connection() as conn:
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    assert conn.rollbacks == 1
+
+
+def test_operational_error_discards_the_connection(connections):
+    pool = ConnectionPool(minconn=0, maxconn=1)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+    assert conn.closed
+    assert pool.stats()['size'] == 0
+    with pool.connection() as replacement:
+        assert replacement is not conn
+
+
+def test_broken_idle_connection_is_replaced(connections):
+    pool = ConnectionPool(minconn=1, maxconn=1, health_check_interval=0)
+    connections[0].broken = True
+    with pool.connection() as conn:
+        assert conn is connections[1]
+    stats = pool.stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['connections_discarded'] == 1
+
+
+def test_recently_used_connection_is_not_pinged(connections):
+    pool = ConnectionPool(minconn=1, maxconn=1, health_check_interval=60)
+    with pool.connection():
+        pass
+    assert connections[0].pings == 0
+
+
+def test_closed_pool_refuses_checkouts(connections):
+    pool = ConnectionPool(minconn=1, maxconn=2)
+    conn = pool.getconn()
+    pool.closeall()
+    with pytest.raises(psycopg2.InterfaceError):
+        pool.getconn()
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()['size'] == 0
@@ -0,0 +1,132 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from drift_monitor import (PSI_DRIFT, PSI_WATCH, DriftMonitor, bin_edges, bin_index, histogram_quantiles,
+                           load_reference, psi, status)
+
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'drift_reference.json')
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return load_reference(REFERENCE_PATH)
+
+
+@pytest.fixture
+def monitor(reference):
+    monitors = []
+
+    def start(**kwargs):
+        monitors.append(DriftMonitor(reference, **kwargs))
+        return monitors[-1]
+
+    yield start
+    for monitor in monitors:
+        monitor.close()
+
+
+def test_bin_index_puts_edges_in_the_upper_bin():
+    edges = np.array([1.0, 2.0])
+    assert bin_index(np.array([0.5, 1.0, 1.5, 2.0, 9.0]), edges).tolist() == [0, 1, 1, 2, 2]
+
+
+def test_bin_edges_of_categorical_and_continuous_columns():
+    edges, categorical = bin_edges(np.array([1, 2, 3, 1, 2, 3]))
+    assert categorical and edges.tolist() == [1.5, 2.5]
+    edges, categorical = bin_edges(np.arange(1000, dtype=float))
+    assert not categorical and len(edges) == 9
+
+
+def test_psi_is_zero_for_the_reference_distribution():
+    expected = np.array([0.2, 0.3, 0.5])
+    assert psi(expected, np.array([20, 30, 50])) == pytest.approx(0.0)
+    assert psi(expected, np.zeros(3)) == 0.0
+
+
+def test_psi_grows_with_the_shift():
+    expected = np.array([0.25, 0.25, 0.25, 0.25])
+    slight, strong = psi(expected, np.array([30, 25, 25, 20])), psi(expected, np.array([70, 10, 10, 10]))
+    assert 0 < slight < PSI_WATCH < PSI_DRIFT < strong
+    assert status(slight) == 'ok' and status(strong) == 'drift'
+    assert status((PSI_WATCH + PSI_DRIFT) / 2) == 'watch'
+
+
+def test_histogram_quantiles_interpolate_within_bins():
+    counts = np.array([0, 50, 50, 0])
+    edges = np.array([0.0, 10.0, 20.0])
+    assert histogram_quantiles(counts, edges, 0.0, 20.0, quantiles=(0.5,)) == pytest.approx([10.0])
+
+
+def test_windows_close_after_window_predictions(monitor, random_X):
+    drift = monitor(window=100)
+    drift.observe(random_X[:250], np.zeros(250))
+    drift.flush()
+    report = drift.report()
+    assert drift.stats()['windows'] == 2
+    assert report['total']['observations'] == 250
+    assert report['current']['observations'] == 50
+    assert report['last_window']['observations'] == 100
+
+
+def test_windows_count_predictions_with_missing_values(monitor, random_X):
+    X = random_X[:250].copy()
+    X[::2, 0] = np.nan
+    drift = monitor(window=100)
+    drift.observe(X, np.zeros(250))
+    drift.flush()
+    assert drift.stats()['windows'] == 2
+    gender = drift.report()['total']['columns'][0]
+    assert gender['name'] == 'gender' and gender['observations'] == 125
+
+
+def test_predictions_of_another_model_version_are_not_compared(monitor, random_X):
+    drift = monitor(window=1000)
+    drift.observe(random_X[:10], np.ones(10), np.full(10, 0.9), model_version='other')
+    drift.observe(random_X[10:20], np.ones(10), np.full(10, 0.9), model_version=drift.model_version)
+    drift.flush()
+    columns = {row['name']: row for row in drift.report()['total']['columns']}
+    assert columns['prediction']['observations'] == 10
+    assert columns['probability']['mean'] == pytest.approx(0.9)
+    assert columns['gender']['observations'] == 20
+
+
+def test_shifted_inputs_raise_an_alert(monitor, random_X):
+    X = random_X[:200].copy()
+    X[:, 3] = 200
+    drift = monitor(window=200)
+    drift.observe(X, np.zeros(200))
+    drift.flush()
+    assert 'ap_hi' in drift.drifted()
+    assert any(alert['column'] == 'ap_hi' and alert['mean'] == 200 for alert in drift.report()['alerts'])
+
+
+def test_state_is_resumed_after_a_restart(monitor, random_X, tmp_path):
+    path = str(tmp_path / 'drift_state.json')
+    first = monitor(window=100, state_path=path)
+    first.observe(random_X[:130], np.zeros(130))
+    first.close()
+    resumed = monitor(window=100, state_path=path)
+    report = resumed.report()
+    assert report['total']['observations'] == 130
+    assert report['current']['observations'] == 30
+    assert report['last_window']['observations'] == 100
+
+
+
+def test_failed_save_does_not_stop_the_monitor_thread(monitor, random_X, tmp_path):
+    # The state file's directory is missing, so every save the thread attempts fails
+    drift = monitor(window=100, state_path=str(tmp_path / 'missing' / 'drift_state.json'), interval=0.0)
+    drift.observe(random_X[:10], np.zeros(10))
+    deadline = time.monotonic() + 10
+    while drift.stats()['errors'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert drift.stats()['errors'] >= 2
+    assert drift.stats()['last_error'].startswith('FileNotFoundError')
+    assert drift._thread.is_alive()
+    (tmp_path / 'missing').mkdir()
+    drift.observe(random_X[10:20], np.zeros(10))
+    drift.close()
+    assert drift.report()['total']['observations'] == 20
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from explanations import TreeExplainer, factor_codes, reference_shap_values, top_factors
+from features import FEATURE_NAMES
+
+
+@pytest.fixture(scope='module')
+def explainer(model):
+    return TreeExplainer(model)
+
+
+def test_contributions_add_up_to_the_raw_prediction(explainer, model, random_X):
+    contributions = explainer.shap_values(random_X)
+    assert contributions.shape == (len(random_X), len(FEATURE_NAMES))
+    np.testing.assert_allclose(explainer.expected_value + contributions.sum(axis=1),
+                               model.decision_function(random_X), rtol=0, atol=1e-9)
+
+
+def test_contributions_match_the_brute_force_reference(explainer, model, random_X):
+    for record in random_X[:5]:
+        np.testing.assert_allclose(explainer.explain(record), reference_shap_values(model, record),
+                                   rtol=0, atol=1e-9)
+
+
+def test_explain_matches_the_batch_and_is_cached(explainer, random_X):
+    record = random_X[7]
+    hits = explainer.stats()['hits']
+    first = explainer.explain(record)
+    second = explainer.explain(record.tolist())
+    np.testing.assert_array_equal(first, explainer.shap_values(random_X[7:8])[0])
+    assert second is first
+    assert explainer.stats()['hits'] == hits + 1
+    assert not first.flags.writeable
+
+
+def test_missing_values_are_refused(explainer, random_X):
+    X = random_X[:2].copy()
+    X[1, 0] = np.nan
+    with pytest.raises(ValueError, match="finite"):
+        explainer.shap_values(X)
+
+
+def test_model_without_covers_cannot_be_explained(model):
+    class Uncovered:
+        cover = None
+
+    with pytest.raises(ValueError, match="node covers"):
+        TreeExplainer(Uncovered())
+
+
+def test_top_factors_are_ordered_by_effect(records):
+    from features import encode
+
+    record = encode(records[1:2])[0]
+    contributions = np.zeros(len(FEATURE_NAMES))
+    contributions[[3, 5, 10]] = [0.4, -0.6, 0.1]
+    factors = top_factors(record, contributions)
+    assert [label for label, _, _ in factors] == ['Cholesterol', 'Systolic blood pressure', 'Age']
+    assert factors[0][1] == 'Well Above Normal'
+    assert [contribution for _, _, contribution in factors] == [-0.6, 0.4, 0.1]
+    assert top_factors(record, np.zeros(len(FEATURE_NAMES))) == []
+
+
+def test_factor_codes_name_what_raised_the_risk():
+    contributions = np.zeros((2, len(FEATURE_NAMES)))
+    contributions[0, [3, 10, 5, 0]] = [0.5, 0.2, 0.3, -0.9]
+    assert factor_codes(contributions).tolist() == ['ap_hi,cholesterol,ageinyears', '']
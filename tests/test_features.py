@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import FEATURE_NAMES, FEATURES, decode, encode, option_index, options, out_of_range
+
+
+def test_encode_maps_text_options_to_numbers(records):
+    X = encode(records)
+    assert X.shape == (3, len(FEATURE_NAMES)) and X.dtype == np.float64 and X.flags.c_contiguous
+    assert X[1].tolist() == [2, 165, 90, 150, 95, 3, 2, 1, 0, 0, 60]
+
+
+def test_encode_accepts_every_input_layout(records):
+    expected = encode(records)
+    np.testing.assert_array_equal(encode(records[0]), expected[:1])
+    np.testing.assert_array_equal(encode(pd.DataFrame(records)), expected)
+    np.testing.assert_array_equal(encode({name: [record[name] for record in records] for name in FEATURE_NAMES}),
+                                  expected)
+    np.testing.assert_array_equal(encode([tuple(row) for row in expected]), expected)
+    np.testing.assert_array_equal(encode(expected.astype(np.float32)), expected)
+
+
+def test_encode_accepts_numbers_for_categorical_columns(records):
+    records[1].update(gender=2, cholesterol=3, gluc=2, smoke=1, alco=0, active=0)
+    np.testing.assert_array_equal(encode(records[1:2]), encode([dict(records[1], gender='Female')]))
+
+
+def test_unknown_text_options_take_the_default():
+    record = encode([('Other', 170, 70, 120, 80, 'High', 'Normal', 'Maybe', 'No', 'Yes', 50)])[0]
+    assert record[[0, 5, 7]].tolist() == [2, 1, 0]
+
+
+@pytest.mark.parametrize('data', [np.zeros((2, 3)), np.zeros(11), [(1, 2, 3)]])
+def test_encode_refuses_the_wrong_number_of_columns(data):
+    with pytest.raises(ValueError):
+        encode(data)
+
+
+def test_encode_of_no_records_is_empty():
+    assert encode([]).shape == (0, len(FEATURE_NAMES))
+
+
+@pytest.mark.parametrize('feature', [feature for feature in FEATURES if feature.encoding is not None])
+def test_decode_inverts_the_encoding(feature):
+    for text, number in feature.encoding.items():
+        assert decode(feature.name, number) == text
+        assert options(feature.name)[option_index(feature.name, number)] == text
+
+
+def test_decode_of_an_unknown_number_falls_back_to_the_default():
+    assert decode('cholesterol', 7) == 'Normal'
+    assert decode('gender', 0) == 'Female'
+
+
+def test_options_keep_the_display_order():
+    assert options('cholesterol') == ['Normal', 'Above Normal', 'Well Above Normal']
+    assert options('smoke') == ['Yes', 'No']
+
+
+def test_out_of_range_flags_records_outside_the_schema(records):
+    X = encode(records)
+    X[0, 3] = 400
+    X[2, 10] = -1
+    assert out_of_range(X).tolist() == [True, False, True]
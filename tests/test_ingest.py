@@ -0,0 +1,71 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import FEATURE_INDEX
+from ingest import FEED_COLUMNS, REJECT_REASONS, read_chunks, validate_chunk
+
+# One valid lab feed row in the cardio_train.csv layout, age in days
+ROW = {'id': 11, 'age': 18250, 'gender': 2, 'height': 165, 'weight': 90.5, 'ap_hi': 150, 'ap_lo': 95,
+       'cholesterol': 3, 'gluc': 2, 'smoke': 1, 'alco': 0, 'active': 0, 'cardio': 1}
+
+
+def reasons_of(rows):
+    *_, reasons = validate_chunk(pd.DataFrame(rows))
+    return [REJECT_REASONS[reason] if reason >= 0 else None for reason in reasons]
+
+
+def test_valid_rows_are_encoded():
+    patient_ids, age_days, X, reasons = validate_chunk(pd.DataFrame([ROW, dict(ROW, id=12)]))
+    assert patient_ids.tolist() == [11, 12] and age_days.tolist() == [18250, 18250]
+    assert X[0].tolist() == [2, 165, 90.5, 150, 95, 3, 2, 1, 0, 0, 50]
+    assert reasons.tolist() == [-1, -1]
+
+
+@pytest.mark.parametrize('change, reason', [
+    ({'ap_hi': 'n/a'}, 'malformed'),
+    ({'age': None}, 'malformed'),
+    ({'id': ''}, 'malformed'),
+    ({'cholesterol': 2.5}, 'invalid_code'),
+    ({'id': 0}, 'invalid_code'),
+    ({'id': 11.5}, 'invalid_code'),
+    ({'ap_hi': 1000}, 'out_of_range'),
+    ({'gender': 3}, 'out_of_range'),
+])
+def test_invalid_rows_are_rejected_with_a_reason(change, reason):
+    assert reasons_of([ROW, dict(ROW, **change)]) == [None, reason]
+
+
+def test_first_failing_check_is_reported():
+    assert reasons_of([dict(ROW, ap_hi='n/a', cholesterol=2.5, ap_lo=1000)]) == ['malformed']
+    assert reasons_of([dict(ROW, cholesterol=2.5, ap_lo=1000)]) == ['invalid_code']
+
+
+def test_repeated_patients_are_kept_as_separate_tests():
+    patient_ids, _, X, reasons = validate_chunk(pd.DataFrame([ROW, dict(ROW, ap_hi=160)]))
+    assert patient_ids.tolist() == [11, 11] and reasons.tolist() == [-1, -1]
+    assert X[:, FEATURE_INDEX['ap_hi']].tolist() == [150, 160]
+
+
+def test_csv_and_ndjson_feeds_read_the_same(tmp_path):
+    rows = [ROW, dict(ROW, id=12, ap_hi='n/a'), dict(ROW, id=13)]
+    csv_path, ndjson_path = tmp_path / 'feed.csv', tmp_path / 'feed.ndjson'
+    pd.DataFrame(rows).to_csv(csv_path, sep=';', index=False)
+    ndjson_path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    csv_chunks = list(read_chunks(str(csv_path), chunk_rows=2))
+    ndjson_chunks = list(read_chunks(str(ndjson_path), chunk_rows=2))
+    assert [len(chunk) for chunk in csv_chunks] == [len(chunk) for chunk in ndjson_chunks] == [2, 1]
+    for csv_chunk, ndjson_chunk in zip(csv_chunks, ndjson_chunks):
+        csv_result, ndjson_result = validate_chunk(csv_chunk), validate_chunk(ndjson_chunk)
+        for csv_values, ndjson_values in zip(csv_result, ndjson_result):
+            np.testing.assert_array_equal(csv_values, ndjson_values)
+
+
+def test_feed_without_a_required_column_is_refused(tmp_path):
+    path = tmp_path / 'feed.csv'
+    pd.DataFrame([{column: ROW[column] for column in FEED_COLUMNS if column != 'gluc'}]).to_csv(
+        path, sep=';', index=False)
+    with pytest.raises(ValueError, match="missing the columns gluc"):
+        list(read_chunks(str(path)))
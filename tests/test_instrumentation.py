@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from instrumentation import STAGE_ERRORS, STAGE_SECONDS, Histogram, Registry, timed
+
+
+def errors(stage):
+    return {labels: value for _, labels, value in STAGE_ERRORS.samples() if f'stage="{stage}"' in labels}
+
+
+def test_timed_context_records_the_duration():
+    with timed('test-context'):
+        time.sleep(0.01)
+    snapshot = STAGE_SECONDS.snapshot(stage='test-context')
+    assert snapshot['count'] == 1 and snapshot['sum'] >= 0.01
+
+
+def test_timed_counts_errors_and_reraises():
+    with pytest.raises(KeyError):
+        with timed('test-error'):
+            raise KeyError('x')
+    assert errors('test-error') == {'{stage="test-error",error="KeyError"}': 1}
+    assert STAGE_SECONDS.snapshot(stage='test-error')['count'] == 1
+
+
+def test_overlapping_decorated_calls_each_record_their_own_duration():
+    @timed('test-decorated')
+    def work(seconds):
+        time.sleep(seconds)
+
+    long_call = threading.Thread(target=work, args=(0.2,))
+    long_call.start()
+    time.sleep(0.1)
+    work(0.01)
+    long_call.join()
+    snapshot = STAGE_SECONDS.snapshot(stage='test-decorated')
+    assert snapshot['count'] == 2
+    # With a shared start time the long call would be timed from the start of the short one
+    assert snapshot['sum'] >= 0.21
+    assert sum(count for bound, count in snapshot['buckets'].items() if bound <= 0.05) == 1
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram('test_seconds', "Test.", buckets=(0.1, 1.0))
+    for value in (0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.snapshot()['buckets'] == {0.1: 1, 1.0: 1, float('inf'): 1}
+
+
+def test_registry_renders_the_prometheus_text_format():
+    registry = Registry()
+    registry.counter('test_total', "Things.", ('kind',)).inc(kind='a "quoted"\nvalue')
+    histogram = registry.histogram('test_seconds', "Durations.", buckets=(0.5,))
+    histogram.observe(0.25)
+    histogram.observe(2)
+    assert registry.render() == (
+        '# HELP test_total Things.\n'
+        '# TYPE test_total counter\n'
+        'test_total{kind="a \\"quoted\\"\\nvalue"} 1\n'
+        '# HELP test_seconds Durations.\n'
+        '# TYPE test_seconds histogram\n'
+        'test_seconds_bucket{le="0.5"} 1\n'
+        'test_seconds_bucket{le="+Inf"} 2\n'
+        'test_seconds_sum 2.25\n'
+        'test_seconds_count 2\n'
+    )
+
+
+def test_metric_names_are_registered_once():
+    registry = Registry()
+    registry.gauge('test_value', "Value.")
+    with pytest.raises(ValueError):
+        registry.counter('test_value', "Value.")
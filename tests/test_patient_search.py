@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+import queries
+from patient_search import like_prefix, search_patients
+
+# (User ID, first name, last name) of one physician's panel
+PANEL = [(1, 'Mary', 'Cole'), (2, 'Mark', 'Cole'), (3, 'Mary', 'Adams'), (4, 'Ann', 'Mary'), (5, 'Mary', 'Cole'),
+         (6, 'Tom', 'O_Neil'), (7, 'Tom', 'Oxley'), (8, 'Ed', '100%')]
+
+
+def like(value, pattern):
+    # Postgres LIKE with the default backslash escape
+    regex = ''.join('.*' if token == '%' else '.' if token == '_' else re.escape(token[-1])
+                    for token in re.findall(r'\\.|.', pattern))
+    return re.fullmatch(regex, value, re.DOTALL) is not None
+
+
+class PanelCursor:
+    # Evaluates SEARCH_PATIENTS over PANEL, as Postgres would
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, params):
+        assert query == queries.SEARCH_PATIENTS
+        self.executed.append(params)
+        after = (params['after_last'], params['after_first'], params['after_id'])
+        matches = sorted((last, first, user_id) for user_id, first, last in PANEL
+                         if any(like(name.lower(), params['prefix'])
+                                for name in (first, last, f'{first} {last}'))
+                         and (params['after_id'] is None or (last, first, user_id) > after))
+        self.rows = [(user_id, first, last) for last, first, user_id in matches[:params['limit']]]
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.mark.parametrize('text, pattern', [
+    ('Mary', 'mary%'),
+    ('  mary   CO ', 'mary co%'),
+    ('', '%'),
+    ('o_n', 'o\\_n%'),
+    ('100%', '100\\%%'),
+    ('a\\b', 'a\\\\b%'),
+])
+def test_like_prefix_escapes_wildcards(text, pattern):
+    assert like_prefix(text) == pattern
+
+
+def test_search_matches_first_last_and_full_names():
+    rows, cursor = search_patients(PanelCursor(), 9, 'mary')
+    assert [row[0] for row in rows] == [3, 1, 5, 4]
+    assert cursor is None
+    rows, _ = search_patients(PanelCursor(), 9, 'Mary C')
+    assert [row[0] for row in rows] == [1, 5]
+
+
+def test_typed_wildcards_match_literally():
+    rows, _ = search_patients(PanelCursor(), 9, 'o_')
+    assert [row[0] for row in rows] == [6]
+    rows, _ = search_patients(PanelCursor(), 9, '100%')
+    assert [row[0] for row in rows] == [8]
+
+
+def test_pages_continue_after_the_cursor():
+    cur = PanelCursor()
+    pages, after = [], None
+    while True:
+        rows, after = search_patients(cur, 9, '', limit=3, after=after)
+        pages.append([row[0] for row in rows])
+        if after is None:
+            break
+    assert pages == [[8, 3, 2], [1, 5, 4], [6, 7]]
+    # One extra row is fetched to tell whether another page follows
+    assert all(params['limit'] == 4 for params in cur.executed)
+    assert cur.executed[1]['after_id'] == 2 and cur.executed[1]['after_last'] == 'Cole'
+
+
+def test_full_last_page_has_no_cursor():
+    rows, cursor = search_patients(PanelCursor(), 9, 'cole', limit=3)
+    assert len(rows) == 3 and cursor is None
@@ -0,0 +1,136 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import queries
+from persistence import BackgroundWriter, save_patient_test
+
+ENCODED = {'gender': 2.0, 'height': 165.0, 'weight': 90.5, 'ap_hi': 150.0, 'ap_lo': 95.0, 'cholesterol': 3.0,
+           'gluc': 2.0, 'smoke': 1.0, 'alco': 0.0, 'active': 0.0, 'ageinyears': 60.0}
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        assert query == queries.SAVE_PATIENT_TEST
+        self.db.gate.wait()
+        if params['patient_id'] not in self.db.patients:
+            self.row = None
+            return
+        self.db.pending.append(params)
+        self.row = (len(self.db.saved) + len(self.db.pending),)
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        if self.db.fail_commit:
+            raise RuntimeError("commit failed")
+        self.db.saved.extend(self.db.pending)
+        self.db.pending.clear()
+
+
+class FakePool:
+    # Stands in for ConnectionPool with one connection to a database of known patients
+    def __init__(self, patients=(1, 2, 3)):
+        self.patients = set(patients)
+        self.saved, self.pending = [], []
+        self.fail_commit = False
+        self.gate = threading.Event()
+        self.gate.set()
+
+    @contextmanager
+    def connection(self):
+        try:
+            yield FakeConnection(self)
+        finally:
+            self.pending.clear()
+
+
+@pytest.fixture
+def writer():
+    writers = []
+
+    def start(pool, **kwargs):
+        writers.append(BackgroundWriter(pool, **kwargs))
+        return writers[-1]
+
+    yield start
+    for writer in writers:
+        writer.close()
+
+
+def test_save_patient_test_sends_one_statement_with_whole_numbers():
+    pool = FakePool()
+    with pool.connection() as conn, conn.cursor() as cur:
+        assert save_patient_test(cur, 7, 1, ENCODED, 60.4, 1) == 1
+        conn.commit()
+    [params] = pool.saved
+    assert params['physician_id'] == 7 and params['age'] == 60 and params['prediction'] == 1
+    assert params['weight'] == 90.5 and isinstance(params['ap_hi'], int)
+
+
+def test_save_patient_test_of_an_unknown_patient_returns_none():
+    pool = FakePool()
+    with pool.connection() as conn, conn.cursor() as cur:
+        assert save_patient_test(cur, 7, 99, ENCODED, 60, 1) is None
+
+
+def test_updates_are_written_in_submission_order(writer):
+    pool = FakePool()
+    background = writer(pool)
+    futures = [background.submit(7, patient_id, ENCODED, 60, 0) for patient_id in (3, 1, 2)]
+    assert [future.result(timeout=5) for future in futures] == [1, 2, 3]
+    assert [params['patient_id'] for params in pool.saved] == [3, 1, 2]
+    stats = background.stats()
+    assert stats['submitted'] == stats['written'] == 3 and stats['pending'] == 0
+
+
+def test_failed_write_is_reported_through_the_future(writer):
+    pool = FakePool()
+    pool.fail_commit = True
+    background = writer(pool)
+    future = background.submit(7, 1, ENCODED, 60, 0)
+    with pytest.raises(RuntimeError, match="commit failed"):
+        future.result(timeout=5)
+    assert pool.saved == []
+    assert background.stats()['failed'] == 1
+
+
+def test_close_writes_the_queued_updates():
+    pool = FakePool()
+    pool.gate.clear()
+    background = BackgroundWriter(pool)
+    futures = [background.submit(7, 1, ENCODED, 60, 0) for _ in range(5)]
+    pool.gate.set()
+    background.close()
+    assert all(future.done() for future in futures)
+    assert len(pool.saved) == 5
+
+
+def test_flush_waits_for_pending_updates(writer):
+    pool = FakePool()
+    pool.gate.clear()
+    background = writer(pool)
+    background.submit(7, 1, ENCODED, 60, 0)
+    background.submit(7, 2, ENCODED, 60, 0)
+    threading.Timer(0.05, pool.gate.set).start()
+    background.flush()
+    assert len(pool.saved) == 2
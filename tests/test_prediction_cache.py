@@ -0,0 +1,152 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from prediction_cache import PredictionCache, SQLitePredictionStore, open_prediction_store
+
+
+class CountingModel:
+    # Wraps the real model to count the records it scores, under a version the test can change
+    def __init__(self, model, version=None):
+        self.model = model
+        self.version = version or model.version
+        self.input_dtype = model.input_dtype
+        self.classes_ = model.classes_
+        self.scored = 0
+
+    def predict_with_proba(self, X):
+        self.scored += len(X)
+        return self.model.predict_with_proba(X)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hits_return_the_model_predictions(model, random_X):
+    counting = CountingModel(model)
+    cache = PredictionCache(maxsize=1000, ttl=None)
+    first = cache.predict(counting, random_X[:100])
+    second = cache.predict(counting, random_X[:100])
+    np.testing.assert_array_equal(first, model.predict(random_X[:100]))
+    np.testing.assert_array_equal(second, first)
+    assert counting.scored == 100
+    assert cache.stats()['hits'] == 100
+
+
+def test_hits_return_the_model_probabilities(model, random_X):
+    cache = PredictionCache(maxsize=1000, ttl=None)
+    cache.predict(CountingModel(model), random_X[:50])
+    labels, proba = cache.predict_with_proba(CountingModel(model), random_X[:100])
+    expected_labels, expected_proba = model.predict_with_proba(random_X[:100])
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_array_equal(proba, expected_proba)
+    assert cache.stats()['hits'] == 50
+
+
+def test_least_recently_used_entry_is_evicted(model, random_X):
+    counting = CountingModel(model)
+    cache = PredictionCache(maxsize=2, ttl=None)
+    a, b, c = random_X[:1], random_X[1:2], random_X[2:3]
+    cache.predict(counting, a)
+    cache.predict(counting, b)
+    cache.predict(counting, a)
+    cache.predict(counting, c)
+    assert cache.stats()['evictions'] == 1
+    cache.predict(counting, a)
+    assert counting.scored == 3
+    cache.predict(counting, b)
+    assert counting.scored == 4
+
+
+def test_entries_expire_after_ttl(model, random_X):
+    counting = CountingModel(model)
+    clock = Clock()
+    cache = PredictionCache(maxsize=10, ttl=60, clock=clock)
+    cache.predict(counting, random_X[:1])
+    clock.now = 59
+    cache.predict(counting, random_X[:1])
+    assert counting.scored == 1
+    clock.now = 61
+    cache.predict(counting, random_X[:1])
+    assert counting.scored == 2
+    assert cache.stats()['expirations'] == 1
+
+
+def test_new_model_version_drops_entries(model, random_X):
+    cache = PredictionCache(maxsize=10, ttl=None)
+    cache.predict(CountingModel(model, 'a'), random_X[:3])
+    retrained = CountingModel(model, 'b')
+    cache.predict(retrained, random_X[:3])
+    assert retrained.scored == 3
+    assert cache.stats()['invalidations'] == 3
+
+
+def test_identical_records_after_dtype_cast_share_an_entry(model, random_X):
+    counting = CountingModel(model)
+    cache = PredictionCache(maxsize=10, ttl=None)
+    record = random_X[:1].astype(np.float64)
+    nudged = record.copy()
+    # Below float32 resolution, so the model cannot tell the two apart
+    nudged[0, 2] += 1e-9
+    cache.predict(counting, record)
+    cache.predict(counting, nudged)
+    assert counting.scored == 1
+
+
+def test_sqlite_store_is_shared_between_caches(model, random_X, tmp_path):
+    path = str(tmp_path / 'predictions.sqlite')
+    first, second = CountingModel(model), CountingModel(model)
+    expected = PredictionCache(10, None, store=f'sqlite:{path}').predict_with_proba(first, random_X[:20])
+    other_worker = PredictionCache(10, None, store=f'sqlite:{path}')
+    for shared, scored in zip(other_worker.predict_with_proba(second, random_X[:20]), expected):
+        np.testing.assert_array_equal(shared, scored)
+    assert second.scored == 0
+    assert other_worker.stats()['shared_hits'] == 20
+
+
+def test_sqlite_store_ignores_other_versions_and_expired_entries(tmp_path):
+    store = SQLitePredictionStore(str(tmp_path / 'predictions.sqlite'))
+    store.put_many('a', [(b'x', 1, 0.75), (b'y', 0, 0.25)], expires=100.0)
+    assert store.get_many('a', [b'x', b'y'], now=50.0) == {b'x': (1, 0.75), b'y': (0, 0.25)}
+    assert store.get_many('b', [b'x'], now=50.0) == {}
+    assert store.get_many('a', [b'x'], now=150.0) == {}
+
+
+def test_sqlite_store_purge_trims_to_maxsize(tmp_path):
+    store = SQLitePredictionStore(str(tmp_path / 'predictions.sqlite'), maxsize=2)
+    store.put_many('a', [(bytes([i]), i % 2, i / 4) for i in range(5)], expires=None)
+    store.put_many('b', [(b'z', 1, 1.0)], expires=None)
+    store.purge('a', now=0.0)
+    found = store.get_many('a', [bytes([i]) for i in range(5)], now=0.0)
+    assert found == {bytes([3]): (1, 0.75), bytes([4]): (0, 1.0)}
+    assert store.get_many('b', [b'z'], now=0.0) == {}
+
+
+def test_sqlite_store_without_probabilities_starts_over(tmp_path):
+    path = str(tmp_path / 'predictions.sqlite')
+    with sqlite3.connect(path) as conn:
+        conn.execute("""CREATE TABLE predictions (version TEXT NOT NULL, record BLOB NOT NULL,
+                        prediction INTEGER NOT NULL, expires REAL, PRIMARY KEY (version, record))""")
+        conn.execute("INSERT INTO predictions VALUES ('a', x'01', 1, NULL)")
+    store = SQLitePredictionStore(path)
+    assert store.get_many('a', [b'\x01'], now=0.0) == {}
+    store.put_many('a', [(b'\x01', 1, 0.5)], expires=None)
+    assert store.get_many('a', [b'\x01'], now=0.0) == {b'\x01': (1, 0.5)}
+
+
+def test_open_prediction_store_specs(tmp_path):
+    assert open_prediction_store('memory') is None
+    assert isinstance(open_prediction_store(f'sqlite:{tmp_path / "p.sqlite"}'), SQLitePredictionStore)
+    with pytest.raises(ValueError):
+        open_prediction_store('redis://localhost')
+
+
+def test_maxsize_must_be_positive():
+    with pytest.raises(ValueError):
+        PredictionCache(maxsize=0, ttl=None)
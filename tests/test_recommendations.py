@@ -0,0 +1,70 @@
+import numpy as np
+
+from features import encode
+from recommendations import RULE_INDEX, RULES, evaluate, recommend, recommendation_codes
+
+
+def level(levels, row, rule):
+    return RULES[RULE_INDEX[rule]].levels[levels[row, RULE_INDEX[rule]]].code
+
+
+def test_evaluate_applies_thresholds(records):
+    levels = evaluate(encode(records), np.array([0, 1, 0]))
+    assert level(levels, 0, 'prediction') == 'no_risk'
+    assert level(levels, 1, 'prediction') == 'high_risk'
+    assert level(levels, 0, 'ap_hi') == 'at_risk'
+    assert level(levels, 1, 'ap_hi') == 'very_high'
+    assert level(levels, 1, 'ap_lo') == 'very_high'
+    assert level(levels, 2, 'ap_lo') == 'at_risk'
+    assert level(levels, 1, 'bmi') == 'overweight'
+    assert level(levels, 0, 'bmi') == 'normal'
+    assert level(levels, 1, 'cholesterol') == 'well_above_normal'
+    assert level(levels, 1, 'gluc') == 'above_normal'
+
+
+def test_recommendation_codes_name_what_calls_for_attention(records):
+    X = encode(records)
+    codes = recommendation_codes(evaluate(X, np.array([0, 1, 0])))
+    assert codes[0] == 'ap_lo.at_risk,ap_hi.at_risk'
+    assert codes[1].split(',') == ['prediction.high_risk', 'bmi.overweight', 'ap_lo.very_high', 'ap_hi.very_high',
+                                   'cholesterol.well_above_normal', 'gluc.above_normal', 'smoke.yes', 'active.no']
+    assert codes[2] == 'ap_lo.at_risk,ap_hi.at_risk,cholesterol.above_normal,alco.yes'
+
+
+def test_recommendation_codes_of_a_healthy_record_are_empty(records):
+    records[0].update(ap_hi=110, ap_lo=70)
+    assert recommendation_codes(evaluate(encode(records[:1]), np.array([0])))[0] == ''
+
+
+def test_recommendation_codes_match_per_record_evaluation(random_X):
+    predictions = np.arange(len(random_X)) % 2
+    batch = recommendation_codes(evaluate(random_X, predictions))
+    single = [recommendation_codes(evaluate(random_X[i:i + 1], predictions[i:i + 1]))[0]
+              for i in range(len(random_X))]
+    assert batch.tolist() == single
+
+
+def test_recommend_fills_in_the_bmi(records):
+    messages = recommend(encode(records[1:2])[0], 1, 'patient')
+    assert ('warning', "Your Body Mass Index is 33.1. It's recommended to lose weight to lower your risk of "
+                       "cardiovascular disease.") in messages
+    assert messages[0][0] == 'heading'
+
+
+def test_recommend_agrees_with_evaluate(random_X):
+    predictions = np.arange(len(random_X)) % 2
+    levels = evaluate(random_X, predictions)
+    for row in range(0, len(random_X), 25):
+        severities = [kind for kind, _ in recommend(random_X[row], predictions[row], 'patient') if kind != 'heading']
+        expected = [RULES[i].levels[levels[row, i]].severity for i in range(len(RULES))
+                    if RULES[i].levels[levels[row, i]].patient is not None]
+        assert sorted(severities) == sorted(expected)
+
+
+def test_recommend_leaves_out_messages_an_audience_does_not_get(records):
+    record = encode(records[1:2])[0]
+    patient = [text for kind, text in recommend(record, 1, 'patient') if kind != 'heading']
+    physician = [text for kind, text in recommend(record, 1, 'physician') if kind != 'heading']
+    assert "Your systolic blood pressure is very high. Seek medical attention immediately." in patient
+    assert not any('systolic' in text for text in physician)
+    assert len(physician) == len(patient) - 1
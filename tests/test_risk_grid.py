@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+from features import FEATURE_INDEX, FEATURES
+from risk_grid import RiskGrid, build, check, default_axes, grid_version, quantize
+from tree_model import MODEL_PATH
+
+# A coarse grid over the numeric inputs, every option of the categorical ones
+SMALL_AXES = {'height': (150, 20, 3), 'weight': (50, 30, 3), 'ap_hi': (100, 40, 3), 'ap_lo': (60, 30, 2),
+              'ageinyears': (35, 15, 3)}
+
+
+@pytest.fixture(scope='module')
+def grid_path(tmp_path_factory):
+    axes = [SMALL_AXES.get(feature.name, axis) for feature, axis in zip(FEATURES, default_axes())]
+    path = str(tmp_path_factory.mktemp('risk_grid'))
+    build(os.path.join(ROOT, MODEL_PATH), path, axes=axes, jobs=1, verbose=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def grid(grid_path):
+    return RiskGrid.load(grid_path)
+
+
+def test_quantize_keeps_the_decision_threshold():
+    assert quantize(np.array([0.0, 0.4999, 0.5, 0.999, 1.0])).tolist() == [0, 127, 128, 255, 255]
+
+
+def test_built_table_matches_the_model(grid_path, grid, model):
+    assert grid.model_version == grid_version(grid_path) == model.version
+    assert check(grid, model, samples=2000) == 0
+
+
+def test_records_snap_to_the_nearest_cell_within_range(grid):
+    record = np.array([[1, 158, 200, 60, 80, 2, 1, 0, 1, 1, 41.4]])
+    assert grid.snap(record)[0].tolist() == [1, 150, 110, 100, 90, 2, 1, 0, 1, 1, 35]
+    assert grid.indices(record)[0, FEATURE_INDEX['ap_lo']] == 1
+
+
+def test_lookup_agrees_with_predict_proba(grid, random_X):
+    proba = grid.predict_proba(random_X[:50])
+    assert [grid.lookup(record) for record in random_X[:50].tolist()] == proba.tolist()
+    np.testing.assert_array_equal(grid.predict(random_X[:50]), (proba >= 0.5).astype(np.int64))
+
+
+def test_lookup_is_within_a_bucket_of_the_model_at_grid_points(grid, model, random_X):
+    X = grid.snap(random_X[:200])
+    np.testing.assert_allclose(grid.predict_proba(X), model.predict_proba(X)[:, 1], atol=1 / 256)
+
+
+def test_table_of_other_inputs_is_refused(grid):
+    with pytest.raises(ValueError, match="does not match"):
+        RiskGrid(grid.risk, grid.axes[:-1], grid.model_version)
+
+
+def test_missing_table_has_no_version(tmp_path):
+    assert grid_version(str(tmp_path)) is None
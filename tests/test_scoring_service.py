@@ -0,0 +1,151 @@
+import json
+import socket
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from features import FEATURE_NAMES, encode
+from scoring_service import MAX_JSON_BYTES, parse_records, start_server
+
+
+@pytest.fixture
+def server(model):
+    server = start_server(model, max_wait=0.001)
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def exchange(url, data):
+    # Sends raw bytes on one connection and reads until the server closes it or stops answering
+    host, port = url.rsplit('/', 1)[-1].split(':')
+    received = b''
+    with socket.create_connection((host, int(port)), timeout=1) as sock:
+        sock.sendall(data)
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                received += chunk
+        except socket.timeout:
+            pass
+    return received
+
+
+# A request hidden in a body the server leaves unread; it must not be answered
+SMUGGLED = b'GET /health HTTP/1.1\r\nHost: localhost\r\n\r\n'
+
+
+def post(url, body, content_type='application/json'):
+    request = urllib.request.Request(url + '/predict', data=body.encode(), method='POST',
+                                     headers={'Content-Type': content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def test_parse_records_accepts_objects_and_arrays(records):
+    X = parse_records(records)
+    np.testing.assert_array_equal(X, encode(records))
+    np.testing.assert_array_equal(parse_records(X.tolist()), X)
+
+
+@pytest.mark.parametrize('feature, value, message', [
+    ('ap_hi', None, "ap_hi must be a number, got null"),
+    ('cholesterol', 'High', "cholesterol must be a number or one of"),
+    ('ap_hi', 1000, "ap_hi must be a number from 70 to 300, got 1000"),
+    ('weight', float('nan'), "weight must be a number from 10 to 300, got nan"),
+    ('height', float('inf'), "height must be a number from 50 to 250, got inf"),
+    ('smoke', True, "smoke must be a number or one of \\['Yes', 'No'\\], got true"),
+    ('gender', False, "gender must be a number or one of"),
+])
+def test_parse_records_rejects_invalid_values(records, feature, value, message):
+    records[1][feature] = value
+    with pytest.raises(ValueError, match=f"Record 1: {message}"):
+        parse_records(records)
+
+
+def test_parse_records_rejects_missing_feature(records):
+    del records[2]['gluc']
+    with pytest.raises(ValueError, match="Record 12 is missing feature 'gluc'"):
+        parse_records(records, first=10)
+
+
+def test_parse_records_numbers_records_from_first(records):
+    records[0]['ap_lo'] = 10
+    with pytest.raises(ValueError, match="Record 1000: ap_lo"):
+        parse_records(records, first=1000)
+
+
+def test_predict_json(server, model, records):
+    status, body = post(server, json.dumps({'instances': records}))
+    assert status == 200
+    result = json.loads(body)
+    assert result['model_version'] == model.version
+    labels, proba = model.predict_with_proba(encode(records))
+    assert [p['prediction'] for p in result['predictions']] == labels.tolist()
+    np.testing.assert_allclose([p['probability'] for p in result['predictions']], proba[:, 1])
+
+
+@pytest.mark.parametrize('body', [
+    '{"instances": [{"gender": "Male"}]}',
+    '[[1, 170, 70, 120, 80, 1, 1, 0, 0, 1, NaN]]',
+    '[[1, 170, 70, 1000, 80, 1, 1, 0, 0, 1, 50]]',
+    '{"instances": [',
+])
+def test_predict_json_rejects_invalid_records(server, body):
+    status, response = post(server, body)
+    assert status == 400
+    assert json.loads(response)['error']
+
+
+def test_predict_ndjson_reports_first_invalid_line(server, records):
+    records[1]['ap_hi'] = 1000
+    status, body = post(server, '\n'.join(map(json.dumps, records)) + '\n', 'application/x-ndjson')
+    assert status == 200
+    [line] = [json.loads(line) for line in body.splitlines()]
+    assert line['error'].startswith("Record 1: ap_hi")
+
+
+def test_parse_records_rejects_booleans_in_arrays(records):
+    row = encode(records[:1])[0].tolist()
+    row[8] = True
+    with pytest.raises(ValueError, match="Record 0: alco must be a number"):
+        parse_records([row])
+
+
+def test_oversized_json_body_closes_the_connection(server):
+    head = (f'POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {MAX_JSON_BYTES + 1}\r\n\r\n').encode()
+    response = exchange(server, head + SMUGGLED)
+    assert response.startswith(b'HTTP/1.1 400') and b'Connection: close' in response
+    assert response.count(b'HTTP/1.1 ') == 1
+
+
+def test_ndjson_stopped_by_an_error_closes_the_connection(server):
+    body = b'{not json}\n' + SMUGGLED
+    head = (f'POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/x-ndjson\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n').encode()
+    response = exchange(server, head + body)
+    assert b'Invalid JSON on line 1' in response
+    assert response.count(b'HTTP/1.1 ') == 1
+
+
+def test_keep_alive_connection_serves_further_requests(server, records):
+    body = json.dumps(records[0]).encode()
+    request = (f'POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+               f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+    response = exchange(server, request + request)
+    assert response.count(b'HTTP/1.1 200') == 2
+
+
+def test_health_lists_features(server, model):
+    with urllib.request.urlopen(server + '/health', timeout=10) as response:
+        health = json.load(response)
+    assert health['model_version'] == model.version
+    assert health['features'] == list(FEATURE_NAMES)
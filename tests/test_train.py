@@ -0,0 +1,76 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier
+
+from train import VERSION_INFIX, publish_artifact, write_outputs
+from tree_model import POINTER_SUFFIX, TreeEnsemble, artifact_version, load_model, resolve_artifact
+
+
+@pytest.fixture(scope='module')
+def trained(random_X):
+    # Small models are enough to exercise the outputs; the labels follow the systolic blood pressure
+    y = (random_X[:, 3] > 140).astype(np.int64)
+    return [GradientBoostingClassifier(n_estimators=n, max_depth=2, random_state=0).fit(random_X, y)
+            for n in (3, 4, 5)]
+
+
+def report():
+    return {'settings': {'backend': 'gradient_boosting', 'seed': 0}, 'best_params': {},
+            'dataset': {'sha256': '0' * 64}}
+
+
+def version_directories(parent):
+    return sorted(name for name in os.listdir(parent) if VERSION_INFIX in name)
+
+
+def test_without_a_pointer_the_artifact_path_is_loaded(model, tmp_path):
+    target = str(tmp_path / 'gb_model')
+    model.save(target)
+    assert resolve_artifact(target) == target
+    assert artifact_version(target) == model.version
+
+
+def test_retrain_publishes_a_version_next_to_the_shipped_artifact(model, trained, random_X, tmp_path):
+    target = str(tmp_path / 'gb_model')
+    model.save(target)
+    shipped = sorted(os.listdir(target))
+    version = write_outputs(trained[0], random_X, report(), output=target, pickle_path=str(tmp_path / 'm.pkl'))
+    # The checked-out directory is left as it was, the pointer names the new version
+    assert sorted(os.listdir(target)) == shipped
+    assert TreeEnsemble.load(target + os.sep).version == version == artifact_version(target)
+    assert os.path.dirname(resolve_artifact(target)) == str(tmp_path)
+    assert load_model(target).version == TreeEnsemble.from_sklearn(trained[0]).version
+    with open(tmp_path / 'm.pkl', 'rb') as file:
+        assert TreeEnsemble.from_sklearn(pickle.load(file)).version == version
+
+
+def test_previous_version_is_kept_and_older_ones_removed(trained, random_X, tmp_path):
+    target = str(tmp_path / 'gb_model')
+    paths = []
+    for model in trained:
+        write_outputs(model, random_X, report(), output=target, pickle_path=None)
+        paths.append(resolve_artifact(target))
+    assert version_directories(tmp_path) == sorted(os.path.basename(path) for path in paths[1:])
+    assert not os.path.exists(target)
+    assert not os.path.exists(target + POINTER_SUFFIX + '.staging')
+
+
+def test_loaders_keep_the_version_they_resolved(trained, random_X, tmp_path):
+    target = str(tmp_path / 'gb_model')
+    write_outputs(trained[0], random_X, report(), output=target, pickle_path=None)
+    path = resolve_artifact(target)
+    write_outputs(trained[1], random_X, report(), output=target, pickle_path=None)
+    assert load_model(path).version == TreeEnsemble.from_sklearn(trained[0]).version
+    assert load_model(target).version == TreeEnsemble.from_sklearn(trained[1]).version
+
+
+def test_pointer_names_the_version_directory(model, tmp_path):
+    target = str(tmp_path / 'gb_model')
+    source = str(tmp_path / f'gb_model{VERSION_INFIX}a')
+    model.save(source)
+    publish_artifact(source, target)
+    with open(target + POINTER_SUFFIX) as file:
+        assert file.read() == os.path.basename(source) + '\n'
@@ -0,0 +1,73 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+from tree_model import PICKLE_PATH, SMALL_BATCH, TreeEnsemble, artifact_version, load_model
+
+
+@pytest.fixture(scope='module')
+def sklearn_model():
+    with open(os.path.join(ROOT, PICKLE_PATH), 'rb') as file:
+        return pickle.load(file)
+
+
+@pytest.fixture(scope='module')
+def compiled(sklearn_model):
+    return TreeEnsemble.from_sklearn(sklearn_model)
+
+
+@pytest.mark.parametrize('rows', [1, SMALL_BATCH, 500])
+def test_compiled_model_matches_the_pickle_bit_for_bit(sklearn_model, compiled, random_X, rows):
+    # Small batches walk the trees, larger ones use the bitvector evaluator
+    X = random_X[:rows]
+    np.testing.assert_array_equal(compiled.predict_proba(X), sklearn_model.predict_proba(X))
+    np.testing.assert_array_equal(compiled.predict(X), sklearn_model.predict(X))
+    np.testing.assert_array_equal(compiled.decision_function(X), sklearn_model.decision_function(X))
+
+
+def test_predict_with_proba_matches_predict_and_predict_proba(compiled, random_X):
+    labels, proba = compiled.predict_with_proba(random_X)
+    np.testing.assert_array_equal(labels, compiled.predict(random_X))
+    np.testing.assert_array_equal(proba, compiled.predict_proba(random_X))
+
+
+@pytest.mark.parametrize('X', [np.zeros((2, 10)), np.full((2, 11), np.nan)])
+def test_invalid_inputs_are_refused(compiled, X):
+    with pytest.raises(ValueError):
+        compiled.predict(X)
+
+
+def test_artifact_is_the_compiled_pickle(compiled, model, random_X):
+    assert model.version == compiled.version
+    np.testing.assert_array_equal(model.predict_proba(random_X), compiled.predict_proba(random_X))
+
+
+def test_saved_artifact_loads_the_same_model(compiled, random_X, tmp_path):
+    path = str(tmp_path / 'model')
+    compiled.save(path)
+    loaded = load_model(path)
+    assert loaded.version == compiled.version == artifact_version(path)
+    assert isinstance(loaded.value, np.memmap)
+    np.testing.assert_array_equal(loaded.predict_proba(random_X), compiled.predict_proba(random_X))
+
+
+def test_corrupt_artifact_is_refused(compiled, tmp_path):
+    path = str(tmp_path / 'model')
+    compiled.save(path)
+    value = np.load(os.path.join(path, 'value.npy'))
+    value[0] += 1.0
+    np.save(os.path.join(path, 'value.npy'), value)
+    with pytest.raises(ValueError, match="corrupt"):
+        load_model(path)
+
+
+def test_artifact_of_an_unknown_format_is_refused(compiled, tmp_path):
+    path = str(tmp_path / 'model')
+    compiled.save(path)
+    with open(os.path.join(path, 'model.json'), 'w') as file:
+        file.write('{"format": "cvd-tree-ensemble", "format_version": 99}')
+    with pytest.raises(ValueError, match="Unsupported"):
+        load_model(path)
@@ -0,0 +1,383 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from features import FEATURE_NAMES, FEATURES
+from tree_model import MODEL_PATH, PICKLE_PATH, POINTER_SUFFIX, TreeEnsemble, resolve_artifact, verify
+
+# Compact dtypes for reading cardio_train.csv; feature columns use the schema's storage dtypes
+CSV_DTYPES = {'id': np.int64, 'age': np.int32, 'cardio': np.int8}
+CSV_DTYPES.update({feature.name: feature.dtype for feature in FEATURES if feature.name != 'ageinyears'})
+
+# Rows parsed per chunk while streaming the CSV
+CSV_CHUNK_ROWS = 100000
+
+# Hyperparameters searched by default; the notebook's model is the first combination
+PARAM_GRID = {
+    'n_estimators': [100, 200],
+    'learning_rate': [0.1, 0.05],
+    'max_depth': [3, 4],
+}
+
+# Model backend used unless another one is requested, see BACKENDS
+DEFAULT_BACKEND = 'gradient_boosting'
+
+# Metrics report written next to the model artifact
+METRICS_FILE = 'metrics.json'
+
+# Each trained artifact is written to a directory named <artifact path><VERSION_INFIX><random suffix>, which
+# the artifact's pointer file names once it is current; the artifact path itself keeps the shipped artifact
+VERSION_INFIX = '.version-'
+
+# Per-process training data, set by _init_worker so it is sent to each worker once rather than per task
+_data = {}
+
+
+def _gradient_boosting(params, seed):
+    from sklearn.ensemble import GradientBoostingClassifier
+
+    return GradientBoostingClassifier(random_state=seed, **params)
+
+
+def _hist_gradient_boosting(params, seed):
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    params = dict(params)
+    max_iter = params.pop('n_estimators')
+    # Early stopping would hold out its own validation split and make the stage count data dependent
+    return HistGradientBoostingClassifier(max_iter=max_iter, early_stopping=False, random_state=seed, **params)
+
+
+# Model backends: name -> function building an unfitted classifier from the searched parameters and a seed.
+# Every backend must be exportable with TreeEnsemble.from_sklearn so the app can serve it.
+BACKENDS = {
+    'gradient_boosting': _gradient_boosting,
+    'hist_gradient_boosting': _hist_gradient_boosting,
+}
+
+
+def build_model(backend, params, seed=0):
+    """
+    Creates an unfitted classifier of the given backend.
+
+    Args:
+        backend (str): Key of BACKENDS.
+        params (dict): Searched hyperparameters: n_estimators, learning_rate and max_depth.
+        seed (int, optional): Random state of the model. Defaults to 0.
+
+    Returns:
+        object: Unfitted scikit-learn classifier.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](params, seed)
+
+
+def load_dataset(path='data/cardio_train.csv', chunk_rows=CSV_CHUNK_ROWS, use_cache=True):
+    """
+    Streams cardio_train.csv into compact arrays with the same feature derivation as CVD_Prediction.ipynb.
+
+    If the file has an up-to-date column cache (see dataset_cache.py), the arrays are read from it instead
+    of parsing the CSV.
+
+    Args:
+        path (str, optional): Semicolon-delimited file in the cardio_train.csv layout.
+        chunk_rows (int, optional): Rows parsed per chunk. Defaults to CSV_CHUNK_ROWS.
+        use_cache (bool, optional): Read the column cache when it is up to date. Defaults to True.
+
+    Returns:
+        tuple: float32 feature matrix of shape (n_records, 11) in the model's column order, and the int8
+            cardio labels of shape (n_records,).
+    """
+    import pandas as pd
+    from dataset_cache import default_cache_path, is_fresh, load_features
+
+    if use_cache and is_fresh(path):
+        return load_features(default_cache_path(path))
+    features, labels = [], []
+    for chunk in pd.read_csv(path, delimiter=';', dtype=CSV_DTYPES, chunksize=chunk_rows):
+        # Age in days to years, computed in float64 like the notebook before storing it compactly
+        chunk['ageinyears'] = chunk['age'] / 365
+        features.append(chunk[list(FEATURE_NAMES)].to_numpy(dtype=np.float32))
+        labels.append(chunk['cardio'].to_numpy())
+    return np.ascontiguousarray(np.concatenate(features)), np.concatenate(labels)
+
+
+def file_sha256(path):
+    """
+    Hashes a file in blocks, so the metrics report identifies exactly which extract a model was trained on.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def param_combinations(grid):
+    """
+    Expands a hyperparameter grid into every combination, in the grid's order.
+
+    Args:
+        grid (dict): Parameter name to list of values.
+
+    Returns:
+        list: One dict of parameters per combination.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _init_worker(X, y, folds, seed, backend):
+    from sklearn.model_selection import StratifiedKFold
+
+    _data['X'], _data['y'], _data['seed'], _data['backend'] = X, y, seed, backend
+    _data['splits'] = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(X, y))
+
+
+def _fit_fold(params, fold):
+    from sklearn.metrics import accuracy_score, roc_auc_score
+
+    X, y = _data['X'], _data['y']
+    train_index, test_index = _data['splits'][fold]
+    start = time.perf_counter()
+    model = build_model(_data['backend'], params, _data['seed']).fit(X[train_index], y[train_index])
+    fit_seconds = time.perf_counter() - start
+    probabilities = model.predict_proba(X[test_index])[:, 1]
+    return {
+        'roc_auc': roc_auc_score(y[test_index], probabilities),
+        'accuracy': accuracy_score(y[test_index], model.classes_[(probabilities >= 0.5).astype(int)]),
+        'fit_seconds': fit_seconds,
+    }
+
+
+def _elbow_inertia(k):
+    from sklearn.cluster import KMeans
+
+    # The notebook clusters the raw columns including the label
+    data = np.column_stack([_data['X'], _data['y']])
+    return KMeans(n_clusters=k, random_state=0).fit(data).inertia_
+
+
+def cross_validate(X, y, grid, folds=5, seed=0, jobs=None, elbow=False, backend=DEFAULT_BACKEND):
+    """
+    Scores every hyperparameter combination with stratified k-fold cross-validation.
+
+    Every (combination, fold) fit is an independent task on a process pool, so the search scales with the
+    number of cores. The optional KMeans elbow curve from the notebook runs on the same pool.
+
+    Args:
+        X (numpy.ndarray): Training features.
+        y (numpy.ndarray): Training labels.
+        grid (dict): Parameter name to list of values.
+        folds (int, optional): Number of folds. Defaults to 5.
+        seed (int, optional): Seed for the fold split and the models. Defaults to 0.
+        jobs (int, optional): Worker processes. Defaults to None, one per core.
+        elbow (bool, optional): Also compute KMeans inertia for k=1..9. Defaults to False.
+        backend (str, optional): Key of BACKENDS. Defaults to DEFAULT_BACKEND.
+
+    Returns:
+        tuple: Search results sorted by mean ROC-AUC (best first), and the elbow inertias keyed by k
+            (empty unless elbow is set).
+    """
+    combinations = param_combinations(grid)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(X, y, folds, seed, backend)) as pool:
+        elbow_futures = {k: pool.submit(_elbow_inertia, k) for k in range(1, 10)} if elbow else {}
+        fold_futures = [[pool.submit(_fit_fold, params, fold) for fold in range(folds)] for params in combinations]
+        results = []
+        for params, futures in zip(combinations, fold_futures):
+            scores = [future.result() for future in futures]
+            roc_auc = [score['roc_auc'] for score in scores]
+            result = {
+                'params': params,
+                'roc_auc_mean': float(np.mean(roc_auc)),
+                'roc_auc_std': float(np.std(roc_auc)),
+                'accuracy_mean': float(np.mean([score['accuracy'] for score in scores])),
+                'fit_seconds': float(sum(score['fit_seconds'] for score in scores)),
+            }
+            results.append(result)
+            print(f"{params}: ROC-AUC {result['roc_auc_mean']:.4f} +/- {result['roc_auc_std']:.4f}, "
+                  f"accuracy {result['accuracy_mean']:.4f}")
+        inertia = {k: float(future.result()) for k, future in elbow_futures.items()}
+    results.sort(key=lambda result: -result['roc_auc_mean'])
+    return results, inertia
+
+
+def evaluate(model, X, y):
+    """
+    Computes the notebook's holdout metrics for a fitted model.
+
+    Returns:
+        dict: Accuracy, ROC-AUC, confusion matrix and per-class report.
+    """
+    from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, roc_auc_score
+
+    predictions = model.predict(X)
+    return {
+        'accuracy': accuracy_score(y, predictions),
+        'roc_auc': roc_auc_score(y, model.predict_proba(X)[:, 1]),
+        'confusion_matrix': confusion_matrix(y, predictions).tolist(),
+        'classification_report': classification_report(y, predictions, output_dict=True),
+    }
+
+
+def publish_artifact(source, target):
+    """
+    Makes a freshly written version directory the current artifact by renaming a new pointer file over the old
+    one, a single atomic step, so readers always find either the old or the new version, complete. The
+    directory at `target`, the artifact checked out with the repository, is left untouched. The version the
+    pointer named before is kept for readers still loading from it; older versions are removed.
+
+    Args:
+        source (str): Directory written next to `target`, named with VERSION_INFIX.
+        target (str): Artifact path, see tree_model.resolve_artifact.
+    """
+    target = target.rstrip(os.sep)
+    previous = resolve_artifact(target)
+    pointer = target + POINTER_SUFFIX
+    with open(pointer + '.staging', 'w') as file:
+        file.write(os.path.basename(source) + '\n')
+    os.replace(pointer + '.staging', pointer)
+    parent = os.path.dirname(os.path.abspath(target))
+    keep = {os.path.realpath(source), os.path.realpath(previous)}
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if (name.startswith(os.path.basename(target) + VERSION_INFIX) and os.path.isdir(path)
+                and os.path.realpath(path) not in keep):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def train(data_path, grid, folds=5, seed=0, jobs=None, elbow=False, test_size=0.3, split_seed=42,
+          backend=DEFAULT_BACKEND):
+    """
+    Runs the full training pipeline: load, cross-validated search, refit of the best parameters, holdout evaluation.
+
+    Args:
+        data_path (str): File in the cardio_train.csv layout.
+        grid (dict): Parameter name to list of values.
+        folds (int, optional): Cross-validation folds. Defaults to 5.
+        seed (int, optional): Seed for the folds and the models. Defaults to 0.
+        jobs (int, optional): Worker processes. Defaults to None, one per core.
+        elbow (bool, optional): Also compute the KMeans elbow curve. Defaults to False.
+        test_size (float, optional): Holdout fraction. Defaults to 0.3, as in the notebook.
+        split_seed (int, optional): Seed of the holdout split. Defaults to 42, as in the notebook.
+        backend (str, optional): Key of BACKENDS. Defaults to DEFAULT_BACKEND.
+
+    Returns:
+        tuple: Fitted classifier, holdout features, and the metrics report.
+    """
+    from sklearn.model_selection import train_test_split
+
+    timings = {}
+    start = time.perf_counter()
+    X, y = load_dataset(data_path)
+    timings['load'] = time.perf_counter() - start
+    print(f"Loaded {len(X)} records in {timings['load']:.2f}s")
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=split_seed)
+
+    start = time.perf_counter()
+    results, inertia = cross_validate(X_train, y_train, grid, folds=folds, seed=seed, jobs=jobs, elbow=elbow,
+                                      backend=backend)
+    timings['search'] = time.perf_counter() - start
+
+    best_params = results[0]['params']
+    start = time.perf_counter()
+    model = build_model(backend, best_params, seed).fit(X_train, y_train)
+    timings['refit'] = time.perf_counter() - start
+
+    report = {
+        'dataset': {'path': data_path, 'sha256': file_sha256(data_path), 'records': int(len(X)),
+                    'train_records': int(len(X_train)), 'test_records': int(len(X_test))},
+        'settings': {'backend': backend, 'folds': folds, 'seed': seed, 'test_size': test_size, 'split_seed': split_seed,
+                     'jobs': jobs or os.cpu_count()},
+        'best_params': best_params,
+        'search': results,
+        'holdout': evaluate(model, X_test, y_test),
+        'timings': timings,
+    }
+    if inertia:
+        report['elbow_inertia'] = inertia
+    return model, X_test, report
+
+
+def write_outputs(model, X_check, report, output=MODEL_PATH, pickle_path=PICKLE_PATH):
+    """
+    Writes the trained model as a compiled artifact with its metrics report, and as a pickle.
+
+    The artifact is checked against the sklearn model before anything is replaced.
+
+    Args:
+        model (object): Fitted classifier of one of the BACKENDS.
+        X_check (numpy.ndarray): Inputs the compiled artifact must reproduce exactly.
+        report (dict): Metrics report; the model version is added to it.
+        output (str, optional): Artifact path the new version is published under. Defaults to MODEL_PATH.
+        pickle_path (str, optional): Pickle file, or None to skip it. Defaults to PICKLE_PATH.
+
+    Returns:
+        str: Version of the written artifact.
+    """
+    compiled = TreeEnsemble.from_sklearn(model)
+    if not verify(model, compiled, X_check):
+        raise RuntimeError("Compiled model does not reproduce the trained model")
+    compiled.metadata.update({'backend': report['settings']['backend'], 'params': report['best_params'],
+                              'dataset_sha256': report['dataset']['sha256'], 'seed': report['settings']['seed']})
+    report['model_version'] = compiled.version
+
+    output = output.rstrip(os.sep)
+    staging = tempfile.mkdtemp(prefix=os.path.basename(output) + VERSION_INFIX,
+                               dir=os.path.dirname(os.path.abspath(output)))
+    # Readable by the services loading the model, as a directory made by save() would be
+    os.chmod(staging, 0o755)
+    try:
+        compiled.save(staging)
+        with open(os.path.join(staging, METRICS_FILE), 'w') as file:
+            json.dump(report, file, indent=2)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    publish_artifact(staging, output)
+
+    if pickle_path:
+        with open(pickle_path + '.staging', 'wb') as file:
+            pickle.dump(model, file)
+        os.replace(pickle_path + '.staging', pickle_path)
+    return compiled.version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the cardiovascular disease model from cardio_train.csv.")
+    parser.add_argument('--data', default='data/cardio_train.csv', help="Training data in the cardio_train.csv layout.")
+    parser.add_argument('--output', default=MODEL_PATH, help="Artifact path to publish the new version under.")
+    parser.add_argument('--pickle', default=PICKLE_PATH, help="Pickle file to write, empty to skip.")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=DEFAULT_BACKEND, help="Model implementation.")
+    parser.add_argument('--n-estimators', type=int, nargs='+', default=PARAM_GRID['n_estimators'])
+    parser.add_argument('--learning-rate', type=float, nargs='+', default=PARAM_GRID['learning_rate'])
+    parser.add_argument('--max-depth', type=int, nargs='+', default=PARAM_GRID['max_depth'])
+    parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the folds and the models.")
+    parser.add_argument('--jobs', type=int, default=None, help="Worker processes, one per core by default.")
+    parser.add_argument('--elbow', action='store_true', help="Also report the KMeans elbow curve for k=1..9.")
+    args = parser.parse_args()
+
+    grid = {'n_estimators': args.n_estimators, 'learning_rate': args.learning_rate, 'max_depth': args.max_depth}
+    start = time.perf_counter()
+    model, X_test, report = train(args.data, grid, folds=args.folds, seed=args.seed, jobs=args.jobs,
+                                  elbow=args.elbow, backend=args.backend)
+    version = write_outputs(model, X_test, report, output=args.output, pickle_path=args.pickle or None)
+    holdout = report['holdout']
+    print(f"Best parameters {report['best_params']}: holdout accuracy {holdout['accuracy']:.4f}, "
+          f"ROC-AUC {holdout['roc_auc']:.4f}")
+    print(f"Wrote model version {version} to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
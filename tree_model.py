@@ -0,0 +1,648 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import pickle
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Default location of the exported model artifact, and of the pickle it is exported from
+MODEL_PATH = 'gb_model'
+PICKLE_PATH = 'gb_model.pkl'
+
+# Retraining writes each artifact to a directory of its own next to the artifact path and names the current
+# one in a pointer file, <artifact path><POINTER_SUFFIX>; without a pointer the artifact path itself is loaded
+POINTER_SUFFIX = '.current'
+
+# Artifact layout: a small JSON header plus one .npy file per packed array
+FORMAT_NAME = 'cvd-tree-ensemble'
+FORMAT_VERSION = 1
+HEADER_FILE = 'model.json'
+ARRAY_NAMES = ('feature', 'threshold', 'children_left', 'children_right', 'value', 'roots')
+
+# Arrays that do not change predictions, so they are left out of the model version; older artifacts lack them
+OPTIONAL_ARRAY_NAMES = ('cover',)
+
+# Batches up to this size walk the trees directly, larger ones use the bitvector evaluator
+SMALL_BATCH = 64
+
+# Lowest set bit of every 8-bit leaf mask
+_LOWEST_BIT = np.array([(v & -v).bit_length() - 1 if v else 0 for v in range(256)], dtype=np.intp)
+
+# Leaf mask types by width; trees with more than 64 leaves are always scored by walking them
+_MASK_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+_expit = None
+
+
+def _expit_scalar(x):
+    return 1.0 / (1.0 + math.exp(-x)) if x > -700.0 else 0.0
+
+
+def _logistic(raw):
+    """
+    Applies the logistic function with the C library's exp, like scipy.special.expit which sklearn uses.
+    NumPy's own vectorized exp can differ in the last bit, which would break bit-for-bit parity.
+    Small batches use math.exp directly, so the interactive path never pays for importing scipy.
+    """
+    global _expit
+    if raw.shape[0] <= SMALL_BATCH:
+        return np.array([_expit_scalar(x) for x in raw.tolist()], dtype=np.float64)
+    if _expit is None:
+        try:
+            from scipy.special import expit as _expit
+        except ImportError:
+            _expit = np.vectorize(_expit_scalar, otypes=[np.float64])
+    return _expit(raw)
+
+
+class TreeEnsemble:
+    """
+    Gradient boosted decision trees flattened into packed NumPy arrays.
+
+    All trees are stored back to back in flat node arrays. Small batches are scored by walking every tree
+    at once with a fixed number of vectorized gather/compare steps; leaf nodes point to themselves, which
+    lets shallower paths simply stay put until the deepest tree has been walked. Larger batches use a
+    QuickScorer-style bitvector evaluation: for each feature one searchsorted over its sorted split
+    thresholds selects a precomputed mask of the leaves still reachable in every tree, and the exit leaf
+    of each tree is the lowest bit left after ANDing the masks of all features.
+
+    Args:
+        feature (numpy.ndarray): Feature index tested at each node (int32).
+        threshold (numpy.ndarray): Split threshold at each node, samples go left when value <= threshold (float64).
+        children_left (numpy.ndarray): Flat index of each node's left child, or of itself for leaves (int32).
+        children_right (numpy.ndarray): Flat index of each node's right child, or of itself for leaves (int32).
+        value (numpy.ndarray): Leaf values already scaled by the learning rate (float64).
+        roots (numpy.ndarray): Flat index of each tree's root node, in boosting order (int32).
+        init_raw (float): Raw (log-odds) prediction of the initial estimator.
+        max_depth (int): Depth of the deepest tree.
+        classes (numpy.ndarray): Class labels, negative class first.
+        n_features (int): Number of input features.
+        input_dtype (str, optional): Dtype inputs are cast to before comparing, as done by the source model.
+        decision (str, optional): How predict() picks the class, matching the source model: 'raw' predicts the
+            positive class when the raw prediction is >= 0, 'proba' when its probability is the larger one.
+        metadata (dict, optional): Descriptive information stored in the artifact header.
+        cover (numpy.ndarray, optional): Training samples (weight) reaching each node, used to explain
+            predictions (float64).
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, init_raw, max_depth,
+                 classes, n_features, input_dtype='float32', decision='raw', metadata=None, cover=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.init_raw = float(init_raw)
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+        self.input_dtype = np.dtype(input_dtype)
+        if decision not in ('raw', 'proba'):
+            raise ValueError(f"Unknown decision rule: {decision}")
+        self.decision = decision
+        self.metadata = dict(metadata or {})
+        self.cover = cover
+        self._version = None
+
+        # Index arrays converted once, so the hot loops don't convert int32 indices on every gather
+        self._feature = feature.astype(np.intp)
+        self._left = children_left.astype(np.intp)
+        self._right = children_right.astype(np.intp)
+        self._roots = roots.astype(np.intp)
+        self._build_bitvector_tables()
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def version(self):
+        """
+        Content hash identifying the model, independent of where or how it was stored.
+        """
+        if self._version is None:
+            digest = hashlib.sha256()
+            for name in ARRAY_NAMES:
+                digest.update(np.ascontiguousarray(getattr(self, name)).tobytes())
+            digest.update(repr((self.init_raw, self.classes_.tolist(), self.input_dtype.str)).encode())
+            if self.decision != 'raw':
+                digest.update(self.decision.encode())
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """
+        Flattens a fitted binary scikit-learn GradientBoostingClassifier or HistGradientBoostingClassifier.
+
+        Args:
+            model (object): Fitted classifier with two classes.
+
+        Returns:
+            TreeEnsemble: Equivalent packed ensemble.
+        """
+        if len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be exported")
+        from sklearn import __version__ as sklearn_version
+
+        if hasattr(model, '_predictors'):
+            trees, settings = cls._flatten_hist_gradient_boosting(model)
+        else:
+            trees, settings = cls._flatten_gradient_boosting(model)
+        offsets = np.cumsum([0] + [len(tree['feature']) for tree in trees])
+        return cls(
+            feature=np.concatenate([tree['feature'] for tree in trees]).astype(np.int32),
+            threshold=np.concatenate([tree['threshold'] for tree in trees]).astype(np.float64),
+            children_left=np.concatenate([tree['left'] + offset for tree, offset in zip(trees, offsets)]).astype(np.int32),
+            children_right=np.concatenate([tree['right'] + offset for tree, offset in zip(trees, offsets)]).astype(np.int32),
+            value=np.concatenate([tree['value'] for tree in trees]).astype(np.float64),
+            roots=offsets[:-1].astype(np.int32),
+            cover=np.concatenate([tree['cover'] for tree in trees]).astype(np.float64),
+            classes=model.classes_,
+            n_features=model.n_features_in_,
+            metadata={'source': type(model).__name__, 'sklearn_version': sklearn_version},
+            **settings,
+        )
+
+    @staticmethod
+    def _flatten_gradient_boosting(model):
+        trees = []
+        for estimator in model.estimators_[:, 0]:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            trees.append({
+                'feature': np.where(is_leaf, 0, tree.feature),
+                'threshold': np.where(is_leaf, np.inf, tree.threshold),
+                'left': np.where(is_leaf, nodes, tree.children_left),
+                'right': np.where(is_leaf, nodes, tree.children_right),
+                # Scaled exactly as sklearn does when it adds each stage to the raw prediction
+                'value': model.learning_rate * tree.value[:, 0, 0],
+                'cover': tree.weighted_n_node_samples,
+            })
+        settings = {
+            'init_raw': model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0, 0],
+            'max_depth': max(estimator.tree_.max_depth for estimator in model.estimators_[:, 0]),
+            'input_dtype': 'float32',
+            'decision': 'raw',
+        }
+        return trees, settings
+
+    @staticmethod
+    def _flatten_hist_gradient_boosting(model):
+        trees = []
+        for predictors in model._predictors:
+            nodes = predictors[0].nodes
+            if nodes['is_categorical'].any():
+                raise ValueError("Models with categorical splits cannot be exported")
+            indices = np.arange(len(nodes))
+            is_leaf = nodes['is_leaf'].astype(bool)
+            trees.append({
+                'feature': np.where(is_leaf, 0, nodes['feature_idx']),
+                'threshold': np.where(is_leaf, np.inf, nodes['num_threshold']),
+                'left': np.where(is_leaf, indices, nodes['left']),
+                'right': np.where(is_leaf, indices, nodes['right']),
+                # Leaf values already include the learning rate
+                'value': nodes['value'],
+                'cover': nodes['count'],
+            })
+        settings = {
+            'init_raw': np.ravel(model._baseline_prediction)[0],
+            'max_depth': max(int(predictors[0].nodes['depth'].max()) for predictors in model._predictors),
+            # The histogram model compares unbinned float64 inputs and predicts the more probable class
+            'input_dtype': 'float64',
+            'decision': 'proba',
+        }
+        return trees, settings
+
+    def save(self, path):
+        """
+        Writes the model as a versioned artifact directory: model.json plus one .npy file per array.
+
+        Args:
+            path (str): Directory to write, created if needed.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+            if getattr(self, name) is not None:
+                np.save(os.path.join(path, f'{name}.npy'), getattr(self, name), allow_pickle=False)
+        header = {
+            'format': FORMAT_NAME,
+            'format_version': FORMAT_VERSION,
+            'model_version': self.version,
+            'n_features': self.n_features_in_,
+            'n_trees': self.n_trees,
+            'max_depth': self.max_depth,
+            'init_raw': self.init_raw,
+            'classes': self.classes_.tolist(),
+            'input_dtype': self.input_dtype.str,
+            'decision': self.decision,
+            'metadata': self.metadata,
+        }
+        # Written last, so a directory with a header always has complete arrays
+        with open(os.path.join(path, HEADER_FILE), 'w') as file:
+            json.dump(header, file, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Reads a model artifact written by save(), memory-mapping its arrays.
+
+        Args:
+            path (str): Artifact directory.
+            mmap_mode (str, optional): Passed to numpy.load, None reads the arrays into memory. Defaults to 'r'.
+
+        Returns:
+            TreeEnsemble: The stored model.
+        """
+        # Resolve the pointer once, so a retrain switching it cannot mix the files of two versions
+        path = resolve_artifact(path)
+        with open(os.path.join(path, HEADER_FILE)) as file:
+            header = json.load(file)
+        if header.get('format') != FORMAT_NAME or header.get('format_version', 0) > FORMAT_VERSION:
+            raise ValueError(f"Unsupported model artifact in {path}: {header.get('format')} "
+                             f"version {header.get('format_version')}")
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in ARRAY_NAMES}
+        for name in OPTIONAL_ARRAY_NAMES:
+            if os.path.exists(os.path.join(path, f'{name}.npy')):
+                arrays[name] = np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        model = cls(init_raw=header['init_raw'], max_depth=header['max_depth'], classes=header['classes'],
+                    n_features=header['n_features'], input_dtype=header['input_dtype'],
+                    decision=header.get('decision', 'raw'),
+                    metadata=header.get('metadata'), **arrays)
+        if model.version != header['model_version']:
+            raise ValueError(f"Model artifact in {path} is corrupt: content does not match its version")
+        return model
+
+    def _build_bitvector_tables(self):
+        """
+        Precomputes the per-feature leaf masks used by the bitvector evaluator.
+        Masks are as wide as the largest tree needs, up to 64 leaves; with larger trees every batch is
+        scored by walking them.
+        """
+        self._split_tables = None
+        tree_leaves = []  # Leaf nodes of each tree, left to right
+        split_nodes = []  # (node, tree, range of leaf positions in the node's left subtree)
+        for tree, root in enumerate(self._roots):
+            leaves = []
+
+            def visit(node):
+                start = len(leaves)
+                if self._left[node] == node:
+                    leaves.append(node)
+                    return
+                visit(self._left[node])
+                split_nodes.append((node, tree, start, len(leaves)))
+                visit(self._right[node])
+
+            visit(root)
+            tree_leaves.append(leaves)
+        max_leaves = max(len(leaves) for leaves in tree_leaves)
+        if max_leaves > 64:
+            return
+        self._mask_dtype = next(np.dtype(dtype) for dtype in _MASK_DTYPES if np.dtype(dtype).itemsize * 8 >= max_leaves)
+        full_mask = int(np.iinfo(self._mask_dtype).max)
+
+        leaf_values = np.zeros((self.n_trees, self._mask_dtype.itemsize * 8), dtype=np.float64)
+        for tree, leaves in enumerate(tree_leaves):
+            leaf_values[tree, :len(leaves)] = self.value[leaves]
+        if self._mask_dtype.itemsize == 1:
+            # Leaf values indexed by (tree, 8-bit mask of reachable leaves): the exit leaf is the lowest set bit
+            self._mask_values = np.ascontiguousarray(leaf_values[:, _LOWEST_BIT])
+        self._leaf_values = leaf_values
+
+        # A split that is false (value > threshold) rules out the leaves of its left subtree
+        tables = []
+        for feature in range(self.n_features_in_):
+            nodes = sorted((n for n in split_nodes if self.feature[n[0]] == feature), key=lambda n: self.threshold[n[0]])
+            thresholds = np.array([self.threshold[n[0]] for n in nodes], dtype=np.float64)
+            masks = np.full((len(nodes) + 1, self.n_trees), full_mask, dtype=self._mask_dtype)
+            for k, (node, tree, start, stop) in enumerate(nodes, start=1):
+                masks[k] = masks[k - 1]
+                masks[k, tree] &= np.array(full_mask ^ ((1 << stop) - (1 << start)), dtype=self._mask_dtype)
+            if len(nodes):
+                tables.append((feature, thresholds, masks))
+        self._split_tables = tables
+
+    def leaves(self, X):
+        """
+        Finds the leaf each sample reaches in every tree.
+
+        Args:
+            X (numpy.ndarray): Inputs of shape (n_samples, n_features).
+
+        Returns:
+            numpy.ndarray: Flat leaf node indices of shape (n_samples, n_trees).
+        """
+        X = self._validate(X)
+        flat_X = X.ravel()
+        row_offsets = (np.arange(X.shape[0], dtype=np.intp) * X.shape[1])[:, None]
+        node = np.broadcast_to(self._roots, (X.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = flat_X[row_offsets + self._feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self._left[node], self._right[node])
+        return node
+
+    def _validate(self, X):
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected an array of shape (n, {self.n_features_in_}), got {X.shape}")
+        # The packed trees have no missing value branches: every value is routed by value <= threshold, so a
+        # NaN would silently go right where the histogram model may have learned to send it left
+        if not np.isfinite(X).all():
+            raise ValueError("Inputs must be finite, missing values are not supported")
+        return X
+
+    def _raw_bitvector(self, X):
+        columns = np.ascontiguousarray(X.T, dtype=np.float64)
+        mask = np.full((X.shape[0], self.n_trees), np.iinfo(self._mask_dtype).max, dtype=self._mask_dtype)
+        for feature, thresholds, masks in self._split_tables:
+            # Number of splits on this feature whose threshold is below the value, i.e. that send it right
+            mask &= masks.take(np.searchsorted(thresholds, columns[feature], side='left'), axis=0)
+        mask = np.ascontiguousarray(mask.T)
+        raw = np.full(X.shape[0], self.init_raw, dtype=np.float64)
+        if self._mask_dtype.itemsize == 1:
+            stages = (self._mask_values[tree].take(mask[tree]) for tree in range(self.n_trees))
+        else:
+            # Position of the lowest set bit: isolate it, then read its exponent (exact for powers of two)
+            exit_leaves = np.frexp(mask & (~mask + 1))[1] - 1
+            stages = np.take_along_axis(self._leaf_values, exit_leaves, axis=1)
+        # Add tree by tree, in boosting order, so rounding matches sklearn's stage-wise sum
+        for stage in stages:
+            raw += stage
+        return raw
+
+    def decision_function(self, X):
+        """
+        Computes the raw (log-odds) prediction for each sample.
+
+        Args:
+            X (numpy.ndarray): Inputs of shape (n_samples, n_features).
+
+        Returns:
+            numpy.ndarray: Raw predictions of shape (n_samples,).
+        """
+        X = self._validate(X)
+        if self._split_tables is not None and X.shape[0] > SMALL_BATCH:
+            return self._raw_bitvector(X)
+        node = self.leaves(X)
+        stages = np.empty((node.shape[0], self.n_trees + 1), dtype=np.float64)
+        stages[:, 0] = self.init_raw
+        stages[:, 1:] = self.value[node]
+        # Accumulate tree by tree, in boosting order, so rounding matches sklearn's stage-wise sum
+        return np.add.accumulate(stages, axis=1)[:, -1]
+
+    def predict_proba(self, X):
+        """
+        Predicts class probabilities.
+
+        Args:
+            X (numpy.ndarray): Inputs of shape (n_samples, n_features).
+
+        Returns:
+            numpy.ndarray: Probabilities of shape (n_samples, 2), ordered as classes_.
+        """
+        return self._proba(self.decision_function(X))
+
+    def predict(self, X):
+        """
+        Predicts class labels.
+
+        Args:
+            X (numpy.ndarray): Inputs of shape (n_samples, n_features).
+
+        Returns:
+            numpy.ndarray: Predicted labels of shape (n_samples,).
+        """
+        return self.predict_with_proba(X)[0]
+
+    def predict_with_proba(self, X):
+        """
+        Predicts class labels and probabilities with a single pass over the trees.
+
+        Args:
+            X (numpy.ndarray): Inputs of shape (n_samples, n_features).
+
+        Returns:
+            tuple: Labels of shape (n_samples,) and probabilities of shape (n_samples, 2), as predict() and
+                predict_proba() would return them.
+        """
+        raw = self.decision_function(X)
+        proba = self._proba(raw)
+        if self.decision == 'proba':
+            positive = proba[:, 1] > proba[:, 0]
+        else:
+            positive = raw >= 0
+        return self.classes_[positive.astype(np.intp)], proba
+
+    @staticmethod
+    def _proba(raw):
+        proba = np.empty((raw.shape[0], 2), dtype=np.float64)
+        proba[:, 1] = _logistic(raw)
+        proba[:, 0] = 1.0 - proba[:, 1]
+        return proba
+
+
+def resolve_artifact(path=MODEL_PATH):
+    """
+    Finds the directory holding the current version of a model artifact: the one named by its pointer file,
+    if a retrain wrote one, otherwise the artifact path itself.
+
+    Args:
+        path (str, optional): Artifact directory or pickle file. Defaults to MODEL_PATH.
+
+    Returns:
+        str: Path to load.
+    """
+    path = path.rstrip(os.sep)
+    try:
+        with open(path + POINTER_SUFFIX) as file:
+            name = file.read().strip()
+    except FileNotFoundError:
+        return path
+    return os.path.join(os.path.dirname(path), name)
+
+
+def load_model(path=MODEL_PATH):
+    """
+    Loads a model artifact directory, or compiles a pickled scikit-learn model.
+
+    Args:
+        path (str, optional): Artifact directory or pickle file. Defaults to MODEL_PATH.
+
+    Returns:
+        TreeEnsemble: The model.
+    """
+    path = resolve_artifact(path)
+    if os.path.isdir(path):
+        return TreeEnsemble.load(path)
+    with open(path, 'rb') as file:
+        return TreeEnsemble.from_sklearn(pickle.load(file))
+
+
+def artifact_version(path=MODEL_PATH):
+    """
+    Reads the version of a model artifact without loading its arrays, so callers can cheaply notice
+    that the artifact was replaced.
+
+    Args:
+        path (str, optional): Artifact directory or pickle file. Defaults to MODEL_PATH.
+
+    Returns:
+        str: The artifact's model version, or the modification time of a pickle file.
+    """
+    path = resolve_artifact(path)
+    if os.path.isdir(path):
+        with open(os.path.join(path, HEADER_FILE)) as file:
+            return json.load(file)['model_version']
+    return str(os.path.getmtime(path))
+
+
+def load_training_features(path='data/cardio_train.csv'):
+    """
+    Loads the training data with the same feature derivation as CVD_Prediction.ipynb.
+
+    Args:
+        path (str, optional): Path to cardio_train.csv.
+
+    Returns:
+        numpy.ndarray: Encoded feature matrix of shape (n_records, 11).
+    """
+    import pandas as pd
+    from features import encode
+
+    data = pd.read_csv(path, delimiter=';')
+    data['ageinyears'] = data['age'] / 365
+    return encode(data)
+
+
+def verify(model, compiled, X):
+    """
+    Checks that the compiled ensemble reproduces the sklearn model bit for bit, and that it refuses inputs with
+    missing values instead of scoring them differently.
+
+    Args:
+        model (GradientBoostingClassifier): Source model.
+        compiled (TreeEnsemble): Compiled ensemble.
+        X (numpy.ndarray): Inputs to compare on.
+
+    Returns:
+        bool: True if predict_proba and predict are identical for every row and missing values are refused.
+    """
+    same_proba = np.array_equal(model.predict_proba(X), compiled.predict_proba(X))
+    same_labels = np.array_equal(model.predict(X), compiled.predict(X))
+    missing = np.array(X[:2 * SMALL_BATCH], dtype=np.float64)
+    missing[::2, 0] = np.nan
+    try:
+        compiled.predict_proba(missing)
+        refuses_missing = False
+    except ValueError:
+        refuses_missing = True
+    print(f"predict_proba identical on {len(X)} rows: {same_proba}")
+    print(f"predict identical on {len(X)} rows: {same_labels}")
+    print(f"rows with missing values refused: {refuses_missing}")
+    return same_proba and same_labels and refuses_missing
+
+
+def _best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(model, compiled, X, repeat=200):
+    """
+    Compares single-row and 10k-row predict_proba latency of the sklearn model and the compiled ensemble.
+
+    Args:
+        model (GradientBoostingClassifier): Source model.
+        compiled (TreeEnsemble): Compiled ensemble.
+        X (numpy.ndarray): Inputs, at least 10000 rows.
+        repeat (int, optional): Timed repetitions, the best one is reported.
+
+    Returns:
+        dict: Best latency in seconds per implementation and batch size.
+    """
+    results = {}
+    for batch_size, repetitions in ((1, repeat), (10000, max(repeat // 20, 3))):
+        batch = X[:batch_size]
+        results[batch_size] = {
+            'sklearn': _best_time(lambda: model.predict_proba(batch), repetitions),
+            'compiled': _best_time(lambda: compiled.predict_proba(batch), repetitions),
+        }
+        timing = results[batch_size]
+        print(f"{batch_size:>6} rows: sklearn {timing['sklearn'] * 1e3:8.3f} ms, "
+              f"compiled {timing['compiled'] * 1e3:8.3f} ms ({timing['sklearn'] / timing['compiled']:.1f}x)")
+    return results
+
+
+def measure_load_time(pickle_path=PICKLE_PATH, artifact_path=MODEL_PATH, repeat=5):
+    """
+    Measures, in fresh interpreters, how long it takes to import and load the pickle versus the artifact.
+
+    Args:
+        pickle_path (str, optional): Pickled scikit-learn model.
+        artifact_path (str, optional): Exported artifact directory.
+        repeat (int, optional): Fresh processes per variant, the best one is reported.
+
+    Returns:
+        dict: Best load time in seconds per variant.
+    """
+    snippets = {
+        'pickle': f"import pickle; pickle.load(open({pickle_path!r}, 'rb'))",
+        'artifact': f"import tree_model; tree_model.TreeEnsemble.load({artifact_path!r})",
+    }
+    results = {}
+    for name, snippet in snippets.items():
+        code = f"import time; start = time.perf_counter(); {snippet}; print(time.perf_counter() - start)"
+        runs = [float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                     cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+                for _ in range(repeat)]
+        results[name] = min(runs)
+        print(f"{name:>8}: {results[name] * 1e3:8.1f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the pickled Gradient Boosting model into packed NumPy trees.")
+    parser.add_argument('command', choices=['export', 'verify', 'benchmark', 'load-time'])
+    parser.add_argument('--model', default=PICKLE_PATH, help="Path to the pickled model.")
+    parser.add_argument('--output', default=MODEL_PATH, help="Artifact directory to export to or verify.")
+    parser.add_argument('--data', default='data/cardio_train.csv', help="Path to cardio_train.csv.")
+    args = parser.parse_args()
+
+    if args.command == 'load-time':
+        measure_load_time(args.model, args.output)
+        return
+
+    with open(args.model, 'rb') as file:
+        model = pickle.load(file)
+    compiled = TreeEnsemble.from_sklearn(model)
+
+    if args.command == 'export':
+        compiled.save(args.output)
+        print(f"Exported model version {compiled.version} to {args.output}")
+    elif args.command == 'verify':
+        X = load_training_features(args.data)
+        ok = verify(model, compiled, X)
+        if os.path.isdir(args.output):
+            print(f"Artifact {args.output}:")
+            ok = verify(model, TreeEnsemble.load(args.output), X) and ok
+        if not ok:
+            raise SystemExit(1)
+    else:
+        benchmark(model, compiled, load_training_features(args.data))
+
+
+if __name__ == '__main__':
+    main()